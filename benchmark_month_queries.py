@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк выборок за месяц: extract(year/month) без индексов против полуинтервала дат с индексами.
+Заполняет временную SQLite-базу (по умолчанию 100 000 уроков), печатает план запроса и задержку.
+Пример: python benchmark_month_queries.py --lessons 100000 --students 200
+"""
+
+import sys
+import os
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
+
+from sqlalchemy import create_engine, func, insert, select, text
+from src.database import (Base, User, Lesson, Homework, Payment, UserRole, AttendanceStatus,
+                          HomeworkStatus, month_range)
+
+def seed(engine, lessons: int, students: int):
+    rng = random.Random(42)
+    start = datetime(2023, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {'full_name': f"Ученик {i}", 'role': UserRole.STUDENT, 'access_code': f"bench{i}"}
+            for i in range(1, students + 1)
+        ])
+        conn.execute(insert(Lesson), [
+            {'student_id': rng.randint(1, students), 'topic': "Урок",
+             'date': start + timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60)),
+             'attendance_status': rng.choice(list(AttendanceStatus))}
+            for _ in range(lessons)
+        ])
+        conn.execute(insert(Homework), [
+            {'lesson_id': rng.randint(1, lessons), 'description': "ДЗ",
+             'status': rng.choice(list(HomeworkStatus)),
+             'checked_at': start + timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))}
+            for _ in range(lessons // 2)
+        ])
+        conn.execute(insert(Payment), [
+            {'student_id': rng.randint(1, students), 'lessons_paid': 8,
+             'payment_date': start + timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))}
+            for _ in range(lessons // 10)
+        ])
+
+def extract_queries(student_id: int, year: int, month: int):
+    by_month = lambda column: (func.extract('year', column) == year, func.extract('month', column) == month)
+    return {
+        'lessons_for_student': select(Lesson.id).where(Lesson.student_id == student_id, *by_month(Lesson.date)),
+        'payments_for_student': select(Payment.id).where(Payment.student_id == student_id, *by_month(Payment.payment_date)),
+        'checked_homeworks': select(func.count(Homework.id)).where(
+            Homework.status == HomeworkStatus.CHECKED, *by_month(Homework.checked_at)),
+    }
+
+def range_queries(student_id: int, year: int, month: int):
+    start, end = month_range(year, month)
+    return {
+        'lessons_for_student': select(Lesson.id).where(
+            Lesson.student_id == student_id, Lesson.date >= start, Lesson.date < end),
+        'payments_for_student': select(Payment.id).where(
+            Payment.student_id == student_id, Payment.payment_date >= start, Payment.payment_date < end),
+        'checked_homeworks': select(func.count(Homework.id)).where(
+            Homework.status == HomeworkStatus.CHECKED, Homework.checked_at >= start, Homework.checked_at < end),
+    }
+
+def measure(engine, queries: dict, repeat: int):
+    results = {}
+    with engine.connect() as conn:
+        for name, query in queries.items():
+            compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).fetchall()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(query).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            results[name] = (elapsed, " | ".join(row[-1] for row in plan))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк выборок за месяц")
+    parser.add_argument("--lessons", type=int, default=100000)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    engine = create_engine(f"sqlite:///{db_path}")
+    indexes = [index for model in (Lesson, Homework, Payment) for index in model.__table__.indexes]
+    Base.metadata.create_all(engine)
+    for index in indexes:
+        index.drop(engine)  # «До»: база без составных индексов
+
+    print(f"Заполняем {db_path}: {args.lessons} уроков, {args.students} учеников...")
+    seed(engine, args.lessons, args.students)
+
+    params = (7, 2024, 3)
+    before = measure(engine, extract_queries(*params), args.repeat)
+    for index in indexes:
+        index.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    after = measure(engine, range_queries(*params), args.repeat)
+
+    for name in before:
+        print(f"\n{name}")
+        print(f"  до:    {before[name][0]:8.3f} мс  план: {before[name][1]}")
+        print(f"  после: {after[name][0]:8.3f} мс  план: {after[name][1]}")
+
+if __name__ == "__main__":
+    main()
@@ -65,7 +65,8 @@ from src.handlers.parent import show_parent_dashboard
  BROADCAST_MESSAGE, BROADCAST_CONFIRM, SELECT_PARENT_TYPE, SELECT_EXISTING_PARENT,
  SELECT_SECOND_PARENT_TYPE, SELECT_EXISTING_SECOND_PARENT, ADD_SECOND_PARENT_NAME,
  MESSAGE_INPUT, MESSAGE_CONFIRM) = range(30)
-from src.database import engine, Base
+from src.database import engine, Base, rebuild_balances
+from src.async_database import dispose_async_engine
 from src.scheduler import send_reminders, send_payment_reminders, send_homework_deadline_reminders
 from src.admin_handlers import add_tutor, add_parent
 
@@ -76,6 +77,8 @@ load_dotenv()
 # Профессиональное логирование
 from src.logger import setup_logging, log_user_action, log_telegram_error, metrics
 from src.health_monitor import health_monitor, setup_default_checks
+from src.identity_cache import identity_cache
+from src.chart_renderer import chart_render_pool
 
 logger = setup_logging(
     log_level=os.getenv("LOG_LEVEL", "INFO"),
@@ -178,15 +181,25 @@ async def initialize_systems(application):
         logger.error(f"❌ Ошибка при инициализации систем: {e}")
         raise
 
+async def shutdown_systems(application):
+    """Освобождает ресурсы при остановке бота."""
+    await dispose_async_engine()
+    logger.info("Пул асинхронных соединений с БД закрыт")
+    logger.info(f"Кэш идентичности: {identity_cache.stats()}")
+    chart_render_pool.shutdown()
+    logger.info(f"Пул отрисовки графиков остановлен: {chart_render_pool.stats()}")
+
 def main() -> None:
     """Запускает бота."""
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created/checked.")
+    logger.info(f"Student balances reconciled: {rebuild_balances()}")
 
     # Создаем приложение с улучшенными настройками таймаута и обработки ошибок
     application = (Application.builder()
                    .token(TOKEN)
                    .post_init(initialize_systems)
+                   .post_shutdown(shutdown_systems)
                    .connect_timeout(30)  # Таймаут подключения 30 сек
                    .read_timeout(30)     # Таймаут чтения 30 сек
                    .write_timeout(30)    # Таймаут записи 30 сек
@@ -8,6 +8,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.database import SessionLocal, User, UserRole
+from src.identity_cache import identity_cache
 
 def create_admin_user():
     """Создает или обновляет админского пользователя с кодом доступа ADMIN2024"""
@@ -34,6 +35,7 @@ def create_admin_user():
             old_admin.access_code = 'ADMIN2024'
             old_admin.full_name = 'Марина Администратор'
             db.commit()
+            identity_cache.invalidate_users(old_admin.id)
             print(f"Код доступа обновлен: {old_admin.access_code}")
             return old_admin
         
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Скрипт для создания уроков на семестр по шаблонам еженедельного расписания (WeeklySchedule).
+Пример: python generate_schedule_lessons.py --weeks 16 --time 16:00
+"""
+
+import sys
+import os
+import argparse
+from datetime import datetime
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
+
+from src.database import create_lessons_from_schedules, DEFAULT_SCHEDULE_WEEKS
+
+def main():
+    parser = argparse.ArgumentParser(description="Создание уроков по шаблонам расписания")
+    parser.add_argument("--weeks", type=int, default=DEFAULT_SCHEDULE_WEEKS, help="Горизонт в неделях")
+    parser.add_argument("--time", default="16:00", help="Время уроков в формате ЧЧ:ММ")
+    parser.add_argument("--tutor-id", type=int, default=None, help="Только шаблоны этого репетитора")
+    parser.add_argument("--student-id", type=int, action="append", default=None, help="Только эти ученики")
+    args = parser.parse_args()
+
+    lesson_time = datetime.strptime(args.time, '%H:%M').time()
+    created = create_lessons_from_schedules(lesson_time, args.weeks, args.tutor_id, args.student_id)
+    for student_id, count in created.items():
+        print(f"Ученик {student_id}: создано уроков {count}")
+    print(f"Всего создано уроков: {sum(created.values())} для {len(created)} учеников")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для создания таблицы student_balances и первичного заполнения балансов.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
+
+from src.database import engine, StudentBalance, rebuild_balances
+
+def migrate_student_balances():
+    """Создает таблицу student_balances и пересчитывает балансы всех учеников."""
+    try:
+        StudentBalance.__table__.create(bind=engine, checkfirst=True)
+        print("Таблица student_balances создана/проверена")
+
+        count = rebuild_balances()
+        print(f"Балансы пересчитаны для {count} учеников")
+        return True
+    except Exception as e:
+        print(f"Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("Начинаем миграцию балансов...")
+    if migrate_student_balances():
+        print("Миграция завершена успешно!")
+    else:
+        print("Миграция завершилась с ошибкой!")
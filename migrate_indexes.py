@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для создания составных индексов под выборки за месяц и по статусам:
+lessons(student_id, date), lessons(student_id, attendance_status),
+homeworks(status, checked_at), payments(student_id, payment_date).
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
+
+from src.database import engine, Lesson, Homework, Payment
+
+def migrate_indexes():
+    """Создает недостающие индексы (существующие пропускаются)."""
+    try:
+        for model in (Lesson, Homework, Payment):
+            for index in model.__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
+                print(f"Индекс {index.name} создан/проверен")
+        return True
+    except Exception as e:
+        print(f"Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("Начинаем миграцию индексов...")
+    if migrate_indexes():
+        print("Миграция завершена успешно!")
+    else:
+        print("Миграция завершилась с ошибкой!")
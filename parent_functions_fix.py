@@ -7,7 +7,7 @@
 
 async def show_child_progress(update, context):
     """Показывает подробный прогресс ребенка"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.callback_query.answer("❌ Доступ запрещен")
         return
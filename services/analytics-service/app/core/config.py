@@ -78,6 +78,12 @@ class Settings(BaseSettings):
     DB_MAX_OVERFLOW: int = 20
     ASYNC_BATCH_SIZE: int = 1000
     
+    # Event Consumer Settings
+    EVENT_CONSUMER_MODE: str = "batch"  # batch (micro-batches with bulk writes), single
+    EVENT_CONSUMER_PREFETCH: int = 500  # Unacked messages the broker may deliver in batch mode
+    EVENT_BATCH_SIZE: int = 200
+    EVENT_BATCH_MAX_WAIT_MS: int = 250  # Flush a partial batch after this delay
+    
     # JWT
     JWT_SECRET_KEY: str = "analytics-service-secret-key-change-in-production"
     JWT_ALGORITHM: str = "HS256"
@@ -0,0 +1,170 @@
+"""
+Batch Plan for Analytics Events
+Merges a micro-batch of events in memory into per-table updates; kept free of
+database imports so the merge rules can be tested on their own
+"""
+
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Counters in UserActivity incremented by each event type: (user id field, column)
+ACTIVITY_COUNTERS = {
+    "lesson.completed": ("student_id", "lessons_attended"),
+    "homework.submitted": ("student_id", "homeworks_submitted"),
+    "material.accessed": ("user_id", "materials_accessed"),
+    "user.login": ("user_id", "login_count"),
+}
+
+
+def lesson_defaults() -> Dict[str, Any]:
+    """Required LessonStats columns that events may not carry"""
+    return {
+        "tutor_id": "",
+        "student_id": "",
+        "date": datetime.utcnow(),
+        "duration_minutes": 0,
+        "planned_duration": 0,
+        "status": "scheduled",
+        "attendance_status": "unknown",
+    }
+
+
+def payment_defaults() -> Dict[str, Any]:
+    """Required PaymentSummary columns that events may not carry"""
+    return {
+        "user_id": "",
+        "amount": 0.0,
+        "payment_method": "unknown",
+        "payment_date": datetime.utcnow(),
+        "status": "pending",
+        "payment_type": "lesson",
+    }
+
+
+def parse_time(value: Any) -> datetime:
+    """Event timestamp as naive UTC datetime (now if missing or malformed)"""
+    if isinstance(value, datetime):
+        return value
+    if value:
+        try:
+            return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+def event_payload(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat event data (services wrap it into an envelope with 'data')"""
+    data = event.get("data")
+    if isinstance(data, dict) and ("event_type" in event or "service" in event):
+        return data
+    return event
+
+
+def as_key(value: Any) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+class BatchPlan:
+    """
+    Aggregated effect of a batch. Entity updates (lesson, payment) are merged in delivery
+    order, so the last event for an entity wins; counters are summed per (user, day)
+    """
+
+    def __init__(self):
+        self.lessons: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.payments: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.activity: Dict[Tuple[str, datetime], Counter] = {}
+        self.material_rows: List[Dict[str, Any]] = []
+        self.counts: Counter = Counter()
+        self.skipped = 0
+
+    def add(self, routing_key: str, event: Dict[str, Any]):
+        data = event_payload(event)
+        handler = getattr(self, "_" + routing_key.replace(".", "_"), None)
+        if handler is not None:
+            handler(data)
+        counter = ACTIVITY_COUNTERS.get(routing_key)
+        if counter is not None:
+            self._count(data.get(counter[0]), data, counter[1])
+        if handler is None and counter is None:
+            self.skipped += 1
+            return
+        self.counts[routing_key] += 1
+
+    def _count(self, user_id: Any, data: Dict[str, Any], column: str):
+        if user_id is None:
+            return
+        day = parse_time(data.get("timestamp") or data.get("completed_at") or data.get("submitted_at")
+                         or data.get("accessed_at") or data.get("login_time")).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        self.activity.setdefault((str(user_id), day), Counter())[column] += 1
+
+    def _lesson(self, data: Dict[str, Any], **fields):
+        lesson_id = as_key(data.get("lesson_id"))
+        if lesson_id is None:
+            return
+        update = self.lessons.setdefault(lesson_id, {})
+        for field in ("tutor_id", "student_id"):
+            if data.get(field) is not None:
+                update[field] = str(data[field])
+        update.update({key: value for key, value in fields.items() if value is not None})
+
+    def _lesson_created(self, data: Dict[str, Any]):
+        self._lesson(
+            data,
+            status="scheduled",
+            date=parse_time(data.get("scheduled_at") or data.get("date")),
+            subject=as_key(data.get("subject_id") or data.get("subject")),
+            planned_duration=data.get("duration_minutes"),
+        )
+
+    def _lesson_completed(self, data: Dict[str, Any]):
+        self._lesson(
+            data,
+            status="completed",
+            attendance_status="present",
+            student_rating=data.get("rating"),
+            actual_end_time=parse_time(data.get("completed_at")),
+            duration_minutes=data.get("duration_minutes"),
+        )
+
+    def _lesson_cancelled(self, data: Dict[str, Any]):
+        self._lesson(data, status="cancelled", is_cancelled=True)
+
+    def _payment(self, data: Dict[str, Any], **fields):
+        payment_id = as_key(data.get("payment_id"))
+        if payment_id is None:
+            return
+        update = self.payments.setdefault(payment_id, {})
+        if data.get("student_id") is not None:
+            update["user_id"] = str(data["student_id"])
+        if data.get("tutor_id") is not None:
+            update["tutor_id"] = str(data["tutor_id"])
+        if data.get("amount") is not None:
+            update["amount"] = float(data["amount"])
+        update.update({key: value for key, value in fields.items() if value is not None})
+
+    def _payment_processed(self, data: Dict[str, Any]):
+        self._payment(
+            data,
+            status="completed",
+            payment_method=data.get("payment_method"),
+            payment_date=parse_time(data.get("processed_at") or data.get("timestamp")),
+            confirmation_time=parse_time(data.get("processed_at") or data.get("timestamp")),
+        )
+
+    def _payment_failed(self, data: Dict[str, Any]):
+        self._payment(data, status="failed", payment_date=parse_time(data.get("failed_at") or data.get("timestamp")))
+
+    def _material_accessed(self, data: Dict[str, Any]):
+        if data.get("material_id") is None or data.get("user_id") is None:
+            return
+        self.material_rows.append({
+            "material_id": str(data["material_id"]),
+            "user_id": str(data["user_id"]),
+            "material_type": data.get("material_type") or "unknown",
+            "access_method": data.get("access_type"),
+            "access_date": parse_time(data.get("accessed_at")),
+        })
@@ -6,7 +6,9 @@ Consumes events from RabbitMQ and updates analytics data
 import json
 import asyncio
 import logging
-from typing import Dict, Any, Callable
+import time
+from collections import Counter
+from typing import Dict, Any, Callable, List, Optional
 from datetime import datetime
 import aio_pika
 from aio_pika import connect, Message
@@ -14,12 +16,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, select
 import os
 
+from shared.reliable_consumer import DeadLetterTopology, ReliableConsumer
+
+from ..core.config import settings
 from ..database import get_db_session
 from ..models import User, Lesson, Payment, Homework, Material
 from ..services.lesson_analytics import LessonAnalyticsService
 from ..services.payment_analytics import PaymentAnalyticsService
 from ..services.user_analytics import UserAnalyticsService
 from ..services.material_analytics import MaterialAnalyticsService
+from .batch_writer import AnalyticsBatchWriter
 
 logger = logging.getLogger(__name__)
 
@@ -31,12 +37,32 @@ class AnalyticsEventConsumer:
         self.channel = None
         self.queues = {}
         
+        # Delayed retries and quarantine (dlq.analytics.events)
+        self.reliable = ReliableConsumer(DeadLetterTopology("analytics", "analytics.events"))
+        
         # Services
         self.lesson_service = LessonAnalyticsService()
         self.payment_service = PaymentAnalyticsService()
         self.user_service = UserAnalyticsService()
         self.material_service = MaterialAnalyticsService()
         
+        # Batch mode: messages are buffered and applied as one transaction per micro-batch
+        self.batch_mode = settings.EVENT_CONSUMER_MODE == "batch"
+        self.batch_size = settings.EVENT_BATCH_SIZE
+        self.batch_max_wait = settings.EVENT_BATCH_MAX_WAIT_MS / 1000
+        self.batch_writer = AnalyticsBatchWriter()
+        self._buffer: List[aio_pika.IncomingMessage] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        
+        # Batch metrics
+        self.batches = 0
+        self.events_applied = 0
+        self.events_failed = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+        self.events_by_key: Counter = Counter()
+        
         # Event handlers mapping
         self.event_handlers = {
             "lesson.completed": self.handle_lesson_completed,
@@ -60,8 +86,9 @@ class AnalyticsEventConsumer:
             self.connection = await connect(rabbitmq_url)
             self.channel = await self.connection.channel()
             
-            # Set QoS for fair dispatch
-            await self.channel.set_qos(prefetch_count=1)
+            # Batch mode needs enough unacked messages in flight to fill a batch
+            prefetch_count = settings.EVENT_CONSUMER_PREFETCH if self.batch_mode else 1
+            await self.channel.set_qos(prefetch_count=max(prefetch_count, 1))
             
             logger.info("Connected to RabbitMQ for analytics events")
             
@@ -94,6 +121,7 @@ class AnalyticsEventConsumer:
             for routing_key in routing_keys:
                 await analytics_queue.bind(analytics_exchange, routing_key)
             
+            await self.reliable.declare(self.channel, analytics_queue)
             self.queues["analytics"] = analytics_queue
             
             logger.info("Analytics queues and bindings setup complete")
@@ -109,34 +137,104 @@ class AnalyticsEventConsumer:
             await self.setup_queues()
             
             # Start consuming from analytics queue
-            await self.queues["analytics"].consume(self.process_message)
+            callback = self.collect_message if self.batch_mode else self.reliable.wrap(self.process_message)
+            await self.queues["analytics"].consume(callback)
             
-            logger.info("Started consuming analytics events")
+            logger.info(f"Started consuming analytics events ({'batch' if self.batch_mode else 'single'} mode)")
             
         except Exception as e:
             logger.error(f"Failed to start consuming: {str(e)}")
             raise
 
     async def process_message(self, message: aio_pika.IncomingMessage):
-        """Process incoming event message"""
-        async with message.process():
+        """Process incoming event message (errors are retried, then quarantined)"""
+        # Parse message
+        event_data = json.loads(message.body.decode())
+        event_type = message.routing_key
+        
+        logger.info(f"Processing analytics event: {event_type}")
+        
+        # Get handler for event type
+        handler = self.event_handlers.get(event_type)
+        if handler:
+            await handler(event_data)
+        else:
+            logger.warning(f"No handler found for event type: {event_type}")
+
+    async def collect_message(self, message: aio_pika.IncomingMessage):
+        """Buffer incoming message; flush when the batch is full or after max wait"""
+        self._buffer.append(message)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush_batch()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self.batch_max_wait, lambda: asyncio.create_task(self.flush_batch())
+            )
+
+    async def flush_batch(self):
+        """
+        Apply buffered messages in one transaction and ack them with a single multiple-ack.
+        Batches are applied one at a time in delivery order, so later events for the same
+        lesson or payment always win
+        """
+        async with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+
+            started = time.monotonic()
+            messages, events = [], []
+            for message in batch:
+                try:
+                    events.append((message.routing_key, json.loads(message.body.decode())))
+                    messages.append(message)
+                except ValueError as e:
+                    await self.reliable.quarantine(message, e, "batch")
+                    self.events_failed += 1
+
+            if messages:
+                try:
+                    counts = await self.batch_writer.apply(events)
+                    await messages[-1].ack(multiple=True)
+                    self.events_by_key.update(counts)
+                    self.events_applied += len(messages)
+                except Exception as e:
+                    logger.warning(f"Batch of {len(messages)} analytics events failed, applying one by one: {str(e)}")
+                    await self._apply_individually(messages, events)
+
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.last_batch_seconds = time.monotonic() - started
+            self.reliable.handler_stats("batch").observe(self.last_batch_seconds)
+
+    async def _apply_individually(self, messages: List[aio_pika.IncomingMessage], events: List[tuple]):
+        """Isolate failing events of a batch: each one is retried with backoff, then quarantined"""
+        for message, event in zip(messages, events):
             try:
-                # Parse message
-                event_data = json.loads(message.body.decode())
-                event_type = message.routing_key
-                
-                logger.info(f"Processing analytics event: {event_type}")
-                
-                # Get handler for event type
-                handler = self.event_handlers.get(event_type)
-                if handler:
-                    await handler(event_data)
-                else:
-                    logger.warning(f"No handler found for event type: {event_type}")
-                
+                counts = await self.batch_writer.apply([event])
+                await message.ack()
+                self.events_by_key.update(counts)
+                self.events_applied += 1
             except Exception as e:
-                logger.error(f"Error processing message: {str(e)}")
-                # Message will be requeued due to exception
+                await self.reliable.fail(message, e, "batch")
+                self.events_failed += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Consumer throughput metrics"""
+        return {
+            "mode": "batch" if self.batch_mode else "single",
+            "buffered": len(self._buffer),
+            "batches": self.batches,
+            "events_applied": self.events_applied,
+            "events_failed": self.events_failed,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_seconds": round(self.last_batch_seconds, 4),
+            "events_by_key": dict(self.events_by_key),
+            "reliability": self.reliable.get_metrics(),
+        }
 
     async def handle_lesson_completed(self, event_data: Dict[str, Any]):
         """Handle lesson completion event"""
@@ -421,6 +519,8 @@ class AnalyticsEventConsumer:
 
     async def close(self):
         """Close connection"""
+        if self.batch_mode and self.channel:
+            await self.flush_batch()
         if self.connection:
             await self.connection.close()
             logger.info("Analytics event consumer connection closed")
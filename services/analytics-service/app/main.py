@@ -4,6 +4,7 @@ FastAPI app for analytics and reporting functionality
 """
 
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
@@ -12,6 +13,8 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
+from shared.token_validator import get_token_validator
+
 from .api.v1.router import router as api_v1_router
 from .database import engine
 from .models import Base
@@ -33,12 +36,18 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
+    # Revocation list for in-process token validation
+    token_validator = get_token_validator()
+    revocation_sync = asyncio.create_task(token_validator.start_sync())
+    
     logger.info("Analytics Service started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down Analytics Service...")
+    revocation_sync.cancel()
+    await token_validator.close()
     await engine.dispose()
     logger.info("Analytics Service shut down complete")
 
@@ -0,0 +1,87 @@
+"""
+Tests for merging a batch of analytics events into a BatchPlan
+"""
+
+from datetime import datetime
+
+from app.events.batch_plan import BatchPlan, event_payload, parse_time
+
+
+def test_lesson_updates_merge_in_delivery_order():
+    plan = BatchPlan()
+    plan.add("lesson.created", {"lesson_id": 7, "tutor_id": 1, "student_id": 2,
+                                "scheduled_at": "2024-05-01T10:00:00Z", "duration_minutes": 60})
+    plan.add("lesson.completed", {"lesson_id": 7, "student_id": 2, "rating": 5,
+                                  "completed_at": "2024-05-01T11:00:00", "duration_minutes": 55})
+
+    assert list(plan.lessons) == ["7"]
+    lesson = plan.lessons["7"]
+    assert lesson["status"] == "completed"
+    assert lesson["tutor_id"] == "1"
+    assert lesson["student_id"] == "2"
+    assert lesson["planned_duration"] == 60
+    assert lesson["duration_minutes"] == 55
+    assert lesson["student_rating"] == 5
+    assert lesson["date"] == datetime(2024, 5, 1, 10, 0)
+
+
+def test_last_event_for_entity_wins():
+    plan = BatchPlan()
+    plan.add("lesson.completed", {"lesson_id": 3})
+    plan.add("lesson.cancelled", {"lesson_id": 3})
+    plan.add("payment.failed", {"payment_id": 9, "student_id": 4, "amount": "100"})
+    plan.add("payment.processed", {"payment_id": 9, "amount": 150, "payment_method": "card"})
+
+    assert plan.lessons["3"]["status"] == "cancelled"
+    assert plan.lessons["3"]["is_cancelled"] is True
+    payment = plan.payments["9"]
+    assert payment["status"] == "completed"
+    assert payment["user_id"] == "4"
+    assert payment["amount"] == 150.0
+    assert payment["payment_method"] == "card"
+
+
+def test_activity_counters_are_summed_per_user_and_day():
+    plan = BatchPlan()
+    plan.add("user.login", {"user_id": 1, "login_time": "2024-05-01T08:00:00"})
+    plan.add("user.login", {"user_id": 1, "login_time": "2024-05-01T20:00:00"})
+    plan.add("user.login", {"user_id": 1, "login_time": "2024-05-02T08:00:00"})
+    plan.add("homework.submitted", {"student_id": 1, "submitted_at": "2024-05-01T09:00:00"})
+
+    day = datetime(2024, 5, 1)
+    assert plan.activity[("1", day)] == {"login_count": 2, "homeworks_submitted": 1}
+    assert plan.activity[("1", datetime(2024, 5, 2))] == {"login_count": 1}
+    assert plan.counts["user.login"] == 3
+
+
+def test_material_access_adds_row_and_counter():
+    plan = BatchPlan()
+    plan.add("material.accessed", {"material_id": 5, "user_id": 2, "access_type": "download",
+                                   "accessed_at": "2024-05-01T12:00:00"})
+    plan.add("material.accessed", {"material_id": 5})
+
+    assert plan.material_rows == [{
+        "material_id": "5",
+        "user_id": "2",
+        "material_type": "unknown",
+        "access_method": "download",
+        "access_date": datetime(2024, 5, 1, 12, 0),
+    }]
+    assert plan.activity[("2", datetime(2024, 5, 1))] == {"materials_accessed": 1}
+
+
+def test_unknown_events_are_skipped():
+    plan = BatchPlan()
+    plan.add("user.deleted", {"user_id": 1})
+    plan.add("lesson.created", {"tutor_id": 1})
+
+    assert plan.skipped == 1
+    assert plan.lessons == {}
+    assert plan.counts == {"lesson.created": 1}
+
+
+def test_envelope_is_unwrapped():
+    envelope = {"event_type": "lesson.cancelled", "service": "lesson-service", "data": {"lesson_id": 1}}
+    assert event_payload(envelope) == {"lesson_id": 1}
+    assert event_payload({"lesson_id": 1, "data": {"x": 1}}) == {"lesson_id": 1, "data": {"x": 1}}
+    assert parse_time("2024-05-01T10:00:00+03:00") == datetime(2024, 5, 1, 10, 0)
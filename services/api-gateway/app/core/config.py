@@ -25,11 +25,16 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    JWT_CACHE_SIZE: int = 10000              # Проверенных токенов в кэше Gateway
+    REVOCATION_SYNC_INTERVAL: int = 5        # Как часто забирать новые отзывы из Auth Service
+    REVOCATION_SNAPSHOT_INTERVAL: int = 600  # Как часто забирать полный снимок отзывов
+    REVOCATION_MAX_STALENESS: int = 30       # Дольше без синхронизации - каждый токен проверяется в Auth Service
     
     # Redis для кеширования и rate limiting
     REDIS_URL: str = "redis://redis:6379/6"
     
     # URLs микросервисов
+    AUTH_SERVICE_URL: str = "http://auth-service:8002"
     USER_SERVICE_URL: str = "http://user-service:8001"
     LESSON_SERVICE_URL: str = "http://lesson-service:8002"
     HOMEWORK_SERVICE_URL: str = "http://homework-service:8003"
@@ -65,6 +70,23 @@ class Settings(BaseSettings):
     RATE_LIMIT_REQUESTS: int = 100  # Запросов на пользователя
     RATE_LIMIT_WINDOW: int = 60     # Окно в секундах
     RATE_LIMIT_BURST: int = 20      # Всплеск запросов
+    RATE_LIMIT_BACKEND: str = "memory"  # memory, redis (общие лимиты для всех реплик)
+    RATE_LIMIT_ROLE_LIMITS: Dict[str, int] = {
+        # Запросов за окно для авторизованных пользователей по ролям
+        "admin": 600,
+        "tutor": 300,
+        "student": 100,
+        "parent": 100,
+    }
+    RATE_LIMIT_ROUTE_COSTS: Dict[str, int] = {
+        # Вес запроса по префиксу пути (по умолчанию 1)
+        "/auth/login": 5,
+        "/api/v1/auth/login": 5,
+        "/api/v1/analytics": 3,
+        "/api/v1/reports": 3,
+        "/api/v1/files": 2,
+        "/api/v1/materials/upload": 5,
+    }
     
     # Circuit breaker настройки
     CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5    # Порог ошибок
@@ -85,7 +107,7 @@ class Settings(BaseSettings):
     HEALTH_CHECK_TIMEOUT: int = 5    # Таймаут проверки
     
     # Load balancing настройки
-    LOAD_BALANCING_STRATEGY: str = "round_robin"  # round_robin, least_connections, random
+    LOAD_BALANCING_STRATEGY: str = "round_robin"  # round_robin, least_outstanding (least_connections), ewma
     SERVICE_INSTANCES: Dict[str, List[str]] = {
         # Можно добавить несколько инстансов каждого сервиса
         "user-service": ["http://user-service:8001"],
@@ -123,6 +145,10 @@ class Settings(BaseSettings):
     CACHE_TTL_USERS: int = 600       # 10 минут
     CACHE_TTL_LESSONS: int = 1800    # 30 минут
     CACHE_TTL_MATERIALS: int = 3600  # 1 час
+    RESPONSE_CACHE_BACKEND: str = "memory"         # memory, redis (второй уровень, общий для реплик)
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000         # Записей в памяти процесса
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 524288   # Ответы больше не кэшируются
+    RESPONSE_CACHE_STALE_SECONDS: int = 600        # Сколько хранить устаревшие записи с ETag для перепроверки
     
     class Config:
         env_file = ".env"
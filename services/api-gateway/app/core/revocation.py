@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Revocation Filter for API Gateway
+Локальная копия отозванных токенов Auth Service: bloom filter из полного снимка плюс
+точный набор jti, отозванных после него. Проверка отзыва — поиск по хэшу без обращения
+к Auth Service и БД; к Auth Service идем только при срабатывании bloom filter.
+Пока снимок не загружен или синхронизация не удается дольше REVOCATION_MAX_STALENESS,
+каждый токен проверяется в Auth Service, а при его недоступности отклоняется
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set
+
+import httpx
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Bloom filter по jti. Формат и схема хэширования совпадают с BloomFilter
+    в Auth Service (app/core/revocation.py)
+    """
+
+    def __init__(self, size: int, hashes: int, bits: bytes = None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BloomFilter":
+        return cls(data["size"], data["hashes"], base64.b64decode(data["bits"]))
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """Отозванные jti, синхронизируемые с Auth Service в фоне"""
+
+    def __init__(self, auth_service_url: str = None, sync_interval: float = None,
+                 snapshot_interval: float = None, confirmed_size: int = 10000,
+                 max_staleness: float = None):
+        self.auth_service_url = auth_service_url or settings.AUTH_SERVICE_URL
+        self.sync_interval = sync_interval or settings.REVOCATION_SYNC_INTERVAL
+        self.snapshot_interval = snapshot_interval or settings.REVOCATION_SNAPSHOT_INTERVAL
+        self.max_staleness = max_staleness or settings.REVOCATION_MAX_STALENESS
+        self.bloom: Optional[BloomFilter] = None
+        self.recent: Set[str] = set()  # Отозваны после последнего снимка
+        # Результаты проверки в Auth Service для срабатываний bloom filter: jti -> отозван ли
+        self.confirmed: "OrderedDict[str, bool]" = OrderedDict()
+        self.confirmed_size = confirmed_size
+        self.cursor: Optional[str] = None
+        self.last_snapshot = 0.0
+        self.last_sync: Optional[float] = None
+        self.bloom_hits = 0
+        self.confirmations = 0
+        self.sync_errors = 0
+        self.stale_checks = 0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.auth_service_url, timeout=5.0)
+        return self._client
+
+    @property
+    def is_stale(self) -> bool:
+        """Снимок не загружен или последняя успешная синхронизация старше max_staleness"""
+        return self.bloom is None or self.last_sync is None or time.time() - self.last_sync > self.max_staleness
+
+    def check(self, jti: str) -> Optional[bool]:
+        """
+        True — токен отозван, False — не отозван,
+        None — сработал bloom filter или локальная копия устарела, нужна проверка через confirm()
+        """
+        if jti in self.recent:
+            return True
+        if self.is_stale:
+            # Отзывы могли пройти мимо фильтра: проверяем в Auth Service (fail closed)
+            self.stale_checks += 1
+            return None
+        if jti not in self.bloom:
+            return False
+        self.bloom_hits += 1
+        return self.confirmed.get(jti)
+
+    async def confirm(self, jti: str, token: str) -> bool:
+        """Проверка токена в Auth Service (ложное срабатывание bloom filter или реальный отзыв)"""
+        self.confirmations += 1
+        try:
+            response = await self._get_client().post(
+                "/api/v1/auth/internal/validate-token", json={"token": token}
+            )
+            response.raise_for_status()
+            revoked = not response.json().get("valid", False)
+        except Exception as e:
+            # Не можем подтвердить — считаем отозванным
+            logger.warning(f"Revocation check for token {jti} failed: {e}")
+            return True
+        self.confirmed[jti] = revoked
+        while len(self.confirmed) > self.confirmed_size:
+            self.confirmed.popitem(last=False)
+        return revoked
+
+    def apply_feed(self, feed: Dict[str, Any]):
+        """Применяет ответ /internal/revocations"""
+        if feed.get("full"):
+            self.bloom = BloomFilter.from_dict(feed["bloom"])
+            self.recent = set()
+            self.confirmed.clear()
+            self.last_snapshot = time.monotonic()
+        else:
+            for jti in feed.get("revoked", []):
+                self.recent.add(jti)
+                self.confirmed.pop(jti, None)
+        self.cursor = feed["cursor"]
+        self.last_sync = time.time()
+
+    async def sync(self):
+        """Забирает новые отзывы; периодически — полный снимок, чтобы истекшие токены уходили из фильтра"""
+        full = self.cursor is None or time.monotonic() - self.last_snapshot >= self.snapshot_interval
+        params = None if full else {"since": self.cursor}
+        response = await self._get_client().get("/api/v1/auth/internal/revocations", params=params)
+        response.raise_for_status()
+        self.apply_feed(response.json())
+
+    async def start_sync(self):
+        """Фоновая синхронизация с Auth Service"""
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.sync_errors += 1
+                logger.warning(f"Revocation sync with auth service failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "snapshot_loaded": self.bloom is not None,
+            "stale": self.is_stale,
+            "stale_checks": self.stale_checks,
+            "recent_revocations": len(self.recent),
+            "bloom_hits": self.bloom_hits,
+            "confirmations": self.confirmations,
+            "sync_errors": self.sync_errors,
+            "last_sync": self.last_sync,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Глобальный экземпляр фильтра
+_revocation_filter: Optional[RevocationFilter] = None
+
+def get_revocation_filter() -> RevocationFilter:
+    """Получение глобального экземпляра фильтра отзывов"""
+    global _revocation_filter
+    if _revocation_filter is None:
+        _revocation_filter = RevocationFilter()
+    return _revocation_filter
@@ -3,15 +3,19 @@
 Security utilities for API Gateway
 Утилиты безопасности для API Gateway
 """
+import hashlib
 import logging
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-from fastapi import HTTPException, status, Request
+from typing import Optional, Dict, Any, Tuple
+from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from pydantic import BaseModel
 
 from .config import settings
+from .revocation import get_revocation_filter
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +25,8 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[str] = None
     scopes: list = []
+    jti: Optional[str] = None
+    expires_at: Optional[float] = None
 
 class TokenResponse(BaseModel):
     access_token: str
@@ -81,11 +87,18 @@ class JWTHandler:
             if exp is None or datetime.fromtimestamp(exp) < datetime.utcnow():
                 raise JWTError("Token expired")
             
+            # Токены Auth Service передают пользователя в sub
+            user_id = payload.get("user_id")
+            if user_id is None and payload.get("sub") is not None:
+                user_id = int(payload["sub"])
+            
             return TokenData(
-                user_id=payload.get("user_id"),
+                user_id=user_id,
                 username=payload.get("username"),
                 role=payload.get("role", "user"),
-                scopes=payload.get("scopes", [])
+                scopes=payload.get("scopes", []),
+                jti=payload.get("jti"),
+                expires_at=exp
             )
             
         except JWTError as e:
@@ -110,8 +123,78 @@ class JWTHandler:
         
         return self.create_access_token(new_token_data)
 
-# Глобальный экземпляр
+class TokenClaimsCache:
+    """
+    LRU кэш проверенных access токенов: sha256 токена -> TokenData.
+    Запись живет не дольше exp токена, поэтому повторная проверка подписи не нужна
+    """
+    
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, TokenData]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[TokenData]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, key: str, token_data: TokenData):
+        if token_data.expires_at is None:
+            return
+        self._entries[key] = (float(token_data.expires_at), token_data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+# Глобальные экземпляры
 jwt_handler = JWTHandler()
+token_claims_cache = TokenClaimsCache(settings.JWT_CACHE_SIZE)
+
+def verify_jwt_token(token: str) -> TokenData:
+    """Проверка подписи и срока access токена; проверенные токены берутся из кэша"""
+    key = TokenClaimsCache.token_key(token)
+    token_data = token_claims_cache.get(key)
+    if token_data is None:
+        token_data = jwt_handler.verify_token(token)
+        token_claims_cache.put(key, token_data)
+    return token_data
+
+async def authenticate_token(token: str) -> TokenData:
+    """Проверка access токена с учетом отозванных токенов Auth Service"""
+    token_data = verify_jwt_token(token)
+    if token_data.jti:
+        revocation_filter = get_revocation_filter()
+        revoked = revocation_filter.check(token_data.jti)
+        if revoked is None:
+            revoked = await revocation_filter.confirm(token_data.jti, token)
+        if revoked:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    return token_data
 
 async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = None) -> Optional[TokenData]:
     """Получение текущего пользователя из токена"""
@@ -148,6 +231,17 @@ async def require_role(required_role: str, user: TokenData) -> TokenData:
         )
     return user
 
+async def require_admin(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> TokenData:
+    """Dependency для административных endpoint'ов Gateway"""
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await authenticate_token(credentials.credentials)
+    return await require_role("admin", user)
+
 async def require_scope(required_scope: str, user: TokenData) -> TokenData:
     """Проверка области доступа"""
     if required_scope not in user.scopes and "all" not in user.scopes:
@@ -16,15 +16,20 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
 
 from .core.config import get_settings
-from .core.security import verify_token
+from .core.security import verify_token, token_claims_cache
+from .core.revocation import get_revocation_filter
 from .middleware.auth_middleware import AuthMiddleware
 from .middleware.rate_limit_middleware import RateLimitMiddleware
 from .middleware.logging_middleware import LoggingMiddleware
 from .routes.proxy_routes import router as proxy_router
 from .routes.auth_routes import router as auth_router
 from .routes.health_routes import router as health_router
-from .services.service_registry import ServiceRegistry
-from .services.circuit_breaker import CircuitBreakerManager
+from .routes.admin_routes import router as admin_router
+from .services.service_registry import get_service_registry
+from .services.upstream_pool import get_upstream_pool
+from .services.rate_limiter import get_rate_limiter
+from .services.response_cache import get_response_cache
+from .services.circuit_breaker import get_circuit_breaker_manager
 from .utils.proxy_utils import ProxyUtils
 
 # Настройка логирования
@@ -35,8 +40,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Глобальные сервисы
-service_registry = ServiceRegistry()
-circuit_breaker_manager = CircuitBreakerManager()
+service_registry = get_service_registry()  # Тот же экземпляр, что используют proxy routes
+upstream_pool = get_upstream_pool()
+rate_limiter = get_rate_limiter()
+response_cache = get_response_cache()
+revocation_filter = get_revocation_filter()
+circuit_breaker_manager = get_circuit_breaker_manager()  # Тот же экземпляр, что выбирает экземпляры сервисов
 proxy_utils = ProxyUtils()
 
 @asynccontextmanager
@@ -49,13 +58,17 @@ async def lifespan(app: FastAPI):
     await service_registry.initialize()
     logger.info("Service registry initialized")
     
+    # Создаем постоянные пулы соединений к сервисам
+    await upstream_pool.startup()
+    
     # Инициализируем circuit breakers
-    circuit_breaker_manager.initialize()
+    circuit_breaker_manager.initialize(service_registry.get_breaker_names())
     logger.info("Circuit breakers initialized")
     
     # Запускаем фоновые задачи
     health_check_task = asyncio.create_task(service_registry.start_health_checks())
     metrics_task = asyncio.create_task(circuit_breaker_manager.start_metrics_collection())
+    revocation_task = asyncio.create_task(revocation_filter.start_sync())
     
     try:
         yield
@@ -66,6 +79,7 @@ async def lifespan(app: FastAPI):
         # Останавливаем фоновые задачи
         health_check_task.cancel()
         metrics_task.cancel()
+        revocation_task.cancel()
         
         try:
             await health_check_task
@@ -77,6 +91,15 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
         
+        try:
+            await revocation_task
+        except asyncio.CancelledError:
+            pass
+        
+        await upstream_pool.close()
+        await rate_limiter.close()
+        await response_cache.close()
+        await revocation_filter.close()
         await service_registry.cleanup()
         logger.info("API Gateway shutdown complete")
 
@@ -109,7 +132,7 @@ app.add_middleware(
 
 # Добавляем middleware
 app.add_middleware(LoggingMiddleware)
-app.add_middleware(RateLimitMiddleware)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 app.add_middleware(AuthMiddleware)
 
 # Middleware для добавления заголовков
@@ -175,6 +198,7 @@ async def general_exception_handler(request: Request, exc: Exception):
 # Подключение роутеров
 app.include_router(health_router, prefix="/health", tags=["health"])
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
+app.include_router(admin_router, prefix="/gateway/admin", tags=["admin"])
 app.include_router(proxy_router, prefix="", tags=["proxy"])
 
 # Корневой endpoint
@@ -265,6 +289,13 @@ async def gateway_metrics():
         "circuit_breakers": {
             service_name: breaker.get_metrics()
             for service_name, breaker in circuit_breaker_manager.get_all_breakers().items()
+        },
+        "upstream_pools": upstream_pool.get_metrics(),
+        "rate_limiting": rate_limiter.get_metrics(),
+        "response_cache": response_cache.get_metrics(),
+        "auth": {
+            "token_cache": token_claims_cache.get_metrics(),
+            "revocations": revocation_filter.get_metrics()
         }
     }
 
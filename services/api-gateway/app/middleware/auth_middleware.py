@@ -8,7 +8,7 @@ from starlette.responses import Response, JSONResponse
 import logging
 from typing import Optional
 
-from ..core.security import verify_jwt_token
+from ..core.security import authenticate_token
 
 logger = logging.getLogger(__name__)
 
@@ -60,7 +60,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
         user_data = None
         if token:
             try:
-                user_data = verify_jwt_token(token)
+                user_data = await authenticate_token(token)
                 # Добавляем информацию о пользователе в request
                 request.state.user = user_data
                 request.state.authenticated = True
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Admin Routes for API Gateway
+Управление экземплярами сервисов во время работы
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field
+import logging
+
+from ..core.security import require_admin
+from ..services.service_registry import get_service_registry
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+logger = logging.getLogger(__name__)
+
+class InstanceRequest(BaseModel):
+    url: str = Field(..., description="Базовый URL экземпляра, например http://lesson-service-2:8002")
+
+def get_service_or_404(service_name: str):
+    registry = get_service_registry()
+    if service_name not in registry.services:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Service {service_name} not found"
+        )
+    return registry
+
+@router.get("/services/{service_name}/instances")
+async def list_instances(service_name: str):
+    """Экземпляры сервиса с их состоянием и нагрузкой"""
+    registry = get_service_or_404(service_name)
+    return {
+        "service": service_name,
+        "strategy": registry.services[service_name]["strategy"],
+        "instances": registry.get_instances(service_name)
+    }
+
+@router.post("/services/{service_name}/instances", status_code=status.HTTP_201_CREATED)
+async def add_instance(service_name: str, request: InstanceRequest):
+    """Добавление экземпляра сервиса (сразу проходит проверку здоровья)"""
+    registry = get_service_or_404(service_name)
+    if not request.url.startswith(("http://", "https://")):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Instance URL must start with http:// or https://"
+        )
+    instance = await registry.add_instance(service_name, request.url)
+    return instance.to_dict()
+
+@router.delete("/services/{service_name}/instances")
+async def remove_instance(service_name: str, url: str):
+    """Удаление экземпляра сервиса"""
+    registry = get_service_or_404(service_name)
+    if not await registry.remove_instance(service_name, url):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Instance {url} not found in {service_name}"
+        )
+    return {"service": service_name, "removed": url}
@@ -4,15 +4,19 @@ Proxy Routes for API Gateway
 Маршрутизация запросов к микросервисам
 """
 from fastapi import APIRouter, Request, Depends, HTTPException, status
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 import asyncio
+import time
 
 from ..core.config import get_settings
 from ..services.service_registry import get_service_registry
 from ..services.circuit_breaker import get_circuit_breaker_manager
+from ..services.upstream_pool import get_upstream_pool
+from ..services.response_cache import get_response_cache
 from ..core.security import verify_token_optional
 from ..utils.proxy_utils import ProxyUtils
 
@@ -20,6 +24,15 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 # Service mapping configuration
+# "stream": True — тело запроса и ответа передается потоком, без буферизации в памяти Gateway
+# (для файлов, отчетов и графиков; ответы таких маршрутов не преобразуются).
+# "stream": {"files", ...} — потоком идут только пути с одним из этих сегментов после префикса
+# (/api/v1/materials/5/files), остальные запросы маршрута проксируются обычным образом.
+# Потоковые пути принимают HEAD и передают сервису Range и условные заголовки (206/304)
+# "cache": {"ttl": секунды, "vary": "none" | "role" | "user"} — GET ответы кэшируются в Gateway
+# (один ответ для всех, для роли или для каждого пользователя). Любой POST/PUT/PATCH/DELETE через
+# Gateway к сервису, в том числе потоковый и к маршруту без "cache", после ответа upstream сбрасывает
+# все кэшированные ответы этого сервиса. Маршрут выбирается по самому длинному совпавшему префиксу
 SERVICE_ROUTES = {
     # User Service
     "/api/v1/users": {"service": "user-service", "port": 8001, "strip_prefix": False},
@@ -30,7 +43,8 @@ SERVICE_ROUTES = {
     "/api/v1/schedule": {"service": "lesson-service", "port": 8002, "strip_prefix": False},
     
     # Homework Service
-    "/api/v1/homework": {"service": "homework-service", "port": 8003, "strip_prefix": False},
+    "/api/v1/homework": {"service": "homework-service", "port": 8003, "strip_prefix": False,
+                         "stream": {"files", "download"}},
     "/api/v1/assignments": {"service": "homework-service", "port": 8003, "strip_prefix": False},
     
     # Payment Service
@@ -39,23 +53,33 @@ SERVICE_ROUTES = {
     "/api/v1/balance": {"service": "payment-service", "port": 8004, "strip_prefix": False},
     
     # Material Service
-    "/api/v1/materials": {"service": "material-service", "port": 8005, "strip_prefix": False},
-    "/api/v1/library": {"service": "material-service", "port": 8005, "strip_prefix": False},
-    "/api/v1/files": {"service": "material-service", "port": 8005, "strip_prefix": False},
+    "/api/v1/materials": {"service": "material-service", "port": 8005, "strip_prefix": False,
+                          "stream": {"files", "uploads"}},
+    "/api/v1/materials/grade": {"service": "material-service", "port": 8005, "strip_prefix": False,
+                                "cache": {"ttl": 300, "vary": "none"}},
+    "/api/v1/library": {"service": "material-service", "port": 8005, "strip_prefix": False,
+                        "cache": {"ttl": 300, "vary": "none"}},
+    "/api/v1/files": {"service": "material-service", "port": 8005, "strip_prefix": False,
+                      "stream": {"download"}},
+    # Части resumable загрузок (PUT /api/v1/uploads/{upload_id}?offset=...) идут потоком
+    "/api/v1/uploads": {"service": "material-service", "port": 8005, "strip_prefix": False, "stream": True},
     
     # Notification Service
     "/api/v1/notifications": {"service": "notification-service", "port": 8006, "strip_prefix": False},
     "/api/v1/messages": {"service": "notification-service", "port": 8006, "strip_prefix": False},
     
     # Analytics Service
-    "/api/v1/analytics": {"service": "analytics-service", "port": 8007, "strip_prefix": False},
-    "/api/v1/reports": {"service": "analytics-service", "port": 8007, "strip_prefix": False},
-    "/api/v1/charts": {"service": "analytics-service", "port": 8007, "strip_prefix": False},
+    "/api/v1/analytics": {"service": "analytics-service", "port": 8007, "strip_prefix": False,
+                          "cache": {"ttl": 60, "vary": "user"}},
+    "/api/v1/reports": {"service": "analytics-service", "port": 8007, "strip_prefix": False, "stream": True},
+    "/api/v1/charts": {"service": "analytics-service", "port": 8007, "strip_prefix": False, "stream": True},
     
     # Student Service
-    "/api/v1/students": {"service": "student-service", "port": 8008, "strip_prefix": False},
+    "/api/v1/students": {"service": "student-service", "port": 8008, "strip_prefix": False,
+                         "cache": {"ttl": 30, "vary": "user"}},
     "/api/v1/achievements": {"service": "student-service", "port": 8008, "strip_prefix": False},
-    "/api/v1/gamification": {"service": "student-service", "port": 8008, "strip_prefix": False},
+    "/api/v1/gamification": {"service": "student-service", "port": 8008, "strip_prefix": False,
+                             "cache": {"ttl": 60, "vary": "role"}},
     "/api/v1/progress": {"service": "student-service", "port": 8008, "strip_prefix": False},
 }
 
@@ -67,6 +91,7 @@ PROTECTED_ROUTES = [
     "/api/v1/homework",
     "/api/v1/payments",
     "/api/v1/materials",
+    "/api/v1/uploads",
     "/api/v1/notifications",
     "/api/v1/analytics",
     "/api/v1/students",
@@ -84,59 +109,68 @@ def get_proxy_utils() -> ProxyUtils:
     """Dependency для получения ProxyUtils"""
     return ProxyUtils()
 
-async def route_request(
+# Заголовки, которые относятся к конкретному соединению и не передаются дальше
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade"}
+
+# Заголовки докачки и повторной проверки, которые потоковые маршруты передают сервису
+CONDITIONAL_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+
+# Префиксы от длинных к коротким: /api/v1/materials/grade раньше /api/v1/materials
+ROUTE_PREFIXES = sorted(SERVICE_ROUTES, key=len, reverse=True)
+
+def find_route(path: str) -> Optional[tuple]:
+    """Возвращает (префикс, конфигурация) маршрута для пути или None"""
+    for route_prefix in ROUTE_PREFIXES:
+        if path.startswith(route_prefix):
+            return route_prefix, SERVICE_ROUTES[route_prefix]
+    return None
+
+def is_stream_route(route: tuple, path: str) -> bool:
+    """Передается ли запрос потоком: весь маршрут или путь с одним из сегментов из stream"""
+    route_prefix, target_config = route
+    stream = target_config.get("stream")
+    if stream is True:
+        return True
+    if not stream:
+        return False
+    return any(segment in stream for segment in path[len(route_prefix):].split("/"))
+
+async def prepare_upstream_request(
     path: str,
-    method: str,
     headers: Dict[str, str],
     query_params: str,
-    body: bytes,
     user_data: Optional[Dict[str, Any]] = None
-) -> httpx.Response:
-    """Маршрутизация запроса к соответствующему сервису"""
+):
+    """
+    Находит сервис для маршрута, выбирает его экземпляр и готовит запрос к нему.
+    Возвращает (имя сервиса, экземпляр, circuit breaker экземпляра, полный URL, заголовки).
+    """
     
     # Находим подходящий сервис для маршрута
-    target_service = None
-    target_config = None
-    
-    for route_prefix, config in SERVICE_ROUTES.items():
-        if path.startswith(route_prefix):
-            target_service = config["service"]
-            target_config = config
-            break
-    
-    if not target_service:
+    route = find_route(path)
+    if not route:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Service not found for path: {path}"
         )
+    route_prefix, target_config = route
+    target_service = target_config["service"]
     
-    # Получаем registry и circuit breaker manager
+    # Выбираем здоровый экземпляр с закрытым circuit breaker
     registry = get_service_registry()
-    cb_manager = get_circuit_breaker_manager()
-    
-    # Проверяем circuit breaker
-    circuit_breaker = cb_manager.get_breaker(target_service)
-    if circuit_breaker.is_open():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Service {target_service} is currently unavailable"
-        )
-    
-    # Получаем URL сервиса
-    service_url = await registry.get_service_url(target_service)
-    if not service_url:
+    instance = registry.select_instance(target_service)
+    if instance is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Service {target_service} is not available"
         )
+    circuit_breaker = get_circuit_breaker_manager().get_breaker(instance.breaker_name)
+    service_url = instance.url
     
     # Формируем полный URL
     target_path = path
     if target_config.get("strip_prefix"):
-        for prefix in SERVICE_ROUTES.keys():
-            if path.startswith(prefix):
-                target_path = path[len(prefix):]
-                break
+        target_path = path[len(route_prefix):]
     
     full_url = f"{service_url}{target_path}"
     if query_params:
@@ -161,18 +195,39 @@ async def route_request(
     if auth_header:
         forwarded_headers["Authorization"] = auth_header
     
+    return target_service, instance, circuit_breaker, full_url, forwarded_headers
+
+async def route_request(
+    path: str,
+    method: str,
+    headers: Dict[str, str],
+    query_params: str,
+    body: bytes,
+    user_data: Optional[Dict[str, Any]] = None,
+    extra_headers: Optional[Dict[str, str]] = None
+) -> httpx.Response:
+    """Маршрутизация запроса к соответствующему сервису"""
+    target_service, instance, circuit_breaker, full_url, forwarded_headers = await prepare_upstream_request(
+        path, headers, query_params, user_data
+    )
+    if extra_headers:
+        forwarded_headers.update(extra_headers)
+    
+    start_time = instance.begin()
+    success = False
     try:
-        # Выполняем запрос к сервису
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.request(
-                method=method,
-                url=full_url,
-                headers=forwarded_headers,
-                content=body,
-            )
-            
+        # Выполняем запрос к сервису через постоянный пул соединений
+        response = await get_upstream_pool().request(
+            target_service,
+            method=method,
+            url=full_url,
+            headers=forwarded_headers,
+            content=body,
+        )
+        
         # Записываем успешный вызов в circuit breaker
         await circuit_breaker.record_success()
+        success = True
         
         return response
         
@@ -196,6 +251,139 @@ async def route_request(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal gateway error"
         )
+    finally:
+        instance.end(start_time, record_latency=success)
+
+async def close_instance_stream(target_service: str, upstream: httpx.Response, instance, start_time: float):
+    """Закрывает потоковый ответ и завершает учет запроса в экземпляре"""
+    try:
+        await get_upstream_pool().close_stream(target_service, upstream)
+    finally:
+        instance.end(start_time, record_latency=False)
+
+async def stream_request(
+    path: str,
+    method: str,
+    headers: Dict[str, str],
+    query_params: str,
+    body: AsyncIterator[bytes],
+    user_data: Optional[Dict[str, Any]] = None
+) -> StreamingResponse:
+    """
+    Потоковая маршрутизация: тело запроса передается сервису по мере чтения от клиента,
+    тело ответа — клиенту по мере чтения от сервиса. Обе стороны читаются только тогда,
+    когда другая готова принять данные, поэтому память Gateway не зависит от размера файла.
+    """
+    target_service, instance, circuit_breaker, full_url, forwarded_headers = await prepare_upstream_request(
+        path, headers, query_params, user_data
+    )
+    # Тело передаем, только если клиент его прислал, иначе httpx отправил бы пустой chunked-поток
+    content_length = headers.get("content-length")
+    if content_length:
+        forwarded_headers["Content-Length"] = content_length
+    elif "transfer-encoding" not in headers:
+        body = None
+    for header in CONDITIONAL_HEADERS:
+        if header in headers:
+            forwarded_headers[header.title()] = headers[header]
+    
+    pool = get_upstream_pool()
+    start_time = instance.begin()
+    try:
+        upstream = await pool.open_stream(
+            target_service,
+            method=method,
+            url=full_url,
+            headers=forwarded_headers,
+            content=body,
+        )
+    except (httpx.TimeoutException, httpx.ConnectError) as e:
+        instance.end(start_time, record_latency=False)
+        await circuit_breaker.record_failure()
+        logger.error(f"Error streaming from {target_service} at {full_url}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Service {target_service} is not responding"
+        )
+    except Exception as e:
+        instance.end(start_time, record_latency=False)
+        await circuit_breaker.record_failure()
+        logger.error(f"Unexpected error streaming from {target_service}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal gateway error"
+        )
+    except BaseException:
+        # Клиент отменил запрос
+        instance.end(start_time, record_latency=False)
+        raise
+    
+    # Задержка экземпляра - время до заголовков ответа, без передачи тела
+    instance.observe_latency(time.monotonic() - start_time)
+    
+    await circuit_breaker.record_success()
+    
+    # Тело передается как есть (без распаковки), поэтому Content-Length и Content-Encoding сохраняются
+    response_headers = {
+        key: value for key, value in upstream.headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+    }
+    response_headers["X-Gateway"] = "RepitBot-API-Gateway"
+    response_headers["X-Service"] = target_service
+    
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        background=BackgroundTask(close_instance_stream, target_service, upstream, instance, start_time)
+    )
+
+async def cached_request(
+    route: tuple,
+    path: str,
+    headers: Dict[str, str],
+    query_params: str,
+    user_data: Optional[Dict[str, Any]] = None
+) -> Response:
+    """GET через кэш ответов: HIT без обращения к сервису, иначе один запрос на все одинаковые"""
+    route_prefix, target_config = route
+    cache_config = target_config["cache"]
+    cache = get_response_cache()
+    key = cache.make_key(
+        target_config["service"], path, query_params, cache_config.get("vary", "user"), user_data
+    )
+    
+    async def fetch(etag: Optional[str]) -> httpx.Response:
+        return await route_request(
+            path=path,
+            method="GET",
+            headers=headers,
+            query_params=query_params,
+            body=b"",
+            user_data=user_data,
+            extra_headers={"If-None-Match": etag} if etag else None
+        )
+    
+    entry, cache_status = await cache.get_or_fetch(key, cache_config["ttl"], fetch)
+    
+    response_headers = dict(entry.headers)
+    response_headers["ETag"] = entry.etag
+    response_headers["Age"] = str(entry.age())
+    response_headers["X-Cache"] = cache_status
+    response_headers["X-Gateway"] = "RepitBot-API-Gateway"
+    response_headers["X-Service"] = target_config["service"]
+    
+    # Клиент уже имеет эту версию
+    if entry.status_code == 200 and headers.get("if-none-match") == entry.etag:
+        response_headers.pop("content-type", None)
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=response_headers)
+    
+    return Response(
+        content=entry.body,
+        status_code=entry.status_code,
+        headers=response_headers,
+        media_type=entry.headers.get("content-type")
+    )
 
 def is_route_protected(path: str) -> bool:
     """Проверяет, требует ли маршрут авторизации"""
@@ -206,7 +394,7 @@ def is_admin_route(path: str) -> bool:
     return any(path.startswith(admin) for admin in ADMIN_ROUTES)
 
 # Generic proxy endpoint that handles all API routes
-@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
+@router.api_route("/{path:path}", methods=["GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def proxy_request(
     request: Request,
     path: str,
@@ -232,15 +420,57 @@ async def proxy_request(
                 detail="Admin access required"
             )
     
-    # Получаем тело запроса
-    body = await request.body()
-    
     # Получаем параметры запроса
     query_string = str(request.query_params)
     
     # Получаем заголовки
     headers = dict(request.headers)
     
+    route = find_route(full_path)
+    streamed = bool(route) and is_stream_route(route, full_path)
+    
+    # HEAD передается только потоковым путям: буферизованный ответ потерял бы Content-Length
+    if request.method == "HEAD" and not streamed:
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="HEAD is supported only for file downloads"
+        )
+
+    # GET запросы к кэшируемым маршрутам
+    if route and not streamed and route[1].get("cache") and request.method == "GET":
+        return await cached_request(route, full_path, headers, query_string, user_data)
+
+    try:
+        return await forward_request(request, full_path, headers, query_string, user_data, streamed)
+    finally:
+        # Изменяющий запрос сбрасывает кэш сервиса, когда upstream уже ответил: GET, начатый
+        # до ответа, мог прочитать прежние данные, и его запись должна уйти вместе с остальными
+        if route and request.method not in ("GET", "HEAD", "OPTIONS"):
+            get_response_cache().invalidate_service(route[1]["service"])
+
+async def forward_request(
+    request: Request,
+    full_path: str,
+    headers: Dict[str, str],
+    query_string: str,
+    user_data: Optional[Dict[str, Any]],
+    streamed: bool
+) -> Response:
+    """Проксирует запрос без кэша: потоком или с буферизацией тела"""
+    # Потоковые маршруты не буферизуют тело ни в одну сторону
+    if streamed:
+        return await stream_request(
+            path=full_path,
+            method=request.method,
+            headers=headers,
+            query_params=query_string,
+            body=request.stream(),
+            user_data=user_data
+        )
+    
+    # Получаем тело запроса
+    body = await request.body()
+    
     try:
         # Маршрутизируем запрос
         service_response = await route_request(
@@ -293,8 +523,9 @@ async def proxy_service_health(service_name: str):
         )
     
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{service_url}/health")
+        response = await get_upstream_pool().request(
+            service_name, "GET", f"{service_url}/health", timeout=5.0
+        )
             
         return {
             "service": service_name,
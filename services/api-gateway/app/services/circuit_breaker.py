@@ -6,7 +6,7 @@ Circuit Breaker for API Gateway
 import asyncio
 import time
 import logging
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 from enum import Enum
 from datetime import datetime, timedelta
 
@@ -145,9 +145,12 @@ class CircuitBreakerManager:
             "timeout": 30
         }
     
-    def initialize(self):
-        """Инициализация circuit breakers для всех сервисов"""
-        services = [
+    def initialize(self, names: Optional[List[str]] = None):
+        """
+        Инициализация circuit breakers. names - имена breakers (у экземпляров сервисов
+        это "сервис@url", см. ServiceRegistry.get_breaker_names), по умолчанию - по одному на сервис
+        """
+        services = names or [
             "user-service",
             "lesson-service", 
             "homework-service",
@@ -159,12 +162,9 @@ class CircuitBreakerManager:
         ]
         
         for service_name in services:
-            self.breakers[service_name] = CircuitBreaker(
-                service_name=service_name,
-                **self.default_config
-            )
+            self.get_breaker(service_name)
         
-        logger.info(f"Initialized circuit breakers for {len(services)} services")
+        logger.info(f"Initialized {len(services)} circuit breakers")
     
     def get_breaker(self, service_name: str) -> CircuitBreaker:
         """Получить circuit breaker для сервиса"""
@@ -195,6 +195,10 @@ class CircuitBreakerManager:
             for name, breaker in self.breakers.items()
         }
     
+    def remove_breaker(self, name: str):
+        """Удалить circuit breaker (например, удаленного экземпляра сервиса)"""
+        self.breakers.pop(name, None)
+    
     def reset_breaker(self, service_name: str):
         """Сброс конкретного circuit breaker"""
         if service_name in self.breakers:
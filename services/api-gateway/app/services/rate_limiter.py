@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Limiter for API Gateway
+GCRA (generic cell rate algorithm, эквивалент token bucket): на каждый ключ хранится одно число —
+теоретическое время прихода следующего запроса (TAT). Проверка делает O(1) работы и не требует
+блокировок. Бэкенды: в памяти процесса или Redis (Lua-скрипт), чтобы лимиты действовали
+на все реплики Gateway
+"""
+import importlib.util
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Лимит: limit запросов за window секунд, не более burst подряд"""
+    limit: int
+    window: float
+    burst: int
+
+    @property
+    def emission_interval(self) -> float:
+        """Интервал «стоимости» одного запроса, секунды"""
+        return self.window / self.limit
+
+    @property
+    def tolerance(self) -> float:
+        """Допустимое опережение графика (емкость корзины), секунды"""
+        return self.emission_interval * self.burst
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # Через сколько секунд запрос будет разрешен (0, если разрешен)
+    reset_after: float  # Через сколько секунд корзина полностью восстановится
+
+
+def gcra_step(tat: Optional[float], now: float, interval: float, tolerance: float,
+              cost: int) -> Tuple[bool, float, float]:
+    """
+    Один шаг GCRA. Возвращает (разрешен ли запрос, новый TAT, задержку до разрешения).
+    При отказе TAT не меняется
+    """
+    tat = max(tat or now, now)
+    new_tat = tat + cost * interval
+    allow_at = new_tat - tolerance
+    if now < allow_at:
+        return False, tat, allow_at - now
+    return True, new_tat, 0.0
+
+
+def _build_result(policy: RateLimitPolicy, allowed: bool, tat_after: float,
+                  retry_after: float) -> RateLimitResult:
+    """tat_after — TAT после проверки относительно текущего момента, секунды"""
+    tat_after = max(tat_after, 0.0)
+    # Допуск на погрешность float: (20 * i - i) / i может дать 18.999...
+    remaining = math.floor((policy.tolerance - tat_after) / policy.emission_interval + 1e-9)
+    return RateLimitResult(
+        allowed=allowed,
+        limit=policy.limit,
+        remaining=max(0, remaining),
+        retry_after=retry_after,
+        reset_after=tat_after,
+    )
+
+
+class MemoryRateLimitBackend:
+    """TAT по ключам в памяти процесса"""
+
+    def __init__(self, sweep_interval: float = 60.0):
+        self._tats: Dict[str, float] = {}
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    async def check(self, key: str, policy: RateLimitPolicy, cost: int) -> RateLimitResult:
+        # Между чтением и записью TAT нет await, поэтому блокировка не нужна
+        now = time.monotonic()
+        allowed, tat, retry_after = gcra_step(
+            self._tats.get(key), now, policy.emission_interval, policy.tolerance, cost
+        )
+        if allowed:
+            self._tats[key] = tat
+        if now >= self._next_sweep:
+            self._sweep(now)
+        return _build_result(policy, allowed, tat - now, retry_after)
+
+    def _sweep(self, now: float):
+        """Удаляет ключи, корзины которых уже полностью восстановились"""
+        expired = [key for key, tat in self._tats.items() if tat <= now]
+        for key in expired:
+            del self._tats[key]
+        self._next_sweep = now + self.sweep_interval
+        if expired:
+            logger.debug(f"Cleaned up {len(expired)} rate limit entries")
+
+    def size(self) -> int:
+        return len(self._tats)
+
+    async def close(self):
+        self._tats.clear()
+
+
+# Время берется из Redis (TIME), чтобы реплики с разными часами работали по одному графику.
+# Числа возвращаются строками: Redis обрезает дробные числа из Lua до целых
+GCRA_LUA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + tonumber(clock[2]) / 1000
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+local new_tat = tat + cost * interval
+local allow_at = new_tat - tolerance
+if now < allow_at then
+    return {0, tostring(tat - now), tostring(allow_at - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil(new_tat - now))
+return {1, tostring(new_tat - now), '0'}
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    TAT по ключам в Redis: проверка и обновление выполняются одним Lua-скриптом атомарно.
+    Принимает любой клиент с асинхронным eval (redis.asyncio или его тестовая замена)
+    """
+
+    def __init__(self, client: Any, key_prefix: str = "gateway:ratelimit:"):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisRateLimitBackend":
+        import redis.asyncio as redis
+        return cls(redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5), **kwargs)
+
+    async def check(self, key: str, policy: RateLimitPolicy, cost: int) -> RateLimitResult:
+        allowed, tat_after_ms, retry_after_ms = await self.client.eval(
+            GCRA_LUA_SCRIPT, 1, self.key_prefix + key,
+            policy.emission_interval * 1000, policy.tolerance * 1000, cost
+        )
+        return _build_result(
+            policy, bool(int(allowed)), float(tat_after_ms) / 1000, float(retry_after_ms) / 1000
+        )
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+class RateLimiter:
+    """
+    Лимиты Gateway: политика по роли пользователя, вес запроса по маршруту.
+    Если Redis недоступен, проверка выполняется локально, чтобы не отказывать всем запросам
+    """
+
+    def __init__(self, default_policy: RateLimitPolicy,
+                 role_policies: Optional[Dict[str, RateLimitPolicy]] = None,
+                 route_costs: Optional[Dict[str, int]] = None,
+                 backend: Any = None):
+        self.default_policy = default_policy
+        self.role_policies = role_policies or {}
+        # Самые длинные префиксы проверяются первыми
+        self.route_costs = sorted((route_costs or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.backend = backend or MemoryRateLimitBackend()
+        self.fallback = self.backend if isinstance(self.backend, MemoryRateLimitBackend) else MemoryRateLimitBackend()
+        self.allowed = 0
+        self.rejected = 0
+        self.backend_errors = 0
+
+    def get_policy(self, role: Optional[str]) -> RateLimitPolicy:
+        return self.role_policies.get(role, self.default_policy) if role else self.default_policy
+
+    def get_cost(self, path: str) -> int:
+        for prefix, cost in self.route_costs:
+            if path.startswith(prefix):
+                return cost
+        return 1
+
+    async def check(self, key: str, path: str, role: Optional[str] = None) -> RateLimitResult:
+        policy = self.get_policy(role)
+        # Запрос дороже емкости корзины не прошел бы никогда
+        cost = min(self.get_cost(path), policy.burst)
+        try:
+            result = await self.backend.check(key, policy, cost)
+        except Exception as e:
+            self.backend_errors += 1
+            if self.backend_errors == 1 or self.backend_errors % 100 == 0:
+                logger.warning(f"Rate limit backend error ({self.backend_errors} total), using local limits: {e}")
+            result = await self.fallback.check(key, policy, cost)
+        if result.allowed:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "backend_errors": self.backend_errors,
+            "local_keys": self.fallback.size(),
+        }
+
+    async def close(self):
+        await self.backend.close()
+        if self.fallback is not self.backend:
+            await self.fallback.close()
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Создает лимитер по настройкам Gateway"""
+    from ..core.config import settings
+
+    window = settings.RATE_LIMIT_WINDOW
+    burst = settings.RATE_LIMIT_BURST
+    default_policy = RateLimitPolicy(settings.RATE_LIMIT_REQUESTS, window, burst)
+    role_policies = {
+        role: RateLimitPolicy(limit, window, max(burst, limit * burst // settings.RATE_LIMIT_REQUESTS))
+        for role, limit in settings.RATE_LIMIT_ROLE_LIMITS.items()
+    }
+
+    backend = None
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        if REDIS_AVAILABLE:
+            backend = RedisRateLimitBackend.from_url(settings.REDIS_URL)
+        else:
+            logger.warning("RATE_LIMIT_BACKEND=redis, but redis package is not installed; using local limits")
+
+    return RateLimiter(default_policy, role_policies, settings.RATE_LIMIT_ROUTE_COSTS, backend)
+
+# Глобальный экземпляр лимитера
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    """Получение глобального экземпляра лимитера"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = create_rate_limiter()
+    return _rate_limiter
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Response Cache for API Gateway
+Кэш ответов на GET запросы к маршрутам с "cache" в SERVICE_ROUTES: первый уровень в памяти
+процесса, второй (необязательный) в Redis. Устаревшие записи с ETag сервиса перепроверяются
+через If-None-Match, одинаковые одновременные запросы объединяются в один запрос к сервису
+"""
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+# Заголовки ответа, которые не сохраняются в кэше (httpx уже распаковал тело)
+UNCACHED_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade",
+    "content-length", "content-encoding", "date", "set-cookie",
+}
+VARY_MODES = ("none", "role", "user")
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    etag: str                          # ETag для клиентов (сервиса или вычисленный Gateway)
+    upstream_etag: Optional[str]       # ETag сервиса для перепроверки через If-None-Match
+    stored_at: float
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, response: httpx.Response, ttl: float) -> "CachedResponse":
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key.lower() not in UNCACHED_HEADERS
+        }
+        upstream_etag = response.headers.get("etag")
+        body = response.content
+        etag = upstream_etag or f'W/"{hashlib.sha1(body).hexdigest()[:16]}"'
+        now = time.time()
+        return cls(response.status_code, headers, body, etag, upstream_etag, now, now + ttl)
+
+    def age(self) -> int:
+        return max(0, int(time.time() - self.stored_at))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "status_code": self.status_code,
+            "headers": self.headers,
+            "body": base64.b64encode(self.body).decode("ascii"),
+            "etag": self.etag,
+            "upstream_etag": self.upstream_etag,
+            "stored_at": self.stored_at,
+            "expires_at": self.expires_at,
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "CachedResponse":
+        values = json.loads(data)
+        values["body"] = base64.b64decode(values["body"])
+        return cls(**values)
+
+
+class MemoryCacheTier:
+    """LRU записей в памяти процесса; устаревшие записи хранятся до discard_at для перепроверки"""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, entry: CachedResponse, keep_for: float):
+        self._entries[key] = (time.time() + keep_for, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    async def close(self):
+        self._entries.clear()
+
+
+class RedisCacheTier:
+    """Общий для реплик Gateway уровень кэша в Redis (любой клиент с асинхронными get/set)"""
+
+    def __init__(self, client: Any, key_prefix: str = "gateway:cache:"):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCacheTier":
+        import redis.asyncio as redis
+        return cls(redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5), **kwargs)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        data = await self.client.get(self.key_prefix + key)
+        return CachedResponse.from_json(data) if data else None
+
+    async def set(self, key: str, entry: CachedResponse, keep_for: float):
+        await self.client.set(self.key_prefix + key, entry.to_json(), px=max(1, int(keep_for * 1000)))
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+class ResponseCache:
+    """Кэш ответов маршрутов с объединением одновременных запросов"""
+
+    def __init__(self, memory: Optional[MemoryCacheTier] = None, redis: Optional[RedisCacheTier] = None,
+                 max_entry_bytes: int = 512 * 1024, stale_seconds: float = 600):
+        self.memory = memory or MemoryCacheTier()
+        self.redis = redis
+        self.max_entry_bytes = max_entry_bytes
+        self.stale_seconds = stale_seconds
+        # Поколение сервиса входит в ключ: изменяющий запрос к сервису делает его записи недоступными
+        self._generations: Dict[str, int] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.coalesced = 0
+        self.stale_served = 0
+        self.bypassed = 0
+        self.redis_errors = 0
+
+    def make_key(self, service_name: str, path: str, query: str, vary: str,
+                 user_data: Optional[Dict[str, Any]] = None) -> str:
+        if vary == "user":
+            scope = f"user:{user_data.get('user_id')}" if user_data else "anon"
+        elif vary == "role":
+            scope = f"role:{user_data.get('role')}" if user_data else "anon"
+        else:
+            scope = "*"
+        query = "&".join(sorted(query.split("&"))) if query else ""
+        generation = self._generations.get(service_name, 0)
+        raw = f"{service_name}|{generation}|{scope}|{path}?{query}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def invalidate_service(self, service_name: str):
+        """
+        Сбрасывает записи сервиса после изменяющего запроса через эту реплику.
+        Другие реплики (и уровень Redis) отдают прежние записи не дольше их TTL
+        """
+        self._generations[service_name] = self._generations.get(service_name, 0) + 1
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = await self.memory.get(key)
+        if entry is None and self.redis is not None:
+            try:
+                entry = await self.redis.get(key)
+            except Exception as e:
+                self._redis_error(e)
+            if entry is not None:
+                await self.memory.set(key, entry, self._keep_for(entry))
+        return entry
+
+    async def put(self, key: str, entry: CachedResponse):
+        keep_for = self._keep_for(entry)
+        await self.memory.set(key, entry, keep_for)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, entry, keep_for)
+            except Exception as e:
+                self._redis_error(e)
+
+    def _keep_for(self, entry: CachedResponse) -> float:
+        # Записи с ETag сервиса хранятся дольше TTL, чтобы их можно было перепроверить
+        keep_for = entry.expires_at - time.time()
+        if entry.upstream_etag:
+            keep_for += self.stale_seconds
+        return max(keep_for, 1.0)
+
+    def _redis_error(self, error: Exception):
+        self.redis_errors += 1
+        if self.redis_errors == 1 or self.redis_errors % 100 == 0:
+            logger.warning(f"Response cache Redis error ({self.redis_errors} total): {error}")
+
+    def is_cacheable(self, response: httpx.Response) -> bool:
+        cache_control = response.headers.get("cache-control", "").lower()
+        return (
+            response.status_code == 200
+            and "no-store" not in cache_control
+            and "set-cookie" not in response.headers
+            and len(response.content) <= self.max_entry_bytes
+        )
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        ttl: float,
+        fetch: Callable[[Optional[str]], Awaitable[httpx.Response]]
+    ) -> Tuple[CachedResponse, str]:
+        """
+        Ответ из кэша или от сервиса. fetch(etag) выполняет запрос к сервису
+        (с If-None-Match, если etag передан). Возвращает (ответ, HIT/MISS/REVALIDATED/STALE/BYPASS)
+        """
+        entry = await self.get(key)
+        if entry is not None and entry.expires_at > time.time():
+            self.hits += 1
+            return entry, "HIT"
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._refresh(key, ttl, fetch, entry))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield: отмена одного клиента не отменяет общий запрос к сервису
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key: str, ttl: float, fetch, stale: Optional[CachedResponse]) -> Tuple[CachedResponse, str]:
+        etag = stale.upstream_etag if stale is not None else None
+        try:
+            response = await fetch(etag)
+        except Exception:
+            if stale is None:
+                raise
+            # Сервис недоступен — отдаем устаревшую запись
+            self.stale_served += 1
+            return stale, "STALE"
+
+        if response.status_code == 304 and stale is not None:
+            now = time.time()
+            entry = replace(stale, stored_at=now, expires_at=now + ttl)
+            await self.put(key, entry)
+            self.revalidated += 1
+            return entry, "REVALIDATED"
+
+        entry = CachedResponse.from_response(response, ttl)
+        if not self.is_cacheable(response):
+            self.bypassed += 1
+            return entry, "BYPASS"
+        await self.put(key, entry)
+        self.misses += 1
+        return entry, "MISS"
+
+    def get_metrics(self) -> Dict[str, Any]:
+        served = self.hits + self.revalidated
+        total = served + self.misses
+        return {
+            "backend": "memory+redis" if self.redis is not None else "memory",
+            "entries": self.memory.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "bypassed": self.bypassed,
+            "evictions": self.memory.evictions,
+            "redis_errors": self.redis_errors,
+            "hit_ratio": round(served / total, 3) if total else 0.0,
+        }
+
+    async def close(self):
+        await self.memory.close()
+        if self.redis is not None:
+            await self.redis.close()
+
+
+def create_response_cache() -> ResponseCache:
+    """Создает кэш ответов по настройкам Gateway"""
+    from ..core.config import settings
+
+    redis_tier = None
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        if REDIS_AVAILABLE:
+            redis_tier = RedisCacheTier.from_url(settings.REDIS_URL)
+        else:
+            logger.warning("RESPONSE_CACHE_BACKEND=redis, but redis package is not installed; using memory only")
+
+    return ResponseCache(
+        memory=MemoryCacheTier(settings.RESPONSE_CACHE_MAX_ENTRIES),
+        redis=redis_tier,
+        max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+        stale_seconds=settings.RESPONSE_CACHE_STALE_SECONDS,
+    )
+
+# Глобальный экземпляр кэша
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Получение глобального экземпляра кэша ответов"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = create_response_cache()
+    return _response_cache
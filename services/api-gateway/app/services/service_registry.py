@@ -6,14 +6,93 @@ Service Registry for API Gateway
 import asyncio
 import httpx
 import logging
-from typing import Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set
 from datetime import datetime, timedelta
 import time
 
+from ..core.config import settings
+from .circuit_breaker import get_circuit_breaker_manager
+
 logger = logging.getLogger(__name__)
 
+# Стратегии выбора экземпляра сервиса
+LOAD_BALANCING_STRATEGIES = ("round_robin", "least_outstanding", "ewma")
+STRATEGY_ALIASES = {"least_connections": "least_outstanding"}
+# Вес нового замера в сглаженной задержке экземпляра
+EWMA_ALPHA = 0.3
+
+# Параметры пула соединений к сервису по умолчанию (см. UpstreamClientPool).
+# Сервис может переопределить любой из них в своем "pool" в service_configs.
+DEFAULT_POOL_SETTINGS = {
+    "max_connections": 100,        # Всего соединений к сервису
+    "max_keepalive_connections": 20,  # Сколько простаивающих соединений держать открытыми
+    "keepalive_expiry": 30.0,      # Через сколько секунд закрывать простаивающее соединение
+    "connect_timeout": 3.0,
+    "read_timeout": 30.0,
+    "write_timeout": 30.0,
+    "pool_timeout": 5.0,           # Ожидание свободного соединения при исчерпании пула
+    "http2": True,                 # Используется, если сервис поддерживает HTTP/2 (ALPN)
+}
+
+class ServiceInstance:
+    """Экземпляр сервиса: состояние здоровья, задержка и число запросов в работе"""
+    
+    def __init__(self, service_name: str, url: str, source: str = "config"):
+        self.service_name = service_name
+        self.url = url.rstrip("/")
+        self.source = source  # config или admin (добавлен через API)
+        self.status = "unknown"
+        self.last_check: Optional[datetime] = None
+        self.last_success: Optional[datetime] = None
+        self.last_failure: Optional[datetime] = None
+        self.failure_count = 0
+        self.response_time: Optional[float] = None  # Время ответа последнего health check
+        self.ewma_latency: Optional[float] = None   # Сглаженная задержка запросов и health check
+        self.outstanding = 0                          # Запросов в работе
+        self.total_requests = 0
+    
+    @property
+    def breaker_name(self) -> str:
+        """Имя circuit breaker экземпляра"""
+        return f"{self.service_name}@{self.url}"
+    
+    def observe_latency(self, latency: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += EWMA_ALPHA * (latency - self.ewma_latency)
+    
+    def begin(self) -> float:
+        self.outstanding += 1
+        self.total_requests += 1
+        return time.monotonic()
+    
+    def end(self, start_time: float, record_latency: bool = True):
+        self.outstanding -= 1
+        if record_latency:
+            self.observe_latency(time.monotonic() - start_time)
+    
+    def load_score(self) -> float:
+        """Ожидаемое время ответа с учетом очереди (для стратегии ewma)"""
+        return (self.ewma_latency or 0.0) * (self.outstanding + 1)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "source": self.source,
+            "status": self.status,
+            "last_check": self.last_check.isoformat() if self.last_check else None,
+            "last_success": self.last_success.isoformat() if self.last_success else None,
+            "failure_count": self.failure_count,
+            "response_time": self.response_time,
+            "ewma_latency": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests,
+            "circuit_breaker": get_circuit_breaker_manager().get_breaker(self.breaker_name).get_state().value,
+        }
+
 class ServiceRegistry:
-    """Реестр микросервисов и их состояния"""
+    """Реестр микросервисов, их экземпляров и их состояния"""
     
     def __init__(self):
         self.services: Dict[str, Dict] = {}
@@ -57,7 +136,8 @@ class ServiceRegistry:
                 "port": 8005,
                 "health_endpoint": "/health",
                 "timeout": 5.0,
-                "critical": False
+                "critical": False,
+                "pool": {"read_timeout": 120.0, "write_timeout": 120.0}  # Загрузка и выдача файлов
             },
             "notification-service": {
                 "host": "notification-service",
@@ -71,7 +151,8 @@ class ServiceRegistry:
                 "port": 8007,
                 "health_endpoint": "/health",
                 "timeout": 5.0,
-                "critical": False
+                "critical": False,
+                "pool": {"read_timeout": 60.0}  # Генерация отчетов
             },
             "student-service": {
                 "host": "student-service",
@@ -82,8 +163,12 @@ class ServiceRegistry:
             }
         }
         
+        default_strategy = self._normalize_strategy(settings.LOAD_BALANCING_STRATEGY) or "round_robin"
+        
         # Инициализируем сервисы
         for service_name, config in self.service_configs.items():
+            primary_url = f"http://{config['host']}:{config['port']}"
+            instance_urls = settings.get_service_instances(service_name) or [primary_url]
             self.services[service_name] = {
                 "name": service_name,
                 "host": config["host"],
@@ -92,36 +177,136 @@ class ServiceRegistry:
                 "health_endpoint": config["health_endpoint"],
                 "timeout": config["timeout"],
                 "critical": config["critical"],
+                "pool": {**DEFAULT_POOL_SETTINGS, **config.get("pool", {})},
                 "status": "unknown",
                 "last_check": None,
                 "last_success": None,
                 "last_failure": None,
                 "failure_count": 0,
                 "response_time": None,
-                "metadata": {}
+                "metadata": {},
+                "strategy": self._normalize_strategy(config.get("strategy")) or default_strategy,
+                "instances": {
+                    url.rstrip("/"): ServiceInstance(service_name, url)
+                    for url in instance_urls
+                },
+                "rr_index": 0
             }
     
+    @staticmethod
+    def _normalize_strategy(strategy: Optional[str]) -> Optional[str]:
+        if not strategy:
+            return None
+        strategy = STRATEGY_ALIASES.get(strategy, strategy)
+        if strategy not in LOAD_BALANCING_STRATEGIES:
+            logger.warning(f"Unknown load balancing strategy {strategy}, using round_robin")
+            return "round_robin"
+        return strategy
+    
     async def initialize(self):
         """Инициализация реестра сервисов"""
         logger.info("Initializing service registry...")
         await self.update_all_services_health()
         logger.info(f"Service registry initialized with {len(self.services)} services")
     
-    async def get_service_url(self, service_name: str) -> Optional[str]:
-        """Получение URL сервиса"""
+    def select_instance(self, service_name: str) -> Optional[ServiceInstance]:
+        """
+        Выбор здорового экземпляра с закрытым circuit breaker по стратегии сервиса:
+        round_robin - по кругу, least_outstanding - с наименьшим числом запросов в работе,
+        ewma - с наименьшей сглаженной задержкой с учетом запросов в работе
+        """
         service = self.services.get(service_name)
         if not service:
             return None
         
-        # Возвращаем URL только если сервис здоров
-        if service["status"] == "healthy":
-            return service["url"]
+        cb_manager = get_circuit_breaker_manager()
+        candidates = [
+            instance for instance in service["instances"].values()
+            if instance.status == "healthy" and not cb_manager.get_breaker(instance.breaker_name).is_open()
+        ]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        
+        # Сдвиг по кругу: при равной нагрузке экземпляры выбираются по очереди
+        service["rr_index"] += 1
+        offset = service["rr_index"] % len(candidates)
+        candidates = candidates[offset:] + candidates[:offset]
+        
+        strategy = service["strategy"]
+        if strategy == "least_outstanding":
+            return min(candidates, key=lambda instance: instance.outstanding)
+        if strategy == "ewma":
+            return min(candidates, key=lambda instance: instance.load_score())
+        return candidates[0]
+    
+    async def get_service_url(self, service_name: str) -> Optional[str]:
+        """Получение URL сервиса (выбранного экземпляра)"""
+        instance = self.select_instance(service_name)
+        return instance.url if instance else None
+    
+    async def add_instance(self, service_name: str, url: str) -> ServiceInstance:
+        """Добавление экземпляра сервиса во время работы (с немедленной проверкой здоровья)"""
+        service = self.services.get(service_name)
+        if not service:
+            raise KeyError(service_name)
+        
+        url = url.rstrip("/")
+        async with self._lock:
+            instance = service["instances"].get(url)
+            if instance is None:
+                instance = ServiceInstance(service_name, url, source="admin")
+                service["instances"][url] = instance
+                logger.info(f"Instance {url} added to {service_name}")
+        
+        await self.check_service_health(service_name)
+        return instance
+    
+    async def remove_instance(self, service_name: str, url: str) -> bool:
+        """Удаление экземпляра сервиса; запросы в работе завершаются как обычно"""
+        service = self.services.get(service_name)
+        if not service:
+            raise KeyError(service_name)
+        
+        async with self._lock:
+            instance = service["instances"].pop(url.rstrip("/"), None)
+        if instance is None:
+            return False
         
-        return None
+        get_circuit_breaker_manager().remove_breaker(instance.breaker_name)
+        logger.info(f"Instance {instance.url} removed from {service_name}")
+        await self.check_service_health(service_name)
+        return True
+    
+    def get_instances(self, service_name: str) -> List[Dict[str, Any]]:
+        service = self.services.get(service_name)
+        if not service:
+            raise KeyError(service_name)
+        return [instance.to_dict() for instance in service["instances"].values()]
+    
+    def get_breaker_names(self) -> List[str]:
+        """Имена circuit breakers всех экземпляров"""
+        return [
+            instance.breaker_name
+            for service in self.services.values()
+            for instance in service["instances"].values()
+        ]
+    
+    def get_pool_settings(self, service_name: str) -> Dict:
+        """Параметры пула соединений к сервису"""
+        service = self.services.get(service_name)
+        if not service:
+            return dict(DEFAULT_POOL_SETTINGS)
+        return dict(service["pool"])
     
     async def get_all_services(self) -> Dict[str, Dict]:
         """Получение всех зарегистрированных сервисов"""
-        return self.services.copy()
+        return {
+            name: {
+                **{key: value for key, value in service.items() if key != "rr_index"},
+                "instances": [instance.to_dict() for instance in service["instances"].values()]
+            }
+            for name, service in self.services.items()
+        }
     
     async def get_healthy_services(self) -> List[str]:
         """Получение списка здоровых сервисов"""
@@ -149,78 +334,99 @@ class ServiceRegistry:
                 "failure_count": service["failure_count"],
                 "response_time": service["response_time"],
                 "critical": service["critical"],
-                "metadata": service["metadata"]
+                "metadata": service["metadata"],
+                "strategy": service["strategy"],
+                "instances": [instance.to_dict() for instance in service["instances"].values()]
             }
             for name, service in self.services.items()
         }
     
     async def check_service_health(self, service_name: str) -> bool:
-        """Проверка здоровья конкретного сервиса"""
+        """Проверка здоровья всех экземпляров сервиса; сервис здоров, если здоров хотя бы один"""
         service = self.services.get(service_name)
         if not service:
             logger.warning(f"Service {service_name} not found in registry")
             return False
         
-        health_url = f"{service['url']}{service['health_endpoint']}"
+        instances = list(service["instances"].values())
+        results = await asyncio.gather(
+            *(self.check_instance_health(service, instance) for instance in instances)
+        )
+        healthy = [instance for instance, ok in zip(instances, results) if ok]
+        is_healthy = bool(healthy)
+        
+        # Обновляем информацию о сервисе
+        async with self._lock:
+            service["last_check"] = datetime.now()
+            response_times = [instance.response_time for instance in (healthy or instances) if instance.response_time is not None]
+            service["response_time"] = min(response_times) if response_times else None
+            
+            if is_healthy:
+                service["status"] = "healthy"
+                service["last_success"] = datetime.now()
+                service["failure_count"] = 0
+                
+                # Добавляем в здоровые сервисы
+                self.healthy_services.add(service_name)
+                self.unhealthy_services.discard(service_name)
+            else:
+                service["status"] = "unhealthy"
+                service["last_failure"] = datetime.now()
+                service["failure_count"] += 1
+                
+                # Добавляем в нездоровые сервисы
+                self.unhealthy_services.add(service_name)
+                self.healthy_services.discard(service_name)
+        
+        logger.debug(f"Health check for {service_name}: {len(healthy)}/{len(instances)} instances healthy")
+        return is_healthy
+    
+    async def check_instance_health(self, service: Dict, instance: ServiceInstance) -> bool:
+        """Проверка здоровья одного экземпляра; время ответа учитывается в его задержке"""
+        health_url = f"{instance.url}{service['health_endpoint']}"
         start_time = time.time()
         
         try:
             async with httpx.AsyncClient(timeout=service["timeout"]) as client:
                 response = await client.get(health_url)
-                
+            
             response_time = time.time() - start_time
             is_healthy = response.status_code == 200
             
-            # Обновляем информацию о сервисе
-            async with self._lock:
-                service["last_check"] = datetime.now()
-                service["response_time"] = response_time
+            instance.last_check = datetime.now()
+            instance.response_time = response_time
+            
+            if is_healthy:
+                instance.status = "healthy"
+                instance.last_success = datetime.now()
+                instance.failure_count = 0
+                instance.observe_latency(response_time)
                 
-                if is_healthy:
-                    service["status"] = "healthy"
-                    service["last_success"] = datetime.now()
-                    service["failure_count"] = 0
-                    
-                    # Добавляем в здоровые сервисы
-                    self.healthy_services.add(service_name)
-                    self.unhealthy_services.discard(service_name)
-                    
-                    # Обновляем метаданные из ответа
-                    try:
-                        if response.headers.get("content-type", "").startswith("application/json"):
-                            health_data = response.json()
-                            service["metadata"].update(health_data)
-                    except Exception:
-                        pass
-                        
-                else:
-                    service["status"] = "unhealthy"
-                    service["last_failure"] = datetime.now()
-                    service["failure_count"] += 1
-                    
-                    # Добавляем в нездоровые сервисы
-                    self.unhealthy_services.add(service_name)
-                    self.healthy_services.discard(service_name)
+                # Обновляем метаданные из ответа
+                try:
+                    if response.headers.get("content-type", "").startswith("application/json"):
+                        service["metadata"].update(response.json())
+                except Exception:
+                    pass
+            else:
+                instance.status = "unhealthy"
+                instance.last_failure = datetime.now()
+                instance.failure_count += 1
             
-            logger.debug(f"Health check for {service_name}: {'OK' if is_healthy else 'FAILED'} ({response_time:.3f}s)")
+            logger.debug(f"Health check for {instance.url}: {'OK' if is_healthy else 'FAILED'} ({response_time:.3f}s)")
             return is_healthy
             
         except (httpx.TimeoutException, httpx.ConnectError) as e:
-            logger.warning(f"Health check timeout/connection error for {service_name}: {e}")
+            logger.warning(f"Health check timeout/connection error for {instance.url}: {e}")
         except Exception as e:
-            logger.error(f"Health check error for {service_name}: {e}")
+            logger.error(f"Health check error for {instance.url}: {e}")
         
         # Обновляем при ошибке
-        async with self._lock:
-            service["last_check"] = datetime.now()
-            service["status"] = "unhealthy"
-            service["last_failure"] = datetime.now()
-            service["failure_count"] += 1
-            service["response_time"] = time.time() - start_time
-            
-            self.unhealthy_services.add(service_name)
-            self.healthy_services.discard(service_name)
-        
+        instance.last_check = datetime.now()
+        instance.status = "unhealthy"
+        instance.last_failure = datetime.now()
+        instance.failure_count += 1
+        instance.response_time = time.time() - start_time
         return False
     
     async def update_all_services_health(self):
@@ -272,10 +478,15 @@ class ServiceRegistry:
         return service["status"] == "healthy"
     
     async def get_service_load_balancing_candidates(self, service_name: str) -> List[str]:
-        """Получение кандидатов для балансировки нагрузки (пока что один экземпляр)"""
-        if await self.is_service_available(service_name):
-            return [service_name]
-        return []
+        """URL здоровых экземпляров сервиса с закрытым circuit breaker"""
+        service = self.services.get(service_name)
+        if not service:
+            return []
+        cb_manager = get_circuit_breaker_manager()
+        return [
+            instance.url for instance in service["instances"].values()
+            if instance.status == "healthy" and not cb_manager.get_breaker(instance.breaker_name).is_open()
+        ]
     
     async def mark_service_failure(self, service_name: str):
         """Отметить сбой сервиса"""
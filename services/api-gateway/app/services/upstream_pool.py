@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Upstream Client Pool for API Gateway
+Постоянные HTTP-клиенты к микросервисам: по одному пулу соединений на сервис,
+с keep-alive, HTTP/2 (если доступен) и метриками заполненности пула
+"""
+import importlib.util
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .service_registry import ServiceRegistry, get_service_registry
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 в httpx требует пакет h2; без него работаем по HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class UpstreamPoolStats:
+    """Метрики пула соединений одного сервиса"""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.pool_timeouts = 0
+        self.connect_errors = 0
+        self.total_time = 0.0
+
+    def begin(self) -> float:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.monotonic()
+
+    def end(self, start_time: float):
+        self.in_flight -= 1
+        self.total_requests += 1
+        self.total_time += time.monotonic() - start_time
+
+    def record_error(self, service_name: str, error: Exception):
+        if isinstance(error, httpx.PoolTimeout):
+            self.pool_timeouts += 1
+            logger.warning(f"Upstream pool for {service_name} is saturated ({self.in_flight} in flight)")
+        elif isinstance(error, httpx.ConnectError):
+            self.connect_errors += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturation": round(self.in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+            "total_requests": self.total_requests,
+            "pool_timeouts": self.pool_timeouts,
+            "connect_errors": self.connect_errors,
+            "avg_response_time": round(self.total_time / self.total_requests, 4) if self.total_requests else 0.0,
+        }
+
+
+class UpstreamClientPool:
+    """Пулы соединений к микросервисам, живущие все время работы Gateway"""
+
+    def __init__(self, registry: Optional[ServiceRegistry] = None):
+        self.registry = registry or get_service_registry()
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, UpstreamPoolStats] = {}
+
+    def _create_client(self, service_name: str) -> httpx.AsyncClient:
+        pool = self.registry.get_pool_settings(service_name)
+        limits = httpx.Limits(
+            max_connections=pool["max_connections"],
+            max_keepalive_connections=pool["max_keepalive_connections"],
+            keepalive_expiry=pool["keepalive_expiry"],
+        )
+        timeout = httpx.Timeout(
+            connect=pool["connect_timeout"],
+            read=pool["read_timeout"],
+            write=pool["write_timeout"],
+            pool=pool["pool_timeout"],
+        )
+        http2 = pool["http2"] and HTTP2_AVAILABLE
+        self.stats[service_name] = UpstreamPoolStats(pool["max_connections"])
+        logger.info(
+            f"Upstream pool for {service_name}: max={pool['max_connections']}, "
+            f"keepalive={pool['max_keepalive_connections']}, http2={http2}"
+        )
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    async def startup(self):
+        """Создает клиенты для всех зарегистрированных сервисов"""
+        for service_name in (await self.registry.get_all_services()).keys():
+            self.get_client(service_name)
+        logger.info(f"Upstream client pools created for {len(self.clients)} services")
+
+    def get_client(self, service_name: str) -> httpx.AsyncClient:
+        """Клиент сервиса (создается при первом обращении, если не был создан при старте)"""
+        client = self.clients.get(service_name)
+        if client is None:
+            client = self._create_client(service_name)
+            self.clients[service_name] = client
+        return client
+
+    @asynccontextmanager
+    async def track(self, service_name: str):
+        """Учитывает запрос к сервису в метриках пула"""
+        self.get_client(service_name)
+        stats = self.stats[service_name]
+        start_time = stats.begin()
+        try:
+            yield stats
+        except httpx.HTTPError as e:
+            stats.record_error(service_name, e)
+            raise
+        finally:
+            stats.end(start_time)
+
+    async def request(self, service_name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Выполняет запрос к сервису через его пул соединений"""
+        async with self.track(service_name):
+            return await self.get_client(service_name).request(method, url, **kwargs)
+
+    async def open_stream(self, service_name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Отправляет запрос и возвращает ответ, тело которого еще не прочитано.
+        Соединение занято, пока ответ не закрыт через close_stream.
+        """
+        client = self.get_client(service_name)
+        stats = self.stats[service_name]
+        start_time = stats.begin()
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+        except BaseException as e:
+            if isinstance(e, httpx.HTTPError):
+                stats.record_error(service_name, e)
+            stats.end(start_time)
+            raise
+        response.extensions["gateway_start_time"] = start_time
+        return response
+
+    async def close_stream(self, service_name: str, response: httpx.Response):
+        """Закрывает потоковый ответ и возвращает соединение в пул"""
+        try:
+            await response.aclose()
+        finally:
+            self.stats[service_name].end(response.extensions["gateway_start_time"])
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.get_metrics() for name, stats in self.stats.items()}
+
+    async def close(self):
+        """Закрывает все соединения (при остановке Gateway)"""
+        for service_name, client in self.clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing upstream pool for {service_name}: {e}")
+        self.clients.clear()
+        logger.info("Upstream client pools closed")
+
+# Глобальный экземпляр пула
+_upstream_pool: Optional[UpstreamClientPool] = None
+
+def get_upstream_pool() -> UpstreamClientPool:
+    """Получение глобального экземпляра пула клиентов"""
+    global _upstream_pool
+    if _upstream_pool is None:
+        _upstream_pool = UpstreamClientPool()
+    return _upstream_pool
@@ -0,0 +1,120 @@
+"""
+Tests for the GCRA rate limiter (memory and Redis backends)
+"""
+
+import pytest
+import pytest_asyncio
+
+from app.services import rate_limiter as rate_limiter_module
+from app.services.rate_limiter import (
+    MemoryRateLimitBackend, RateLimiter, RateLimitPolicy, RedisRateLimitBackend, gcra_step
+)
+
+# 60 requests per minute, up to 20 in a row
+POLICY = RateLimitPolicy(limit=60, window=60, burst=20)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock)
+    return clock
+
+
+def test_gcra_step_allows_burst_then_rejects():
+    tat = None
+    for _ in range(20):
+        allowed, tat, retry_after = gcra_step(tat, 0.0, 1.0, 20.0, 1)
+        assert allowed and retry_after == 0.0
+    allowed, new_tat, retry_after = gcra_step(tat, 0.0, 1.0, 20.0, 1)
+    assert not allowed
+    assert new_tat == tat  # Rejected requests do not move TAT
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_gcra_step_cost_uses_several_cells():
+    allowed, tat, _ = gcra_step(None, 0.0, 1.0, 20.0, 5)
+    assert allowed and tat == 5.0
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_remaining_counts_down_from_burst(clock):
+    backend = MemoryRateLimitBackend()
+    results = [await backend.check("user:1", POLICY, 1) for _ in range(21)]
+    assert [r.remaining for r in results[:3]] == [19, 18, 17]
+    assert results[19].allowed and results[19].remaining == 0
+    assert not results[20].allowed
+    assert results[20].retry_after == pytest.approx(POLICY.emission_interval)
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_refills_over_time(clock):
+    backend = MemoryRateLimitBackend()
+    for _ in range(20):
+        await backend.check("user:1", POLICY, 1)
+    assert not (await backend.check("user:1", POLICY, 1)).allowed
+    clock.now += POLICY.emission_interval
+    assert (await backend.check("user:1", POLICY, 1)).allowed
+    # Other keys are independent
+    assert (await backend.check("user:2", POLICY, 1)).remaining == 19
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_sweeps_recovered_keys(clock):
+    backend = MemoryRateLimitBackend(sweep_interval=10)
+    await backend.check("user:1", POLICY, 1)
+    clock.now += 60
+    await backend.check("user:2", POLICY, 1)
+    assert backend.size() == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_route_cost_and_fallback(clock):
+    class BrokenBackend:
+        async def check(self, key, policy, cost):
+            raise ConnectionError("redis is down")
+
+        async def close(self):
+            pass
+
+    limiter = RateLimiter(POLICY, route_costs={"/api/v1/reports": 5}, backend=BrokenBackend())
+    result = await limiter.check("user:1", "/api/v1/reports/monthly")
+    assert result.allowed and result.remaining == 15
+    assert limiter.backend_errors == 1
+    # Cost is capped by the burst so expensive routes are never rejected forever
+    assert limiter.get_cost("/api/v1/reports/x") == 5 and limiter.get_cost("/api/v1/lessons") == 1
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_matches_memory_backend(redis_client):
+    backend = RedisRateLimitBackend(redis_client)
+    results = [await backend.check("user:1", POLICY, 1) for _ in range(21)]
+    assert [r.remaining for r in results[:3]] == [19, 18, 17]
+    assert all(r.allowed for r in results[:20])
+    assert not results[20].allowed
+    assert 0 < results[20].retry_after <= POLICY.emission_interval
+    assert await redis_client.pttl("gateway:ratelimit:user:1") > 0
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_cost(redis_client):
+    backend = RedisRateLimitBackend(redis_client)
+    result = await backend.check("user:1", POLICY, 5)
+    assert result.allowed and result.remaining == 15
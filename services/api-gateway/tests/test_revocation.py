@@ -0,0 +1,68 @@
+"""
+Tests for the gateway revocation filter: local checks and fail-closed behaviour
+"""
+
+import base64
+
+import pytest
+
+from app.core import revocation as revocation_module
+from app.core.revocation import BloomFilter, RevocationFilter
+
+
+def snapshot(*revoked: str) -> dict:
+    bloom = BloomFilter(1024, 3)
+    for jti in revoked:
+        bloom.add(jti)
+    return {
+        "full": True,
+        "cursor": "1",
+        "bloom": {"size": bloom.size, "hashes": bloom.hashes, "bits": base64.b64encode(bytes(bloom.bits)).decode()},
+    }
+
+
+@pytest.fixture
+def revocations():
+    return RevocationFilter(auth_service_url="http://auth", max_staleness=30)
+
+
+def test_no_snapshot_requires_confirmation(revocations):
+    assert revocations.is_stale
+    assert revocations.check("jti-1") is None
+    assert revocations.stale_checks == 1
+
+
+def test_fresh_snapshot_answers_locally(revocations):
+    revocations.apply_feed(snapshot("revoked"))
+    assert not revocations.is_stale
+    assert revocations.check("active") is False
+    # Bloom filter hit without a cached confirmation
+    assert revocations.check("revoked") is None
+    revocations.confirmed["revoked"] = True
+    assert revocations.check("revoked") is True
+
+
+def test_recent_revocations_win(revocations):
+    revocations.apply_feed(snapshot())
+    revocations.apply_feed({"full": False, "cursor": "2", "revoked": ["late"]})
+    assert revocations.check("late") is True
+
+
+def test_stale_sync_requires_confirmation(revocations, monkeypatch):
+    revocations.apply_feed(snapshot())
+    now = revocations.last_sync
+    monkeypatch.setattr(revocation_module.time, "time", lambda: now + 31)
+    assert revocations.is_stale
+    assert revocations.check("active") is None
+    assert revocations.get_metrics()["stale"] is True
+
+
+@pytest.mark.asyncio
+async def test_confirm_fails_closed(revocations):
+    class FailingClient:
+        async def post(self, *args, **kwargs):
+            raise ConnectionError("auth service is down")
+
+    revocations._client = FailingClient()
+    assert await revocations.confirm("jti-1", "token") is True
+    assert "jti-1" not in revocations.confirmed
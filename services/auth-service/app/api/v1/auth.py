@@ -14,8 +14,8 @@ from ...database.connection import get_db
 from ...services.auth_service import AuthService
 from ...schemas.auth import (
     AccessCodeRequest, LoginResponse, TokenRefreshRequest, TokenValidationRequest,
-    TokenValidationResponse, LogoutRequest, SessionCreate, ApiKeyCreate, ApiKeyResponse,
-    AuthStats, HealthCheckResponse, PermissionCheck, PermissionResponse
+    TokenValidationResponse, BatchTokenValidationRequest, BatchTokenValidationResponse, LogoutRequest, SessionCreate, ApiKeyCreate, ApiKeyResponse,
+    AuthStats, HealthCheckResponse, PermissionCheck, PermissionResponse, RevocationFeedResponse
 )
 from ...core.security import permission_manager
 
@@ -134,6 +134,22 @@ async def validate_token(
             error=f"Token validation error: {str(e)}"
         )
 
+@router.post("/validate:batch", response_model=BatchTokenValidationResponse)
+async def validate_tokens_batch(
+    request: BatchTokenValidationRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Валидация нескольких токенов за один запрос (результаты в порядке tokens)
+    """
+    try:
+        auth_service = AuthService(db)
+        return await auth_service.validate_tokens(request.tokens)
+        
+    except Exception as e:
+        error = TokenValidationResponse(valid=False, error=f"Token validation error: {str(e)}")
+        return BatchTokenValidationResponse(results=[error] * len(request.tokens))
+
 @router.post("/logout", status_code=status.HTTP_200_OK)
 async def logout(
     request: LogoutRequest,
@@ -367,6 +383,18 @@ async def internal_validate_token(
     auth_service = AuthService(db)
     return await auth_service.validate_token(request.token)
 
+# Лента отзывов токенов для API Gateway (проверка отзыва без запроса к Auth Service на каждый вызов)
+@router.get("/internal/revocations", response_model=RevocationFeedResponse)
+async def internal_revocations(
+    since: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Внутренний endpoint: полный снимок отзывов (bloom filter) или отзывы после since
+    """
+    auth_service = AuthService(db)
+    return await auth_service.get_revocation_feed(since)
+
 # Endpoint для получения информации о пользователе по токену
 @router.get("/internal/user-info/{user_id}")
 async def get_user_info_internal(
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Auth Service - Revocation Feed
+Компактное представление отозванных токенов (bloom filter) для API Gateway
+"""
+import base64
+import hashlib
+import math
+import os
+from typing import Any, Dict, Iterable
+
+# Допустимая доля ложных срабатываний фильтра
+REVOCATION_BLOOM_FP_RATE = float(os.getenv("REVOCATION_BLOOM_FP_RATE", "0.01"))
+# Перекрытие инкрементальной выдачи: отзывы, закоммиченные позже чтения курсора, не теряются
+REVOCATION_FEED_OVERLAP_SECONDS = int(os.getenv("REVOCATION_FEED_OVERLAP_SECONDS", "5"))
+
+
+class BloomFilter:
+    """
+    Bloom filter по jti. Формат (size, hashes, bits в base64) и схема хэширования
+    должны совпадать с BloomFilter в API Gateway (app/core/revocation.py)
+    и в services/shared/token_validator.py
+    """
+
+    def __init__(self, size: int, hashes: int, bits: bytes = None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float = REVOCATION_BLOOM_FP_RATE) -> "BloomFilter":
+        """Фильтр оптимального размера для capacity элементов"""
+        capacity = max(capacity, 1)
+        size = max(64, math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hashes)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Двойное хэширование: h1 + i * h2 из одного sha256
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "hashes": self.hashes,
+            "bits": base64.b64encode(bytes(self.bits)).decode("ascii"),
+        }
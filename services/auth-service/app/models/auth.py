@@ -32,7 +32,7 @@ class AuthToken(Base):
     
     # Метаданные
     is_revoked = Column(Boolean, default=False, nullable=False)
-    revoked_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True, index=True)  # Инкрементальная выдача отзывов Gateway
     
     # Информация о клиенте
     client_ip = Column(String, nullable=True)
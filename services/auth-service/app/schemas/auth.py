@@ -73,6 +73,14 @@ class TokenValidationResponse(BaseModel):
     scopes: Optional[List[str]] = None
     error: Optional[str] = None
 
+class BatchTokenValidationRequest(BaseModel):
+    """Запрос на валидацию нескольких токенов одним запросом"""
+    tokens: List[str] = Field(..., min_length=1, max_length=500, description="JWT токены для валидации")
+
+class BatchTokenValidationResponse(BaseModel):
+    """Результаты валидации в порядке токенов запроса"""
+    results: List[TokenValidationResponse]
+
 class LogoutRequest(BaseModel):
     """Запрос на выход"""
     token: str = Field(..., description="Access токен")
@@ -169,6 +177,14 @@ class AuthStats(BaseModel):
     failed_logins_24h: int
     unique_users_24h: int
 
+class RevocationFeedResponse(BaseModel):
+    """Отозванные access токены для API Gateway"""
+    cursor: datetime = Field(..., description="Передается в since при следующем запросе")
+    full: bool = Field(..., description="True - полный снимок в bloom, False - только новые отзывы")
+    bloom: Optional[Dict[str, Any]] = Field(None, description="Bloom filter по jti (size, hashes, bits)")
+    revoked: List[str] = Field(default_factory=list, description="jti, отозванные после since")
+    count: int = 0
+
 class UserAuthInfo(BaseModel):
     """Информация об аутентификации пользователя"""
     user_id: int
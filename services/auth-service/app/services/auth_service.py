@@ -14,9 +14,10 @@ import httpx
 from ..models.auth import AuthToken, AccessCode, AuthSession, AuthLog, ApiKey, TokenType
 from ..schemas.auth import (
     AccessCodeRequest, LoginResponse, TokenRefreshRequest, TokenValidationResponse,
-    LogoutRequest, SessionCreate, ApiKeyCreate, AuthLogCreate, AuthStats
+    BatchTokenValidationResponse, LogoutRequest, SessionCreate, ApiKeyCreate, AuthLogCreate, AuthStats, RevocationFeedResponse
 )
 from ..core.security import security_manager, hash_string, create_tokens_for_user
+from ..core.revocation import BloomFilter, REVOCATION_FEED_OVERLAP_SECONDS
 
 class AuthService:
     """Сервис аутентификации и авторизации"""
@@ -224,50 +225,66 @@ class AuthService:
         """
         Валидация токена
         """
-        try:
-            # Декодируем токен
-            payload = security_manager.validate_token(token, "access")
-            if not payload:
-                return TokenValidationResponse(
+        return (await self.validate_tokens([token])).results[0]
+    
+    async def validate_tokens(self, tokens: List[str]) -> BatchTokenValidationResponse:
+        """
+        Валидация нескольких токенов: подписи проверяются локально,
+        отзыв - одним запросом к БД по всем jti
+        """
+        results: List[Optional[TokenValidationResponse]] = [None] * len(tokens)
+        decoded: Dict[int, Dict[str, Any]] = {}
+        
+        for index, token in enumerate(tokens):
+            try:
+                payload = security_manager.validate_token(token, "access")
+                if not payload:
+                    results[index] = TokenValidationResponse(valid=False, error="Invalid or expired token")
+                    continue
+                payload["sub"] = int(payload["sub"])
+                decoded[index] = payload
+            except Exception as e:
+                results[index] = TokenValidationResponse(
                     valid=False,
-                    error="Invalid or expired token"
+                    error=f"Token validation error: {str(e)}"
                 )
-            
-            user_id = int(payload["sub"])
-            token_id = payload["jti"]
-            
+        
+        active: set = set()
+        if decoded:
             # Проверяем в базе данных
-            result = await self.db.execute(
-                select(AuthToken).where(
-                    and_(
-                        AuthToken.token_id == token_id,
-                        AuthToken.user_id == user_id,
-                        AuthToken.token_type == TokenType.ACCESS,
-                        AuthToken.is_revoked == False
+            try:
+                result = await self.db.execute(
+                    select(AuthToken.token_id, AuthToken.user_id).where(
+                        and_(
+                            AuthToken.token_id.in_({payload["jti"] for payload in decoded.values()}),
+                            AuthToken.token_type == TokenType.ACCESS,
+                            AuthToken.is_revoked == False
+                        )
                     )
                 )
-            )
-            stored_token = result.scalar_one_or_none()
-            
-            if not stored_token:
-                return TokenValidationResponse(
-                    valid=False,
-                    error="Token revoked or not found"
-                )
-            
-            return TokenValidationResponse(
+                active = {(row.token_id, row.user_id) for row in result.all()}
+            except Exception as e:
+                # Отзыв не проверить - токены недействительны
+                for index in decoded:
+                    results[index] = TokenValidationResponse(
+                        valid=False,
+                        error=f"Token validation error: {str(e)}"
+                    )
+                return BatchTokenValidationResponse(results=results)
+        
+        for index, payload in decoded.items():
+            if (payload["jti"], payload["sub"]) not in active:
+                results[index] = TokenValidationResponse(valid=False, error="Token revoked or not found")
+                continue
+            results[index] = TokenValidationResponse(
                 valid=True,
-                user_id=user_id,
+                user_id=payload["sub"],
                 user_role=payload.get("role"),
                 expires_at=datetime.fromtimestamp(payload["exp"]),
                 scopes=payload.get("scopes", [])
             )
-            
-        except Exception as e:
-            return TokenValidationResponse(
-                valid=False,
-                error=f"Token validation error: {str(e)}"
-            )
+        
+        return BatchTokenValidationResponse(results=results)
     
     async def logout(
         self, 
@@ -357,6 +374,37 @@ class AuthService:
             )
             return False
     
+    async def get_revocation_feed(self, since: Optional[datetime] = None) -> RevocationFeedResponse:
+        """
+        Отозванные и еще не истекшие access токены для API Gateway.
+        Без since - полный снимок в виде bloom filter, с since - jti, отозванные после since
+        """
+        cursor = datetime.utcnow()
+        conditions = [
+            AuthToken.token_type == TokenType.ACCESS,
+            AuthToken.is_revoked == True,
+            AuthToken.expires_at > cursor
+        ]
+        if since is not None:
+            conditions.append(
+                AuthToken.revoked_at >= since - timedelta(seconds=REVOCATION_FEED_OVERLAP_SECONDS)
+            )
+        
+        result = await self.db.execute(select(AuthToken.token_id).where(and_(*conditions)))
+        token_ids = list(result.scalars().all())
+        
+        if since is not None:
+            return RevocationFeedResponse(
+                cursor=cursor, full=False, revoked=token_ids, count=len(token_ids)
+            )
+        
+        bloom = BloomFilter.for_capacity(len(token_ids))
+        for token_id in token_ids:
+            bloom.add(token_id)
+        return RevocationFeedResponse(
+            cursor=cursor, full=True, bloom=bloom.to_dict(), count=len(token_ids)
+        )
+    
     async def create_session(self, session_data: SessionCreate) -> str:
         """
         Создание новой сессии
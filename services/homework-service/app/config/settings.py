@@ -56,6 +56,11 @@ class Settings(BaseSettings):
     THUMBNAIL_SIZE: int = 200
     COMPRESSED_MAX_SIZE: int = 1920
     JPEG_QUALITY: int = 80
+    MEDIA_QUEUE_NAME: str = "homework_media_processing"
+    MEDIA_WORKERS: int = 2  # Процессы Pillow на экземпляр сервиса
+    MEDIA_CONSUMER_ENABLED: bool = True  # False - экземпляр только ставит задачи в очередь
+    DOWNLOAD_CACHE_CONTROL: str = "private, max-age=3600"
+    FILE_ACCEL_REDIRECT_PREFIX: str = ""  # Например "/protected-files": файлы отдает nginx через sendfile
     
     # Homework settings
     DEFAULT_DEADLINE_HOURS: int = 168  # 7 дней
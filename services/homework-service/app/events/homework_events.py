@@ -15,6 +15,8 @@ import aio_pika
 from aio_pika import Connection, Channel, Exchange, Queue
 from aio_pika.abc import AbstractIncomingMessage
 
+from shared.reliable_consumer import DeadLetterTopology, ReliableConsumer
+
 from ..config.settings import get_settings
 from ..models.homework import Homework, HomeworkSubmission
 
@@ -263,6 +265,8 @@ class HomeworkEventConsumer:
         self.channel: Optional[Channel] = None
         self.exchange: Optional[Exchange] = None
         self._is_running = False
+        # Повторы с задержкой и карантин по очередям
+        self.reliable: Dict[str, ReliableConsumer] = {}
     
     async def initialize(self):
         """Инициализация consumer."""
@@ -312,9 +316,9 @@ class HomeworkEventConsumer:
             await user_queue.bind(self.exchange, "user.updated")
             await user_queue.bind(self.exchange, "user.deleted")
             
-            # Запуск потребления
-            await lesson_queue.consume(self.handle_lesson_event)
-            await user_queue.consume(self.handle_user_event)
+            # Запуск потребления: ack, повторы и карантин делает ReliableConsumer
+            await lesson_queue.consume(await self._reliable(lesson_queue, "homework_service_lesson_events", self.handle_lesson_event))
+            await user_queue.consume(await self._reliable(user_queue, "homework_service_user_events", self.handle_user_event))
             
             self._is_running = True
             logger.info("Started consuming homework events")
@@ -333,43 +337,44 @@ class HomeworkEventConsumer:
         except Exception as e:
             logger.error(f"Error stopping homework event consumer: {e}")
     
+    async def _reliable(self, queue: Queue, queue_name: str, handler) -> Any:
+        """Объявляет очереди повторов и карантина для queue и оборачивает handler"""
+        reliable = ReliableConsumer(DeadLetterTopology(settings.EVENT_EXCHANGE_NAME, queue_name))
+        await reliable.declare(self.channel, queue)
+        self.reliable[queue_name] = reliable
+        return reliable.wrap(handler)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Задержка и ошибки обработчиков, повторы и карантин по очередям"""
+        return {name: reliable.get_metrics() for name, reliable in self.reliable.items()}
+    
     async def handle_lesson_event(self, message: AbstractIncomingMessage):
         """Обработчик событий уроков."""
-        try:
-            async with message.process():
-                event_data = json.loads(message.body.decode('utf-8'))
-                event_type = event_data.get('event_type')
-                
-                logger.info(f"Received lesson event: {event_type}")
-                
-                if event_type == "lesson.created":
-                    await self._handle_lesson_created(event_data)
-                elif event_type == "lesson.updated":
-                    await self._handle_lesson_updated(event_data)
-                elif event_type == "lesson.cancelled":
-                    await self._handle_lesson_cancelled(event_data)
-                elif event_type == "lesson.completed":
-                    await self._handle_lesson_completed(event_data)
-                
-        except Exception as e:
-            logger.error(f"Failed to handle lesson event: {e}")
+        event_data = json.loads(message.body.decode('utf-8'))
+        event_type = event_data.get('event_type')
+        
+        logger.info(f"Received lesson event: {event_type}")
+        
+        if event_type == "lesson.created":
+            await self._handle_lesson_created(event_data)
+        elif event_type == "lesson.updated":
+            await self._handle_lesson_updated(event_data)
+        elif event_type == "lesson.cancelled":
+            await self._handle_lesson_cancelled(event_data)
+        elif event_type == "lesson.completed":
+            await self._handle_lesson_completed(event_data)
     
     async def handle_user_event(self, message: AbstractIncomingMessage):
         """Обработчик событий пользователей."""
-        try:
-            async with message.process():
-                event_data = json.loads(message.body.decode('utf-8'))
-                event_type = event_data.get('event_type')
-                
-                logger.info(f"Received user event: {event_type}")
-                
-                if event_type == "user.updated":
-                    await self._handle_user_updated(event_data)
-                elif event_type == "user.deleted":
-                    await self._handle_user_deleted(event_data)
-                
-        except Exception as e:
-            logger.error(f"Failed to handle user event: {e}")
+        event_data = json.loads(message.body.decode('utf-8'))
+        event_type = event_data.get('event_type')
+        
+        logger.info(f"Received user event: {event_type}")
+        
+        if event_type == "user.updated":
+            await self._handle_user_updated(event_data)
+        elif event_type == "user.deleted":
+            await self._handle_user_deleted(event_data)
     
     async def _handle_lesson_created(self, event_data: Dict[str, Any]):
         """Обработка создания урока."""
@@ -7,7 +7,8 @@ Homework Service - FastAPI микросервис для управления д
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
@@ -46,7 +47,7 @@ async def lifespan(app: FastAPI):
         # Инициализация file service
         logger.info("Initializing file service...")
         file_service = FileService()
-        await file_service.initialize()
+        await file_service.initialize(event_publisher.connection)
         app.state.file_service = file_service
         
         # Инициализация health service
@@ -66,6 +67,7 @@ async def lifespan(app: FastAPI):
             await app.state.event_publisher.close()
         if hasattr(app.state, 'file_service'):
             await app.state.file_service.cleanup()
+            await app.state.file_service.close()
         logger.info("Homework Service shutdown complete")
 
 
@@ -151,6 +153,8 @@ async def get_metrics():
     try:
         health_service = app.state.health_service
         metrics = await health_service.get_metrics()
+        if hasattr(app.state, 'file_service'):
+            metrics["media_processing"] = app.state.file_service.media_queue.get_metrics()
         return metrics
     except Exception as e:
         logger.error(f"Failed to get metrics: {e}")
@@ -160,6 +164,21 @@ async def get_metrics():
         )
 
 
+# Отдача файлов: Range, ETag, HEAD; через Gateway передается потоком
+@app.api_route("/api/v1/homework/files/{file_path:path}", methods=["GET", "HEAD"])
+async def download_file(file_path: str, request: Request, filename: Optional[str] = None):
+    """Скачивание файла домашнего задания из хранилища."""
+    try:
+        return app.state.file_service.get_file_response(
+            file_path,
+            request.headers,
+            filename=filename,
+            method=request.method
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+
 # API роутеры
 app.include_router(
     homework.router,
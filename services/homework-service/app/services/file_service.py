@@ -2,20 +2,28 @@
 """
 File Service для управления файлами домашних заданий.
 Реализует загрузку, обработку, сжатие и безопасность файлов.
+Файлы дедуплицируются по SHA-256 в хранилище блобов, миниатюры и сжатые версии
+создаются один раз на блоб в фоновой очереди обработки медиа.
 """
 
 import os
+import asyncio
 import uuid
+import json
 import hashlib
 import logging
 import mimetypes
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Mapping, Tuple
 from pathlib import Path
 import aiofiles
 from PIL import Image
 import io
 
+from shared.blob_store import BlobStore
+from shared.file_response import RangeFileResponse
+from shared.media_queue import MediaQueue, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+
 from ..config.settings import get_settings
 from ..models.homework import HomeworkFile, SubmissionFile, FileType
 
@@ -41,6 +49,15 @@ ALLOWED_AUDIO_TYPES = {
     'audio/mpeg', 'audio/wav', 'audio/ogg', 'audio/mp4'
 }
 
+# Имена производных файлов блоба
+THUMBNAIL_NAME = "thumb_200x200.jpg"
+COMPRESSED_NAME = "compressed_1920x1080.jpg"
+
+# Маркеры обработки рядом с производными файлами блоба (удаляются сборщиком мусора вместе с ними):
+# задача поставлена (содержимое - задача для повторной постановки) и последняя попытка упала
+PENDING_MARKER = "processing.pending"
+FAILED_MARKER = "processing.failed"
+
 ALL_ALLOWED_TYPES = ALLOWED_IMAGE_TYPES | ALLOWED_DOCUMENT_TYPES | ALLOWED_VIDEO_TYPES | ALLOWED_AUDIO_TYPES
 
 # Максимальные размеры файлов (в байтах)
@@ -60,14 +77,27 @@ class FileService:
         self.storage_path = Path(settings.FILE_STORAGE_PATH)
         self.thumbnail_path = self.storage_path / "thumbnails"
         self.compressed_path = self.storage_path / "compressed"
+        self.temp_path = self.storage_path / "temp"
+        self.blobs: Optional[BlobStore] = None
+        self.media_queue = MediaQueue(
+            settings.MEDIA_QUEUE_NAME,
+            settings.EVENT_EXCHANGE_NAME,
+            self.process_media,
+            workers=settings.MEDIA_WORKERS
+        )
     
-    async def initialize(self):
-        """Инициализация файлового сервиса."""
+    async def initialize(self, connection=None):
+        """
+        Инициализация файлового сервиса.
+        connection - соединение RabbitMQ для очереди обработки медиа (None - очередь в памяти)
+        """
         try:
             # Создание директорий
             self.storage_path.mkdir(exist_ok=True)
             self.thumbnail_path.mkdir(exist_ok=True)
             self.compressed_path.mkdir(exist_ok=True)
+            self.temp_path.mkdir(exist_ok=True)
+            self.blobs = BlobStore(str(self.storage_path))
             
             # Создание поддиректорий по типам файлов
             for file_type in FileType:
@@ -75,6 +105,13 @@ class FileService:
                 (self.thumbnail_path / file_type.value).mkdir(exist_ok=True)
                 (self.compressed_path / file_type.value).mkdir(exist_ok=True)
             
+            await self.media_queue.start(connection, consume=settings.MEDIA_CONSUMER_ENABLED)
+            # RabbitMQ хранит незавершенные задачи сам, повторная постановка только дублировала бы их
+            if self.media_queue.mode == "local":
+                requeued = await self.requeue_pending()
+                if requeued:
+                    logger.info(f"Requeued {requeued} pending media jobs")
+            
             logger.info("File service initialized successfully")
             
         except Exception as e:
@@ -96,11 +133,19 @@ class FileService:
                         if file_age > 30 * 24 * 3600:  # 30 дней
                             file_path.unlink()
             
+            # Удаление блобов без ссылок
+            if self.blobs:
+                await self.blobs.collect_garbage()
+            
             logger.info("File cleanup completed")
             
         except Exception as e:
             logger.error(f"File cleanup error: {e}")
     
+    async def close(self):
+        """Остановка очереди обработки медиа."""
+        await self.media_queue.stop()
+    
     def get_file_type(self, mime_type: str) -> FileType:
         """Определение типа файла по MIME type."""
         if mime_type in ALLOWED_IMAGE_TYPES:
@@ -157,10 +202,13 @@ class FileService:
         filename: str,
         mime_type: str,
         uploaded_by: int,
-        upload_source: str = "api"
+        upload_source: str = "api",
+        priority: int = PRIORITY_NORMAL
     ) -> Dict[str, Any]:
         """
         Сохранение файла в файловую систему.
+        Миниатюра и сжатая версия создаются в фоне: их пути известны сразу,
+        файлы появятся, когда processing_status станет "completed".
         
         Returns:
             Dict с информацией о сохраненном файле
@@ -174,42 +222,51 @@ class FileService:
             # Определение типа файла
             file_type = self.get_file_type(mime_type)
             
-            # Генерация уникального имени файла
-            file_uuid = str(uuid.uuid4())
-            file_ext = Path(filename).suffix.lower()
-            new_filename = f"{file_uuid}{file_ext}"
-            
-            # Путь для сохранения
-            type_dir = self.storage_path / file_type.value
-            file_path = type_dir / new_filename
-            
-            # Сохранение файла
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_data)
-            
             # Расчет хеша файла
             file_hash = hashlib.sha256(file_data).hexdigest()
+            file_ext = Path(filename).suffix.lower()
+            new_filename = f"{file_hash}{file_ext}"
             
-            # Создание миниатюры для изображений
+            # Сохранение во временный файл и перенос в хранилище блобов:
+            # повторная загрузка того же содержимого только добавляет ссылку
+            temp_file = self.temp_path / f"{uuid.uuid4()}.part"
+            try:
+                async with aiofiles.open(temp_file, 'wb') as f:
+                    await f.write(file_data)
+                file_path, created = await self.blobs.put_file(temp_file, file_hash)
+            finally:
+                temp_file.unlink(missing_ok=True)
+            if not created:
+                logger.info(f"Deduplicated file {filename} ({file_hash})")
+            
+            # Миниатюра для изображений и сжатая версия для больших (больше 1MB)
             thumbnail_path = None
-            if file_type == FileType.IMAGE:
-                thumbnail_path = await self._create_thumbnail(file_path, file_type)
-            
-            # Сжатие для больших файлов
             compressed_path = None
-            if len(file_data) > 1024 * 1024:  # Больше 1MB
-                compressed_path = await self._create_compressed_version(file_path, file_type)
+            if file_type == FileType.IMAGE:
+                thumbnail_path = self._derived_path(file_hash, THUMBNAIL_NAME)
+                if len(file_data) > 1024 * 1024:
+                    compressed_path = self._derived_path(file_hash, COMPRESSED_NAME)
+            
+            # Для дубликата производные файлы уже есть в кэше блоба
+            processing_status = self.get_processing_status(thumbnail_path, compressed_path)
+            if processing_status != "completed":
+                # После неудачной обработки повторная загрузка того же файла запускает ее снова
+                job = {"file_hash": file_hash, "compress": compressed_path is not None}
+                await asyncio.to_thread(self._mark, file_hash, PENDING_MARKER, json.dumps(job))
+                await self.media_queue.enqueue(job, priority)
+                processing_status = "pending"
             
             return {
                 "filename": new_filename,
                 "original_filename": filename,
-                "file_path": str(file_path.relative_to(self.storage_path)),
+                "file_path": file_path,
                 "file_size": len(file_data),
                 "file_type": file_type,
                 "mime_type": mime_type,
                 "file_hash": file_hash,
-                "thumbnail_path": str(thumbnail_path.relative_to(self.storage_path)) if thumbnail_path else None,
-                "compressed_path": str(compressed_path.relative_to(self.storage_path)) if compressed_path else None,
+                "thumbnail_path": thumbnail_path,
+                "compressed_path": compressed_path,
+                "processing_status": processing_status,
                 "uploaded_by": uploaded_by,
                 "upload_source": upload_source
             }
@@ -218,61 +275,101 @@ class FileService:
             logger.error(f"Failed to save file {filename}: {e}")
             raise
     
-    async def _create_thumbnail(self, file_path: Path, file_type: FileType) -> Optional[Path]:
-        """Создание миниатюры для изображения."""
-        if file_type != FileType.IMAGE:
-            return None
+    @staticmethod
+    def _build_thumbnail(source: Path, target: Path):
+        with Image.open(source) as img:
+            # Конвертация в RGB если необходимо
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            
+            # Создание миниатюры 200x200
+            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
+            img.save(target, 'JPEG', quality=80, optimize=True)
+    
+    @staticmethod
+    def _build_compressed(source: Path, target: Path):
+        with Image.open(source) as img:
+            # Конвертация в RGB
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            
+            # Уменьшение размера если больше 1920x1080
+            if img.width > 1920 or img.height > 1080:
+                img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
+            
+            # Сохранение с сжатием
+            img.save(target, 'JPEG', quality=70, optimize=True)
+    
+    def _derived_path(self, file_hash: str, name: str) -> str:
+        return str(self.blobs.derived_path(file_hash, name).relative_to(self.storage_path))
+    
+    def _mark(self, file_hash: str, marker: str, content: Optional[str] = None):
+        """Записывает маркер обработки блоба (None - удаляет)"""
+        path = self.blobs.derived_path(file_hash, marker)
+        if content is None:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    
+    def get_processing_status(self, *derived_paths: Optional[str]) -> str:
+        """
+        Статус обработки: "completed", когда все производные файлы созданы,
+        "failed", если последняя попытка завершилась ошибкой, иначе "pending".
+        """
+        missing = [self.storage_path / path for path in derived_paths if path and not (self.storage_path / path).exists()]
+        if not missing:
+            return "completed"
+        if any((path.parent / FAILED_MARKER).exists() for path in missing):
+            return "failed"
+        return "pending"
+    
+    async def process_media(self, job: Dict[str, Any]):
+        """Обработчик очереди медиа: миниатюра и сжатая версия в пуле процессов."""
+        file_hash = job["file_hash"]
+        if not self.blobs.blob_path(file_hash).exists():
+            logger.info(f"Skipping media job for removed blob {file_hash}")
+            return
         
         try:
-            thumbnail_dir = self.thumbnail_path / file_type.value
-            thumbnail_path = thumbnail_dir / f"thumb_{file_path.name}"
-            
-            # Создание миниатюры
-            with Image.open(file_path) as img:
-                # Конвертация в RGB если необходимо
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Создание миниатюры 200x200
-                img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-                img.save(thumbnail_path, 'JPEG', quality=80, optimize=True)
-            
-            return thumbnail_path
+            async with self.media_queue.stage("thumbnail"):
+                await self.blobs.derive(file_hash, THUMBNAIL_NAME, self._build_thumbnail, self.media_queue.executor)
             
+            if job.get("compress"):
+                async with self.media_queue.stage("compress"):
+                    await self.blobs.derive(file_hash, COMPRESSED_NAME, self._build_compressed, self.media_queue.executor)
         except Exception as e:
-            logger.error(f"Failed to create thumbnail for {file_path}: {e}")
-            return None
+            # Ошибка пробрасывается в очередь: повтор с задержкой, затем карантин.
+            # До успешного повтора файл отдается со статусом "failed"
+            await asyncio.to_thread(self._mark, file_hash, FAILED_MARKER, repr(e))
+            raise
+        
+        await asyncio.to_thread(self._mark, file_hash, FAILED_MARKER)
+        await asyncio.to_thread(self._mark, file_hash, PENDING_MARKER)
     
-    async def _create_compressed_version(self, file_path: Path, file_type: FileType) -> Optional[Path]:
-        """Создание сжатой версии файла."""
-        if file_type != FileType.IMAGE:
-            return None
+    async def requeue_pending(self) -> int:
+        """
+        Повторно ставит незавершенные задачи (очередь в памяти процесса теряет их при остановке).
+        Задачи с неудачной последней попыткой не повторяются до новой загрузки файла
+        """
+        def scan() -> List[Dict[str, Any]]:
+            jobs = []
+            for marker in self.blobs.derived_dir.glob(f"*/*/*/{PENDING_MARKER}"):
+                if (marker.parent / FAILED_MARKER).exists():
+                    continue
+                try:
+                    jobs.append(json.loads(marker.read_text()))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable media job marker {marker}: {e}")
+            return jobs
         
-        try:
-            compressed_dir = self.compressed_path / file_type.value
-            compressed_path = compressed_dir / f"comp_{file_path.stem}.jpg"
-            
-            # Сжатие изображения
-            with Image.open(file_path) as img:
-                # Конвертация в RGB
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Уменьшение размера если больше 1920x1080
-                if img.width > 1920 or img.height > 1080:
-                    img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
-                
-                # Сохранение с сжатием
-                img.save(compressed_path, 'JPEG', quality=70, optimize=True)
-            
-            return compressed_path
-            
-        except Exception as e:
-            logger.error(f"Failed to create compressed version for {file_path}: {e}")
-            return None
+        jobs = await asyncio.to_thread(scan)
+        for job in jobs:
+            await self.media_queue.enqueue(job, PRIORITY_LOW)
+        return len(jobs)
     
     async def get_file_data(self, file_path: str) -> bytes:
-        """Получение данных файла."""
+        """Получение данных файла (для отдачи по HTTP - get_file_response)."""
         try:
             full_path = self.storage_path / file_path
             
@@ -286,9 +383,46 @@ class FileService:
             logger.error(f"Failed to read file {file_path}: {e}")
             raise
     
+    def get_file_response(
+        self,
+        file_path: str,
+        request_headers: Mapping[str, str],
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        method: str = "GET"
+    ) -> RangeFileResponse:
+        """
+        HTTP ответ с файлом без чтения в память: Range, ETag (SHA-256 блоба), Cache-Control.
+        С FILE_ACCEL_REDIRECT_PREFIX файл отдает nginx через sendfile.
+        """
+        full_path = (self.storage_path / file_path).resolve()
+        if not full_path.is_relative_to(self.storage_path.resolve()) or not full_path.is_file():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        accel_redirect = None
+        if settings.FILE_ACCEL_REDIRECT_PREFIX:
+            accel_redirect = f"{settings.FILE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{file_path}"
+        
+        return RangeFileResponse(
+            str(full_path),
+            request_headers,
+            filename=filename,
+            media_type=mime_type or mimetypes.guess_type(filename or file_path)[0],
+            etag=self.blobs.digest_of(file_path) if self.blobs else None,
+            cache_control=settings.DOWNLOAD_CACHE_CONTROL,
+            accel_redirect=accel_redirect,
+            method=method
+        )
+    
     async def delete_file(self, file_path: str) -> bool:
         """Удаление файла и связанных миниатюр."""
         try:
+            # Блоб удаляет сборщик мусора вместе с производными файлами, когда на него не останется ссылок
+            file_hash = self.blobs.digest_of(file_path) if self.blobs else None
+            if file_hash:
+                await self.blobs.release(file_hash)
+                return True
+            
             full_path = self.storage_path / file_path
             
             if full_path.exists():
@@ -370,8 +504,9 @@ class FileService:
                     mime_type = 'application/octet-stream'
             
             # Сохранение файла
+            # Пользователь бота ждет ответа - обработка вне очереди пакетных загрузок
             file_info = await self.save_file(
-                file_data, filename, mime_type, uploaded_by, "telegram"
+                file_data, filename, mime_type, uploaded_by, "telegram", PRIORITY_HIGH
             )
             
             # Добавление Telegram метаданных
@@ -409,6 +544,12 @@ class FileService:
                     stats["total_files"] += len(type_files)
                     stats["total_size"] += type_size
             
+            if self.blobs:
+                blob_stats = await self.blobs.get_stats()
+                stats["blobs"] = blob_stats
+                stats["total_files"] += blob_stats["references"]
+                stats["total_size"] += blob_stats["stored_bytes"]
+            
             return stats
             
         except Exception as e:
@@ -14,9 +14,15 @@ from dataclasses import dataclass, asdict
 import aio_pika
 from aio_pika import Connection, Channel, Exchange, Queue
 from aio_pika.abc import AbstractIncomingMessage
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.outbox import AmqpBatchPublisher, OutboxRelay, enqueue, notify_after_commit
+from shared.reliable_consumer import DeadLetterTopology, ReliableConsumer
 
 from ..config.settings import get_settings
+from ..database.connection import AsyncSessionLocal
 from ..models.lesson import Lesson, LessonAttendance
+from .outbox import OutboxEvent
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -46,7 +52,8 @@ class LessonEvent:
 class LessonEventPublisher:
     """
     Publisher для отправки событий о уроках.
-    Использует RabbitMQ для асинхронной доставки событий.
+    События сохраняются в outbox (таблица event_outbox) и доставляются в RabbitMQ
+    фоновым relay пачками с подтверждениями брокера.
     """
     
     def __init__(self):
@@ -54,12 +61,14 @@ class LessonEventPublisher:
         self.channel: Optional[Channel] = None
         self.exchange: Optional[Exchange] = None
         self._is_connected = False
+        self.relay = OutboxRelay(AsyncSessionLocal, OutboxEvent)
     
     async def initialize(self):
         """Инициализация подключения к RabbitMQ."""
         try:
             self.connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-            self.channel = await self.connection.channel()
+            # Подтверждения брокера: событие помечается опубликованным только после ack
+            self.channel = await self.connection.channel(publisher_confirms=True)
             
             # Создание exchange
             self.exchange = await self.channel.declare_exchange(
@@ -68,6 +77,9 @@ class LessonEventPublisher:
                 durable=True
             )
             
+            self.relay.publisher = AmqpBatchPublisher(self.exchange)
+            self.relay.start()
+            
             self._is_connected = True
             logger.info("Event publisher initialized successfully")
             
@@ -79,6 +91,7 @@ class LessonEventPublisher:
     async def close(self):
         """Закрытие подключения."""
         try:
+            await self.relay.stop()
             if self.connection and not self.connection.is_closed:
                 await self.connection.close()
             self._is_connected = False
@@ -86,35 +99,39 @@ class LessonEventPublisher:
         except Exception as e:
             logger.error(f"Error closing event publisher: {e}")
     
-    async def publish_event(self, event: LessonEvent, routing_key: str):
-        """Публикация события."""
-        if not self._is_connected or not self.exchange:
-            logger.warning("Event publisher not connected, skipping event")
-            return
+    async def publish_event(self, event: LessonEvent, routing_key: str, db: Optional[AsyncSession] = None):
+        """
+        Публикация события через outbox.
+        С db событие сохраняется в транзакции вызывающего кода (коммит делает он,
+        relay будится после коммита), без db - в отдельной транзакции. Событие не теряется при недоступном RabbitMQ.
+        """
+        headers = {
+            'event_type': event.event_type,
+            'service': 'lesson-service',
+            'version': '1.0'
+        }
         
         try:
-            message_body = json.dumps(event.to_dict(), ensure_ascii=False)
+            if db is not None:
+                enqueue(db, OutboxEvent, routing_key, event.to_dict(), headers)
+                notify_after_commit(db, self.relay)
+            else:
+                async with AsyncSessionLocal() as session:
+                    enqueue(session, OutboxEvent, routing_key, event.to_dict(), headers)
+                    await session.commit()
+                self.relay.notify()
             
-            await self.exchange.publish(
-                aio_pika.Message(
-                    message_body.encode('utf-8'),
-                    content_type='application/json',
-                    headers={
-                        'event_type': event.event_type,
-                        'service': 'lesson-service',
-                        'version': '1.0'
-                    }
-                ),
-                routing_key=routing_key
-            )
-            
-            logger.info(f"Published event {event.event_type} for lesson {event.lesson_id}")
+            logger.info(f"Queued event {event.event_type} for lesson {event.lesson_id}")
             
         except Exception as e:
-            logger.error(f"Failed to publish event {event.event_type}: {e}")
+            logger.error(f"Failed to queue event {event.event_type}: {e}")
             raise
     
-    async def publish_lesson_created(self, lesson: Lesson):
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Метрики outbox relay: пропускная способность, отставание, повторы."""
+        return await self.relay.get_metrics()
+    
+    async def publish_lesson_created(self, lesson: Lesson, db: Optional[AsyncSession] = None):
         """Событие создания урока."""
         event = LessonEvent(
             event_type="lesson.created",
@@ -131,9 +148,9 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.created")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.created", db)
     
-    async def publish_lesson_updated(self, lesson: Lesson, old_data: Dict[str, Any]):
+    async def publish_lesson_updated(self, lesson: Lesson, old_data: Dict[str, Any], db: Optional[AsyncSession] = None):
         """Событие обновления урока."""
         event = LessonEvent(
             event_type="lesson.updated",
@@ -151,14 +168,15 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.updated")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.updated", db)
     
     async def publish_lesson_rescheduled(
         self, 
         lesson: Lesson, 
         original_date: datetime, 
         new_date: datetime, 
-        reason: str
+        reason: str,
+        db: Optional[AsyncSession] = None
     ):
         """Событие переноса урока."""
         event = LessonEvent(
@@ -176,9 +194,9 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.rescheduled")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.rescheduled", db)
     
-    async def publish_lesson_cancelled(self, lesson: Lesson, reason: str):
+    async def publish_lesson_cancelled(self, lesson: Lesson, reason: str, db: Optional[AsyncSession] = None):
         """Событие отмены урока."""
         event = LessonEvent(
             event_type="lesson.cancelled",
@@ -195,9 +213,9 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.cancelled")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.cancelled", db)
     
-    async def publish_lesson_deleted(self, lesson: Lesson):
+    async def publish_lesson_deleted(self, lesson: Lesson, db: Optional[AsyncSession] = None):
         """Событие удаления урока."""
         event = LessonEvent(
             event_type="lesson.deleted",
@@ -211,9 +229,9 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.deleted")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.deleted", db)
     
-    async def publish_attendance_marked(self, lesson: Lesson, attendance: LessonAttendance):
+    async def publish_attendance_marked(self, lesson: Lesson, attendance: LessonAttendance, db: Optional[AsyncSession] = None):
         """Событие отметки посещаемости."""
         event = LessonEvent(
             event_type="lesson.attendance_marked",
@@ -232,9 +250,9 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.attendance")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.attendance", db)
     
-    async def publish_lesson_reminder_needed(self, lesson: Lesson, hours_before: int):
+    async def publish_lesson_reminder_needed(self, lesson: Lesson, hours_before: int, db: Optional[AsyncSession] = None):
         """Событие необходимости отправки напоминания о уроке."""
         event = LessonEvent(
             event_type="lesson.reminder_needed",
@@ -250,7 +268,7 @@ class LessonEventPublisher:
             }
         )
         
-        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.reminder")
+        await self.publish_event(event, f"{settings.LESSON_EVENT_ROUTING_KEY}.reminder", db)
 
 
 class LessonEventConsumer:
@@ -264,6 +282,8 @@ class LessonEventConsumer:
         self.channel: Optional[Channel] = None
         self.exchange: Optional[Exchange] = None
         self._is_running = False
+        # Повторы с задержкой и карантин по очередям
+        self.reliable: Dict[str, ReliableConsumer] = {}
     
     async def initialize(self):
         """Инициализация consumer."""
@@ -312,9 +332,9 @@ class LessonEventConsumer:
             await homework_queue.bind(self.exchange, "homework.submitted")
             await homework_queue.bind(self.exchange, "homework.checked")
             
-            # Запуск потребления
-            await user_queue.consume(self.handle_user_event)
-            await homework_queue.consume(self.handle_homework_event)
+            # Запуск потребления: ack, повторы и карантин делает ReliableConsumer
+            await user_queue.consume(await self._reliable(user_queue, "lesson_service_user_events", self.handle_user_event))
+            await homework_queue.consume(await self._reliable(homework_queue, "lesson_service_homework_events", self.handle_homework_event))
             
             self._is_running = True
             logger.info("Started consuming events")
@@ -333,42 +353,42 @@ class LessonEventConsumer:
         except Exception as e:
             logger.error(f"Error stopping event consumer: {e}")
     
+    async def _reliable(self, queue: Queue, queue_name: str, handler) -> Any:
+        """Объявляет очереди повторов и карантина для queue и оборачивает handler"""
+        reliable = ReliableConsumer(DeadLetterTopology(settings.EVENT_EXCHANGE_NAME, queue_name))
+        await reliable.declare(self.channel, queue)
+        self.reliable[queue_name] = reliable
+        return reliable.wrap(handler)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Задержка и ошибки обработчиков, повторы и карантин по очередям"""
+        return {name: reliable.get_metrics() for name, reliable in self.reliable.items()}
+    
     async def handle_user_event(self, message: AbstractIncomingMessage):
         """Обработчик событий пользователей."""
-        try:
-            async with message.process():
-                event_data = json.loads(message.body.decode('utf-8'))
-                event_type = event_data.get('event_type')
-                
-                logger.info(f"Received user event: {event_type}")
-                
-                if event_type == "user.updated":
-                    await self._handle_user_updated(event_data)
-                elif event_type == "user.deleted":
-                    await self._handle_user_deleted(event_data)
-                
-        except Exception as e:
-            logger.error(f"Failed to handle user event: {e}")
-            # В реальном приложении здесь может быть retry логика
+        event_data = json.loads(message.body.decode('utf-8'))
+        event_type = event_data.get('event_type')
+        
+        logger.info(f"Received user event: {event_type}")
+        
+        if event_type == "user.updated":
+            await self._handle_user_updated(event_data)
+        elif event_type == "user.deleted":
+            await self._handle_user_deleted(event_data)
     
     async def handle_homework_event(self, message: AbstractIncomingMessage):
         """Обработчик событий домашних заданий."""
-        try:
-            async with message.process():
-                event_data = json.loads(message.body.decode('utf-8'))
-                event_type = event_data.get('event_type')
-                
-                logger.info(f"Received homework event: {event_type}")
-                
-                if event_type == "homework.assigned":
-                    await self._handle_homework_assigned(event_data)
-                elif event_type == "homework.submitted":
-                    await self._handle_homework_submitted(event_data)
-                elif event_type == "homework.checked":
-                    await self._handle_homework_checked(event_data)
-                
-        except Exception as e:
-            logger.error(f"Failed to handle homework event: {e}")
+        event_data = json.loads(message.body.decode('utf-8'))
+        event_type = event_data.get('event_type')
+        
+        logger.info(f"Received homework event: {event_type}")
+        
+        if event_type == "homework.assigned":
+            await self._handle_homework_assigned(event_data)
+        elif event_type == "homework.submitted":
+            await self._handle_homework_submitted(event_data)
+        elif event_type == "homework.checked":
+            await self._handle_homework_checked(event_data)
     
     async def _handle_user_updated(self, event_data: Dict[str, Any]):
         """Обработка обновления пользователя."""
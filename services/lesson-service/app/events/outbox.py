@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Таблица transactional outbox Lesson Service.
+Relay, публикация пачками с publisher confirms и enqueue - в shared/outbox.py
+(services/shared, копируется в образ как пакет shared)
+"""
+from shared.outbox import OutboxMixin
+
+from ..models.lesson import Base
+
+
+class OutboxEvent(OutboxMixin, Base):
+    """Событие, ожидающее публикации в RabbitMQ"""
+    pass
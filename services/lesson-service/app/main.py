@@ -138,6 +138,7 @@ async def get_metrics():
     try:
         health_service = app.state.health_service
         metrics = await health_service.get_metrics()
+        metrics["event_outbox"] = await app.state.event_publisher.get_metrics()
         return metrics
     except Exception as e:
         logger.error(f"Failed to get metrics: {e}")
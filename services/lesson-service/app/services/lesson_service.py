@@ -60,12 +60,14 @@ class LessonService:
             )
             
             db.add(lesson)
-            await db.commit()
-            await db.refresh(lesson)
+            await db.flush()
             
-            # Отправка события
+            # Событие сохраняется в outbox в той же транзакции
             if self.event_publisher:
-                await self.event_publisher.publish_lesson_created(lesson)
+                await self.event_publisher.publish_lesson_created(lesson, db=db)
+            
+            await db.commit()
+            await db.refresh(lesson)
             
             logger.info(f"Created lesson {lesson.id} for student {lesson.student_id}")
             return lesson
@@ -119,13 +121,13 @@ class LessonService:
             
             lesson.updated_at = datetime.now()
             
+            # Событие сохраняется в outbox в той же транзакции
+            if self.event_publisher:
+                await self.event_publisher.publish_lesson_updated(lesson, old_data, db=db)
+            
             await db.commit()
             await db.refresh(lesson)
             
-            # Отправка события
-            if self.event_publisher:
-                await self.event_publisher.publish_lesson_updated(lesson, old_data)
-            
             logger.info(f"Updated lesson {lesson.id}")
             return lesson
             
@@ -171,15 +173,15 @@ class LessonService:
             )
             db.add(cancellation)
             
-            await db.commit()
-            await db.refresh(lesson)
-            
-            # Отправка события
+            # Событие сохраняется в outbox в той же транзакции
             if self.event_publisher:
                 await self.event_publisher.publish_lesson_rescheduled(
-                    lesson, original_date, reschedule_data.new_date, reschedule_data.reason
+                    lesson, original_date, reschedule_data.new_date, reschedule_data.reason, db=db
                 )
             
+            await db.commit()
+            await db.refresh(lesson)
+            
             logger.info(f"Rescheduled lesson {lesson.id} from {original_date} to {reschedule_data.new_date}")
             return lesson
             
@@ -224,13 +226,13 @@ class LessonService:
             # Логика сдвига будущих уроков (из shift_lessons_after_cancellation)
             await self._shift_lessons_after_cancellation(lesson, db)
             
+            # Событие сохраняется в outbox в той же транзакции
+            if self.event_publisher:
+                await self.event_publisher.publish_lesson_cancelled(lesson, cancel_data.reason, db=db)
+            
             await db.commit()
             await db.refresh(lesson)
             
-            # Отправка события
-            if self.event_publisher:
-                await self.event_publisher.publish_lesson_cancelled(lesson, cancel_data.reason)
-            
             logger.info(f"Cancelled lesson {lesson.id}")
             return lesson
             
@@ -424,12 +426,14 @@ class LessonService:
                 attendance.actual_duration_minutes = int(duration.total_seconds() / 60)
             
             db.add(attendance)
-            await db.commit()
-            await db.refresh(attendance)
+            await db.flush()
             
-            # Отправка события
+            # Событие сохраняется в outbox в той же транзакции
             if self.event_publisher:
-                await self.event_publisher.publish_attendance_marked(lesson, attendance)
+                await self.event_publisher.publish_attendance_marked(lesson, attendance, db=db)
+            
+            await db.commit()
+            await db.refresh(attendance)
             
             logger.info(f"Marked attendance for lesson {lesson.id}")
             return attendance
@@ -539,13 +543,13 @@ class LessonService:
             if not lesson:
                 return False
             
+            # Событие сохраняется в outbox в той же транзакции
+            if self.event_publisher:
+                await self.event_publisher.publish_lesson_deleted(lesson, db=db)
+            
             await db.delete(lesson)
             await db.commit()
             
-            # Отправка события
-            if self.event_publisher:
-                await self.event_publisher.publish_lesson_deleted(lesson)
-            
             logger.info(f"Deleted lesson {lesson.id}")
             return True
             
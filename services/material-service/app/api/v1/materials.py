@@ -6,8 +6,7 @@ RESTful API for materials library and file management
 
 import logging
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Form, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...database.connection import get_db
@@ -18,7 +17,9 @@ from ...schemas.material import (
     MaterialListResponse, MaterialSearchRequest, MaterialStatsResponse,
     MaterialCategoryCreate, MaterialCategoryResponse, MaterialCategoryListResponse,
     MaterialFileResponse, FileUploadResponse, BatchFileUploadResponse,
-    MaterialFileListResponse, LegacyMaterialResponse, HealthResponse
+    MaterialFileListResponse, LegacyMaterialResponse, HealthResponse,
+    UploadSessionCreate, UploadSessionResponse,
+    MaterialReviewCreate, MaterialReviewResponse
 )
 from ...models.material import MaterialType, AccessLevel
 from ...core.config import settings
@@ -114,9 +115,10 @@ async def search_materials(
     is_featured: Optional[bool] = Query(None, description="Filter featured materials"),
     min_rating: Optional[float] = Query(None, ge=0, le=5, description="Minimum rating filter"),
     created_by_user_id: Optional[int] = Query(None, description="Filter by creator"),
+    tags: Optional[List[str]] = Query(None, description="Filter by tags (all must match)"),
     page: int = Query(1, ge=1, description="Page number"),
     per_page: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Items per page"),
-    sort_by: str = Query("created_at", description="Sort field"),
+    sort_by: str = Query("relevance", description="Sort field; relevance ranks search matches"),
     sort_order: str = Query("desc", regex="^(asc|desc)$", description="Sort order")
 ):
     """Search materials with filtering and pagination"""
@@ -131,6 +133,7 @@ async def search_materials(
             is_featured=is_featured,
             min_rating=min_rating,
             created_by_user_id=created_by_user_id,
+            tags=tags or [],
             page=page,
             per_page=per_page,
             sort_by=sort_by,
@@ -154,7 +157,8 @@ async def search_materials(
                 "difficulty_level": difficulty_level,
                 "is_featured": is_featured,
                 "min_rating": min_rating,
-                "created_by_user_id": created_by_user_id
+                "created_by_user_id": created_by_user_id,
+                "tags": tags
             }
         )
     except Exception as e:
@@ -201,6 +205,30 @@ async def increment_view_count(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
 
+@router.post("/materials/{material_id}/reviews", response_model=MaterialReviewResponse, status_code=status.HTTP_201_CREATED)
+async def create_review(material_id: int, review_data: MaterialReviewCreate):
+    """Add a review to material"""
+    if review_data.material_id != material_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Material ID mismatch")
+    review = await material_service.create_review(review_data)
+    if not review:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material not found")
+    return review
+
+
+@router.put("/materials/{material_id}/reviews/{review_id}/approval", response_model=MaterialReviewResponse)
+async def set_review_approval(
+    material_id: int,
+    review_id: int,
+    is_approved: bool = Query(..., description="Approve or reject the review")
+):
+    """Approve or reject a review (moderation)"""
+    review = await material_service.set_review_approval(material_id, review_id, is_approved)
+    if not review:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
+    return review
+
+
 @router.get("/materials/stats", response_model=MaterialStatsResponse)
 async def get_material_stats():
     """Get material statistics"""
@@ -279,6 +307,68 @@ async def batch_upload_files(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
 
+# Resumable uploads: create a session, PUT parts at offset (raw body), then complete.
+# After a failure GET the session and continue from received_bytes
+@router.post("/materials/{material_id}/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(material_id: int, upload: UploadSessionCreate):
+    """Start resumable upload for a large file"""
+    try:
+        return await file_service.create_upload_session(
+            material_id=material_id,
+            filename=upload.filename,
+            total_size=upload.total_size,
+            title=upload.title,
+            description=upload.description,
+            uploaded_by_user_id=upload.uploaded_by_user_id
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating upload session: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(upload_id: str):
+    """Get resumable upload state"""
+    return await file_service.get_upload_session(upload_id)
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Byte offset of this part")
+):
+    """Upload next part of a resumable upload (request body is streamed to disk)"""
+    try:
+        return await file_service.upload_chunk(upload_id, offset, request.stream())
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error uploading part of {upload_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=MaterialFileResponse, status_code=status.HTTP_201_CREATED)
+async def complete_upload(upload_id: str):
+    """Finish resumable upload and attach the file to its material"""
+    try:
+        return await file_service.complete_upload(upload_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error completing upload {upload_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
+
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload(upload_id: str):
+    """Cancel resumable upload"""
+    if not await file_service.abort_upload(upload_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+
+
 @router.get("/materials/{material_id}/files", response_model=MaterialFileListResponse)
 async def get_material_files(material_id: int):
     """Get files for material"""
@@ -303,19 +393,15 @@ async def get_file(file_id: int):
     return file
 
 
-@router.get("/files/{file_id}/download")
+@router.api_route("/files/{file_id}/download", methods=["GET", "HEAD"])
 async def download_file(
     file_id: int,
+    request: Request,
     user_id: Optional[int] = Query(None, description="User ID (for tracking)")
 ):
-    """Download file"""
+    """Download file (supports Range and If-None-Match)"""
     try:
-        file_path, filename, mime_type = await file_service.download_file(file_id, user_id)
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type=mime_type
-        )
+        return await file_service.download_file(file_id, request.headers, user_id, method=request.method)
     except HTTPException:
         raise
     except Exception as e:
@@ -48,6 +48,9 @@ class Settings(BaseSettings):
         "mp3", "mp4", "avi", "mov", "wav",
         "zip", "rar"
     ]
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # Upload read/write chunk (bounds memory per upload)
+    MAX_RESUMABLE_FILE_SIZE: int = 2 * 1024 * 1024 * 1024  # 2GB, resumable uploads (videos)
+    RESUMABLE_UPLOAD_TTL: int = 86400  # Abandoned resumable uploads are removed after 24h
     THUMBNAIL_SIZE: tuple = (200, 200)
     PREVIEW_SIZE: tuple = (800, 600)
     
@@ -93,13 +96,19 @@ class Settings(BaseSettings):
     # Search settings
     SEARCH_MIN_QUERY_LENGTH: int = 2
     SEARCH_MAX_RESULTS: int = 1000
-    ENABLE_FULL_TEXT_SEARCH: bool = True
+    ENABLE_FULL_TEXT_SEARCH: bool = True  # Index text extracted from PDF/DOCX/TXT files
+    SEARCH_TEXT_CONFIG: str = "russian"  # PostgreSQL text search configuration (stemming, stop words)
+    SEARCH_MAX_CONTENT_CHARS: int = 200000  # Extracted text indexed per material (tsvector is limited to 1MB)
     
     # File processing
     ENABLE_THUMBNAIL_GENERATION: bool = True
     ENABLE_PREVIEW_GENERATION: bool = True
     ENABLE_FILE_COMPRESSION: bool = True
     ENABLE_VIRUS_SCANNING: bool = False
+    MEDIA_QUEUE_NAME: str = "material_media_processing"
+    MEDIA_WORKERS: int = 2  # Pillow worker processes per instance
+    MEDIA_CONSUMER_ENABLED: bool = True  # False: instance only enqueues, dedicated workers process
+    MEDIA_PROCESSING_TIMEOUT: int = 1800  # "processing" files untouched this long are requeued at startup
     
     # Background tasks
     BACKGROUND_TASK_ENABLED: bool = True
@@ -114,6 +123,12 @@ class Settings(BaseSettings):
     # Analytics
     ENABLE_ACCESS_LOGGING: bool = True
     ENABLE_DOWNLOAD_TRACKING: bool = True
+    DOWNLOAD_COUNTER_FLUSH_INTERVAL: int = 5  # seconds, download counters are written in batches
+    DOWNLOAD_COUNTER_MAX_PENDING: int = 500  # flush earlier when this many downloads are buffered
+    DOWNLOAD_COUNTER_MAX_RETRIES: int = 3  # failed flushes before buffered access rows are dropped
+    DOWNLOAD_COUNTER_MAX_ACCESS_ROWS: int = 10000  # oldest buffered access rows are dropped beyond this
+    DOWNLOAD_CACHE_CONTROL: str = "private, max-age=3600"
+    FILE_ACCEL_REDIRECT_PREFIX: str = ""  # e.g. "/protected-files": nginx serves files via sendfile
     ENABLE_VIEW_TRACKING: bool = True
     
     # Development settings
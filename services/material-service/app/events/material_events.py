@@ -11,7 +11,8 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 
 from ..services.material_service import MaterialService
-from ..services.file_service import FileService
+from ..services.file_service import FileService, get_media_queue
+from ..services.download_counter import get_download_counter
 from ..core.config import settings
 from .rabbitmq_client import RabbitMQClient, MaterialEventPublisher, MockRabbitMQClient
 
@@ -344,7 +345,10 @@ class MaterialEventHandler:
         return {
             "is_running": self.is_running,
             "rabbitmq_connected": await self.rabbitmq_client.health_check() if self.rabbitmq_client else False,
-            "consumers_active": len(self.rabbitmq_client.consumers) if self.rabbitmq_client else 0
+            "consumers_active": len(self.rabbitmq_client.consumers) if self.rabbitmq_client else 0,
+            "consumers": self.rabbitmq_client.get_consumer_metrics() if self.rabbitmq_client else {},
+            "media_processing": get_media_queue().get_metrics(),
+            "download_counter": get_download_counter().get_metrics()
         }
     
     async def _create_material_recommendations(self, user_id: int, user_grade: int):
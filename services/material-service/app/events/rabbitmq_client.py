@@ -13,6 +13,8 @@ import aio_pika
 from aio_pika.abc import AbstractRobustConnection, AbstractRobustChannel
 from aio_pika import connect_robust, ExchangeType, Message
 
+from shared.reliable_consumer import DeadLetterTopology, ReliableConsumer
+
 from ..core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -27,6 +29,7 @@ class RabbitMQClient:
         self.exchange = None
         self.is_connected = False
         self.consumers = {}
+        self.reliable_consumers: Dict[str, ReliableConsumer] = {}
         
     async def connect(self) -> bool:
         """Establish connection to RabbitMQ"""
@@ -141,23 +144,19 @@ class RabbitMQClient:
                 await queue.bind(self.exchange, routing_key)
                 logger.info(f"Bound queue {queue_name} to {routing_key}")
             
-            # Create consumer
+            # Delayed retry queues and quarantine (dlq.<queue>)
+            reliable = ReliableConsumer(DeadLetterTopology(settings.RABBITMQ_EXCHANGE, queue_name))
+            await reliable.declare(self.channel, queue)
+            self.reliable_consumers[queue_name] = reliable
+            
+            # Create consumer: errors propagate to ReliableConsumer (retry or quarantine)
             async def message_handler(message: aio_pika.IncomingMessage):
-                async with message.process():
-                    try:
-                        # Parse message
-                        event_data = json.loads(message.body.decode())
-                        logger.info(f"Received event: {event_data.get('event_type')} on {queue_name}")
-                        
-                        # Handle event
-                        await handler(event_data)
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing message in {queue_name}: {e}")
-                        raise
+                event_data = json.loads(message.body.decode())
+                logger.info(f"Received event: {event_data.get('event_type')} on {queue_name}")
+                await handler(event_data)
             
             # Start consuming
-            consumer_tag = await queue.consume(message_handler)
+            consumer_tag = await queue.consume(reliable.wrap(message_handler, queue_name))
             self.consumers[queue_name] = consumer_tag
             
             logger.info(f"Started consumer for queue: {queue_name}")
@@ -205,6 +204,10 @@ class RabbitMQClient:
         except Exception as e:
             logger.error(f"Failed to setup DLQ for {original_queue_name}: {e}")
     
+    def get_consumer_metrics(self) -> Dict[str, Any]:
+        """Handler latency, failures, retries and quarantined messages per queue"""
+        return {name: reliable.get_metrics() for name, reliable in self.reliable_consumers.items()}
+    
     async def health_check(self) -> bool:
         """Check RabbitMQ connection health"""
         try:
@@ -17,6 +17,10 @@ from .api.v1.materials import router as materials_router
 from .events.material_events import MaterialEventHandler
 from .core.config import settings
 from .storage.file_storage import FileStorageManager
+from .services.file_service import FileService, get_media_queue
+from .services.download_counter import get_download_counter
+from .services.search_index import get_search_index
+from .services.material_service import MaterialService
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -39,6 +43,14 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
     
+    # Full-text index (tsvector/GIN on PostgreSQL, FTS5 on SQLite); indexes missing materials
+    await get_search_index().initialize()
+    logger.info("Search index initialized")
+    
+    # Rating aggregates may be missing for reviews written before they were maintained
+    await MaterialService().refresh_rating()
+    logger.info("Material ratings recalculated")
+    
     # Initialize file storage
     file_storage = FileStorageManager()
     await file_storage.initialize()
@@ -49,10 +61,31 @@ async def lifespan(app: FastAPI):
     await event_handler.start()
     logger.info("Event handler started")
     
+    # Background thumbnail/preview generation (durable queue when RabbitMQ is connected)
+    await get_media_queue().start(
+        getattr(event_handler.rabbitmq_client, "connection", None),
+        consume=settings.MEDIA_CONSUMER_ENABLED
+    )
+    logger.info("Media processing queue started")
+    
+    # Jobs of the in-process queue are lost on restart: pending and stuck files go back to it
+    if get_media_queue().mode == "local":
+        try:
+            requeued = await FileService().requeue_pending()
+            if requeued:
+                logger.info(f"Requeued processing of {requeued} pending files")
+        except Exception as e:
+            logger.error(f"Failed to requeue pending files: {e}")
+    
+    # Download counters are written in batches
+    await get_download_counter().start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Material Service...")
+    await get_media_queue().stop()
+    await get_download_counter().stop()
     if event_handler:
         await event_handler.stop()
     if file_storage:
@@ -145,6 +145,7 @@ class Material(Base):
     category = relationship("MaterialCategory", back_populates="materials")
     files = relationship("MaterialFile", back_populates="material", cascade="all, delete-orphan")
     reviews = relationship("MaterialReview", back_populates="material", cascade="all, delete-orphan")
+    tag_entries = relationship("MaterialTag", cascade="all, delete-orphan")
     
     # Indexes
     __table_args__ = (
@@ -211,6 +212,7 @@ class MaterialFile(Base):
     
     # Relationships
     material = relationship("Material", back_populates="files")
+    text = relationship("MaterialFileText", uselist=False, cascade="all, delete-orphan")
     
     # Indexes
     __table_args__ = (
@@ -220,6 +222,34 @@ class MaterialFile(Base):
     )
 
 
+class MaterialTag(Base):
+    """Normalized material tag (lowercase), used for tag filters"""
+    __tablename__ = 'material_tags'
+    
+    material_id = Column(Integer, ForeignKey('materials.id', ondelete='CASCADE'), primary_key=True)
+    tag = Column(String(50), primary_key=True)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_material_tags_tag', 'tag', 'material_id'),
+    )
+
+
+class MaterialFileText(Base):
+    """Text extracted from a material file (PDF, DOCX, TXT) for the search index"""
+    __tablename__ = 'material_file_texts'
+    
+    file_id = Column(Integer, ForeignKey('material_files.id', ondelete='CASCADE'), primary_key=True)
+    material_id = Column(Integer, ForeignKey('materials.id', ondelete='CASCADE'), nullable=False)
+    content = Column(Text, nullable=False)
+    extracted_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_material_file_texts_material', 'material_id'),
+    )
+
+
 class MaterialReview(Base):
     """Material review/rating model"""
     __tablename__ = 'material_reviews'
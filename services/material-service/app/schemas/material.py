@@ -241,7 +241,7 @@ class MaterialSearchRequest(BaseModel):
     created_by_user_id: Optional[int] = None
     page: int = Field(1, ge=1)
     per_page: int = Field(20, ge=1, le=100)
-    sort_by: str = Field("created_at", description="Sort field")
+    sort_by: str = Field("relevance", description="Sort field; relevance ranks search matches (newest first without query)")
     sort_order: str = Field("desc", regex="^(asc|desc)$")
 
 
@@ -278,6 +278,26 @@ class BatchFileUploadResponse(BaseModel):
 
 
 # Compatibility schemas (for migration from existing system)
+class UploadSessionCreate(BaseModel):
+    """Schema for starting a resumable upload"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    total_size: int = Field(..., gt=0)
+    title: Optional[str] = Field(None, max_length=255)
+    description: Optional[str] = None
+    uploaded_by_user_id: Optional[int] = None
+
+
+class UploadSessionResponse(BaseModel):
+    """Schema for resumable upload state"""
+    upload_id: str
+    material_id: int
+    filename: str
+    total_size: int
+    received_bytes: int
+    chunk_size: int
+    is_complete: bool
+
+
 class LegacyMaterialResponse(BaseModel):
     """Legacy material format for compatibility"""
     id: int
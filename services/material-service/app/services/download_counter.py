@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Download Counter
+Buffered download bookkeeping: access_count/download_count increments and
+MaterialAccess rows are accumulated in memory and written in one transaction
+per flush instead of a commit on every download. Counters of a failed flush are
+merged back and retried; access rows are dropped when the insert is rejected
+(e.g. the file was deleted) or keeps failing, so one bad batch cannot block
+later flushes, and their buffer is bounded
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from ..core.config import settings
+from ..database.connection import db_manager
+from ..models.material import Material, MaterialAccess, MaterialFile
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    """Accumulates downloads and flushes them every DOWNLOAD_COUNTER_FLUSH_INTERVAL seconds"""
+
+    def __init__(
+        self,
+        session_factory: Callable = db_manager.get_session,
+        flush_interval: float = None,
+        max_pending: int = None,
+        max_retries: int = None,
+        max_access_rows: int = None
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval or settings.DOWNLOAD_COUNTER_FLUSH_INTERVAL
+        self.max_pending = max_pending or settings.DOWNLOAD_COUNTER_MAX_PENDING
+        self.max_retries = max_retries or settings.DOWNLOAD_COUNTER_MAX_RETRIES
+        self.max_access_rows = max_access_rows or settings.DOWNLOAD_COUNTER_MAX_ACCESS_ROWS
+
+        self.file_counts: Counter = Counter()
+        self.material_counts: Counter = Counter()
+        self.access_rows: List[Dict[str, Any]] = []
+        self.pending = 0
+        self.failed_flushes = 0  # consecutive
+
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {"recorded": 0, "flushed": 0, "flushes": 0, "flush_errors": 0, "access_rows_dropped": 0}
+
+    def record(self, file_id: int, material_id: int, user_id: Optional[int] = None):
+        """Count a download; written to the database on the next flush"""
+        self.file_counts[file_id] += 1
+        self.material_counts[material_id] += 1
+        if settings.ENABLE_DOWNLOAD_TRACKING:
+            self.access_rows.append({
+                "material_id": material_id,
+                "file_id": file_id,
+                "user_id": user_id,
+                "access_type": "download",
+                "accessed_at": datetime.utcnow(),
+            })
+            self._trim_access_rows()
+        self.pending += 1
+        self.metrics["recorded"] += 1
+
+        if self.pending >= self.max_pending and not self._flush_lock.locked():
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def _trim_access_rows(self):
+        overflow = len(self.access_rows) - self.max_access_rows
+        if overflow > 0:
+            del self.access_rows[:overflow]
+            self.metrics["access_rows_dropped"] += overflow
+
+    async def flush(self) -> int:
+        """Write buffered downloads; on failure counters are merged back into the buffer"""
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+            file_counts, self.file_counts = self.file_counts, Counter()
+            material_counts, self.material_counts = self.material_counts, Counter()
+            access_rows, self.access_rows = self.access_rows, []
+            pending, self.pending = self.pending, 0
+
+            session = await self.session_factory()
+            try:
+                # SET count = count + n: concurrent instances do not lose increments
+                await session.execute(
+                    update(MaterialFile.__table__)
+                    .where(MaterialFile.__table__.c.id == bindparam("row_id"))
+                    .values(access_count=MaterialFile.__table__.c.access_count + bindparam("increment")),
+                    [{"row_id": key, "increment": n} for key, n in file_counts.items()]
+                )
+                await session.execute(
+                    update(Material.__table__)
+                    .where(Material.__table__.c.id == bindparam("row_id"))
+                    .values(download_count=Material.__table__.c.download_count + bindparam("increment")),
+                    [{"row_id": key, "increment": n} for key, n in material_counts.items()]
+                )
+                if access_rows:
+                    await session.execute(insert(MaterialAccess.__table__), access_rows)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                self.file_counts.update(file_counts)
+                self.material_counts.update(material_counts)
+                self.pending += pending
+                self.failed_flushes += 1
+                self.metrics["flush_errors"] += 1
+                if access_rows and (isinstance(e, IntegrityError) or self.failed_flushes >= self.max_retries):
+                    # Rows that cannot be written would fail every later flush
+                    self.metrics["access_rows_dropped"] += len(access_rows)
+                    logger.error(f"Failed to flush {pending} downloads, dropped {len(access_rows)} access rows: {e}")
+                else:
+                    self.access_rows[:0] = access_rows
+                    self._trim_access_rows()
+                    logger.error(f"Failed to flush {pending} downloads: {e}")
+                return 0
+            finally:
+                await session.close()
+
+            self.failed_flushes = 0
+            self.metrics["flushed"] += pending
+            self.metrics["flushes"] += 1
+            return pending
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self.metrics, "pending": self.pending, "flush_interval": self.flush_interval}
+
+
+_download_counter: Optional[DownloadCounter] = None
+
+
+def get_download_counter() -> DownloadCounter:
+    global _download_counter
+    if _download_counter is None:
+        _download_counter = DownloadCounter()
+    return _download_counter
@@ -8,18 +8,31 @@ import os
 import logging
 import asyncio
 import subprocess
+import zipfile
+from concurrent.futures import Executor
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple
+from xml.etree import ElementTree
 from PIL import Image, ImageOps, ImageDraw, ImageFont
 import magic
 import json
 from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..core.config import settings
-from ..models.material import FileType
+from ..models.material import FileType, MaterialFile, MaterialFileText
+from .search_index import get_search_index
 
 logger = logging.getLogger(__name__)
 
+# Files whose text is extracted into the search index
+TEXT_FILE_TYPES = ['pdf', 'docx', 'txt']
+PDF_TEXT_TIMEOUT = 120  # seconds
+PDF_TEXT_MAX_PAGES = 500
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+WORD_TEXT_TAG = WORD_NAMESPACE + "t"
+WORD_PARAGRAPH_TAG = WORD_NAMESPACE + "p"
+
 
 class FileProcessor:
     """Advanced file processing for materials"""
@@ -508,48 +521,91 @@ class FileProcessor:
             logger.error(f"Error cleaning up temporary files: {e}")
 
 
-class SearchIndexer:
-    """Text search indexing for materials"""
-    
-    def __init__(self):
-        self.index_dir = Path(settings.UPLOAD_DIR) / "search_index"
-    
-    async def extract_text_from_file(self, file_path: Path, file_type: FileType) -> str:
-        """Extract searchable text from file"""
-        try:
-            if file_type.value == "pdf":
-                return await self._extract_text_from_pdf(file_path)
-            elif file_type.value in ["docx", "doc"]:
-                return await self._extract_text_from_document(file_path)
-            elif file_type.value == "txt":
-                return await self._extract_text_from_txt(file_path)
-            else:
-                return ""
-        except Exception as e:
-            logger.error(f"Error extracting text from {file_path}: {e}")
-            return ""
-    
-    async def _extract_text_from_pdf(self, file_path: Path) -> str:
-        """Extract text from PDF (requires PyPDF2 or pdfplumber)"""
-        # Placeholder - would implement with actual PDF library
+def _pdf_text(file_path: Path, max_chars: int) -> str:
+    """PDF text via pdftotext (poppler-utils)"""
+    try:
+        result = subprocess.run(
+            ["pdftotext", "-q", "-enc", "UTF-8", "-l", str(PDF_TEXT_MAX_PAGES), str(file_path), "-"],
+            capture_output=True,
+            timeout=PDF_TEXT_TIMEOUT
+        )
+    except FileNotFoundError:
+        logger.warning("pdftotext is not installed, PDF text is not indexed")
         return ""
-    
-    async def _extract_text_from_document(self, file_path: Path) -> str:
-        """Extract text from Word document (requires python-docx)"""
-        # Placeholder - would implement with actual document library
+    return result.stdout[:max_chars * 4].decode("utf-8", errors="ignore")
+
+
+def _docx_text(file_path: Path, max_chars: int) -> str:
+    """Paragraph text of word/document.xml, parsed incrementally"""
+    parts: List[str] = []
+    size = 0
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as document:
+        for _, element in ElementTree.iterparse(document):
+            if element.tag == WORD_TEXT_TAG and element.text:
+                parts.append(element.text)
+                size += len(element.text)
+            elif element.tag == WORD_PARAGRAPH_TAG:
+                parts.append("\n")
+                element.clear()
+            if size >= max_chars:
+                break
+    return "".join(parts)
+
+
+def _txt_text(file_path: Path, max_chars: int) -> str:
+    """Plain text in UTF-8, falling back to cp1251"""
+    with open(file_path, "rb") as f:
+        data = f.read(max_chars * 4)
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start > len(data) - 4:
+            # Read limit cut a multibyte character
+            return data[:e.start].decode("utf-8", errors="replace")
+        return data.decode("cp1251", errors="replace")
+
+
+def extract_text(file_path: str, file_type: str, max_chars: int) -> str:
+    """
+    Searchable text of a PDF, DOCX or TXT file with whitespace collapsed.
+    Module level so it can run in the media queue process pool
+    """
+    extractor = TEXT_EXTRACTORS.get(file_type)
+    if extractor is None:
         return ""
+    return " ".join(extractor(Path(file_path), max_chars).split())[:max_chars]
+
+
+TEXT_EXTRACTORS = {"pdf": _pdf_text, "docx": _docx_text, "txt": _txt_text}
+
+
+class SearchIndexer:
+    """Text extraction from material files for the search index"""
     
-    async def _extract_text_from_txt(self, file_path: Path) -> str:
-        """Extract text from plain text file"""
+    async def extract_text_from_file(
+        self,
+        file_path: Path,
+        file_type: FileType,
+        executor: Optional[Executor] = None
+    ) -> str:
+        """Extract searchable text from file in executor (threads by default)"""
         try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                return await f.read()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                executor, extract_text, str(file_path), file_type.value, settings.SEARCH_MAX_CONTENT_CHARS
+            )
         except Exception as e:
-            logger.error(f"Error reading text file {file_path}: {e}")
+            logger.error(f"Error extracting text from {file_path}: {e}")
             return ""
     
-    async def index_material_content(self, material_id: int, content: str):
-        """Index material content for search"""
-        # Placeholder for full-text search implementation
-        # Could use Elasticsearch, Whoosh, or similar
-        pass
\ No newline at end of file
+    async def index_file_content(self, session: AsyncSession, material_file: MaterialFile, content: str):
+        """Store extracted file text and re-index its material (caller commits)"""
+        file_text = await session.get(MaterialFileText, material_file.id)
+        if file_text is None:
+            file_text = MaterialFileText(file_id=material_file.id, material_id=material_file.material_id, content=content)
+            session.add(file_text)
+        else:
+            file_text.content = content
+            file_text.extracted_at = datetime.utcnow()
+        await session.flush()
+        await get_search_index().index_material(session, material_file.material_id)
@@ -5,32 +5,56 @@ File upload, management, and processing for materials
 """
 
 import logging
-from datetime import datetime
-from typing import List, Optional, Tuple, BinaryIO
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple, BinaryIO
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func, and_, or_, update
 from fastapi import UploadFile, HTTPException
 
+from shared.file_response import RangeFileResponse
+from shared.media_queue import MediaQueue, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+
 from ..models.material import MaterialFile, Material, MaterialAccess
 from ..schemas.material import (
     MaterialFileCreate, MaterialFileResponse,
-    FileUploadResponse, BatchFileUploadResponse
+    FileUploadResponse, BatchFileUploadResponse, UploadSessionResponse
 )
 from ..database.connection import db_manager
 from ..storage.file_storage import (
-    FileStorageManager, get_file_type_from_extension,
-    validate_file_type, get_mime_type
+    FileStorageManager, FileTooLargeError, UploadSession, UploadSessionError, UploadSessionNotFound,
+    get_file_type_from_extension, validate_file_type, get_mime_type
 )
 from ..core.config import settings
+from .download_counter import get_download_counter
+from .file_processor import SearchIndexer, TEXT_FILE_TYPES
+from .search_index import get_search_index
 
 logger = logging.getLogger(__name__)
 
+IMAGE_FILE_TYPES = ['jpg', 'jpeg', 'png', 'gif', 'bmp']
+
+_media_queue: Optional[MediaQueue] = None
+
+
+def get_media_queue() -> MediaQueue:
+    """Shared queue for thumbnail/preview generation and text extraction"""
+    global _media_queue
+    if _media_queue is None:
+        _media_queue = MediaQueue(
+            settings.MEDIA_QUEUE_NAME,
+            settings.RABBITMQ_EXCHANGE,
+            FileService().process_media,
+            workers=settings.MEDIA_WORKERS
+        )
+    return _media_queue
+
 
 class FileService:
     """Service for file management"""
     
     def __init__(self):
         self.storage = FileStorageManager()
+        self.indexer = SearchIndexer()
     
     async def upload_file(
         self,
@@ -39,85 +63,35 @@ class FileService:
         title: Optional[str] = None,
         description: Optional[str] = None,
         uploaded_by_user_id: Optional[int] = None,
-        session: Optional[AsyncSession] = None
+        session: Optional[AsyncSession] = None,
+        priority: int = PRIORITY_HIGH
     ) -> MaterialFileResponse:
-        """Upload file for material"""
+        """Upload file for material (streamed to storage in chunks)"""
         if session is None:
             session = await db_manager.get_session()
             should_close = True
         else:
             should_close = False
         
+        stored = None
         try:
             # Validate file
             await self._validate_upload_file(upload_file)
             
             # Check if material exists
-            material_result = await session.execute(
-                select(Material).where(Material.id == material_id)
-            )
-            material = material_result.scalar_one_or_none()
-            if not material:
-                raise HTTPException(status_code=404, detail="Material not found")
+            await self._get_material(session, material_id)
             
-            # Read file data
-            file_data = await upload_file.read()
-            
-            # Store file
-            file_path, filename, checksum, file_size = await self.storage.store_file(
-                file_data, upload_file.filename
-            )
+            # Stream file to storage: checksum and size limit are applied per chunk
+            try:
+                stored = await self.storage.store_upload(upload_file)
+            except FileTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
             
-            # Determine file type
-            file_type = get_file_type_from_extension(upload_file.filename)
-            mime_type = get_mime_type(upload_file.filename)
-            
-            # Create file record
-            material_file = MaterialFile(
-                material_id=material_id,
-                filename=filename,
-                original_filename=upload_file.filename,
-                file_path=file_path,
-                file_type=file_type,
-                mime_type=mime_type,
-                file_size=file_size,
-                checksum=checksum,
-                title=title or upload_file.filename,
-                description=description,
-                uploaded_by_user_id=uploaded_by_user_id,
-                upload_completed=True,
-                processing_status="completed"
+            material_file = await self._create_file_record(
+                session, material_id, stored, upload_file.filename,
+                title, description, uploaded_by_user_id, priority
             )
-            
-            session.add(material_file)
-            await session.flush()
-            
-            # Generate thumbnail and preview for images
-            if file_type.value in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-                try:
-                    thumbnail_path = await self.storage.generate_thumbnail(file_path)
-                    if thumbnail_path:
-                        material_file.thumbnail_path = thumbnail_path
-                    
-                    preview_path = await self.storage.generate_preview(file_path)
-                    if preview_path:
-                        material_file.preview_path = preview_path
-                        material_file.has_preview = True
-                except Exception as e:
-                    logger.warning(f"Failed to generate thumbnail/preview: {e}")
-            
-            # Set as primary if it's the first file
-            file_count_result = await session.execute(
-                select(func.count(MaterialFile.id))
-                .where(MaterialFile.material_id == material_id)
-            )
-            if file_count_result.scalar() == 1:
-                material_file.is_primary = True
-            
-            # Generate file URL
-            material_file.file_url = f"/files/{file_path}"
-            
-            await session.commit()
+            stored = None  # Committed together with the record
             
             logger.info(f"File uploaded: {material_file.id} - {upload_file.filename}")
             
@@ -125,12 +99,185 @@ class FileService:
             
         except Exception as e:
             await session.rollback()
+            if stored:
+                # Do not leave files without a record
+                await self.storage.delete_file(stored[0])
             logger.error(f"Error uploading file: {e}")
             raise
         finally:
             if should_close:
                 await session.close()
     
+    async def _get_material(self, session: AsyncSession, material_id: int) -> Material:
+        material_result = await session.execute(
+            select(Material).where(Material.id == material_id)
+        )
+        material = material_result.scalar_one_or_none()
+        if not material:
+            raise HTTPException(status_code=404, detail="Material not found")
+        return material
+    
+    async def _create_file_record(
+        self,
+        session: AsyncSession,
+        material_id: int,
+        stored: Tuple[str, str, str, int],
+        original_filename: str,
+        title: Optional[str],
+        description: Optional[str],
+        uploaded_by_user_id: Optional[int],
+        priority: int = PRIORITY_NORMAL
+    ) -> MaterialFile:
+        """Create and commit MaterialFile for a stored file; image derivatives and text extraction are queued"""
+        file_path, filename, checksum, file_size = stored
+        
+        # Determine file type
+        file_type = get_file_type_from_extension(original_filename)
+        mime_type = get_mime_type(original_filename)
+        
+        # Thumbnail, preview and searchable text are produced in the background
+        needs_processing = (
+            file_type.value in IMAGE_FILE_TYPES
+            and (settings.ENABLE_THUMBNAIL_GENERATION or settings.ENABLE_PREVIEW_GENERATION)
+        ) or (file_type.value in TEXT_FILE_TYPES and settings.ENABLE_FULL_TEXT_SEARCH)
+        
+        # Create file record
+        material_file = MaterialFile(
+            material_id=material_id,
+            filename=filename,
+            original_filename=original_filename,
+            file_path=file_path,
+            file_type=file_type,
+            mime_type=mime_type,
+            file_size=file_size,
+            checksum=checksum,
+            title=title or original_filename,
+            description=description,
+            uploaded_by_user_id=uploaded_by_user_id,
+            upload_completed=True,
+            processing_status="pending" if needs_processing else "completed"
+        )
+        
+        session.add(material_file)
+        await session.flush()
+        
+        # Set as primary if it's the first file
+        file_count_result = await session.execute(
+            select(func.count(MaterialFile.id))
+            .where(MaterialFile.material_id == material_id)
+        )
+        if file_count_result.scalar() == 1:
+            material_file.is_primary = True
+        
+        # Generate file URL
+        material_file.file_url = f"/files/{file_path}"
+        
+        await session.commit()
+        
+        if needs_processing:
+            try:
+                await get_media_queue().enqueue(
+                    {"file_id": material_file.id, "file_path": file_path}, priority
+                )
+            except Exception as e:
+                # The record stays "pending" and can be requeued
+                logger.error(f"Failed to queue processing of file {material_file.id}: {e}")
+        
+        return material_file
+    
+    async def process_media(self, job: Dict[str, Any]):
+        """Media queue handler: image derivatives or text indexing, reported in processing_status"""
+        file_id = job["file_id"]
+        
+        session = await db_manager.get_session()
+        try:
+            result = await session.execute(select(MaterialFile).where(MaterialFile.id == file_id))
+            material_file = result.scalar_one_or_none()
+            if not material_file:
+                logger.info(f"Skipping media job for deleted file {file_id}")
+                return
+            material_file.processing_status = "processing"
+            await session.commit()
+            
+            try:
+                if material_file.file_type.value in TEXT_FILE_TYPES:
+                    await self._index_file_text(session, material_file)
+                else:
+                    await self._generate_derivatives(session, material_file)
+            except Exception as e:
+                # The job is retried by the queue; until then the file is reported as failed
+                await session.rollback()
+                await session.execute(
+                    update(MaterialFile).where(MaterialFile.id == file_id).values(processing_status="failed")
+                )
+                await session.commit()
+                logger.warning(f"Failed to process file {file_id}: {e}")
+                raise
+        finally:
+            await session.close()
+    
+    async def _generate_derivatives(self, session: AsyncSession, material_file: MaterialFile):
+        """Thumbnail and preview of an image file in the media pool"""
+        queue = get_media_queue()
+        async with queue.stage("thumbnail"):
+            thumbnail_path = await self.storage.generate_thumbnail(
+                material_file.file_path, executor=queue.executor
+            )
+        async with queue.stage("preview"):
+            preview_path = await self.storage.generate_preview(
+                material_file.file_path, executor=queue.executor
+            )
+        
+        async with queue.stage("store"):
+            if thumbnail_path:
+                material_file.thumbnail_path = thumbnail_path
+            if preview_path:
+                material_file.preview_path = preview_path
+                material_file.has_preview = True
+            material_file.processing_status = "completed"
+            await session.commit()
+    
+    async def _index_file_text(self, session: AsyncSession, material_file: MaterialFile):
+        """Extract file text in the media pool and add it to the material's search index entry"""
+        queue = get_media_queue()
+        async with queue.stage("extract_text"):
+            content = await self.indexer.extract_text_from_file(
+                await self.storage.get_file_path(material_file.file_path),
+                material_file.file_type,
+                executor=queue.executor
+            )
+        async with queue.stage("index"):
+            await self.indexer.index_file_content(session, material_file, content)
+            material_file.processing_status = "completed"
+            await session.commit()
+    
+    async def requeue_pending(self, processing_timeout: Optional[int] = None) -> int:
+        """
+        Queue files still "pending" again, and files left "processing" for longer than
+        MEDIA_PROCESSING_TIMEOUT by a crash: jobs of the in-process queue are lost on restart.
+        Only for the in-process queue, RabbitMQ keeps unfinished jobs itself
+        """
+        processing_timeout = processing_timeout or settings.MEDIA_PROCESSING_TIMEOUT
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=processing_timeout)
+        session = await db_manager.get_session()
+        try:
+            result = await session.execute(
+                select(MaterialFile.id, MaterialFile.file_path)
+                .where(or_(
+                    MaterialFile.processing_status == "pending",
+                    and_(MaterialFile.processing_status == "processing", MaterialFile.updated_at < cutoff)
+                ))
+                .order_by(MaterialFile.id)
+            )
+            rows = result.all()
+        finally:
+            await session.close()
+        
+        queue = get_media_queue()
+        for file_id, file_path in rows:
+            await queue.enqueue({"file_id": file_id, "file_path": file_path}, PRIORITY_LOW)
+        return len(rows)
+    
     async def batch_upload_files(
         self,
         material_id: int,
@@ -155,7 +302,8 @@ class FileService:
                         material_id=material_id,
                         upload_file=upload_file,
                         uploaded_by_user_id=uploaded_by_user_id,
-                        session=session
+                        session=session,
+                        priority=PRIORITY_NORMAL
                     )
                     
                     uploaded_files.append(FileUploadResponse(
@@ -185,6 +333,129 @@ class FileService:
             if should_close:
                 await session.close()
     
+    # Resumable uploads (large video materials)
+    
+    async def create_upload_session(
+        self,
+        material_id: int,
+        filename: str,
+        total_size: int,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        uploaded_by_user_id: Optional[int] = None,
+        session: Optional[AsyncSession] = None
+    ) -> UploadSessionResponse:
+        """Start a resumable upload; parts are sent with upload_chunk"""
+        if not validate_file_type(filename):
+            raise HTTPException(
+                status_code=422,
+                detail=f"File type not allowed. Allowed types: {', '.join(settings.ALLOWED_FILE_TYPES)}"
+            )
+        
+        if session is None:
+            session = await db_manager.get_session()
+            should_close = True
+        else:
+            should_close = False
+        
+        try:
+            await self._get_material(session, material_id)
+        finally:
+            if should_close:
+                await session.close()
+        
+        try:
+            upload = await self.storage.create_upload_session(
+                material_id, filename, total_size,
+                title=title, description=description, uploaded_by_user_id=uploaded_by_user_id
+            )
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        
+        logger.info(f"Resumable upload started: {upload.upload_id} - {filename} ({total_size} bytes)")
+        return self._upload_session_response(upload)
+    
+    async def get_upload_session(self, upload_id: str) -> UploadSessionResponse:
+        """Upload state; a client resumes from received_bytes"""
+        try:
+            return self._upload_session_response(await self.storage.get_upload_session(upload_id))
+        except UploadSessionNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    
+    async def upload_chunk(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes]
+    ) -> UploadSessionResponse:
+        """Append a part of a resumable upload, streamed to disk"""
+        try:
+            upload = await self.storage.append_upload_chunk(upload_id, offset, chunks)
+        except UploadSessionNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except UploadSessionError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        return self._upload_session_response(upload)
+    
+    async def complete_upload(
+        self,
+        upload_id: str,
+        session: Optional[AsyncSession] = None
+    ) -> MaterialFileResponse:
+        """Move a fully received upload into storage and create the file record"""
+        try:
+            upload, stored = await self.storage.complete_upload_session(upload_id)
+        except UploadSessionNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except UploadSessionError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        if session is None:
+            session = await db_manager.get_session()
+            should_close = True
+        else:
+            should_close = False
+        
+        try:
+            await self._get_material(session, upload.material_id)
+            material_file = await self._create_file_record(
+                session, upload.material_id, stored, upload.filename,
+                upload.title, upload.description, upload.uploaded_by_user_id, PRIORITY_LOW
+            )
+            
+            logger.info(f"Resumable upload completed: {material_file.id} - {upload.filename}")
+            
+            return MaterialFileResponse.model_validate(material_file)
+            
+        except Exception as e:
+            await session.rollback()
+            await self.storage.delete_file(stored[0])
+            logger.error(f"Error completing upload {upload_id}: {e}")
+            raise
+        finally:
+            if should_close:
+                await session.close()
+    
+    async def abort_upload(self, upload_id: str) -> bool:
+        """Cancel a resumable upload and remove its partial data"""
+        try:
+            return await self.storage.abort_upload_session(upload_id)
+        except UploadSessionNotFound:
+            return False
+    
+    def _upload_session_response(self, upload: UploadSession) -> UploadSessionResponse:
+        return UploadSessionResponse(
+            upload_id=upload.upload_id,
+            material_id=upload.material_id,
+            filename=upload.filename,
+            total_size=upload.total_size,
+            received_bytes=upload.received_bytes,
+            chunk_size=self.storage.chunk_size,
+            is_complete=upload.is_complete
+        )
+    
     async def get_file(
         self,
         file_id: int,
@@ -261,13 +532,16 @@ class FileService:
             if not file:
                 return False
             
-            # Delete from storage
-            await self.storage.delete_file(file.file_path)
-            
-            # Delete record
+            # Delete record; extracted text leaves the search index with it
             await session.delete(file)
+            await session.flush()
+            if file.file_type.value in TEXT_FILE_TYPES:
+                await get_search_index().index_material(session, file.material_id)
             await session.commit()
             
+            # Drop the blob reference only after the record is gone
+            await self.storage.delete_file(file.file_path)
+            
             logger.info(f"File deleted: {file_id}")
             return True
             
@@ -282,12 +556,15 @@ class FileService:
     async def download_file(
         self,
         file_id: int,
+        request_headers: Mapping[str, str],
         user_id: Optional[int] = None,
+        method: str = "GET",
         session: Optional[AsyncSession] = None
-    ) -> Tuple[str, str, str]:
+    ) -> RangeFileResponse:
         """
-        Get file download info and log access
-        Returns: (file_path, filename, mime_type)
+        Serve file from disk: Range, ETag from the stored checksum, Cache-Control.
+        A download is counted only when the response starts at the first byte
+        (not for 304 or resumed ranges); counters are written in batches
         """
         if session is None:
             session = await db_manager.get_session()
@@ -297,43 +574,39 @@ class FileService:
         
         try:
             result = await session.execute(
-                select(MaterialFile, Material)
-                .join(Material, MaterialFile.material_id == Material.id)
-                .where(MaterialFile.id == file_id)
+                select(MaterialFile).where(MaterialFile.id == file_id)
             )
-            row = result.first()
+            file = result.scalar_one_or_none()
             
-            if not row:
+            if not file:
                 raise HTTPException(status_code=404, detail="File not found")
             
-            file, material = row
-            
             # Check if file exists in storage
             file_path = await self.storage.get_file_path(file.file_path)
             if not await self.storage.file_exists(file.file_path):
                 raise HTTPException(status_code=404, detail="File not found in storage")
             
-            # Increment download counts
-            file.access_count += 1
-            material.download_count += 1
-            
-            # Log access if enabled
-            if settings.ENABLE_DOWNLOAD_TRACKING:
-                access_log = MaterialAccess(
-                    material_id=material.id,
-                    file_id=file.id,
-                    user_id=user_id,
-                    access_type="download",
-                    accessed_at=datetime.utcnow()
-                )
-                session.add(access_log)
+            accel_redirect = None
+            if settings.FILE_ACCEL_REDIRECT_PREFIX:
+                accel_redirect = f"{settings.FILE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{file.file_path}"
+            
+            response = RangeFileResponse(
+                str(file_path),
+                request_headers,
+                filename=file.original_filename,
+                media_type=file.mime_type or "application/octet-stream",
+                etag=file.checksum,
+                cache_control=settings.DOWNLOAD_CACHE_CONTROL,
+                accel_redirect=accel_redirect,
+                method=method
+            )
             
-            await session.commit()
+            if response.from_first_byte and method.upper() != "HEAD":
+                get_download_counter().record(file.id, file.material_id, user_id)
             
-            return str(file_path), file.original_filename, file.mime_type or "application/octet-stream"
+            return response
             
         except Exception as e:
-            await session.rollback()
             logger.error(f"Error downloading file: {e}")
             raise
         finally:
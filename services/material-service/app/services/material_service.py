@@ -14,16 +14,18 @@ from sqlalchemy.orm import selectinload
 
 from ..models.material import (
     Material, MaterialCategory, MaterialFile, MaterialReview,
-    MaterialType, AccessLevel, MaterialAccess
+    MaterialType, AccessLevel, MaterialAccess, MaterialTag
 )
 from ..schemas.material import (
     MaterialCreate, MaterialUpdate, MaterialResponse,
     MaterialSearchRequest, MaterialStatsResponse,
-    MaterialCategoryCreate, MaterialCategoryResponse
+    MaterialCategoryCreate, MaterialCategoryResponse,
+    MaterialReviewCreate, MaterialReviewResponse
 )
 from ..database.connection import db_manager
 from ..core.config import settings
 from .file_service import FileService
+from .search_index import get_search_index, normalize_tags
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +35,7 @@ class MaterialService:
     
     def __init__(self):
         self.file_service = FileService()
+        self.search_index = get_search_index()
     
     async def create_material(
         self,
@@ -71,6 +74,8 @@ class MaterialService:
             
             session.add(material)
             await session.flush()  # Get ID
+            await self.search_index.sync_tags(session, material.id, material_data.tags)
+            await self.search_index.index_material(session, material.id)
             await session.commit()
             
             logger.info(f"Material created: {material.id} - {material.title}")
@@ -173,6 +178,10 @@ class MaterialService:
             
             material.updated_at = datetime.utcnow()
             
+            if 'tags' in update_data:
+                await self.search_index.sync_tags(session, material_id, material_update.tags)
+            await session.flush()
+            await self.search_index.index_material(session, material_id)
             await session.commit()
             
             logger.info(f"Material updated: {material_id}")
@@ -214,7 +223,8 @@ class MaterialService:
             for file in material.files:
                 await self.file_service.delete_file(file.id, session)
             
-            # Delete material record (files will be cascade deleted)
+            # Delete material record (files and tags will be cascade deleted)
+            await self.search_index.remove_material(session, material_id)
             await session.delete(material)
             await session.commit()
             
@@ -242,26 +252,16 @@ class MaterialService:
             should_close = False
         
         try:
-            # Build base query
-            query = select(Material).options(
-                selectinload(Material.category),
-                selectinload(Material.files)
-            )
-            
             # Apply filters
             conditions = [Material.is_active == True]
             
+            # Full-text matches come from the search index, not from scanning materials
+            rank = None
             if search_request.query:
-                search_term = f"%{search_request.query}%"
-                conditions.append(
-                    or_(
-                        Material.title.ilike(search_term),
-                        Material.description.ilike(search_term),
-                        Material.subject.ilike(search_term),
-                        Material.topic.ilike(search_term),
-                        Material.tags.ilike(search_term)
-                    )
-                )
+                matches = self.search_index.match(search_request.query)
+                if matches is None:
+                    return [], 0
+                rank = matches.c.rank
             
             if search_request.grade:
                 conditions.append(Material.grade == search_request.grade)
@@ -284,44 +284,60 @@ class MaterialService:
             if search_request.created_by_user_id:
                 conditions.append(Material.created_by_user_id == search_request.created_by_user_id)
             
-            if search_request.tags:
-                for tag in search_request.tags:
-                    conditions.append(Material.tags.ilike(f'%"{tag}"%'))
-            
-            # Apply rating filter if specified
-            if search_request.min_rating:
-                # This requires a subquery to calculate average rating
-                rating_subquery = (
-                    select(func.avg(MaterialReview.rating).label('avg_rating'))
-                    .where(MaterialReview.material_id == Material.id)
-                    .where(MaterialReview.is_approved == True)
-                    .subquery()
+            for tag in normalize_tags(search_request.tags):
+                conditions.append(
+                    Material.id.in_(select(MaterialTag.material_id).where(MaterialTag.tag == tag))
                 )
-                conditions.append(rating_subquery.c.avg_rating >= search_request.min_rating)
-            
-            # Apply all conditions
-            if conditions:
-                query = query.where(and_(*conditions))
-            
-            # Get total count
-            count_query = select(func.count()).select_from(query.subquery())
-            count_result = await session.execute(count_query)
-            total = count_result.scalar()
             
-            # Apply sorting
-            sort_column = getattr(Material, search_request.sort_by, Material.created_at)
-            if search_request.sort_order == "desc":
-                query = query.order_by(desc(sort_column))
+            # Rating filter uses the precomputed rating_sum/rating_count aggregate
+            if search_request.min_rating:
+                conditions.append(and_(
+                    Material.rating_count > 0,
+                    Material.rating_sum >= search_request.min_rating * Material.rating_count
+                ))
+            
+            # Total is returned with the page rows instead of a separate count query
+            query = select(Material, func.count().over().label("total"))
+            if rank is not None:
+                query = query.join(matches, matches.c.material_id == Material.id)
+            query = query.where(and_(*conditions))
+            
+            # Apply sorting: relevance when searching, otherwise the requested column
+            sort_column = Material.__table__.c.get(search_request.sort_by)
+            if sort_column is None:
+                if rank is not None:
+                    query = query.order_by(desc(rank), desc(Material.id))
+                else:
+                    query = query.order_by(desc(Material.created_at), desc(Material.id))
+            elif search_request.sort_order == "desc":
+                query = query.order_by(desc(sort_column), desc(Material.id))
             else:
-                query = query.order_by(asc(sort_column))
+                query = query.order_by(asc(sort_column), asc(Material.id))
             
             # Apply pagination
             query = query.offset((search_request.page - 1) * search_request.per_page)
             query = query.limit(search_request.per_page)
+            query = query.options(
+                selectinload(Material.category),
+                selectinload(Material.files)
+            )
             
             # Execute query
             result = await session.execute(query)
-            materials = result.scalars().all()
+            rows = result.all()
+            materials = [row[0] for row in rows]
+            
+            if rows:
+                total = rows[0].total
+            elif search_request.page > 1:
+                # Page past the end: count separately
+                count_query = select(func.count(Material.id))
+                if rank is not None:
+                    count_query = count_query.join(matches, matches.c.material_id == Material.id)
+                count_result = await session.execute(count_query.where(and_(*conditions)))
+                total = count_result.scalar()
+            else:
+                total = 0
             
             # Convert to response models
             material_responses = []
@@ -348,6 +364,111 @@ class MaterialService:
             if should_close:
                 await session.close()
     
+    def _rating_update(self, material_id: Optional[int] = None):
+        """UPDATE of rating_sum/rating_count from approved reviews: one material or all of them"""
+        approved = and_(MaterialReview.material_id == Material.__table__.c.id, MaterialReview.is_approved == True)
+        statement = Material.__table__.update().values(
+            rating_sum=select(func.coalesce(func.sum(MaterialReview.rating), 0)).where(approved).scalar_subquery(),
+            rating_count=select(func.count(MaterialReview.id)).where(approved).scalar_subquery()
+        )
+        if material_id is not None:
+            statement = statement.where(Material.__table__.c.id == material_id)
+        return statement
+    
+    async def refresh_rating(
+        self,
+        material_id: Optional[int] = None,
+        session: Optional[AsyncSession] = None
+    ):
+        """Recalculate rating_sum/rating_count from approved reviews (all materials if material_id is None)"""
+        if session is None:
+            session = await db_manager.get_session()
+            should_close = True
+        else:
+            should_close = False
+        
+        try:
+            await session.execute(self._rating_update(material_id))
+            await session.commit()
+            
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error refreshing rating of material {material_id or 'all'}: {e}")
+            raise
+        finally:
+            if should_close:
+                await session.close()
+    
+    async def create_review(
+        self,
+        review_data: MaterialReviewCreate,
+        session: Optional[AsyncSession] = None
+    ) -> Optional[MaterialReviewResponse]:
+        """Add a review; the rating aggregate is updated in the same transaction"""
+        if session is None:
+            session = await db_manager.get_session()
+            should_close = True
+        else:
+            should_close = False
+        
+        try:
+            material = await session.get(Material, review_data.material_id)
+            if not material:
+                return None
+            
+            review = MaterialReview(**review_data.model_dump())
+            session.add(review)
+            await session.flush()
+            await session.execute(self._rating_update(review.material_id))
+            await session.commit()
+            await session.refresh(review)
+            
+            logger.info(f"Review {review.id} added to material {review.material_id}")
+            return MaterialReviewResponse.model_validate(review)
+            
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error creating review: {e}")
+            raise
+        finally:
+            if should_close:
+                await session.close()
+    
+    async def set_review_approval(
+        self,
+        material_id: int,
+        review_id: int,
+        is_approved: bool,
+        session: Optional[AsyncSession] = None
+    ) -> Optional[MaterialReviewResponse]:
+        """Approve or reject a review and recalculate the rating of its material"""
+        if session is None:
+            session = await db_manager.get_session()
+            should_close = True
+        else:
+            should_close = False
+        
+        try:
+            review = await session.get(MaterialReview, review_id)
+            if not review or review.material_id != material_id:
+                return None
+            
+            review.is_approved = is_approved
+            await session.flush()
+            await session.execute(self._rating_update(review.material_id))
+            await session.commit()
+            await session.refresh(review)
+            
+            return MaterialReviewResponse.model_validate(review)
+            
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error updating review {review_id}: {e}")
+            raise
+        finally:
+            if should_close:
+                await session.close()
+    
     async def get_materials_by_grade(self, grade: int) -> List[MaterialResponse]:
         """Get materials for specific grade (compatibility method)"""
         search_request = MaterialSearchRequest(
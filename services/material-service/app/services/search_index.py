@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Material Search Index
+Inverted full-text index over material metadata and text extracted from files.
+PostgreSQL: weighted tsvector with a GIN index, ranked by ts_rank_cd.
+SQLite (development/tests): FTS5 virtual table ranked by bm25().
+Index rows and normalized tags are written in the same transaction as the material
+"""
+
+import json
+import logging
+import re
+from typing import Iterable, List, Optional
+
+from sqlalchemy import column, delete, func, insert, literal_column, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Subquery
+
+from ..core.config import settings
+from ..database.connection import db_manager
+from ..models.material import Material, MaterialFileText, MaterialTag
+
+logger = logging.getLogger(__name__)
+
+INDEX_TABLE = "material_search_index"
+MAX_TAG_LENGTH = 50
+BACKFILL_BATCH_SIZE = 100
+
+# Indexed fields, most important first: (field, tsvector weight, bm25 weight)
+INDEX_FIELDS = (
+    ("title", "A", 10.0),
+    ("tags", "A", 8.0),
+    ("subject", "B", 4.0),
+    ("topic", "B", 4.0),
+    ("description", "C", 2.0),
+    ("content", "D", 1.0),
+)
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    """Lowercase, collapse whitespace, drop empty and duplicate tags"""
+    normalized = []
+    for tag in tags or []:
+        value = " ".join(str(tag).split()).lower()[:MAX_TAG_LENGTH]
+        if value and value not in normalized:
+            normalized.append(value)
+    return normalized
+
+
+def parse_tags(tags_json: Optional[str]) -> List[str]:
+    """Tags from the Material.tags JSON column"""
+    if not tags_json:
+        return []
+    try:
+        tags = json.loads(tags_json)
+    except ValueError:
+        return []
+    return tags if isinstance(tags, list) else []
+
+
+class SearchIndex:
+    """Full-text index of materials; the backend is chosen by the database dialect"""
+
+    def __init__(self, engine=None, text_config: str = None):
+        self.engine = engine or db_manager.engine
+        text_config = text_config or settings.SEARCH_TEXT_CONFIG
+        if not re.fullmatch(r"\w+", text_config):
+            raise ValueError(f"Invalid text search configuration: {text_config}")
+        self.text_config = text_config
+        self.table = table(INDEX_TABLE, column("material_id"), column("document"), column("rowid"))
+
+    @property
+    def backend(self) -> str:
+        name = self.engine.dialect.name
+        if name not in ("postgresql", "sqlite"):
+            raise RuntimeError(f"Full-text search is not supported for {name}")
+        return name
+
+    @property
+    def _config_sql(self) -> str:
+        return f"'{self.text_config}'::regconfig"
+
+    def _ddl(self) -> List[str]:
+        if self.backend == "postgresql":
+            return [
+                f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+                "material_id INTEGER PRIMARY KEY REFERENCES materials(id) ON DELETE CASCADE, "
+                "document TSVECTOR NOT NULL)",
+                f"CREATE INDEX IF NOT EXISTS idx_material_search_document ON {INDEX_TABLE} USING GIN (document)",
+            ]
+        fields = ", ".join(name for name, _, _ in INDEX_FIELDS)
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} "
+            f"USING fts5({fields}, tokenize = 'unicode61 remove_diacritics 2')"
+        ]
+
+    async def initialize(self):
+        """Create the index and backfill materials that are not indexed yet"""
+        async with self.engine.begin() as conn:
+            for statement in self._ddl():
+                await conn.execute(text(statement))
+        indexed = await self.backfill()
+        if indexed:
+            logger.info(f"Search index backfilled with {indexed} materials")
+
+    def _indexed_ids(self):
+        key = self.table.c.material_id if self.backend == "postgresql" else self.table.c.rowid
+        return select(key)
+
+    async def backfill(self) -> int:
+        """Index materials (and their tags) missing from the index, in batches"""
+        indexed = 0
+        session = await db_manager.get_session()
+        try:
+            while True:
+                result = await session.execute(
+                    select(Material.id, Material.tags)
+                    .where(Material.id.not_in(self._indexed_ids()))
+                    .order_by(Material.id)
+                    .limit(BACKFILL_BATCH_SIZE)
+                )
+                rows = result.all()
+                if not rows:
+                    return indexed
+                for material_id, tags_json in rows:
+                    await self.sync_tags(session, material_id, parse_tags(tags_json))
+                    await self.index_material(session, material_id)
+                await session.commit()
+                indexed += len(rows)
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Search index backfill failed after {indexed} materials: {e}")
+            raise
+        finally:
+            await session.close()
+
+    async def sync_tags(self, session: AsyncSession, material_id: int, tags: Optional[Iterable[str]]):
+        """Replace normalized tags of a material (caller commits)"""
+        await session.execute(delete(MaterialTag.__table__).where(MaterialTag.__table__.c.material_id == material_id))
+        rows = [{"material_id": material_id, "tag": tag} for tag in normalize_tags(tags)]
+        if rows:
+            await session.execute(insert(MaterialTag.__table__), rows)
+
+    async def index_material(self, session: AsyncSession, material_id: int):
+        """(Re)build the index row of a material from its fields and file texts (caller commits)"""
+        result = await session.execute(
+            select(Material.title, Material.tags, Material.subject, Material.topic, Material.description)
+            .where(Material.id == material_id)
+        )
+        row = result.one_or_none()
+        if row is None:
+            await self.remove_material(session, material_id)
+            return
+
+        texts = await session.execute(
+            select(MaterialFileText.content)
+            .where(MaterialFileText.material_id == material_id)
+            .order_by(MaterialFileText.file_id)
+        )
+        values = {
+            "material_id": material_id,
+            "title": row.title or "",
+            "tags": " ".join(normalize_tags(parse_tags(row.tags))),
+            "subject": row.subject or "",
+            "topic": row.topic or "",
+            "description": row.description or "",
+            "content": "\n".join(texts.scalars().all())[:settings.SEARCH_MAX_CONTENT_CHARS],
+        }
+
+        if self.backend == "postgresql":
+            document = " || ".join(
+                f"setweight(to_tsvector({self._config_sql}, :{name}), '{weight}')"
+                for name, weight, _ in INDEX_FIELDS
+            )
+            await session.execute(
+                text(
+                    f"INSERT INTO {INDEX_TABLE} (material_id, document) VALUES (:material_id, {document}) "
+                    "ON CONFLICT (material_id) DO UPDATE SET document = EXCLUDED.document"
+                ),
+                values
+            )
+        else:
+            fields = [name for name, _, _ in INDEX_FIELDS]
+            await session.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :material_id"), values)
+            await session.execute(
+                text(
+                    f"INSERT INTO {INDEX_TABLE} (rowid, {', '.join(fields)}) "
+                    f"VALUES (:material_id, {', '.join(':' + name for name in fields)})"
+                ),
+                values
+            )
+
+    async def remove_material(self, session: AsyncSession, material_id: int):
+        """Drop the index row (PostgreSQL also removes it by ON DELETE CASCADE)"""
+        key = "material_id" if self.backend == "postgresql" else "rowid"
+        await session.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE {key} = :material_id"), {"material_id": material_id})
+
+    def match(self, query: str) -> Optional[Subquery]:
+        """
+        Materials matching the query as a subquery (material_id, rank), higher rank is better.
+        None if the query has no searchable words
+        """
+        words = WORD_RE.findall(query.lower())
+        if not words:
+            return None
+
+        if self.backend == "postgresql":
+            tsquery = func.websearch_to_tsquery(literal_column(self._config_sql), query)
+            return (
+                select(
+                    self.table.c.material_id.label("material_id"),
+                    func.ts_rank_cd(self.table.c.document, tsquery, 32).label("rank")
+                )
+                .where(self.table.c.document.op("@@")(tsquery))
+                .subquery("search_matches")
+            )
+
+        # FTS5 has no stemming: every word is matched as a prefix
+        fts_query = " ".join(f'"{word}"*' for word in words)
+        index = literal_column(INDEX_TABLE)
+        weights = [literal_column(str(weight)) for _, _, weight in INDEX_FIELDS]
+        return (
+            select(
+                self.table.c.rowid.label("material_id"),
+                (-func.bm25(index, *weights)).label("rank")
+            )
+            .where(index.op("MATCH")(fts_query))
+            .subquery("search_matches")
+        )
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+def get_search_index() -> SearchIndex:
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex()
+    return _search_index
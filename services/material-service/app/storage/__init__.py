@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+File storage for Material Service
+"""
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+File Storage
+Local file storage for material files. Uploads are streamed in fixed-size chunks:
+the SHA-256 is updated per chunk, data goes to a temp file that is atomically renamed
+into place, and the size limit is enforced while reading, so memory per upload is
+bounded by the chunk size. Large files can be uploaded in resumable parts.
+Files are deduplicated by SHA-256 in a content-addressed blob store; thumbnails
+and previews are generated once per blob
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import time
+import uuid
+from concurrent.futures import Executor
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from PIL import Image
+
+from shared.blob_store import BlobStore
+
+from ..core.config import settings
+from ..models.material import FileType
+
+logger = logging.getLogger(__name__)
+
+class FileTooLargeError(Exception):
+    """Upload exceeded the allowed size"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File too large. Maximum size: {max_size} bytes")
+        self.max_size = max_size
+
+
+class UploadSessionError(Exception):
+    """Resumable upload got data at a wrong offset or is not complete yet"""
+    pass
+
+
+class UploadSessionNotFound(UploadSessionError):
+    """Resumable upload session does not exist or has expired"""
+    pass
+
+
+def get_file_extension(filename: Optional[str]) -> str:
+    return Path(filename or "").suffix.lower().lstrip(".")
+
+
+def get_file_type_from_extension(filename: str) -> FileType:
+    """Map file extension to FileType (OTHER if unknown)"""
+    try:
+        return FileType(get_file_extension(filename))
+    except ValueError:
+        return FileType.OTHER
+
+
+def validate_file_type(filename: Optional[str]) -> bool:
+    """Check extension against ALLOWED_FILE_TYPES"""
+    return get_file_extension(filename) in settings.ALLOWED_FILE_TYPES
+
+
+def get_mime_type(filename: str) -> str:
+    return mimetypes.guess_type(filename or "")[0] or "application/octet-stream"
+
+
+@dataclass
+class UploadSession:
+    """State of a resumable upload, stored next to its partial data"""
+    upload_id: str
+    material_id: int
+    filename: str
+    total_size: int
+    received_bytes: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    title: Optional[str] = None
+    description: Optional[str] = None
+    uploaded_by_user_id: Optional[int] = None
+
+    @property
+    def is_complete(self) -> bool:
+        return self.received_bytes >= self.total_size
+
+
+class FileStorageManager:
+    """Local file storage with streaming writes"""
+
+    def __init__(self, upload_dir: str = None, chunk_size: int = None):
+        self.upload_dir = Path(upload_dir or settings.UPLOAD_DIR)
+        self.temp_dir = self.upload_dir / "temp"
+        self.sessions_dir = self.temp_dir / "sessions"
+        self.thumbnails_dir = self.upload_dir / "thumbnails"
+        self.previews_dir = self.upload_dir / "previews"
+        self.chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+        self.blobs = BlobStore(str(self.upload_dir))
+
+        for directory in (self.upload_dir, self.temp_dir, self.sessions_dir, self.thumbnails_dir, self.previews_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        # Incremental hashes of resumable uploads in this process: upload_id -> (offset, sha256)
+        self._session_hashes: Dict[str, Tuple[int, Any]] = {}
+        # One part, completion or abort at a time per upload: a retried PUT racing the original
+        # one would pass the offset check too and interleave writes into the same file
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+
+    async def initialize(self):
+        await self.cleanup_stale_uploads()
+        await self.blobs.collect_garbage()
+
+    async def cleanup(self):
+        await self.blobs.collect_garbage()
+
+    # === Streaming writes ===
+
+    async def _commit_temp(self, temp_path: Path, original_filename: str, checksum: str) -> Tuple[str, str]:
+        """
+        Atomically move a fully written temp file into the blob store. A file with the
+        same content is stored once: the temp file is dropped and a reference is added
+        """
+        file_path, created = await self.blobs.put_file(temp_path, checksum)
+        if not created:
+            logger.info(f"Deduplicated upload {original_filename} ({checksum})")
+        extension = get_file_extension(original_filename)
+        return file_path, f"{checksum}.{extension}" if extension else checksum
+
+    async def store_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        original_filename: str,
+        max_size: Optional[int] = None
+    ) -> Tuple[str, str, str, int]:
+        """
+        Store a stream of chunks.
+        Returns: (file_path, filename, checksum, file_size)
+        """
+        max_size = max_size or settings.MAX_FILE_SIZE
+        temp_path = self.temp_dir / f"{uuid.uuid4().hex}.part"
+        sha256 = hashlib.sha256()
+        size = 0
+
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeError(max_size)
+                    sha256.update(chunk)
+                    await f.write(chunk)
+                await f.flush()
+                await asyncio.to_thread(os.fsync, f.fileno())
+
+            file_path, filename = await self._commit_temp(temp_path, original_filename, sha256.hexdigest())
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        return file_path, filename, sha256.hexdigest(), size
+
+    async def read_chunks(self, reader: Any, chunk_size: int = None) -> AsyncIterator[bytes]:
+        """Chunks from an object with async read(size), e.g. UploadFile"""
+        chunk_size = chunk_size or self.chunk_size
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    async def store_upload(self, upload_file: Any, max_size: Optional[int] = None) -> Tuple[str, str, str, int]:
+        """Stream an UploadFile to storage without reading it into memory"""
+        return await self.store_stream(self.read_chunks(upload_file), upload_file.filename, max_size)
+
+    async def store_file(self, file_data: bytes, original_filename: str) -> Tuple[str, str, str, int]:
+        """Store in-memory file data"""
+        async def single_chunk():
+            yield file_data
+
+        return await self.store_stream(single_chunk(), original_filename)
+
+    # === Resumable uploads ===
+
+    def _session_paths(self, upload_id: str) -> Tuple[Path, Path]:
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadSessionNotFound("Upload session not found")
+        return self.sessions_dir / f"{upload_id}.json", self.sessions_dir / f"{upload_id}.part"
+
+    async def _save_session(self, session: UploadSession):
+        meta_path, _ = self._session_paths(session.upload_id)
+        session.updated_at = time.time()
+        temp_meta = meta_path.with_suffix(".json.tmp")
+        async with aiofiles.open(temp_meta, "w") as f:
+            await f.write(json.dumps(asdict(session)))
+        os.replace(temp_meta, meta_path)
+
+    async def create_upload_session(
+        self,
+        material_id: int,
+        filename: str,
+        total_size: int,
+        **metadata
+    ) -> UploadSession:
+        """Start a resumable upload of total_size bytes"""
+        if total_size > settings.MAX_RESUMABLE_FILE_SIZE:
+            raise FileTooLargeError(settings.MAX_RESUMABLE_FILE_SIZE)
+
+        await self.cleanup_stale_uploads()
+        session = UploadSession(
+            upload_id=uuid.uuid4().hex,
+            material_id=material_id,
+            filename=filename,
+            total_size=total_size,
+            **metadata
+        )
+        _, data_path = self._session_paths(session.upload_id)
+        data_path.touch()
+        self._session_hashes[session.upload_id] = (0, hashlib.sha256())
+        await self._save_session(session)
+        return session
+
+    def _session_lock(self, upload_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(upload_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            # Locks are kept only for existing sessions, unknown upload ids fail inside the lock
+            if self._session_paths(upload_id)[0].exists():
+                self._session_locks[upload_id] = lock
+        return lock
+
+    async def get_upload_session(self, upload_id: str) -> UploadSession:
+        meta_path, _ = self._session_paths(upload_id)
+        try:
+            async with aiofiles.open(meta_path, "r") as f:
+                return UploadSession(**json.loads(await f.read()))
+        except FileNotFoundError:
+            raise UploadSessionNotFound("Upload session not found")
+
+    async def append_upload_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        """
+        Append a part at offset (must equal received_bytes, so a client resumes from
+        the offset reported by get_upload_session after a failure)
+        """
+        async with self._session_lock(upload_id):
+            session = await self.get_upload_session(upload_id)
+            if offset != session.received_bytes:
+                raise UploadSessionError(f"Expected offset {session.received_bytes}, got {offset}")
+
+            _, data_path = self._session_paths(upload_id)
+            hashed = self._session_hashes.get(upload_id)
+            sha256 = hashed[1] if hashed and hashed[0] == offset else None
+            received = session.received_bytes
+
+            try:
+                async with aiofiles.open(data_path, "r+b") as f:
+                    # Drop bytes of a previously interrupted part
+                    await f.truncate(offset)
+                    await f.seek(offset)
+                    async for chunk in chunks:
+                        if received + len(chunk) > session.total_size:
+                            raise FileTooLargeError(session.total_size)
+                        if sha256 is not None:
+                            sha256.update(chunk)
+                        await f.write(chunk)
+                        received += len(chunk)
+                    await f.flush()
+                    await asyncio.to_thread(os.fsync, f.fileno())
+            finally:
+                # Keep what was written: after a failure the client continues from the stored offset
+                session.received_bytes = received
+                if sha256 is None:
+                    self._session_hashes.pop(upload_id, None)
+                else:
+                    self._session_hashes[upload_id] = (received, sha256)
+                await self._save_session(session)
+
+            return session
+
+    async def _hash_file(self, path: Path) -> str:
+        sha256 = hashlib.sha256()
+        async with aiofiles.open(path, "rb") as f:
+            while True:
+                chunk = await f.read(self.chunk_size)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    async def complete_upload_session(self, upload_id: str) -> Tuple[UploadSession, Tuple[str, str, str, int]]:
+        """Move a fully received upload into storage; returns the session and store_file tuple"""
+        async with self._session_lock(upload_id):
+            session = await self.get_upload_session(upload_id)
+            if not session.is_complete:
+                raise UploadSessionError(f"Upload incomplete: {session.received_bytes} of {session.total_size} bytes")
+
+            meta_path, data_path = self._session_paths(upload_id)
+            hashed = self._session_hashes.pop(upload_id, None)
+            if hashed and hashed[0] == session.received_bytes:
+                checksum = hashed[1].hexdigest()
+            else:
+                # Hash state lost (restart or interrupted part) - rehash from disk in chunks
+                checksum = await self._hash_file(data_path)
+
+            file_path, filename = await self._commit_temp(data_path, session.filename, checksum)
+            meta_path.unlink(missing_ok=True)
+            self._session_locks.pop(upload_id, None)
+            return session, (file_path, filename, checksum, session.received_bytes)
+
+    async def abort_upload_session(self, upload_id: str) -> bool:
+        async with self._session_lock(upload_id):
+            meta_path, data_path = self._session_paths(upload_id)
+            self._session_hashes.pop(upload_id, None)
+            existed = meta_path.exists()
+            meta_path.unlink(missing_ok=True)
+            data_path.unlink(missing_ok=True)
+            self._session_locks.pop(upload_id, None)
+            return existed
+
+    async def cleanup_stale_uploads(self, max_age: int = None) -> int:
+        """Remove resumable uploads not touched for RESUMABLE_UPLOAD_TTL seconds"""
+        max_age = max_age or settings.RESUMABLE_UPLOAD_TTL
+        cutoff = time.time() - max_age
+        removed = 0
+        for meta_path in self.sessions_dir.glob("*.json"):
+            try:
+                if meta_path.stat().st_mtime < cutoff:
+                    await self.abort_upload_session(meta_path.stem)
+                    removed += 1
+            except (OSError, UploadSessionError) as e:
+                logger.warning(f"Failed to remove stale upload {meta_path.stem}: {e}")
+        return removed
+
+    # === Files ===
+
+    async def get_file_path(self, file_path: str) -> Path:
+        return self.upload_dir / file_path
+
+    async def file_exists(self, file_path: str) -> bool:
+        return (self.upload_dir / file_path).is_file()
+
+    async def delete_file(self, file_path: str) -> bool:
+        """Drop a reference to a blob (removed by GC when unreferenced) or delete a legacy file"""
+        digest = self.blobs.digest_of(file_path)
+        try:
+            if digest is not None:
+                await self.blobs.release(digest)
+            else:
+                (self.upload_dir / file_path).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _resize(source: Path, target: Path, suffix: str, size: Tuple[int, int]) -> bool:
+        with Image.open(source) as img:
+            if suffix == "preview" and img.width <= size[0] and img.height <= size[1]:
+                return False
+            if img.mode in ("RGBA", "P", "LA"):
+                img = img.convert("RGB")
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            img.save(target, "JPEG", quality=85, optimize=True)
+        return True
+
+    async def _derive_image(
+        self,
+        file_path: str,
+        target_dir: Path,
+        suffix: str,
+        size: Tuple[int, int],
+        executor: Optional[Executor] = None
+    ) -> Optional[str]:
+        """Resize in executor (a process pool for the media queue, threads by default)"""
+        name = f"{suffix}_{size[0]}x{size[1]}.jpg"
+        builder = partial(FileStorageManager._resize, suffix=suffix, size=tuple(size))
+        digest = self.blobs.digest_of(file_path)
+        if digest is not None:
+            # Cached per blob: duplicates reuse the existing image
+            return await self.blobs.derive(digest, name, builder, executor)
+
+        target = target_dir / f"{Path(file_path).stem}_{suffix}.jpg"
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(executor, builder, self.upload_dir / file_path, target):
+            return None
+        return str(target.relative_to(self.upload_dir))
+
+    async def generate_thumbnail(self, file_path: str, executor: Optional[Executor] = None) -> Optional[str]:
+        if not settings.ENABLE_THUMBNAIL_GENERATION:
+            return None
+        return await self._derive_image(file_path, self.thumbnails_dir, "thumb", settings.THUMBNAIL_SIZE, executor)
+
+    async def generate_preview(self, file_path: str, executor: Optional[Executor] = None) -> Optional[str]:
+        if not settings.ENABLE_PREVIEW_GENERATION:
+            return None
+        return await self._derive_image(file_path, self.previews_dir, "preview", settings.PREVIEW_SIZE, executor)
+
+    def _scan(self) -> Dict[str, Any]:
+        files, size = 0, 0
+        for root, dirs, names in os.walk(self.upload_dir):
+            if Path(root) == self.upload_dir:
+                dirs[:] = [d for d in dirs if d != "temp"]
+            for name in names:
+                try:
+                    size += os.stat(os.path.join(root, name)).st_size
+                    files += 1
+                except OSError:
+                    pass
+        return {"files": files, "size_bytes": size}
+
+    async def get_storage_stats(self) -> Dict[str, Any]:
+        stats = await asyncio.to_thread(self._scan)
+        return {
+            "storage_type": settings.STORAGE_TYPE,
+            "upload_dir": str(self.upload_dir),
+            "disk_files": stats["files"],
+            "disk_size_mb": round(stats["size_bytes"] / (1024 * 1024), 2),
+            "pending_uploads": len(list(self.sessions_dir.glob("*.json"))),
+            "blobs": await self.blobs.get_stats(),
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Пакет shared импортируется из каталога services, как из /app в образе
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
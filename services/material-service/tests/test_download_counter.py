@@ -0,0 +1,127 @@
+"""
+Tests for buffered download counters: batched increments, retries and dropping unwritable access rows
+"""
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.material import Base, FileType, Material, MaterialAccess, MaterialFile
+from app.services.download_counter import DownloadCounter
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def enable_foreign_keys(connection, record):
+        connection.execute("PRAGMA foreign_keys=ON")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as session:
+        session.add(Material(id=1, title="Algebra"))
+        session.add(MaterialFile(id=10, material_id=1, filename="a.pdf", original_filename="a.pdf",
+                                 file_path="a.pdf", file_type=FileType.PDF, file_size=1))
+        await session.commit()
+
+    async def get_session():
+        # Same contract as db_manager.get_session
+        return factory()
+
+    yield get_session
+    await engine.dispose()
+
+
+class FailingSession:
+    """Session whose statements fail, as during a database outage"""
+
+    async def execute(self, *args, **kwargs):
+        raise ConnectionError("database is down")
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+async def counts(session_factory):
+    async with await session_factory() as session:
+        material = await session.get(Material, 1)
+        file = await session.get(MaterialFile, 10)
+        accesses = await session.scalar(select(func.count()).select_from(MaterialAccess))
+        return material.download_count, file.access_count, accesses
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_increments_and_access_rows(session_factory):
+    counter = DownloadCounter(session_factory, flush_interval=60, max_pending=100)
+    for user_id in (1, 2, 3):
+        counter.record(10, 1, user_id)
+
+    assert await counter.flush() == 3
+    assert await counts(session_factory) == (3, 3, 3)
+    assert await counter.flush() == 0
+    assert counter.get_metrics()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_outage_keeps_downloads_until_retries_run_out(session_factory):
+    factory = session_factory
+    broken = True
+
+    async def flaky_factory():
+        return FailingSession() if broken else await factory()
+
+    counter = DownloadCounter(flaky_factory, flush_interval=60, max_pending=100, max_retries=3)
+    counter.record(10, 1, 1)
+    assert await counter.flush() == 0
+    counter.record(10, 1, 2)
+    assert await counter.flush() == 0
+    assert len(counter.access_rows) == 2
+
+    broken = False
+    assert await counter.flush() == 2
+    assert await counts(factory) == (2, 2, 2)
+    assert counter.failed_flushes == 0
+
+    broken = True
+    counter.record(10, 1, 3)
+    for _ in range(3):
+        await counter.flush()
+    # Access rows are given up after max_retries, the counters are still kept
+    assert counter.access_rows == []
+    assert counter.metrics["access_rows_dropped"] == 1
+    broken = False
+    assert await counter.flush() == 1
+    assert await counts(factory) == (3, 3, 2)
+
+
+@pytest.mark.asyncio
+async def test_rejected_access_rows_do_not_block_later_flushes(session_factory):
+    counter = DownloadCounter(session_factory, flush_interval=60, max_pending=100)
+    # File 99 was deleted: its access row violates the foreign key
+    counter.record(99, 1, 1)
+    counter.record(10, 1, 2)
+
+    assert await counter.flush() == 0
+    assert counter.access_rows == []
+    assert counter.metrics["access_rows_dropped"] == 2
+
+    counter.record(10, 1, 3)
+    assert await counter.flush() == 3
+    assert await counts(session_factory) == (3, 2, 1)
+
+
+def test_access_row_buffer_is_bounded():
+    counter = DownloadCounter(None, flush_interval=60, max_pending=1000, max_access_rows=5)
+    for user_id in range(8):
+        counter.record(10, 1, user_id)
+
+    assert [row["user_id"] for row in counter.access_rows] == [3, 4, 5, 6, 7]
+    assert counter.metrics["access_rows_dropped"] == 3
+    assert counter.pending == 8
@@ -0,0 +1,133 @@
+"""
+Tests for streaming writes and resumable uploads in FileStorageManager
+"""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from app.storage.file_storage import (
+    FileStorageManager, FileTooLargeError, UploadSessionError, UploadSessionNotFound
+)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileStorageManager(str(tmp_path / "uploads"), chunk_size=4)
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def temp_files(storage: FileStorageManager):
+    return [path for path in storage.temp_dir.iterdir() if path.is_file()]
+
+
+@pytest.mark.asyncio
+async def test_store_stream_hashes_and_stores_content(storage):
+    file_path, filename, checksum, size = await storage.store_stream(stream(b"hello ", b"world"), "notes.txt")
+
+    assert checksum == hashlib.sha256(b"hello world").hexdigest()
+    assert filename == f"{checksum}.txt"
+    assert size == 11
+    assert (storage.upload_dir / file_path).read_bytes() == b"hello world"
+    assert temp_files(storage) == []
+
+
+@pytest.mark.asyncio
+async def test_size_limit_is_enforced_mid_stream(storage):
+    consumed = []
+
+    async def chunks():
+        for chunk in (b"1234", b"5678", b"9abc", b"def0"):
+            consumed.append(chunk)
+            yield chunk
+
+    with pytest.raises(FileTooLargeError):
+        await storage.store_stream(chunks(), "big.bin", max_size=10)
+
+    # Stops reading at the chunk that crosses the limit and removes the partial file
+    assert len(consumed) == 3
+    assert temp_files(storage) == []
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_hash_spans_parts(storage):
+    session = await storage.create_upload_session(5, "video.mp4", 10)
+    await storage.append_upload_chunk(session.upload_id, 0, stream(b"01234"))
+    session = await storage.append_upload_chunk(session.upload_id, 5, stream(b"567", b"89"))
+    assert session.is_complete
+
+    completed, (file_path, filename, checksum, size) = await storage.complete_upload_session(session.upload_id)
+    assert completed.material_id == 5
+    assert checksum == hashlib.sha256(b"0123456789").hexdigest()
+    assert size == 10
+    assert (storage.upload_dir / file_path).read_bytes() == b"0123456789"
+    with pytest.raises(UploadSessionNotFound):
+        await storage.get_upload_session(session.upload_id)
+
+
+@pytest.mark.asyncio
+async def test_offset_mismatch_is_rejected(storage):
+    session = await storage.create_upload_session(1, "a.bin", 8)
+    await storage.append_upload_chunk(session.upload_id, 0, stream(b"abcd"))
+
+    with pytest.raises(UploadSessionError, match="Expected offset 4, got 0"):
+        await storage.append_upload_chunk(session.upload_id, 0, stream(b"abcd"))
+    with pytest.raises(UploadSessionError, match="Upload incomplete"):
+        await storage.complete_upload_session(session.upload_id)
+    assert (await storage.get_upload_session(session.upload_id)).received_bytes == 4
+
+
+@pytest.mark.asyncio
+async def test_part_beyond_total_size_keeps_received_bytes(storage):
+    session = await storage.create_upload_session(1, "a.bin", 6)
+    with pytest.raises(FileTooLargeError):
+        await storage.append_upload_chunk(session.upload_id, 0, stream(b"abcd", b"efgh"))
+
+    # The client resumes from the stored offset
+    assert (await storage.get_upload_session(session.upload_id)).received_bytes == 4
+    await storage.append_upload_chunk(session.upload_id, 4, stream(b"ef"))
+    _, (_, _, checksum, _) = await storage.complete_upload_session(session.upload_id)
+    assert checksum == hashlib.sha256(b"abcdef").hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_lost_hash_state_is_rebuilt_from_disk(storage, tmp_path):
+    session = await storage.create_upload_session(1, "a.bin", 8)
+    await storage.append_upload_chunk(session.upload_id, 0, stream(b"abcd"))
+
+    # Another process (or a restart) continues the upload without the in-memory hash
+    restarted = FileStorageManager(str(tmp_path / "uploads"), chunk_size=4)
+    await restarted.append_upload_chunk(session.upload_id, 4, stream(b"efgh"))
+    assert session.upload_id not in restarted._session_hashes
+
+    _, (file_path, _, checksum, _) = await restarted.complete_upload_session(session.upload_id)
+    assert checksum == hashlib.sha256(b"abcdefgh").hexdigest()
+    assert (restarted.upload_dir / file_path).read_bytes() == b"abcdefgh"
+
+
+@pytest.mark.asyncio
+async def test_cleanup_removes_only_stale_uploads(storage):
+    stale = await storage.create_upload_session(1, "old.bin", 8)
+    fresh = await storage.create_upload_session(1, "new.bin", 8)
+    meta_path, data_path = storage._session_paths(stale.upload_id)
+    past = time.time() - 7200
+    os.utime(meta_path, (past, past))
+
+    assert await storage.cleanup_stale_uploads(max_age=3600) == 1
+    assert not meta_path.exists() and not data_path.exists()
+    assert (await storage.get_upload_session(fresh.upload_id)).filename == "new.bin"
+
+
+@pytest.mark.asyncio
+async def test_unknown_upload_ids_are_not_found(storage):
+    with pytest.raises(UploadSessionNotFound):
+        await storage.get_upload_session("../../etc/passwd")
+    with pytest.raises(UploadSessionNotFound):
+        await storage.append_upload_chunk("0" * 32, 0, stream(b"x"))
+    assert await storage.abort_upload_session("0" * 32) is False
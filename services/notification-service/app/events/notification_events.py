@@ -5,6 +5,7 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import aio_pika
 from aio_pika import Message, DeliveryMode
+from shared.reliable_consumer import DeadLetterTopology, ReliableConsumer
 from app.core.config import settings
 from app.services.notification_service import NotificationService
 from app.models.notification import NotificationChannel, NotificationType, NotificationPriority
@@ -20,6 +21,8 @@ class NotificationEventConsumer:
         self.channel = None
         self.notification_service = NotificationService()
         self.running = False
+        # Повторы с задержкой и карантин (dlq.notifications)
+        self.reliable = ReliableConsumer(DeadLetterTopology("events", "notifications"))
         
         # Маппинг событий на типы уведомлений
         self.event_mapping = {
@@ -88,8 +91,11 @@ class NotificationEventConsumer:
             for binding in bindings:
                 await notifications_queue.bind(events_exchange, binding)
             
-            # Запускаем обработчик
-            await notifications_queue.consume(self.process_event)
+            # Очереди повторов и карантина
+            await self.reliable.declare(self.channel, notifications_queue)
+            
+            # Запускаем обработчик: ack, повторы и карантин делает ReliableConsumer
+            await notifications_queue.consume(self.reliable.wrap(self.process_event))
             
             logger.info("Started consuming notification events")
             
@@ -109,21 +115,19 @@ class NotificationEventConsumer:
         logger.info("Stopping notification event consumer")
     
     async def process_event(self, message: aio_pika.IncomingMessage):
-        """Обработать событие"""
-        async with message.process():
-            try:
-                # Парсим данные события
-                event_data = json.loads(message.body.decode())
-                routing_key = message.routing_key
-                
-                logger.info(f"Processing event: {routing_key}")
-                
-                # Обрабатываем в зависимости от типа события
-                await self._handle_event(routing_key, event_data)
-                
-            except Exception as e:
-                logger.error(f"Error processing event: {e}")
-                # Не перекидываем исключение, чтобы сообщение было acknowledged
+        """Обработать событие (ошибка - повтор с задержкой, затем карантин)"""
+        # Парсим данные события
+        event_data = json.loads(message.body.decode())
+        routing_key = message.routing_key
+        
+        logger.info(f"Processing event: {routing_key}")
+        
+        # Обрабатываем в зависимости от типа события
+        await self._handle_event(routing_key, event_data)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Задержка и ошибки обработчиков, повторы и карантин"""
+        return self.reliable.get_metrics()
     
     async def _handle_event(self, event_type: str, event_data: Dict[str, Any]):
         """Обработать конкретное событие"""
@@ -153,6 +157,7 @@ class NotificationEventConsumer:
                 
         except Exception as e:
             logger.error(f"Error handling event {event_type}: {e}")
+            raise
     
     async def _handle_lesson_created(self, data: Dict[str, Any]):
         """Обработать событие создания урока"""
@@ -176,6 +176,7 @@ async def health_check():
         # Проверяем обработчик событий
         if notification_consumer.running:
             health_status["components"]["event_consumer"] = "healthy"
+            health_status["event_consumer_stats"] = notification_consumer.get_metrics()
         else:
             health_status["components"]["event_consumer"] = "stopped"
             health_status["status"] = "degraded"
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Transactional outbox table of Payment Service.
+The relay, confirmed batch publishing and enqueue live in shared/outbox.py
+(services/shared, copied into the image as the shared package)
+"""
+from shared.outbox import OutboxMixin
+
+from ..models.payment import Base
+
+
+class OutboxEvent(OutboxMixin, Base):
+    """Event waiting to be published to RabbitMQ"""
+    pass
@@ -14,6 +14,7 @@ from decimal import Decimal
 from ..services.payment_service import PaymentService
 from ..services.balance_service import BalanceService
 from ..core.config import settings
+from ..database.connection import AsyncSessionLocal
 from .rabbitmq_client import RabbitMQClient, EventPublisher, MockRabbitMQClient
 
 logger = logging.getLogger(__name__)
@@ -45,6 +46,9 @@ class PaymentEventHandler:
                 self.rabbitmq_client = MockRabbitMQClient()
                 await self.rabbitmq_client.connect()
             
+            # Deliver stored events (including ones queued while the broker was down)
+            self.event_publisher.start(self.rabbitmq_client)
+            
             # Setup event consumers
             await self._setup_event_consumers()
             
@@ -56,6 +60,7 @@ class PaymentEventHandler:
     async def stop(self):
         """Stop event handler"""
         self.is_running = False
+        await self.event_publisher.stop()
         
         # Stop all consumers
         await self.rabbitmq_client.stop_consumer("payment_lesson_events")
@@ -149,31 +154,35 @@ class PaymentEventHandler:
             
             logger.info(f"Processing lesson completed event: lesson_id={lesson_id}, student_id={student_id}")
             
-            # Deduct lesson from balance
-            await self.balance_service.deduct_lessons(
-                student_id=student_id,
-                lessons_count=1,
-                amount=lesson_price,
-                description=f"Lesson completed: {lesson_topic}",
-                lesson_id=lesson_id
-            )
-            
-            # Publish balance deducted event
-            await self.event_publisher.publish_balance_deducted({
-                "student_id": student_id,
-                "lesson_id": lesson_id,
-                "lessons_deducted": 1,
-                "amount_spent": float(lesson_price),
-                "reason": "lesson_completed",
-                "timestamp": datetime.utcnow().isoformat(),
-                "correlation_id": event.get('correlation_id')
-            })
+            # Deduct lesson from balance and store the event in the same transaction
+            async with AsyncSessionLocal() as session:
+                await self.balance_service.deduct_lessons(
+                    student_id=student_id,
+                    lessons_count=1,
+                    amount=lesson_price,
+                    description=f"Lesson completed: {lesson_topic}",
+                    lesson_id=lesson_id,
+                    session=session
+                )
+                
+                await self.event_publisher.publish_balance_deducted({
+                    "student_id": student_id,
+                    "lesson_id": lesson_id,
+                    "lessons_deducted": 1,
+                    "amount_spent": float(lesson_price),
+                    "reason": "lesson_completed",
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "correlation_id": event.get('correlation_id')
+                }, session=session)
+                
+                await session.commit()
             
             logger.info(f"Successfully processed lesson completed event for student {student_id}")
             
         except Exception as e:
             logger.error(f"Error handling lesson completed event: {e}")
-            # TODO: Send to dead letter queue
+            # Retried with backoff, then quarantined by ReliableConsumer
+            raise
     
     async def handle_lesson_cancelled(self, event: Dict[str, Any]):
         """
@@ -191,24 +200,27 @@ class PaymentEventHandler:
             
             # Only refund for excused absences and reschedules
             if cancellation_type in ['excused', 'rescheduled']:
-                # Add lesson back to balance
-                await self.balance_service.add_lessons(
-                    student_id=student_id,
-                    lessons_count=1,
-                    amount=Decimal('0.00'),  # No new money, just returning balance
-                    description=f"Lesson refund: {lesson_topic} ({cancellation_type})",
-                    reference_id=f"lesson_{lesson_id}_refund"
-                )
-                
-                # Publish balance refunded event
-                await self.event_publisher.publish_balance_refunded({
-                    "student_id": student_id,
-                    "lesson_id": lesson_id,
-                    "lessons_refunded": 1,
-                    "reason": cancellation_type,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "correlation_id": event.get('correlation_id')
-                })
+                # Add lesson back to balance and store the event in the same transaction
+                async with AsyncSessionLocal() as session:
+                    await self.balance_service.add_lessons(
+                        student_id=student_id,
+                        lessons_count=1,
+                        amount=Decimal('0.00'),  # No new money, just returning balance
+                        description=f"Lesson refund: {lesson_topic} ({cancellation_type})",
+                        reference_id=f"lesson_{lesson_id}_refund",
+                        session=session
+                    )
+                    
+                    await self.event_publisher.publish_balance_refunded({
+                        "student_id": student_id,
+                        "lesson_id": lesson_id,
+                        "lessons_refunded": 1,
+                        "reason": cancellation_type,
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "correlation_id": event.get('correlation_id')
+                    }, session=session)
+                    
+                    await session.commit()
                 
                 logger.info(f"Refunded balance for student {student_id} due to {cancellation_type} cancellation")
             else:
@@ -216,7 +228,8 @@ class PaymentEventHandler:
             
         except Exception as e:
             logger.error(f"Error handling lesson cancelled event: {e}")
-            # TODO: Send to dead letter queue
+            # Retried with backoff, then quarantined by ReliableConsumer
+            raise
     
     async def handle_student_created(self, event: Dict[str, Any]):
         """
@@ -304,7 +317,9 @@ class PaymentEventHandler:
         return {
             "is_running": self.is_running,
             "rabbitmq_connected": await self.rabbitmq_client.health_check() if self.rabbitmq_client else False,
-            "consumers_active": len(self.rabbitmq_client.consumers) if self.rabbitmq_client else 0
+            "consumers_active": len(self.rabbitmq_client.consumers) if self.rabbitmq_client else 0,
+            "outbox": await self.event_publisher.get_metrics(),
+            "consumers": self.rabbitmq_client.get_consumer_metrics() if self.rabbitmq_client else {}
         }
 
 
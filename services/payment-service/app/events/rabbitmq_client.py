@@ -7,13 +7,19 @@ Handles connection, publishing, and consuming events
 import json
 import logging
 import asyncio
-from typing import Dict, Any, Optional, Callable
+import uuid
+from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
 import aio_pika
 from aio_pika.abc import AbstractRobustConnection, AbstractRobustChannel
 from aio_pika import connect_robust, ExchangeType, Message
 
+from shared.outbox import AmqpBatchPublisher, OutboxMessage, OutboxRelay, enqueue, notify_after_commit
+from shared.reliable_consumer import DeadLetterTopology, ReliableConsumer
+
 from ..core.config import settings
+from ..database.connection import AsyncSessionLocal
+from .outbox import OutboxEvent
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +33,7 @@ class RabbitMQClient:
         self.exchange = None
         self.is_connected = False
         self.consumers = {}
+        self.reliable_consumers: Dict[str, ReliableConsumer] = {}
         
     async def connect(self) -> bool:
         """Establish connection to RabbitMQ"""
@@ -39,8 +46,8 @@ class RabbitMQClient:
                 loop=asyncio.get_event_loop()
             )
             
-            # Create channel
-            self.channel = await self.connection.channel()
+            # Create channel with publisher confirms (publish returns after broker ack)
+            self.channel = await self.connection.channel(publisher_confirms=True)
             await self.channel.set_qos(prefetch_count=settings.EVENT_PROCESSING_BATCH_SIZE)
             
             # Declare exchange
@@ -69,44 +76,45 @@ class RabbitMQClient:
         except Exception as e:
             logger.error(f"Error disconnecting from RabbitMQ: {e}")
     
+    @staticmethod
+    def build_event_message(routing_key: str, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Event envelope shared by all payment events"""
+        return {
+            "event_type": routing_key.split('.')[-1],
+            "data": event_data,
+            "service": "payment-service",
+            "timestamp": datetime.utcnow().isoformat(),
+            "correlation_id": event_data.get('correlation_id'),
+            "version": "1.0"
+        }
+    
     async def publish_event(self, routing_key: str, event_data: Dict[str, Any]) -> bool:
-        """Publish event to exchange"""
+        """Publish event to exchange directly (waits for broker confirm)"""
         if not self.is_connected or not self.exchange:
             logger.error("Not connected to RabbitMQ")
             return False
         
-        try:
-            # Prepare event message
-            event_message = {
-                "event_type": routing_key.split('.')[-1],
-                "data": event_data,
-                "service": "payment-service",
-                "timestamp": datetime.utcnow().isoformat(),
-                "correlation_id": event_data.get('correlation_id'),
-                "version": "1.0"
-            }
-            
-            # Create message
-            message = Message(
-                json.dumps(event_message).encode(),
-                content_type="application/json",
-                delivery_mode=2,  # Persistent
-                timestamp=datetime.utcnow()
-            )
-            
-            # Publish to exchange
-            await self.exchange.publish(
-                message,
-                routing_key=routing_key
-            )
-            
-            logger.info(f"Published event: {routing_key}")
-            logger.debug(f"Event data: {json.dumps(event_message, indent=2)}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to publish event {routing_key}: {e}")
+        event_message = self.build_event_message(routing_key, event_data)
+        message = OutboxMessage(
+            message_id=str(uuid.uuid4()),
+            routing_key=routing_key,
+            body=json.dumps(event_message, default=str).encode(),
+            created_at=datetime.utcnow()
+        )
+        errors = await self.publish_batch([message])
+        if errors[0]:
+            logger.error(f"Failed to publish event {routing_key}: {errors[0]}")
             return False
+        
+        logger.info(f"Published event: {routing_key}")
+        logger.debug(f"Event data: {json.dumps(event_message, indent=2, default=str)}")
+        return True
+    
+    async def publish_batch(self, messages: List[OutboxMessage]) -> List[Optional[str]]:
+        """Publish a batch of outbox messages; returns an error per message (None = confirmed)"""
+        if not self.is_connected or not self.exchange:
+            return ["Not connected to RabbitMQ"] * len(messages)
+        return await AmqpBatchPublisher(self.exchange).publish_batch(messages)
     
     async def create_consumer(
         self,
@@ -141,24 +149,19 @@ class RabbitMQClient:
                 await queue.bind(self.exchange, routing_key)
                 logger.info(f"Bound queue {queue_name} to {routing_key}")
             
-            # Create consumer
+            # Delayed retry queues and quarantine (dlq.<queue>)
+            reliable = ReliableConsumer(DeadLetterTopology(settings.RABBITMQ_EXCHANGE, queue_name))
+            await reliable.declare(self.channel, queue)
+            self.reliable_consumers[queue_name] = reliable
+            
+            # Create consumer: errors propagate to ReliableConsumer (retry or quarantine)
             async def message_handler(message: aio_pika.IncomingMessage):
-                async with message.process():
-                    try:
-                        # Parse message
-                        event_data = json.loads(message.body.decode())
-                        logger.info(f"Received event: {event_data.get('event_type')} on {queue_name}")
-                        
-                        # Handle event
-                        await handler(event_data)
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing message in {queue_name}: {e}")
-                        # Message will be requeued or sent to DLQ
-                        raise
+                event_data = json.loads(message.body.decode())
+                logger.info(f"Received event: {event_data.get('event_type')} on {queue_name}")
+                await handler(event_data)
             
             # Start consuming
-            consumer_tag = await queue.consume(message_handler)
+            consumer_tag = await queue.consume(reliable.wrap(message_handler, queue_name))
             self.consumers[queue_name] = consumer_tag
             
             logger.info(f"Started consumer for queue: {queue_name}")
@@ -206,6 +209,10 @@ class RabbitMQClient:
         except Exception as e:
             logger.error(f"Failed to setup DLQ for {original_queue_name}: {e}")
     
+    def get_consumer_metrics(self) -> Dict[str, Any]:
+        """Handler latency, failures, retries and quarantined messages per queue"""
+        return {name: reliable.get_metrics() for name, reliable in self.reliable_consumers.items()}
+    
     async def health_check(self) -> bool:
         """Check RabbitMQ connection health"""
         try:
@@ -227,45 +234,70 @@ class RabbitMQClient:
 
 
 class EventPublisher:
-    """Helper class for publishing specific payment events"""
+    """
+    Helper class for publishing specific payment events.
+    Events are written to the outbox table (in the caller's transaction when a session
+    is passed) and delivered by the relay in confirmed batches, so they survive broker outages.
+    """
     
     def __init__(self, rabbitmq_client: RabbitMQClient):
         self.client = rabbitmq_client
+        # The publisher is attached in start() and only for a real broker connection
+        self.relay = OutboxRelay(AsyncSessionLocal, OutboxEvent)
+    
+    def start(self, rabbitmq_client: Optional[RabbitMQClient] = None):
+        """
+        Start outbox relay (the client may be replaced by the mock one after a failed connect).
+        The mock client confirms nothing: without a broker events stay pending in the outbox
+        """
+        if rabbitmq_client is not None:
+            self.client = rabbitmq_client
+        if isinstance(self.client, MockRabbitMQClient):
+            logger.warning("RabbitMQ is not available: outbox events stay pending until a broker is connected")
+            return
+        self.relay.publisher = self.client
+        self.relay.start()
     
-    async def publish_payment_processed(self, payment_data: Dict[str, Any]):
+    async def stop(self):
+        """Stop outbox relay"""
+        await self.relay.stop()
+    
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Outbox relay throughput, lag and retry metrics"""
+        return await self.relay.get_metrics()
+    
+    async def publish(self, routing_key: str, event_data: Dict[str, Any], session=None):
+        """Store event in the outbox; commit is left to the caller when session is passed, the relay is woken after it"""
+        event_message = self.client.build_event_message(routing_key, event_data)
+        if session is not None:
+            enqueue(session, OutboxEvent, routing_key, event_message)
+            notify_after_commit(session, self.relay)
+            return
+        
+        async with AsyncSessionLocal() as own_session:
+            enqueue(own_session, OutboxEvent, routing_key, event_message)
+            await own_session.commit()
+        self.relay.notify()
+    
+    async def publish_payment_processed(self, payment_data: Dict[str, Any], session=None):
         """Publish payment processed event"""
-        await self.client.publish_event(
-            "payment.processed",
-            payment_data
-        )
+        await self.publish("payment.processed", payment_data, session)
     
-    async def publish_balance_updated(self, balance_data: Dict[str, Any]):
+    async def publish_balance_updated(self, balance_data: Dict[str, Any], session=None):
         """Publish balance updated event"""
-        await self.client.publish_event(
-            "payment.balance.updated",
-            balance_data
-        )
+        await self.publish("payment.balance.updated", balance_data, session)
     
-    async def publish_balance_deducted(self, deduction_data: Dict[str, Any]):
+    async def publish_balance_deducted(self, deduction_data: Dict[str, Any], session=None):
         """Publish balance deducted event"""
-        await self.client.publish_event(
-            "payment.balance.deducted",
-            deduction_data
-        )
+        await self.publish("payment.balance.deducted", deduction_data, session)
     
-    async def publish_balance_refunded(self, refund_data: Dict[str, Any]):
+    async def publish_balance_refunded(self, refund_data: Dict[str, Any], session=None):
         """Publish balance refunded event"""
-        await self.client.publish_event(
-            "payment.balance.refunded",
-            refund_data
-        )
+        await self.publish("payment.balance.refunded", refund_data, session)
     
-    async def publish_payment_failed(self, failure_data: Dict[str, Any]):
+    async def publish_payment_failed(self, failure_data: Dict[str, Any], session=None):
         """Publish payment failed event"""
-        await self.client.publish_event(
-            "payment.failed",
-            failure_data
-        )
+        await self.publish("payment.failed", failure_data, session)
 
 
 class MockRabbitMQClient(RabbitMQClient):
@@ -288,6 +320,10 @@ class MockRabbitMQClient(RabbitMQClient):
         logger.debug(f"Event data: {json.dumps(event_data, indent=2)}")
         return True
     
+    async def publish_batch(self, messages: List[OutboxMessage]) -> List[Optional[str]]:
+        """Nothing reaches a broker, so no message is confirmed"""
+        return ["Mock RabbitMQ client does not publish"] * len(messages)
+    
     async def create_consumer(self, queue_name: str, routing_keys: list, handler: Callable, dead_letter_exchange: str = None):
         """Mock consumer creation"""
         logger.info(f"Mock consumer created for {queue_name} with keys: {routing_keys}")
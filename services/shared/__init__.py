@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
 """
 Shared components for microservices
-"""
\ No newline at end of file
+Пакет копируется в образ сервиса как /app/shared из отдельного контекста сборки
+(additional_contexts: shared в docker-compose, COPY --from=shared в Dockerfile)
+и импортируется как shared.<модуль>. Локально каталог services добавляется в PYTHONPATH
+"""
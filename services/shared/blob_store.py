@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Content-Addressed Blob Store
+Хранилище файлов с адресацией по SHA-256: одинаковое содержимое хранится один раз.
+Блоб лежит в blobs/<aa>/<bb>/<sha256>, рядом счетчик ссылок <sha256>.refs.
+Производные файлы (миниатюры, превью, сжатые версии) кэшируются на блоб
+в derived/<aa>/<bb>/<sha256>/ и не пересоздаются для дубликатов.
+Блобы без ссылок удаляет сборщик мусора после grace периода.
+
+    python -m shared.blob_store stats ./uploads
+    python -m shared.blob_store gc ./uploads --grace 3600
+"""
+import argparse
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+BLOBS_DIR = "blobs"
+DERIVED_DIR = "derived"
+HEX_DIGITS = set("0123456789abcdef")
+
+
+def is_digest(value: str) -> bool:
+    return len(value) == 64 and set(value) <= HEX_DIGITS
+
+
+class BlobStore:
+    """
+    Блобы и счетчики ссылок внутри root. Счетчик меняется под flock файла .refs,
+    поэтому несколько воркеров одного тома не теряют ссылки
+    """
+
+    def __init__(self, root: str, gc_grace_seconds: int = None):
+        self.root = Path(root)
+        self.blobs_dir = self.root / BLOBS_DIR
+        self.derived_dir = self.root / DERIVED_DIR
+        self.gc_grace_seconds = BLOB_GC_GRACE_SECONDS if gc_grace_seconds is None else gc_grace_seconds
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.derived_dir.mkdir(parents=True, exist_ok=True)
+
+    # === Пути ===
+
+    def _shard(self, digest: str) -> Path:
+        return Path(digest[:2]) / digest[2:4]
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / self._shard(digest) / digest
+
+    def refs_path(self, digest: str) -> Path:
+        return self.blobs_dir / self._shard(digest) / f"{digest}.refs"
+
+    def relative_path(self, digest: str) -> str:
+        """Путь блоба относительно root (хранится в БД вместо имени файла)"""
+        return f"{BLOBS_DIR}/{self._shard(digest).as_posix()}/{digest}"
+
+    def digest_of(self, relative_path: Optional[str]) -> Optional[str]:
+        """SHA-256 блоба по относительному пути или None для файлов вне хранилища"""
+        parts = Path(relative_path or "").parts
+        if len(parts) == 4 and parts[0] == BLOBS_DIR and is_digest(parts[3]):
+            return parts[3]
+        return None
+
+    def derived_path(self, digest: str, name: str) -> Path:
+        return self.derived_dir / self._shard(digest) / digest / name
+
+    # === Счетчик ссылок ===
+
+    @contextmanager
+    def _locked_refs(self, digest: str) -> Iterator[int]:
+        """
+        Открытый под эксклюзивной блокировкой файл .refs. Если сборщик мусора удалил
+        файл, пока мы ждали блокировку, открываем заново
+        """
+        path = self.refs_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    current = None
+                if current is not None and current.st_ino == os.fstat(fd).st_ino:
+                    yield fd
+                    return
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _read_refs(fd: int) -> int:
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = os.read(fd, 32).strip()
+        try:
+            return int(data) if data else 0
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _write_refs(fd: int, refs: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(refs).encode())
+
+    def _put(self, temp_path: Path, digest: str) -> Tuple[str, bool]:
+        with self._locked_refs(digest) as fd:
+            target = self.blob_path(digest)
+            created = not target.exists()
+            if created:
+                os.replace(temp_path, target)
+            else:
+                Path(temp_path).unlink(missing_ok=True)
+            self._write_refs(fd, self._read_refs(fd) + 1)
+        return self.relative_path(digest), created
+
+    def _adjust(self, digest: str, delta: int) -> int:
+        with self._locked_refs(digest) as fd:
+            if not self.blob_path(digest).exists():
+                raise FileNotFoundError(f"Blob not found: {digest}")
+            refs = max(0, self._read_refs(fd) + delta)
+            self._write_refs(fd, refs)
+        return refs
+
+    async def put_file(self, temp_path: Path, digest: str) -> Tuple[str, bool]:
+        """
+        Перемещает полностью записанный временный файл в хранилище и добавляет ссылку.
+        Если блоб уже есть, временный файл удаляется.
+        Returns: (относительный путь, создан ли новый блоб)
+        """
+        return await asyncio.to_thread(self._put, Path(temp_path), digest)
+
+    async def add_ref(self, digest: str) -> int:
+        return await asyncio.to_thread(self._adjust, digest, 1)
+
+    async def release(self, digest: str) -> int:
+        """Убирает ссылку; блоб без ссылок удалит сборщик мусора. Returns: оставшиеся ссылки"""
+        return await asyncio.to_thread(self._adjust, digest, -1)
+
+    async def get_refs(self, digest: str) -> int:
+        def read() -> int:
+            try:
+                return int(self.refs_path(digest).read_text().strip() or 0)
+            except (FileNotFoundError, ValueError):
+                return 0
+        return await asyncio.to_thread(read)
+
+    # === Производные файлы ===
+
+    async def derive(
+        self,
+        digest: str,
+        name: str,
+        builder: Callable[[Path, Path], Any],
+        executor: Optional[Executor] = None
+    ) -> Optional[str]:
+        """
+        Производный файл блоба из кэша; при отсутствии builder(source, target) создается
+        в executor (по умолчанию - пул потоков; для пула процессов builder должен сериализоваться).
+        builder может вернуть False, если производный файл не нужен.
+        Returns: путь относительно root или None
+        """
+        target = self.derived_path(digest, name)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temp = target.with_name(f".{name}.{uuid.uuid4().hex}.tmp")
+            try:
+                loop = asyncio.get_running_loop()
+                if await loop.run_in_executor(executor, builder, self.blob_path(digest), temp) is False:
+                    return None
+                os.replace(temp, target)
+            finally:
+                temp.unlink(missing_ok=True)
+        return target.relative_to(self.root).as_posix()
+
+    # === Сборка мусора ===
+
+    def _collect(self, grace_seconds: int) -> Dict[str, int]:
+        cutoff = time.time() - grace_seconds
+        result = {"blobs_removed": 0, "bytes_freed": 0}
+        for refs_path in self.blobs_dir.glob("*/*/*.refs"):
+            digest = refs_path.stem
+            if not is_digest(digest):
+                continue
+            try:
+                if refs_path.stat().st_mtime >= cutoff:
+                    continue
+                with self._locked_refs(digest) as fd:
+                    if self._read_refs(fd) > 0 or os.fstat(fd).st_mtime >= cutoff:
+                        continue
+                    blob = self.blob_path(digest)
+                    if blob.exists():
+                        result["bytes_freed"] += blob.stat().st_size
+                        blob.unlink()
+                    shutil.rmtree(self.derived_path(digest, ""), ignore_errors=True)
+                    refs_path.unlink(missing_ok=True)
+                result["blobs_removed"] += 1
+            except OSError as e:
+                logger.warning(f"Failed to collect blob {digest}: {e}")
+        return result
+
+    async def collect_garbage(self, grace_seconds: int = None) -> Dict[str, int]:
+        """
+        Удаляет блобы без ссылок и их производные файлы. Счетчик должен пробыть нулевым
+        grace_seconds: за это время повторная загрузка того же файла переиспользует блоб
+        """
+        grace_seconds = self.gc_grace_seconds if grace_seconds is None else grace_seconds
+        result = await asyncio.to_thread(self._collect, grace_seconds)
+        if result["blobs_removed"]:
+            logger.info(f"Blob GC removed {result['blobs_removed']} blobs, freed {result['bytes_freed']} bytes")
+        return result
+
+    def _scan(self) -> Dict[str, int]:
+        stats = {"blobs": 0, "references": 0, "stored_bytes": 0, "logical_bytes": 0, "unreferenced": 0}
+        for refs_path in self.blobs_dir.glob("*/*/*.refs"):
+            try:
+                refs = int(refs_path.read_text().strip() or 0)
+                size = self.blob_path(refs_path.stem).stat().st_size
+            except (OSError, ValueError):
+                continue
+            stats["blobs"] += 1
+            stats["references"] += refs
+            stats["stored_bytes"] += size
+            stats["logical_bytes"] += size * refs
+            if refs == 0:
+                stats["unreferenced"] += 1
+        return stats
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Число блобов и ссылок; logical_bytes - сколько заняли бы файлы без дедупликации"""
+        stats = await asyncio.to_thread(self._scan)
+        stats["saved_bytes"] = max(0, stats["logical_bytes"] - stats["stored_bytes"])
+        return stats
+
+
+async def main(args: argparse.Namespace):
+    store = BlobStore(args.root)
+    if args.command == "gc":
+        print(await store.collect_garbage(args.grace))
+    else:
+        print(await store.get_stats())
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inspect and garbage-collect a blob store")
+    parser.add_argument("command", choices=["gc", "stats"])
+    parser.add_argument("root", help="Storage root, e.g. ./uploads")
+    parser.add_argument("--grace", type=int, default=None, help="Seconds a blob must stay unreferenced")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
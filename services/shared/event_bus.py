@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 """
 Event Bus for Microservices Communication
-Общий Event Bus для обмена событиями между микросервисами
+Общий Event Bus для обмена событиями между микросервисами.
+Публикация идет через канал с publisher confirms; с подключенным outbox (use_outbox)
+события сначала сохраняются в БД сервиса и отправляются фоновым relay пачками.
+Входящие события обрабатываются через ReliableConsumer: повтор с задержкой и карантин
 """
 import asyncio
 import aio_pika
 import json
 import logging
+import time
 import uuid
 from typing import Dict, Any, Callable, Optional, List
 from datetime import datetime
@@ -14,6 +18,9 @@ from enum import Enum
 from dataclasses import dataclass, asdict
 import os
 
+from .outbox import AmqpBatchPublisher, OutboxMessage, OutboxRelay, enqueue
+from .reliable_consumer import DeadLetterTopology, ReliableConsumer
+
 logger = logging.getLogger(__name__)
 
 class EventType(Enum):
@@ -123,6 +130,12 @@ class EventBus:
         # Хранилище обработчиков событий
         self._event_handlers: Dict[EventType, List[Callable]] = {}
         self._consumer_tag: Optional[str] = None
+        self.reliable: Optional[ReliableConsumer] = None
+        
+        # Outbox (use_outbox): модель таблицы, фабрика сессий и relay
+        self.outbox_model: Any = None
+        self.outbox_session_factory: Optional[Callable[[], Any]] = None
+        self.outbox_relay: Optional[OutboxRelay] = None
         
         # Настройки
         self.retry_attempts = 3
@@ -132,7 +145,8 @@ class EventBus:
         """Подключение к RabbitMQ"""
         try:
             self.connection = await aio_pika.connect_robust(self.rabbitmq_url)
-            self.channel = await self.connection.channel()
+            # Подтверждения брокера: publish завершается только после ack
+            self.channel = await self.connection.channel(publisher_confirms=True)
             
             # Создаем exchange
             self.exchange = await self.channel.declare_exchange(
@@ -149,6 +163,10 @@ class EventBus:
                 auto_delete=False
             )
             
+            # Очереди повторов и карантина
+            self.reliable = ReliableConsumer(DeadLetterTopology(self.exchange_name, queue_name))
+            await self.reliable.declare(self.channel, self.queue)
+            
             logger.info(f"Connected to RabbitMQ, queue: {queue_name}")
             
         except Exception as e:
@@ -158,6 +176,9 @@ class EventBus:
     async def disconnect(self):
         """Отключение от RabbitMQ"""
         try:
+            if self.outbox_relay:
+                await self.outbox_relay.stop()
+            
             if self._consumer_tag:
                 await self.queue.cancel(self._consumer_tag)
                 self._consumer_tag = None
@@ -170,38 +191,44 @@ class EventBus:
         except Exception as e:
             logger.error(f"Error disconnecting from RabbitMQ: {e}")
     
-    async def publish_event(self, event: Event):
-        """Публикация события"""
+    def use_outbox(self, session_factory: Callable[[], Any], model: Any) -> OutboxRelay:
+        """
+        Включает outbox: publish_event сохраняет события в таблицу model (OutboxMixin на Base
+        сервиса), relay публикует их пачками. Возвращает запущенный relay
+        """
+        self.outbox_session_factory = session_factory
+        self.outbox_model = model
+        self.outbox_relay = OutboxRelay(session_factory, model, publisher=self)
+        self.outbox_relay.start()
+        return self.outbox_relay
+    
+    def message_headers(self, event: Event) -> Dict[str, Any]:
+        """Заголовки AMQP сообщения события"""
+        return {
+            "event_id": event.event_id,
+            "event_type": event.event_type.value,
+            "source_service": event.source_service,
+            "timestamp": event.timestamp.isoformat(),
+            "user_id": str(event.user_id) if event.user_id else None,
+            "correlation_id": event.correlation_id
+        }
+    
+    async def publish_event(self, event: Event, session: Any = None):
+        """
+        Публикация события. С outbox событие сохраняется в БД: в транзакции session
+        (коммит делает вызывающий код) или в отдельной транзакции, если session не передана
+        """
+        if self.outbox_model is not None:
+            await self.enqueue_event(event, session)
+            return
+        
         try:
             if not self.channel:
                 await self.connect()
             
-            # Сериализуем событие
-            message_body = json.dumps(event.to_dict(), ensure_ascii=False)
-            
-            # Создаем routing key
-            routing_key = event.event_type.value
-            
-            # Публикуем сообщение
-            message = aio_pika.Message(
-                message_body.encode(),
-                headers={
-                    "event_id": event.event_id,
-                    "event_type": event.event_type.value,
-                    "source_service": event.source_service,
-                    "timestamp": event.timestamp.isoformat(),
-                    "user_id": str(event.user_id) if event.user_id else None,
-                    "correlation_id": event.correlation_id
-                },
-                message_id=event.event_id,
-                timestamp=event.timestamp,
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-            )
-            
-            await self.exchange.publish(
-                message,
-                routing_key=routing_key
-            )
+            errors = await AmqpBatchPublisher(self.exchange).publish_batch([self._to_message(event)])
+            if errors[0]:
+                raise RuntimeError(errors[0])
             
             logger.debug(f"Published event {event.event_id}: {event.event_type.value}")
             
@@ -209,6 +236,39 @@ class EventBus:
             logger.error(f"Failed to publish event {event.event_id}: {e}")
             raise
     
+    async def enqueue_event(self, event: Event, session: Any = None):
+        """Сохранение события в outbox"""
+        args = (self.outbox_model, event.event_type.value, event.to_dict(), self.message_headers(event), event.event_id)
+        if session is not None:
+            enqueue(session, *args)
+            return
+        
+        async with self.outbox_session_factory() as own_session:
+            enqueue(own_session, *args)
+            await own_session.commit()
+        self.outbox_relay.notify()
+    
+    async def publish_batch(self, messages: List[OutboxMessage]) -> List[Optional[str]]:
+        """Публикация пачки сообщений outbox с подтверждениями (publisher для OutboxRelay)"""
+        if not self.channel:
+            await self.connect()
+        return await AmqpBatchPublisher(self.exchange).publish_batch(messages)
+    
+    def _to_message(self, event: Event) -> OutboxMessage:
+        return OutboxMessage(
+            message_id=event.event_id,
+            routing_key=event.event_type.value,
+            body=json.dumps(event.to_dict(), ensure_ascii=False).encode(),
+            headers=self.message_headers(event),
+            created_at=event.timestamp
+        )
+    
+    async def get_outbox_metrics(self) -> Dict[str, Any]:
+        """Метрики relay (пропускная способность, отставание, повторы)"""
+        if self.outbox_relay is None:
+            return {"enabled": False}
+        return {"enabled": True, **await self.outbox_relay.get_metrics()}
+    
     def subscribe(self, event_type: EventType, handler: Callable[[Event], None]):
         """Подписка на тип события"""
         if event_type not in self._event_handlers:
@@ -232,7 +292,7 @@ class EventBus:
                 logger.info(f"Bound queue to {event_type.value}")
             
             # Начинаем потребление
-            await self.queue.consume(self._handle_message)
+            await self.queue.consume(self.reliable.wrap(self._handle_message, "event_bus"))
             logger.info("Started consuming events")
             
         except Exception as e:
@@ -240,38 +300,51 @@ class EventBus:
             raise
     
     async def _handle_message(self, message: aio_pika.IncomingMessage):
-        """Обработка входящего сообщения"""
-        try:
-            async with message.process():
-                # Десериализуем событие
-                event_data = json.loads(message.body.decode())
-                event = Event.from_dict(event_data)
-                
-                # Находим обработчики для данного типа события
-                handlers = self._event_handlers.get(event.event_type, [])
-                
-                if not handlers:
-                    logger.warning(f"No handlers for event {event.event_type.value}")
-                    return
+        """
+        Обработка входящего сообщения. Ошибка любого обработчика отправляет событие
+        на повтор целиком (ack и повторы делает ReliableConsumer), поэтому обработчики
+        должны быть идемпотентными
+        """
+        # Десериализуем событие
+        event_data = json.loads(message.body.decode())
+        event = Event.from_dict(event_data)
+        
+        # Находим обработчики для данного типа события
+        handlers = self._event_handlers.get(event.event_type, [])
+        
+        if not handlers:
+            logger.warning(f"No handlers for event {event.event_type.value}")
+            return
+        
+        # Выполняем обработчики
+        errors = []
+        for handler in handlers:
+            stats = self.reliable.handler_stats(handler.__name__)
+            started = time.monotonic()
+            try:
+                if asyncio.iscoroutinefunction(handler):
+                    await handler(event)
+                else:
+                    handler(event)
                 
-                # Выполняем обработчики
-                for handler in handlers:
-                    try:
-                        if asyncio.iscoroutinefunction(handler):
-                            await handler(event)
-                        else:
-                            handler(event)
-                        
-                        logger.debug(f"Handled event {event.event_id} with {handler.__name__}")
-                        
-                    except Exception as e:
-                        logger.error(f"Handler {handler.__name__} failed for event {event.event_id}: {e}")
-                        # Продолжаем выполнение других обработчиков
+                logger.debug(f"Handled event {event.event_id} with {handler.__name__}")
                 
-        except Exception as e:
-            logger.error(f"Failed to handle message: {e}")
-            # Отклоняем сообщение для повторной обработки
-            await message.reject(requeue=True)
+            except Exception as e:
+                stats.failures += 1
+                logger.error(f"Handler {handler.__name__} failed for event {event.event_id}: {e}")
+                # Продолжаем выполнение других обработчиков
+                errors.append(e)
+            finally:
+                stats.observe(time.monotonic() - started)
+        
+        if errors:
+            raise errors[0]
+    
+    def get_consumer_metrics(self) -> Dict[str, Any]:
+        """Задержка и ошибки обработчиков, повторы и карантин"""
+        if self.reliable is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.reliable.get_metrics()}
     
     async def publish_user_created(self, user_data: Dict[str, Any]):
         """Публикация события создания пользователя"""
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+File Response
+Отдача файла с диска без чтения в память: Range (206/416), ETag/If-None-Match (304),
+Cache-Control. Тело отправляется через расширения ASGI zerocopysend (sendfile)
+или pathsend, если их поддерживает сервер, иначе - блоками фиксированного размера.
+С accel_redirect отдачу выполняет nginx (sendfile, Range) по заголовку X-Accel-Redirect:
+
+    location /protected-files/ {
+        internal;
+        alias /app/uploads/;
+    }
+"""
+import asyncio
+import os
+import stat
+from email.utils import formatdate
+from typing import Mapping, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон bytes=a-b, bytes=a-, bytes=-n -> (start, end) включительно.
+    None - заголовка нет или он не поддерживается (несколько диапазонов): отдается весь файл.
+    ValueError - диапазон вне файла (416)
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition("-")
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        if end == 0 or file_size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, file_size - end), file_size - 1
+    if start >= file_size or (end is not None and start > end):
+        raise ValueError("Range not satisfiable")
+    return start, file_size - 1 if end is None else min(end, file_size - 1)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match / If-Range: слабое сравнение, '*' совпадает с любым"""
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    plain = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or any((c[2:] if c.startswith("W/") else c) == plain for c in candidates)
+
+
+class RangeFileResponse(Response):
+    """
+    Ответ с файлом path. etag - хеш содержимого (SHA-256 файла), иначе слабый ETag
+    по mtime и размеру. range_start - первый отдаваемый байт (None для 304/416)
+    """
+
+    chunk_size = FILE_CHUNK_SIZE
+
+    def __init__(
+        self,
+        path: str,
+        request_headers: Mapping[str, str],
+        filename: Optional[str] = None,
+        media_type: Optional[str] = None,
+        etag: Optional[str] = None,
+        cache_control: Optional[str] = None,
+        accel_redirect: Optional[str] = None,
+        method: str = "GET"
+    ):
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        self.accel_redirect = accel_redirect
+        self.send_body = method.upper() != "HEAD"
+
+        stat_result = os.stat(path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(f"Not a file: {path}")
+        self.file_size = stat_result.st_size
+        self.etag = f'"{etag}"' if etag else f'W/"{int(stat_result.st_mtime):x}-{self.file_size:x}"'
+
+        headers = {
+            "etag": self.etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+        }
+        if cache_control:
+            headers["cache-control"] = cache_control
+        if filename:
+            headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+        self.range_start: Optional[int] = 0
+        self.range_end = self.file_size - 1
+
+        if etag_matches(request_headers.get("if-none-match"), self.etag):
+            self.status_code = 304
+            self.range_start = None
+        elif accel_redirect:
+            # Range и sendfile выполняет nginx
+            self.status_code = 200
+            headers["x-accel-redirect"] = accel_redirect
+            try:
+                requested = parse_range(request_headers.get("range"), self.file_size)
+            except ValueError:
+                requested = None
+            self.range_start = requested[0] if requested else 0
+        else:
+            self.status_code = 200
+            range_header = request_headers.get("range")
+            if_range = request_headers.get("if-range")
+            if range_header and (not if_range or etag_matches(if_range, self.etag)):
+                try:
+                    requested = parse_range(range_header, self.file_size)
+                except ValueError:
+                    requested = None
+                    self.status_code = 416
+                    self.range_start = None
+                    headers["content-range"] = f"bytes */{self.file_size}"
+                    headers["content-length"] = "0"
+                if requested is not None:
+                    self.status_code = 206
+                    self.range_start, self.range_end = requested
+                    headers["content-range"] = f"bytes {self.range_start}-{self.range_end}/{self.file_size}"
+            if self.range_start is not None:
+                headers["content-length"] = str(self.range_end - self.range_start + 1)
+
+        self.init_headers(headers)
+
+    @property
+    def content_length(self) -> int:
+        return 0 if self.range_start is None else self.range_end - self.range_start + 1
+
+    @property
+    def from_first_byte(self) -> bool:
+        """Отдача с начала файла: не 304/416 и не продолжение прерванной загрузки"""
+        return self.range_start == 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.accel_redirect or not self.content_length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            # Сервер передает файл через sendfile
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.range_start,
+                    "count": self.content_length,
+                    "more_body": False,
+                })
+        elif "http.response.pathsend" in extensions and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": self.path})
+        else:
+            await self._send_chunks(send)
+
+    async def _send_chunks(self, send: Send):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            offset = self.range_start
+            remaining = self.content_length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(os.pread, fd, min(self.chunk_size, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Файл укоротился во время отдачи - закрываем ответ
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Media Processing Queue
+Фоновая генерация производных файлов (миниатюры, превью, сжатые версии).
+Загрузка только ставит задачу в очередь и сразу отвечает; задачи лежат в durable очереди
+RabbitMQ с приоритетами и обрабатываются воркерами любого экземпляра сервиса,
+а Pillow работает в пуле процессов и не блокирует event loop.
+Без RabbitMQ задачи обрабатываются из очереди в памяти процесса
+"""
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import aio_pika
+
+from .reliable_consumer import DeadLetterTopology, HandlerStats, ReliableConsumer
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Приоритеты задач: интерактивная загрузка обрабатывается раньше пакетной и фоновой
+MEDIA_MAX_PRIORITY = 10
+PRIORITY_HIGH = 8
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 1
+
+
+class MediaQueue:
+    """
+    Очередь задач обработки медиа. handler(job) получает словарь задачи,
+    тяжелые шаги выполняет через stage() и executor, ошибку пробрасывает
+    (в RabbitMQ режиме - повтор с задержкой, затем карантин)
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        exchange_name: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        workers: int = None
+    ):
+        self.queue_name = queue_name
+        self.handler = handler
+        self.workers = workers or MEDIA_WORKERS
+        self.topology = DeadLetterTopology(exchange_name, queue_name)
+        self.reliable = ReliableConsumer(self.topology)
+
+        self.executor: Optional[Executor] = None
+        self.channel: Any = None
+        self.consumer_tag: Optional[str] = None
+        self._local_queue: Optional[asyncio.PriorityQueue] = None
+        self._local_workers: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._started = False
+
+        self.stages: Dict[str, HandlerStats] = {}
+        self.counters = {"enqueued": 0, "completed": 0, "failed": 0, "in_progress": 0}
+        self.enqueued_by_priority: Dict[int, int] = {}
+
+    @property
+    def mode(self) -> str:
+        return "rabbitmq" if self.channel is not None else "local"
+
+    async def start(self, connection: Any = None, consume: bool = True):
+        """
+        Запуск пула процессов и воркеров. connection - соединение aio_pika сервиса
+        (None - очередь в памяти). consume=False - экземпляр только ставит задачи
+        """
+        if self._started:
+            return
+        # spawn: дочерние процессы не наследуют event loop и соединения сервиса
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+        if connection is not None:
+            try:
+                self.channel = await connection.channel()
+                await self.channel.set_qos(prefetch_count=self.workers * 2)
+                queue = await self.channel.declare_queue(
+                    self.queue_name,
+                    durable=True,
+                    arguments={**self.topology.queue_arguments(), "x-max-priority": MEDIA_MAX_PRIORITY}
+                )
+                await self.reliable.declare(self.channel, queue)
+                if consume:
+                    self.consumer_tag = await queue.consume(self.reliable.wrap(self._on_message, self.queue_name))
+            except Exception as e:
+                logger.error(f"Failed to declare media queue {self.queue_name}, using in-process queue: {e}")
+                self.channel = None
+
+        if self.channel is None:
+            self._start_local()
+        self._started = True
+        logger.info(f"Media queue {self.queue_name} started ({self.mode}, {self.workers} workers)")
+
+    def _start_local(self):
+        if self._local_queue is not None:
+            return
+        self._local_queue = asyncio.PriorityQueue()
+        self._local_workers = [asyncio.create_task(self._local_worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._local_workers:
+            task.cancel()
+        await asyncio.gather(*self._local_workers, return_exceptions=True)
+        self._local_workers = []
+        if self.channel is not None and not self.channel.is_closed:
+            await self.channel.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self._started = False
+
+    async def enqueue(self, job: Dict[str, Any], priority: int = PRIORITY_NORMAL) -> bool:
+        """Ставит задачу в очередь; при недоступном брокере - в очередь процесса"""
+        if not self._started:
+            await self.start()
+        priority = max(0, min(MEDIA_MAX_PRIORITY, priority))
+        job = {**job, "job_id": job.get("job_id") or uuid.uuid4().hex, "enqueued_at": time.time()}
+
+        if self.channel is not None:
+            try:
+                await self.channel.default_exchange.publish(
+                    aio_pika.Message(
+                        json.dumps(job).encode(),
+                        content_type="application/json",
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        priority=priority,
+                        message_id=job["job_id"],
+                    ),
+                    routing_key=self.queue_name
+                )
+            except Exception as e:
+                logger.error(f"Failed to publish media job {job['job_id']}, processing in-process: {e}")
+                self._start_local()
+                self._local_queue.put_nowait((-priority, next(self._sequence), job))
+        else:
+            self._local_queue.put_nowait((-priority, next(self._sequence), job))
+
+        self.counters["enqueued"] += 1
+        self.enqueued_by_priority[priority] = self.enqueued_by_priority.get(priority, 0) + 1
+        return True
+
+    async def _on_message(self, message: Any):
+        await self._process(json.loads(message.body.decode()))
+
+    async def _local_worker(self):
+        while True:
+            _, _, job = await self._local_queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Media job {job.get('job_id')} failed: {e}")
+            finally:
+                self._local_queue.task_done()
+
+    async def _process(self, job: Dict[str, Any]):
+        self.stage_stats("queue_wait").observe(max(0.0, time.time() - job.get("enqueued_at", time.time())))
+        self.counters["in_progress"] += 1
+        try:
+            async with self.stage("total"):
+                await self.handler(job)
+            self.counters["completed"] += 1
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        finally:
+            self.counters["in_progress"] -= 1
+
+    def stage_stats(self, name: str) -> HandlerStats:
+        if name not in self.stages:
+            self.stages[name] = HandlerStats()
+        return self.stages[name]
+
+    @asynccontextmanager
+    async def stage(self, name: str) -> AsyncIterator[None]:
+        """Замер длительности шага обработки (thumbnail, preview, store, ...)"""
+        stats = self.stage_stats(name)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            stats.failures += 1
+            raise
+        finally:
+            stats.observe(time.monotonic() - started)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "queue": self.queue_name,
+            "mode": self.mode,
+            "workers": self.workers,
+            "pending_local": self._local_queue.qsize() if self._local_queue is not None else 0,
+            **self.counters,
+            "enqueued_by_priority": self.enqueued_by_priority,
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+            "consumer": self.reliable.get_metrics() if self.consumer_tag else None,
+        }
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Transactional Outbox for Microservices
+События записываются в таблицу outbox сервиса в той же транзакции, что и изменения данных;
+фоновый relay публикует их пачками с publisher confirms и повторяет неподтвержденные с
+экспоненциальной задержкой. Доставка at-least-once: получатели дедуплицируют по message_id
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, and_, delete, event, func, select
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+OUTBOX_ALERT_ATTEMPTS = int(os.getenv("OUTBOX_ALERT_ATTEMPTS", "10"))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+OUTBOX_PUBLISH_TIMEOUT = float(os.getenv("OUTBOX_PUBLISH_TIMEOUT", "10"))
+
+NOTIFY_INFO_KEY = "outbox_relays_to_notify"
+
+
+class OutboxMixin:
+    """
+    Колонки таблицы outbox. Модель объявляется на Base сервиса, чтобы таблица
+    создавалась в его базе: class OutboxEvent(OutboxMixin, Base): pass
+    """
+    __tablename__ = "event_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    message_id = Column(String(64), nullable=False, unique=True)
+    routing_key = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    headers = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    published_at = Column(DateTime, nullable=True, index=True)
+    last_error = Column(Text, nullable=True)
+
+
+@dataclass
+class OutboxMessage:
+    """Сообщение из outbox, готовое к публикации"""
+    message_id: str
+    routing_key: str
+    body: bytes
+    headers: Dict[str, Any] = field(default_factory=dict)
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_record(cls, record: Any) -> "OutboxMessage":
+        return cls(
+            message_id=record.message_id,
+            routing_key=record.routing_key,
+            body=record.body.encode("utf-8"),
+            headers=json.loads(record.headers) if record.headers else {},
+            created_at=record.created_at,
+        )
+
+
+def enqueue(
+    session: Any,
+    model: Any,
+    routing_key: str,
+    payload: Union[Dict[str, Any], str],
+    headers: Optional[Dict[str, Any]] = None,
+    message_id: Optional[str] = None
+) -> Any:
+    """
+    Добавляет событие в outbox в транзакции session. Коммит делает вызывающий код
+    вместе с изменениями данных: событие появится тогда и только тогда, когда они сохранены
+    """
+    body = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    now = datetime.utcnow()
+    record = model(
+        message_id=message_id or str(uuid.uuid4()),
+        routing_key=routing_key,
+        body=body,
+        headers=json.dumps(headers, default=str) if headers else None,
+        created_at=now,
+        attempts=0,
+        next_attempt_at=now,
+    )
+    session.add(record)
+    return record
+
+
+def notify_after_commit(session: Any, relay: "OutboxRelay") -> None:
+    """
+    Будит relay после коммита транзакции session, в которой сохранены события.
+    Нужен, когда коммит делает вызывающий код: до коммита relay событий не увидит
+    """
+    sync_session = getattr(session, "sync_session", session)
+    if not event.contains(sync_session, "after_commit", _wake_relays):
+        event.listen(sync_session, "after_commit", _wake_relays)
+        event.listen(sync_session, "after_rollback", _forget_relays)
+    sync_session.info.setdefault(NOTIFY_INFO_KEY, set()).add(relay)
+
+
+def _wake_relays(sync_session: Any) -> None:
+    for relay in sync_session.info.pop(NOTIFY_INFO_KEY, ()):
+        relay.notify()
+
+
+def _forget_relays(sync_session: Any) -> None:
+    sync_session.info.pop(NOTIFY_INFO_KEY, None)
+
+
+class AmqpBatchPublisher:
+    """
+    Публикация пачки сообщений в exchange aio_pika. Канал должен быть открыт с
+    publisher_confirms=True: exchange.publish ждет подтверждения брокера, а все
+    сообщения пачки публикуются одновременно - одно ожидание подтверждений на пачку
+    """
+
+    def __init__(self, exchange: Any, timeout: float = None):
+        self.exchange = exchange
+        self.timeout = timeout or OUTBOX_PUBLISH_TIMEOUT
+
+    async def publish_batch(self, messages: List[OutboxMessage]) -> List[Optional[str]]:
+        """Ошибка по каждому сообщению; None - брокер подтвердил сообщение"""
+        import aio_pika
+
+        async def publish(message: OutboxMessage):
+            await self.exchange.publish(
+                aio_pika.Message(
+                    message.body,
+                    content_type="application/json",
+                    headers=message.headers,
+                    message_id=message.message_id,
+                    timestamp=message.created_at,
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                ),
+                routing_key=message.routing_key,
+                timeout=self.timeout
+            )
+
+        results = await asyncio.gather(*(publish(message) for message in messages), return_exceptions=True)
+        return [repr(result) if isinstance(result, BaseException) else None for result in results]
+
+
+class InMemoryBroker:
+    """Замена брокера для тестов relay: хранит подтвержденные сообщения, умеет отклонять"""
+
+    def __init__(self):
+        self.messages: List[OutboxMessage] = []
+        self.batches: List[int] = []
+        self.fail_next = 0                  # Сколько следующих сообщений отклонить
+        self.unavailable = False            # Брокер недоступен целиком
+        self.reject: Callable[[OutboxMessage], bool] = lambda message: False
+
+    async def publish_batch(self, messages: List[OutboxMessage]) -> List[Optional[str]]:
+        if self.unavailable:
+            raise ConnectionError("broker unavailable")
+        self.batches.append(len(messages))
+        results: List[Optional[str]] = []
+        for message in messages:
+            if self.fail_next > 0 or self.reject(message):
+                self.fail_next = max(0, self.fail_next - 1)
+                results.append("nack")
+                continue
+            self.messages.append(message)
+            results.append(None)
+        return results
+
+    def routing_keys(self) -> List[str]:
+        return [message.routing_key for message in self.messages]
+
+
+class OutboxRelay:
+    """Фоновая публикация событий из outbox пачками"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        model: Any,
+        publisher: Any = None,
+        batch_size: int = None,
+        poll_interval: float = None,
+        max_backoff: float = None,
+        retention_hours: int = None
+    ):
+        self.session_factory = session_factory
+        self.model = model
+        self.publisher = publisher
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or OUTBOX_POLL_INTERVAL
+        self.max_backoff = max_backoff or OUTBOX_MAX_BACKOFF
+        self.retention = timedelta(hours=retention_hours or OUTBOX_RETENTION_HOURS)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+
+        # Метрики
+        self.published_total = 0
+        self.failed_attempts = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.relay_errors = 0
+        self.last_lag_seconds = 0.0
+        self._recent: Deque[Tuple[float, int]] = deque()  # (время пачки, опубликовано) за минуту
+
+    def notify(self):
+        """Будит relay после коммита с новыми событиями, не дожидаясь poll_interval"""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.max_backoff, 2 ** min(attempts, 16))
+
+    async def run_once(self) -> int:
+        """Публикует одну пачку готовых к отправке событий; возвращает число подтвержденных"""
+        if self.publisher is None:
+            return 0
+
+        async with self.session_factory() as session:
+            now = datetime.utcnow()
+            query = (
+                select(self.model)
+                .where(and_(self.model.published_at.is_(None), self.model.next_attempt_at <= now))
+                .order_by(self.model.id)
+                .limit(self.batch_size)
+                # Несколько реплик сервиса разбирают outbox без пересечений (PostgreSQL)
+                .with_for_update(skip_locked=True)
+            )
+            records = list((await session.execute(query)).scalars().all())
+            if not records:
+                await session.rollback()
+                return 0
+
+            try:
+                errors = await self.publisher.publish_batch([OutboxMessage.from_record(record) for record in records])
+            except Exception as e:
+                errors = [repr(e)] * len(records)
+
+            now = datetime.utcnow()
+            published = 0
+            lag = 0.0
+            for record, error in zip(records, errors):
+                if error is None:
+                    record.published_at = now
+                    published += 1
+                    lag = max(lag, (now - record.created_at).total_seconds())
+                    continue
+                record.attempts += 1
+                record.last_error = error[:1000]
+                record.next_attempt_at = now + timedelta(seconds=self.backoff(record.attempts))
+                self.failed_attempts += 1
+                if record.attempts >= OUTBOX_ALERT_ATTEMPTS:
+                    logger.error(
+                        f"Outbox event {record.message_id} ({record.routing_key}) "
+                        f"not published after {record.attempts} attempts: {error}"
+                    )
+            await session.commit()
+
+        self.batches += 1
+        self.last_batch_size = len(records)
+        self.published_total += published
+        if published:
+            self.last_lag_seconds = lag
+        self._recent.append((time.monotonic(), published))
+        return published
+
+    async def cleanup(self) -> int:
+        """Удаляет опубликованные события старше срока хранения"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(self.model).where(
+                    and_(
+                        self.model.published_at.is_not(None),
+                        self.model.published_at < datetime.utcnow() - self.retention
+                    )
+                )
+            )
+            await session.commit()
+            return result.rowcount or 0
+
+    async def run(self):
+        """Цикл relay: пачки подряд, пока outbox не опустеет, затем ожидание notify() или poll_interval"""
+        while True:
+            published = 0
+            try:
+                published = await self.run_once()
+                if time.monotonic() - self._last_cleanup > 3600:
+                    self._last_cleanup = time.monotonic()
+                    await self.cleanup()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.relay_errors += 1
+                logger.warning(f"Outbox relay iteration failed: {e}")
+
+            if published < self.batch_size:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                except asyncio.CancelledError:
+                    break
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Пропускная способность, отставание и повторы relay"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0][0] > 60:
+            self._recent.popleft()
+
+        pending, oldest, retrying = 0, None, 0
+        try:
+            async with self.session_factory() as session:
+                row = (await session.execute(
+                    select(func.count(self.model.id), func.min(self.model.created_at), func.max(self.model.attempts))
+                    .where(self.model.published_at.is_(None))
+                )).one()
+                pending, oldest, retrying = row[0], row[1], row[2] or 0
+        except Exception as e:
+            logger.warning(f"Failed to read outbox state: {e}")
+
+        return {
+            "pending": pending,
+            "lag_seconds": round((datetime.utcnow() - oldest).total_seconds(), 3) if oldest else 0.0,
+            "last_publish_lag_seconds": round(self.last_lag_seconds, 3),
+            "published_total": self.published_total,
+            "throughput_per_second": round(sum(count for _, count in self._recent) / 60, 3),
+            "failed_attempts": self.failed_attempts,
+            "max_pending_attempts": retrying,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "relay_errors": self.relay_errors,
+        }
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Reliable Consumer for Microservices
+Обработка входящих событий без бесконечных повторов: сообщение с ошибкой подтверждается
+и переопубликовывается в очередь отложенного повтора (TTL очереди с растущей задержкой),
+после исчерпания попыток или при неисправимой ошибке уходит в карантин (dead letter очередь).
+Разбор и повторная отправка карантина - python -m shared.dead_letters
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import aio_pika
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_RETRY_DELAYS = [int(delay) for delay in os.getenv("CONSUMER_RETRY_DELAYS", "5,30,300").split(",")]
+CONSUMER_MAX_ATTEMPTS = int(os.getenv("CONSUMER_MAX_ATTEMPTS", str(len(CONSUMER_RETRY_DELAYS) + 1)))
+
+# Заголовки, которые добавляются к сообщению при повторе и карантине
+ATTEMPTS_HEADER = "x-attempts"
+ORIGIN_QUEUE_HEADER = "x-origin-queue"
+RETRY_QUEUE_HEADER = "x-retry-queue"
+RETURN_EXCHANGE_HEADER = "x-return-exchange"
+ROUTING_KEY_HEADER = "x-original-routing-key"
+ERROR_HEADER = "x-last-error"
+FAILED_AT_HEADER = "x-failed-at"
+
+
+class PermanentError(Exception):
+    """Ошибка, которую бессмысленно повторять: сообщение сразу уходит в карантин"""
+    pass
+
+
+# Ошибки разбора сообщения не исправятся при повторе
+PERMANENT_ERRORS = (PermanentError, json.JSONDecodeError, UnicodeDecodeError)
+
+
+class DeadLetterTopology:
+    """
+    Имена и объявление очередей повторов и карантина для очереди queue_name.
+    Карантин совместим с существующими DLQ сервисов: exchange dlq.<exchange>, очередь dlq.<queue>.
+    Повторы: headers exchange retry.<exchange> раскладывает сообщения по очередям
+    retry.<queue>.<N>s с TTL, истекшие возвращаются через retry.return.<exchange>
+    в исходную очередь с исходным routing key
+    """
+
+    def __init__(self, exchange_name: str, queue_name: str, delays: List[int] = None):
+        self.exchange_name = exchange_name
+        self.queue_name = queue_name
+        self.delays = delays or CONSUMER_RETRY_DELAYS
+        self.dead_exchange_name = f"dlq.{exchange_name}"
+        self.dead_queue_name = f"dlq.{queue_name}"
+        self.dead_routing_key = f"dlq.{queue_name}"
+        self.retry_exchange_name = f"retry.{exchange_name}"
+        self.return_exchange_name = f"retry.return.{exchange_name}"
+
+        self.dead_exchange: Any = None
+        self.retry_exchange: Any = None
+
+    def retry_queue_name(self, delay: int) -> str:
+        return f"retry.{self.queue_name}.{delay}s"
+
+    def queue_arguments(self) -> Dict[str, Any]:
+        """
+        Аргументы основной очереди, чтобы брокер сам отправлял в карантин отклоненные сообщения.
+        Аргументы существующей очереди менять нельзя - только для новых очередей
+        """
+        return {
+            "x-dead-letter-exchange": self.dead_exchange_name,
+            "x-dead-letter-routing-key": self.dead_routing_key,
+        }
+
+    async def declare(self, channel: Any, queue: Any):
+        """Объявляет exchanges и очереди повторов и карантина и привязывает к ним очередь"""
+        self.dead_exchange = await channel.declare_exchange(
+            self.dead_exchange_name, aio_pika.ExchangeType.DIRECT, durable=True
+        )
+        dead_queue = await channel.declare_queue(self.dead_queue_name, durable=True)
+        await dead_queue.bind(self.dead_exchange, self.dead_routing_key)
+
+        self.retry_exchange = await channel.declare_exchange(
+            self.retry_exchange_name, aio_pika.ExchangeType.HEADERS, durable=True
+        )
+        return_exchange = await channel.declare_exchange(
+            self.return_exchange_name, aio_pika.ExchangeType.HEADERS, durable=True
+        )
+        for delay in self.delays:
+            name = self.retry_queue_name(delay)
+            retry_queue = await channel.declare_queue(
+                name,
+                durable=True,
+                arguments={
+                    "x-message-ttl": delay * 1000,
+                    "x-dead-letter-exchange": self.return_exchange_name,
+                }
+            )
+            await retry_queue.bind(self.retry_exchange, arguments={"x-match": "all", RETRY_QUEUE_HEADER: name})
+
+        await queue.bind(return_exchange, arguments={"x-match": "all", ORIGIN_QUEUE_HEADER: self.queue_name})
+
+
+class HandlerStats:
+    """Задержка и ошибки обработчика"""
+
+    def __init__(self):
+        self.processed = 0
+        self.failures = 0
+        self.retries = 0
+        self.quarantined = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent: Deque[float] = deque(maxlen=1000)
+
+    def observe(self, seconds: float):
+        self.processed += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self._recent.append(seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self._recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "processed": self.processed,
+            "failures": self.failures,
+            "retries": self.retries,
+            "quarantined": self.quarantined,
+            "avg_ms": round(self.total_seconds / self.processed * 1000, 2) if self.processed else 0.0,
+            "p95_ms": round(p95 * 1000, 2),
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+def copy_message(message: Any, headers: Dict[str, Any]) -> aio_pika.Message:
+    """Копия входящего сообщения с дополнительными заголовками (без expiration)"""
+    return aio_pika.Message(
+        message.body,
+        headers={**(message.headers or {}), **headers},
+        content_type=message.content_type,
+        content_encoding=message.content_encoding,
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        priority=message.priority,
+        correlation_id=message.correlation_id,
+        reply_to=message.reply_to,
+        message_id=message.message_id,
+        timestamp=message.timestamp,
+        type=message.type,
+        app_id=message.app_id,
+    )
+
+
+def message_attempts(message: Any) -> int:
+    """Сколько раз сообщение уже не удалось обработать"""
+    try:
+        return int((message.headers or {}).get(ATTEMPTS_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ReliableConsumer:
+    """
+    Обертка обработчиков очереди: ack после успешной обработки, отложенный повтор
+    с растущей задержкой при ошибке, карантин после max_attempts попыток
+    """
+
+    def __init__(self, topology: DeadLetterTopology, max_attempts: int = None):
+        self.topology = topology
+        self.max_attempts = max_attempts or CONSUMER_MAX_ATTEMPTS
+        self.stats: Dict[str, HandlerStats] = {}
+        self.publish_errors = 0
+
+    async def declare(self, channel: Any, queue: Any):
+        await self.topology.declare(channel, queue)
+
+    def handler_stats(self, name: str) -> HandlerStats:
+        if name not in self.stats:
+            self.stats[name] = HandlerStats()
+        return self.stats[name]
+
+    def wrap(self, handler: Callable[[Any], Awaitable[Any]], name: str = None) -> Callable[[Any], Awaitable[None]]:
+        """Callback для queue.consume: handler получает сообщение и бросает исключение при ошибке"""
+        name = name or getattr(handler, "__name__", "handler")
+
+        async def on_message(message: Any):
+            await self.process(message, handler, name)
+
+        return on_message
+
+    async def process(self, message: Any, handler: Callable[[Any], Awaitable[Any]], name: str):
+        stats = self.handler_stats(name)
+        started = time.monotonic()
+        try:
+            await handler(message)
+        except Exception as e:
+            stats.observe(time.monotonic() - started)
+            await self.fail(message, e, name)
+            return
+        stats.observe(time.monotonic() - started)
+        await message.ack()
+
+    async def fail(self, message: Any, error: BaseException, name: str = "handler"):
+        """Повтор с задержкой или карантин для сообщения, которое не удалось обработать"""
+        stats = self.handler_stats(name)
+        stats.failures += 1
+        attempts = message_attempts(message) + 1
+        if isinstance(error, PERMANENT_ERRORS) or attempts >= self.max_attempts:
+            await self.quarantine(message, error, name)
+        else:
+            await self.retry(message, error, name)
+
+    async def retry(self, message: Any, error: BaseException, name: str = "handler"):
+        attempts = message_attempts(message) + 1
+        delay = self.topology.delays[min(attempts, len(self.topology.delays)) - 1]
+        retry_queue = self.topology.retry_queue_name(delay)
+        headers = {
+            ATTEMPTS_HEADER: attempts,
+            ORIGIN_QUEUE_HEADER: self.topology.queue_name,
+            RETRY_QUEUE_HEADER: retry_queue,
+            ERROR_HEADER: repr(error)[:1000],
+        }
+        if await self._republish(message, self.topology.retry_exchange, message.routing_key, headers):
+            self.handler_stats(name).retries += 1
+            logger.warning(
+                f"{name} failed on {message.routing_key} (attempt {attempts}/{self.max_attempts}), "
+                f"retry in {delay}s: {error}"
+            )
+
+    async def quarantine(self, message: Any, error: BaseException, name: str = "handler"):
+        headers = {
+            ATTEMPTS_HEADER: message_attempts(message) + 1,
+            ORIGIN_QUEUE_HEADER: self.topology.queue_name,
+            RETURN_EXCHANGE_HEADER: self.topology.return_exchange_name,
+            ROUTING_KEY_HEADER: (message.headers or {}).get(ROUTING_KEY_HEADER, message.routing_key),
+            ERROR_HEADER: repr(error)[:1000],
+            FAILED_AT_HEADER: int(time.time()),
+        }
+        if await self._republish(message, self.topology.dead_exchange, self.topology.dead_routing_key, headers):
+            self.handler_stats(name).quarantined += 1
+            logger.error(
+                f"{name} quarantined message {message.message_id} ({message.routing_key}) "
+                f"to {self.topology.dead_queue_name}: {error}"
+            )
+
+    async def _republish(self, message: Any, exchange: Any, routing_key: str, headers: Dict[str, Any]) -> bool:
+        # Исходное сообщение подтверждаем только после публикации копии
+        try:
+            await exchange.publish(copy_message(message, headers), routing_key=routing_key)
+        except Exception as e:
+            self.publish_errors += 1
+            logger.error(f"Failed to republish message from {self.topology.queue_name}: {e}")
+            await message.nack(requeue=True)
+            return False
+        await message.ack()
+        return True
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "queue": self.topology.queue_name,
+            "dead_letter_queue": self.topology.dead_queue_name,
+            "max_attempts": self.max_attempts,
+            "retry_delays": self.topology.delays,
+            "publish_errors": self.publish_errors,
+            "handlers": {name: stats.to_dict() for name, stats in self.stats.items()},
+        }
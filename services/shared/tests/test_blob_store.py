@@ -0,0 +1,130 @@
+"""
+Tests for the content-addressed blob store: deduplication, reference counting and GC
+"""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from shared.blob_store import BlobStore, is_digest
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "uploads"), gc_grace_seconds=3600)
+
+
+def write_temp(store: BlobStore, data: bytes):
+    temp = store.root / f"upload-{time.monotonic_ns()}.tmp"
+    temp.write_bytes(data)
+    return temp, hashlib.sha256(data).hexdigest()
+
+
+def age_refs(store: BlobStore, digest: str, seconds: int):
+    """Делает счетчик ссылок старше на seconds"""
+    past = time.time() - seconds
+    os.utime(store.refs_path(digest), (past, past))
+
+
+@pytest.mark.asyncio
+async def test_same_content_is_stored_once(store):
+    first, digest = write_temp(store, b"homework")
+    second, _ = write_temp(store, b"homework")
+
+    path, created = await store.put_file(first, digest)
+    assert created
+    assert path == f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+    assert await store.put_file(second, digest) == (path, False)
+
+    assert not first.exists() and not second.exists()
+    assert store.blob_path(digest).read_bytes() == b"homework"
+    assert await store.get_refs(digest) == 2
+    assert store.digest_of(path) == digest
+    assert store.digest_of("legacy/file.pdf") is None
+
+
+@pytest.mark.asyncio
+async def test_release_and_add_ref(store):
+    temp, digest = write_temp(store, b"material")
+    await store.put_file(temp, digest)
+
+    assert await store.add_ref(digest) == 2
+    assert await store.release(digest) == 1
+    assert await store.release(digest) == 0
+    # The counter never goes below zero
+    assert await store.release(digest) == 0
+
+    with pytest.raises(FileNotFoundError):
+        await store.add_ref("0" * 64)
+
+
+@pytest.mark.asyncio
+async def test_gc_removes_only_unreferenced_blobs_after_grace(store):
+    kept_temp, kept = write_temp(store, b"kept")
+    freed_temp, freed = write_temp(store, b"freed")
+    await store.put_file(kept_temp, kept)
+    await store.put_file(freed_temp, freed)
+    await store.release(freed)
+    await store.derive(freed, "thumb.jpg", lambda source, target: target.write_bytes(b"thumb"))
+
+    # Released recently: still within the grace period
+    assert await store.collect_garbage() == {"blobs_removed": 0, "bytes_freed": 0}
+
+    age_refs(store, kept, 7200)
+    age_refs(store, freed, 7200)
+    assert await store.collect_garbage() == {"blobs_removed": 1, "bytes_freed": len(b"freed")}
+
+    assert store.blob_path(kept).exists()
+    assert not store.blob_path(freed).exists()
+    assert not store.refs_path(freed).exists()
+    assert not store.derived_path(freed, "").exists()
+
+
+@pytest.mark.asyncio
+async def test_reupload_after_gc_creates_new_blob(store):
+    temp, digest = write_temp(store, b"again")
+    await store.put_file(temp, digest)
+    await store.release(digest)
+    age_refs(store, digest, 7200)
+    await store.collect_garbage()
+
+    temp, _ = write_temp(store, b"again")
+    _, created = await store.put_file(temp, digest)
+    assert created
+    assert await store.get_refs(digest) == 1
+
+
+@pytest.mark.asyncio
+async def test_derived_files_are_built_once(store):
+    temp, digest = write_temp(store, b"image")
+    await store.put_file(temp, digest)
+    calls = []
+
+    def build(source, target):
+        calls.append(source)
+        target.write_bytes(source.read_bytes().upper())
+
+    first = await store.derive(digest, "preview.jpg", build)
+    second = await store.derive(digest, "preview.jpg", build)
+    assert first == second == f"derived/{digest[:2]}/{digest[2:4]}/{digest}/preview.jpg"
+    assert len(calls) == 1
+    assert (store.root / first).read_bytes() == b"IMAGE"
+
+    assert await store.derive(digest, "skip.jpg", lambda source, target: False) is None
+
+
+@pytest.mark.asyncio
+async def test_stats_count_saved_bytes(store):
+    for _ in range(3):
+        temp, digest = write_temp(store, b"1234567890")
+        await store.put_file(temp, digest)
+
+    stats = await store.get_stats()
+    assert stats["blobs"] == 1
+    assert stats["references"] == 3
+    assert stats["stored_bytes"] == 10
+    assert stats["logical_bytes"] == 30
+    assert stats["saved_bytes"] == 20
+    assert is_digest(digest)
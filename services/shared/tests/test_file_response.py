@@ -0,0 +1,95 @@
+"""
+Tests for Range and ETag handling of file responses
+"""
+
+import pytest
+
+from shared.file_response import RangeFileResponse, etag_matches, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    (None, None),
+    ("", None),
+    ("items=0-1", None),
+    ("bytes=0-1,5-6", None),
+    ("bytes=a-b", None),
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),
+    ("bytes=20-10", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=-10", 0),
+])
+def test_unsatisfiable_range(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches("", '"abc"')
+
+
+@pytest.fixture
+def file_path(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"0123456789")
+    return str(path)
+
+
+def test_range_request_returns_partial_content(file_path):
+    response = RangeFileResponse(file_path, {"range": "bytes=2-5"}, etag="abc")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 2-5/10"
+    assert response.headers["content-length"] == "4"
+    assert not response.from_first_byte
+
+
+def test_matching_etag_returns_not_modified(file_path):
+    response = RangeFileResponse(file_path, {"if-none-match": '"abc"'}, etag="abc")
+    assert response.status_code == 304
+    assert response.content_length == 0
+
+
+def test_stale_if_range_returns_whole_file(file_path):
+    response = RangeFileResponse(file_path, {"range": "bytes=2-5", "if-range": '"old"'}, etag="abc")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "10"
+    assert response.from_first_byte
+
+
+def test_unsatisfiable_range_returns_416(file_path):
+    response = RangeFileResponse(file_path, {"range": "bytes=50-"}, etag="abc")
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+
+
+@pytest.mark.asyncio
+async def test_body_is_sent_in_chunks(file_path):
+    response = RangeFileResponse(file_path, {"range": "bytes=1-8"})
+    response.chunk_size = 3
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await response({"type": "http", "extensions": {}}, None, send)
+    assert messages[0]["status"] == 206
+    assert b"".join(m["body"] for m in messages[1:]) == b"12345678"
+    assert [m["more_body"] for m in messages[1:]] == [True, True, False]
@@ -0,0 +1,170 @@
+"""
+Tests for the outbox relay against the in-memory broker: confirms, nacks, outages and backoff
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+from shared.outbox import InMemoryBroker, OutboxMixin, OutboxRelay, enqueue, notify_after_commit
+
+Base = declarative_base()
+
+
+class OutboxEvent(OutboxMixin, Base):
+    pass
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def add_events(session_factory, *routing_keys):
+    async with session_factory() as session:
+        for routing_key in routing_keys:
+            enqueue(session, OutboxEvent, routing_key, {"key": routing_key})
+        await session.commit()
+
+
+async def load_events(session_factory):
+    async with session_factory() as session:
+        return list((await session.execute(select(OutboxEvent).order_by(OutboxEvent.id))).scalars().all())
+
+
+async def make_due(session_factory):
+    """Переносит отложенные повторы на текущий момент"""
+    async with session_factory() as session:
+        for event in (await session.execute(select(OutboxEvent))).scalars().all():
+            event.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_publishes_batch_in_order(session_factory):
+    broker = InMemoryBroker()
+    relay = OutboxRelay(session_factory, OutboxEvent, publisher=broker, batch_size=2)
+    await add_events(session_factory, "a", "b", "c")
+
+    assert await relay.run_once() == 2
+    assert await relay.run_once() == 1
+    assert await relay.run_once() == 0
+
+    assert broker.routing_keys() == ["a", "b", "c"]
+    assert broker.batches == [2, 1]
+    assert all(event.published_at is not None for event in await load_events(session_factory))
+
+
+@pytest.mark.asyncio
+async def test_nacked_message_is_retried_with_backoff(session_factory):
+    broker = InMemoryBroker()
+    broker.reject = lambda message: message.routing_key == "b"
+    relay = OutboxRelay(session_factory, OutboxEvent, publisher=broker)
+    await add_events(session_factory, "a", "b")
+
+    started = datetime.utcnow()
+    assert await relay.run_once() == 1
+    first, second = await load_events(session_factory)
+    assert first.published_at is not None
+    assert second.published_at is None
+    assert second.attempts == 1
+    assert second.last_error == "nack"
+    assert second.next_attempt_at >= started + timedelta(seconds=relay.backoff(1))
+
+    # Not due yet: nothing is sent again
+    assert await relay.run_once() == 0
+    assert broker.batches == [2]
+
+    broker.reject = lambda message: False
+    await make_due(session_factory)
+    assert await relay.run_once() == 1
+    assert broker.routing_keys() == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_broker_outage_keeps_events_pending(session_factory):
+    broker = InMemoryBroker()
+    broker.unavailable = True
+    relay = OutboxRelay(session_factory, OutboxEvent, publisher=broker)
+    await add_events(session_factory, "a", "b")
+
+    assert await relay.run_once() == 0
+    events = await load_events(session_factory)
+    assert [event.published_at for event in events] == [None, None]
+    assert [event.attempts for event in events] == [1, 1]
+    assert "broker unavailable" in events[0].last_error
+    assert relay.failed_attempts == 2
+
+    broker.unavailable = False
+    await make_due(session_factory)
+    assert await relay.run_once() == 2
+    assert broker.routing_keys() == ["a", "b"]
+
+
+def test_backoff_grows_up_to_limit():
+    relay = OutboxRelay(None, OutboxEvent, max_backoff=60)
+    assert [relay.backoff(attempts) for attempts in (1, 2, 3, 5, 6, 20)] == [2, 4, 8, 32, 60, 60]
+
+
+@pytest.mark.asyncio
+async def test_without_publisher_events_stay_pending(session_factory):
+    relay = OutboxRelay(session_factory, OutboxEvent)
+    await add_events(session_factory, "a")
+
+    assert await relay.run_once() == 0
+    event, = await load_events(session_factory)
+    assert event.published_at is None
+    assert event.attempts == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_pending_events(session_factory):
+    broker = InMemoryBroker()
+    broker.fail_next = 1
+    relay = OutboxRelay(session_factory, OutboxEvent, publisher=broker)
+    await add_events(session_factory, "a", "b")
+
+    await relay.run_once()
+    metrics = await relay.get_metrics()
+    assert metrics["pending"] == 1
+    assert metrics["published_total"] == 1
+    assert metrics["failed_attempts"] == 1
+    assert metrics["max_pending_attempts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_relay_is_woken_after_caller_commit(session_factory):
+    relay = OutboxRelay(session_factory, OutboxEvent)
+    async with session_factory() as session:
+        enqueue(session, OutboxEvent, "a", {})
+        notify_after_commit(session, relay)
+        enqueue(session, OutboxEvent, "b", {})
+        notify_after_commit(session, relay)
+        await session.flush()
+        assert not relay._wakeup.is_set()
+
+        await session.commit()
+        assert relay._wakeup.is_set()
+
+        # Откатанные события relay не будят, и в следующую транзакцию сессии не переходят
+        relay._wakeup.clear()
+        enqueue(session, OutboxEvent, "c", {})
+        notify_after_commit(session, relay)
+        await session.rollback()
+        assert not relay._wakeup.is_set()
+        enqueue(session, OutboxEvent, "d", {})
+        await session.commit()
+        assert not relay._wakeup.is_set()
+
+        enqueue(session, OutboxEvent, "e", {})
+        notify_after_commit(session, relay)
+        await session.commit()
+        assert relay._wakeup.is_set()
@@ -0,0 +1,147 @@
+"""
+Tests for the reliable consumer: retry tiers, quarantine, publish-before-ack and handler stats
+"""
+
+import json
+
+import pytest
+
+from shared.reliable_consumer import (
+    ATTEMPTS_HEADER, ORIGIN_QUEUE_HEADER, RETRY_QUEUE_HEADER, ROUTING_KEY_HEADER,
+    DeadLetterTopology, HandlerStats, PermanentError, ReliableConsumer
+)
+
+
+class FakeMessage:
+    def __init__(self, log, body=b"{}", headers=None, routing_key="lesson.created"):
+        self.log = log
+        self.body = body
+        self.headers = headers
+        self.routing_key = routing_key
+        self.message_id = "m1"
+        self.content_type = "application/json"
+        self.content_encoding = None
+        self.priority = None
+        self.correlation_id = None
+        self.reply_to = None
+        self.timestamp = None
+        self.type = None
+        self.app_id = None
+
+    async def ack(self):
+        self.log.append(("ack",))
+
+    async def nack(self, requeue=False):
+        self.log.append(("nack", requeue))
+
+
+class FakeExchange:
+    def __init__(self, log, name, fail=False):
+        self.log = log
+        self.name = name
+        self.fail = fail
+
+    async def publish(self, message, routing_key):
+        if self.fail:
+            raise ConnectionError("channel closed")
+        self.log.append(("publish", self.name, routing_key, dict(message.headers)))
+
+
+@pytest.fixture
+def log():
+    return []
+
+
+@pytest.fixture
+def consumer(log):
+    topology = DeadLetterTopology("events", "analytics", delays=[5, 30, 300])
+    topology.retry_exchange = FakeExchange(log, "retry")
+    topology.dead_exchange = FakeExchange(log, "dead")
+    return ReliableConsumer(topology, max_attempts=4)
+
+
+async def failing(message):
+    raise RuntimeError("database is down")
+
+
+@pytest.mark.asyncio
+async def test_success_is_acked(consumer, log):
+    async def handler(message):
+        log.append(("handled",))
+
+    await consumer.wrap(handler, "lessons")(FakeMessage(log))
+    assert log == [("handled",), ("ack",)]
+    assert consumer.get_metrics()["handlers"]["lessons"]["processed"] == 1
+
+
+@pytest.mark.parametrize("attempts, delay", [(None, 5), (1, 30), (2, 300)])
+@pytest.mark.asyncio
+async def test_retry_tier_grows_with_attempts(consumer, log, attempts, delay):
+    headers = {ATTEMPTS_HEADER: attempts} if attempts is not None else None
+    await consumer.process(FakeMessage(log, headers=headers), failing, "lessons")
+
+    (action, exchange, routing_key, published), ack = log
+    assert (action, exchange, routing_key) == ("publish", "retry", "lesson.created")
+    assert published[ATTEMPTS_HEADER] == (attempts or 0) + 1
+    assert published[RETRY_QUEUE_HEADER] == f"retry.analytics.{delay}s"
+    assert published[ORIGIN_QUEUE_HEADER] == "analytics"
+    # The copy is published before the original is acked
+    assert ack == ("ack",)
+
+
+@pytest.mark.asyncio
+async def test_attempts_beyond_the_tiers_use_the_longest_delay(consumer, log):
+    consumer.max_attempts = 10
+    await consumer.process(FakeMessage(log, headers={ATTEMPTS_HEADER: 7}), failing, "lessons")
+    assert log[0][3][RETRY_QUEUE_HEADER] == "retry.analytics.300s"
+
+
+@pytest.mark.asyncio
+async def test_quarantine_after_max_attempts(consumer, log):
+    message = FakeMessage(log, headers={ATTEMPTS_HEADER: 3})
+    await consumer.process(message, failing, "lessons")
+
+    (action, exchange, routing_key, published), ack = log
+    assert (action, exchange, routing_key) == ("publish", "dead", "dlq.analytics")
+    assert published[ATTEMPTS_HEADER] == 4
+    assert published[ROUTING_KEY_HEADER] == "lesson.created"
+    assert ack == ("ack",)
+    stats = consumer.get_metrics()["handlers"]["lessons"]
+    assert stats["quarantined"] == 1 and stats["retries"] == 0
+
+
+@pytest.mark.parametrize("error", [PermanentError("bad payload"), json.JSONDecodeError("bad", "x", 0)])
+@pytest.mark.asyncio
+async def test_permanent_errors_are_quarantined_at_once(consumer, log, error):
+    async def handler(message):
+        raise error
+
+    await consumer.process(FakeMessage(log), handler, "lessons")
+    assert log[0][:2] == ("publish", "dead")
+    assert log[0][3][ATTEMPTS_HEADER] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_republish_requeues_the_original(consumer, log):
+    consumer.topology.retry_exchange.fail = True
+    await consumer.process(FakeMessage(log), failing, "lessons")
+
+    assert log == [("nack", True)]
+    assert consumer.publish_errors == 1
+    stats = consumer.get_metrics()["handlers"]["lessons"]
+    assert stats["failures"] == 1 and stats["retries"] == 0
+
+
+def test_handler_stats():
+    stats = HandlerStats()
+    assert stats.to_dict()["avg_ms"] == 0.0
+    for seconds in (0.01, 0.02, 0.03, 0.04):
+        stats.observe(seconds)
+    stats.failures = 1
+
+    result = stats.to_dict()
+    assert result["processed"] == 4
+    assert result["failures"] == 1
+    assert result["avg_ms"] == 25.0
+    assert result["p95_ms"] == 40.0
+    assert result["max_ms"] == 40.0
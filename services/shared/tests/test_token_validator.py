@@ -0,0 +1,138 @@
+"""
+Tests for in-process token validation: signature cache, revocation feed and fail-closed staleness
+"""
+
+import base64
+import time
+
+import pytest
+from jose import jwt
+
+from shared.token_validator import BloomFilter, TokenValidator, invalid
+
+SECRET = "test-secret"
+
+
+def make_token(jti: str, user_id: int = 7, token_type: str = "access", ttl: int = 300) -> str:
+    claims = {"sub": str(user_id), "jti": jti, "type": token_type, "role": "tutor", "exp": int(time.time()) + ttl}
+    return jwt.encode(claims, SECRET, algorithm="HS256")
+
+
+def snapshot(*revoked: str, size: int = 1024, hashes: int = 3) -> dict:
+    bloom = BloomFilter(size, hashes)
+    for jti in revoked:
+        for position in bloom._positions(jti):
+            bloom.bits[position >> 3] |= 1 << (position & 7)
+    return {"full": True, "cursor": "c1", "bloom": {"size": size, "hashes": hashes,
+                                                      "bits": base64.b64encode(bytes(bloom.bits)).decode()}}
+
+
+class FakeValidator(TokenValidator):
+    """Ответы Auth Service подменяются: отозваны jti из revoked_remote"""
+
+    def __init__(self, **kwargs):
+        super().__init__(secret_key=SECRET, **kwargs)
+        self.revoked_remote = set()
+        self.remote_calls = []
+        self.auth_down = False
+
+    async def _validate_remote(self, tokens):
+        self.remote_calls.append(len(tokens))
+        self.remote_validations += len(tokens)
+        if self.auth_down:
+            return [invalid("Auth service unavailable")] * len(tokens)
+        results = []
+        for token in tokens:
+            claims = self.decode(token)
+            results.append(invalid("Token revoked") if claims["jti"] in self.revoked_remote else self.to_result(claims))
+        return results
+
+
+@pytest.mark.asyncio
+async def test_valid_token_is_checked_locally_after_snapshot():
+    validator = FakeValidator()
+    validator.apply_feed(snapshot("other"))
+
+    result = await validator.validate(make_token("a"))
+    assert result["valid"] and result["user_id"] == 7 and result["user_role"] == "tutor"
+    await validator.validate(make_token("a"))
+    assert validator.remote_calls == []
+    assert validator.local_validations == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_tokens_are_rejected_without_auth_service():
+    validator = FakeValidator()
+    validator.apply_feed(snapshot())
+
+    results = await validator.validate_many([
+        "garbage",
+        make_token("r", token_type="refresh"),
+        make_token("e", ttl=-10),
+        jwt.encode({"sub": "1", "jti": "x", "type": "access", "exp": int(time.time()) + 60}, "other", algorithm="HS256"),
+    ])
+    assert [result["valid"] for result in results] == [False] * 4
+    assert validator.remote_calls == []
+
+
+@pytest.mark.asyncio
+async def test_bloom_hits_are_confirmed_in_one_batch_and_remembered():
+    validator = FakeValidator()
+    validator.apply_feed(snapshot("revoked", "false-positive"))
+    validator.revoked_remote = {"revoked"}
+
+    tokens = [make_token("revoked"), make_token("false-positive"), make_token("clean")]
+    results = await validator.validate_many(tokens)
+    assert [result["valid"] for result in results] == [False, True, True]
+    assert validator.remote_calls == [2]
+
+    # Ответы Auth Service запомнены до следующего снимка
+    await validator.validate_many(tokens)
+    assert validator.remote_calls == [2]
+
+
+@pytest.mark.asyncio
+async def test_incremental_feed_revokes_immediately():
+    validator = FakeValidator()
+    validator.apply_feed(snapshot())
+    token = make_token("b")
+    assert (await validator.validate(token))["valid"]
+
+    validator.apply_feed({"full": False, "cursor": "c2", "revoked": ["b"]})
+    assert (await validator.validate(token)) == invalid("Token revoked")
+    assert validator.cursor == "c2"
+
+
+@pytest.mark.asyncio
+async def test_without_snapshot_every_token_goes_to_auth_service():
+    validator = FakeValidator()
+    assert validator.is_stale
+
+    assert (await validator.validate(make_token("a")))["valid"]
+    assert (await validator.validate(make_token("a")))["valid"]
+    assert validator.remote_calls == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_stale_snapshot_fails_closed_when_auth_service_is_down():
+    validator = FakeValidator(max_staleness=30)
+    validator.apply_feed(snapshot())
+    validator.last_sync = time.time() - 60
+    validator.auth_down = True
+
+    result = await validator.validate(make_token("a"))
+    assert result == invalid("Auth service unavailable")
+    metrics = validator.get_metrics()
+    assert metrics["stale"] is True
+    assert metrics["stale_checks"] == 1
+
+    # Успешная синхронизация снова разрешает локальную проверку
+    validator.apply_feed({"full": False, "cursor": "c2", "revoked": []})
+    assert (await validator.validate(make_token("a")))["valid"]
+
+
+def test_claims_cache_is_bounded():
+    validator = FakeValidator(cache_size=2)
+    for jti in ("a", "b", "c"):
+        validator.decode(make_token(jti))
+    assert validator.get_metrics()["cached_tokens"] == 2
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Token Validator for Microservices
+Общая проверка access токенов внутри процесса сервиса: подпись и срок проверяются локально,
+отзыв - по локальной копии списка отзывов Auth Service (bloom filter + новые отзывы),
+которая обновляется в фоне только при изменениях. К Auth Service идем только при срабатывании
+bloom filter (пакетно, через /validate:batch). Пока список не загружен или синхронизация
+не удается дольше REVOCATION_MAX_STALENESS, каждый токен проверяется в Auth Service,
+а при его недоступности отклоняется
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from jose import JWTError, jwt
+
+logger = logging.getLogger(__name__)
+
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-super-secret-jwt-key-change-in-production")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8002")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+REVOCATION_SYNC_INTERVAL = int(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+REVOCATION_SNAPSHOT_INTERVAL = int(os.getenv("REVOCATION_SNAPSHOT_INTERVAL", "600"))
+REVOCATION_MAX_STALENESS = int(os.getenv("REVOCATION_MAX_STALENESS", "30"))
+
+
+class BloomFilter:
+    """
+    Bloom filter по jti. Формат и схема хэширования совпадают с BloomFilter
+    в Auth Service и API Gateway (app/core/revocation.py)
+    """
+
+    def __init__(self, size: int, hashes: int, bits: bytes = None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BloomFilter":
+        return cls(data["size"], data["hashes"], base64.b64decode(data["bits"]))
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def invalid(error: str) -> Dict[str, Any]:
+    """Результат проверки недействительного токена (формат TokenValidationResponse)"""
+    return {"valid": False, "user_id": None, "user_role": None, "expires_at": None, "scopes": None, "error": error}
+
+
+class TokenValidator:
+    """Проверка access токенов без запроса к Auth Service на каждый вызов"""
+
+    def __init__(self, secret_key: str = None, algorithm: str = None, auth_service_url: str = None,
+                 cache_size: int = None, sync_interval: float = None, snapshot_interval: float = None,
+                 max_staleness: float = None):
+        self.secret_key = secret_key or JWT_SECRET_KEY
+        self.algorithm = algorithm or JWT_ALGORITHM
+        self.auth_service_url = auth_service_url or AUTH_SERVICE_URL
+        self.cache_size = cache_size or TOKEN_CACHE_SIZE
+        self.sync_interval = sync_interval or REVOCATION_SYNC_INTERVAL
+        self.snapshot_interval = snapshot_interval or REVOCATION_SNAPSHOT_INTERVAL
+        self.max_staleness = max_staleness or REVOCATION_MAX_STALENESS
+
+        # sha256(token) -> (exp, claims): подпись каждого токена проверяется один раз
+        self._claims: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.bloom: Optional[BloomFilter] = None
+        self.recent: Set[str] = set()  # Отозваны после последнего снимка
+        # Результаты проверки в Auth Service для срабатываний bloom filter: jti -> отозван ли
+        self.confirmed: "OrderedDict[str, bool]" = OrderedDict()
+        self.cursor: Optional[str] = None
+        self.last_snapshot = 0.0
+        self.last_sync: Optional[float] = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.local_validations = 0
+        self.remote_validations = 0
+        self.sync_errors = 0
+        self.stale_checks = 0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.auth_service_url, timeout=5.0)
+        return self._client
+
+    # === Локальная проверка ===
+
+    def decode(self, token: str) -> Optional[Dict[str, Any]]:
+        """Claims access токена с действительной подписью и сроком или None"""
+        key = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+        cached = self._claims.get(key)
+        if cached is not None:
+            if cached[0] > now:
+                self._claims.move_to_end(key)
+                self.cache_hits += 1
+                return cached[1]
+            del self._claims[key]
+
+        self.cache_misses += 1
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            return None
+        if payload.get("type") != "access" or not payload.get("jti") or not payload.get("exp"):
+            return None
+        try:
+            payload["sub"] = int(payload["sub"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        self._claims[key] = (float(payload["exp"]), payload)
+        while len(self._claims) > self.cache_size:
+            self._claims.popitem(last=False)
+        return payload
+
+    @property
+    def is_stale(self) -> bool:
+        """Список отзывов не загружен или давно не обновлялся"""
+        return (
+            self.cursor is None
+            or self.last_sync is None
+            or time.time() - self.last_sync > self.max_staleness
+        )
+
+    def is_revoked(self, jti: str) -> Optional[bool]:
+        """
+        True - отозван, False - не отозван, None - нужна проверка в Auth Service
+        (сработал bloom filter или список отзывов не загружен либо устарел)
+        """
+        if jti in self.recent:
+            return True
+        if self.is_stale:
+            self.stale_checks += 1
+            return None
+        if self.bloom is None or jti not in self.bloom:
+            return False
+        return self.confirmed.get(jti)
+
+    @staticmethod
+    def to_result(claims: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "valid": True,
+            "user_id": claims["sub"],
+            "user_role": claims.get("role"),
+            "expires_at": datetime.utcfromtimestamp(claims["exp"]).isoformat(),
+            "scopes": claims.get("scopes", []),
+            "error": None,
+        }
+
+    # === Проверка токенов ===
+
+    async def validate(self, token: str) -> Dict[str, Any]:
+        """Проверка одного токена; результат в формате TokenValidationResponse"""
+        return (await self.validate_many([token]))[0]
+
+    async def validate_many(self, tokens: List[str]) -> List[Dict[str, Any]]:
+        """Проверка нескольких токенов; неясные случаи проверяются в Auth Service одним запросом"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tokens)
+        pending: List[int] = []
+
+        for index, token in enumerate(tokens):
+            claims = self.decode(token)
+            if claims is None:
+                results[index] = invalid("Invalid or expired token")
+                continue
+            revoked = self.is_revoked(claims["jti"])
+            if revoked is None:
+                pending.append(index)
+            elif revoked:
+                results[index] = invalid("Token revoked")
+            else:
+                self.local_validations += 1
+                results[index] = self.to_result(claims)
+
+        if pending:
+            remote = await self._validate_remote([tokens[index] for index in pending])
+            for index, result in zip(pending, remote):
+                results[index] = result
+                jti = self.decode(tokens[index])["jti"]
+                self._remember(jti, not result.get("valid", False))
+
+        return results
+
+    async def _validate_remote(self, tokens: List[str]) -> List[Dict[str, Any]]:
+        self.remote_validations += len(tokens)
+        try:
+            response = await self._get_client().post("/api/v1/auth/validate:batch", json={"tokens": tokens})
+            response.raise_for_status()
+            return response.json()["results"]
+        except Exception as e:
+            # Не можем подтвердить - считаем недействительными
+            logger.warning(f"Batch token validation in auth service failed: {e}")
+            return [invalid("Auth service unavailable")] * len(tokens)
+
+    def _remember(self, jti: str, revoked: bool):
+        # Запоминаем только ответы по срабатываниям bloom filter актуального снимка
+        if self.is_stale:
+            return
+        self.confirmed[jti] = revoked
+        while len(self.confirmed) > self.cache_size:
+            self.confirmed.popitem(last=False)
+
+    # === Синхронизация отзывов ===
+
+    def apply_feed(self, feed: Dict[str, Any]):
+        """Применяет ответ /internal/revocations"""
+        if feed.get("full"):
+            self.bloom = BloomFilter.from_dict(feed["bloom"])
+            self.recent = set()
+            self.confirmed.clear()
+            self.last_snapshot = time.monotonic()
+        else:
+            for jti in feed.get("revoked", []):
+                self.recent.add(jti)
+                self.confirmed.pop(jti, None)
+        self.cursor = feed["cursor"]
+        self.last_sync = time.time()
+
+    async def sync(self):
+        """Забирает новые отзывы; периодически - полный снимок, чтобы истекшие токены уходили из фильтра"""
+        full = self.cursor is None or time.monotonic() - self.last_snapshot >= self.snapshot_interval
+        params = None if full else {"since": self.cursor}
+        response = await self._get_client().get("/api/v1/auth/internal/revocations", params=params)
+        response.raise_for_status()
+        self.apply_feed(response.json())
+
+    async def start_sync(self):
+        """Фоновая синхронизация с Auth Service (запускается при старте сервиса)"""
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.sync_errors += 1
+                logger.warning(f"Revocation sync with auth service failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "cached_tokens": len(self._claims),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "local_validations": self.local_validations,
+            "remote_validations": self.remote_validations,
+            "snapshot_loaded": self.bloom is not None,
+            "stale": self.is_stale,
+            "stale_checks": self.stale_checks,
+            "recent_revocations": len(self.recent),
+            "sync_errors": self.sync_errors,
+            "last_sync": self.last_sync,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Глобальный экземпляр валидатора
+_token_validator: Optional[TokenValidator] = None
+
+def get_token_validator() -> TokenValidator:
+    """Получение глобального экземпляра валидатора токенов"""
+    global _token_validator
+    if _token_validator is None:
+        _token_validator = TokenValidator()
+    return _token_validator
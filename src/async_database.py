@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный слой доступа к БД для обработчиков бота.
+Использует те же модели, что и src/database.py, но работает через AsyncEngine
+(aiosqlite для SQLite, asyncpg для PostgreSQL), поэтому запросы не блокируют event loop.
+Синхронные функции в src/database.py остаются для скриптов миграции и утилит.
+"""
+
+import asyncio
+import os
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import joinedload
+
+from .database import (
+    DATABASE_URL, User, UserRole, Lesson, Homework, Payment, Material, StudentBalance,
+    get_balances, month_range
+)
+from .identity_cache import Identity, identity_cache
+
+# Драйверы для асинхронного подключения
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    """Преобразует синхронный URL БД в URL с асинхронным драйвером."""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"Нет асинхронного драйвера для БД: {scheme}")
+    return ASYNC_DRIVERS[dialect] + sep + rest
+
+def _engine_options(url: str) -> dict:
+    """Параметры пула соединений из переменных окружения."""
+    if url.startswith("sqlite"):
+        # SQLite не поддерживает параллельную запись, большой пул ему не нужен
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def dispose_async_engine():
+    """Закрывает все соединения пула (вызывается при остановке бота)."""
+    await async_engine.dispose()
+
+# --- Пользователи ---
+async def get_user_by_telegram_id_async(telegram_id: int):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalars().first()
+
+async def get_identity_async(telegram_id: int):
+    """
+    Возвращает Identity пользователя (id, роль, имя, родители, дети) из кэша,
+    при промахе загружает ее из БД. Незарегистрированные пользователи не кэшируются.
+    """
+    identity = identity_cache.get(telegram_id)
+    if identity is not None:
+        return identity
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalars().first()
+        if user is None:
+            return None
+        child_ids = ()
+        if user.role == UserRole.PARENT:
+            child_ids = tuple((await db.execute(
+                select(User.id).where(or_(User.parent_id == user.id, User.second_parent_id == user.id))
+            )).scalars().all())
+    identity = Identity(
+        id=user.id,
+        telegram_id=user.telegram_id,
+        role=user.role,
+        full_name=user.full_name,
+        parent_ids=tuple(parent_id for parent_id in (user.parent_id, user.second_parent_id) if parent_id),
+        child_ids=child_ids
+    )
+    identity_cache.put(identity)
+    return identity
+
+async def get_user_by_id_async(user_id: int):
+    async with AsyncSessionLocal() as db:
+        return await db.get(User, user_id)
+
+async def get_student_by_name_async(full_name: str):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(User).where(User.full_name == full_name, User.role == UserRole.STUDENT)
+        )).scalars().first()
+
+async def get_all_users_async():
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(User))).scalars().all()
+
+async def get_all_students_async():
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(User).where(User.role == UserRole.STUDENT))).scalars().all()
+
+async def get_all_parents_async():
+    """Возвращает всех родителей с их детьми."""
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(User).options(joinedload(User.children)).where(User.role == UserRole.PARENT)
+        )).unique().scalars().all()
+
+# --- Уроки и ДЗ ---
+async def get_lesson_by_id_async(lesson_id: int):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Lesson).options(joinedload(Lesson.homeworks), joinedload(Lesson.student)).where(Lesson.id == lesson_id)
+        )).unique().scalars().first()
+
+async def get_homework_by_id_async(hw_id: int):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Homework).options(joinedload(Homework.lesson)).where(Homework.id == hw_id)
+        )).scalars().first()
+
+async def get_lessons_for_student_by_month_async(student_id: int, year: int, month: int):
+    """Возвращает все уроки для ученика за указанный год и месяц."""
+    start, end = month_range(year, month)
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Lesson).where(
+                Lesson.student_id == student_id,
+                Lesson.date >= start,
+                Lesson.date < end
+            ).order_by(Lesson.date)
+        )).scalars().all()
+
+async def get_payments_for_student_by_month_async(student_id: int, year: int, month: int):
+    """Возвращает все платежи для ученика за указанный год и месяц."""
+    start, end = month_range(year, month)
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Payment).where(
+                Payment.student_id == student_id,
+                Payment.payment_date >= start,
+                Payment.payment_date < end
+            ).order_by(Payment.payment_date)
+        )).scalars().all()
+
+# --- Материалы ---
+async def get_all_materials_async():
+    """Возвращает все материалы из библиотеки."""
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Material).order_by(Material.grade, Material.created_at.desc())
+        )).scalars().all()
+
+async def get_materials_by_grade_async(grade: int):
+    """Возвращает материалы для определённого класса."""
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Material).where(Material.grade == grade).order_by(Material.created_at.desc())
+        )).scalars().all()
+
+async def get_material_by_id_async(material_id: int):
+    """Возвращает материал по его ID."""
+    async with AsyncSessionLocal() as db:
+        return await db.get(Material, material_id)
+
+# --- Баланс ---
+async def get_balances_async(student_ids):
+    """
+    Возвращает {student_id: баланс} из таблицы балансов.
+    Для учеников без строки баланса используется синхронный get_balances, который ее досчитывает.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return {}
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(StudentBalance).where(StudentBalance.student_id.in_(student_ids))
+        )).scalars().all()
+    balances = {row.student_id: row.balance for row in rows}
+    missing = [student_id for student_id in student_ids if student_id not in balances]
+    if missing:
+        balances.update(await asyncio.to_thread(get_balances, missing))
+    return balances
+
+async def get_student_balance_async(student_id: int):
+    """Возвращает баланс занятий для ученика."""
+    return (await get_balances_async([student_id]))[student_id]
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш графиков прогресса.
+График ученика перестраивается только после изменения его уроков, ДЗ или баллов (грязный флаг,
+который выставляют события ORM). Файлы адресуются по содержимому: имя файла содержит хэш данных
+графика, поэтому одинаковые данные не рендерятся повторно. Для уже отправленных файлов
+запоминается file_id Telegram, чтобы не загружать картинку заново.
+Старые файлы удаляются по возрасту и суммарному размеру каталога.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm.attributes import get_history
+
+from .database import Lesson, Homework, User
+
+logger = logging.getLogger('RepitBot.Performance')
+
+CHART_DIR = "charts"
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL", "3600"))  # Страховка от изменений из других процессов
+CHART_CACHE_MAX_AGE = float(os.getenv("CHART_CACHE_MAX_AGE_HOURS", "168")) * 3600
+CHART_CACHE_MAX_BYTES = int(float(os.getenv("CHART_CACHE_MAX_MB", "100")) * 1024 * 1024)
+
+
+@dataclass
+class ChartEntry:
+    key: str
+    path: str
+    expires_at: float
+
+
+class ChartCache:
+    """Актуальные графики по ученикам и file_id отправленных файлов."""
+
+    def __init__(self, chart_dir: str = CHART_DIR, ttl: float = CHART_CACHE_TTL,
+                 max_age: float = CHART_CACHE_MAX_AGE, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self.chart_dir = chart_dir
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._entries: Dict[int, ChartEntry] = {}
+        self._file_ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, student_id: int, key: str) -> str:
+        return os.path.join(self.chart_dir, f"progress_chart_{student_id}_{key}.png")
+
+    def get(self, student_id: int) -> Optional[str]:
+        """Путь к актуальному графику или None, если график надо собрать заново."""
+        with self._lock:
+            entry = self._entries.get(student_id)
+            # Устаревшая запись остается до put(), чтобы заменить (и удалить) старый файл
+            if entry is None or entry.expires_at < time.monotonic() or not os.path.exists(entry.path):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.path
+
+    def put(self, student_id: int, key: str, path: str):
+        with self._lock:
+            previous = self._entries.get(student_id)
+            self._entries[student_id] = ChartEntry(key, path, time.monotonic() + self.ttl)
+        if previous is not None and previous.path != path:
+            self._remove_file(previous.path)
+
+    def mark_dirty(self, *student_ids):
+        """Сбрасывает актуальность графиков учеников (None игнорируются)."""
+        with self._lock:
+            for student_id in student_ids:
+                entry = self._entries.get(student_id)
+                if entry is not None:
+                    entry.expires_at = 0.0
+
+    def get_file_id(self, path: str) -> Optional[str]:
+        return self._file_ids.get(path)
+
+    def remember_file_id(self, path: str, file_id: str):
+        self._file_ids[path] = file_id
+
+    def forget_file_id(self, path: str):
+        self._file_ids.pop(path, None)
+
+    def evict(self):
+        """Удаляет файлы старше max_age и самые старые файлы сверх max_bytes."""
+        if not os.path.isdir(self.chart_dir):
+            return
+        with self._lock:
+            in_use = {entry.path for entry in self._entries.values()}
+        files = []
+        for name in os.listdir(self.chart_dir):
+            path = os.path.join(self.chart_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            if path in in_use and now - mtime <= self.max_age:
+                continue
+            self._remove_file(path)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Chart cache evicted {removed} files, {total} bytes left")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'file_ids': len(self._file_ids),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def _remove_file(self, path: str):
+        self.forget_file_id(path)
+        with self._lock:
+            for student_id, entry in list(self._entries.items()):
+                if entry.path == path:
+                    del self._entries[student_id]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+chart_cache = ChartCache()
+
+
+# --- Грязные флаги: события ORM, меняющие данные графика ---
+def _history_values(target, key):
+    history = get_history(target, key)
+    return [*history.deleted, *history.unchanged, *history.added]
+
+@event.listens_for(Lesson, 'after_insert')
+@event.listens_for(Lesson, 'after_update')
+@event.listens_for(Lesson, 'after_delete')
+def _lesson_changed(mapper, connection, target):
+    chart_cache.mark_dirty(target.student_id, *_history_values(target, 'student_id'))
+
+@event.listens_for(Homework, 'after_insert')
+@event.listens_for(Homework, 'after_update')
+@event.listens_for(Homework, 'after_delete')
+def _homework_changed(mapper, connection, target):
+    lesson_ids = {target.lesson_id, *_history_values(target, 'lesson_id')} - {None}
+    if lesson_ids:
+        student_ids = connection.execute(
+            select(Lesson.student_id).where(Lesson.id.in_(lesson_ids))
+        ).scalars().all()
+        chart_cache.mark_dirty(*student_ids)
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    if get_history(target, 'points').has_changes() or get_history(target, 'full_name').has_changes():
+        chart_cache.mark_dirty(target.id)
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    chart_cache.mark_dirty(target.id)
@@ -1,24 +1,91 @@
 # -*- coding: utf-8 -*-
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    HAS_MATPLOTLIB = True
-except ImportError:
-    plt = None
-    mdates = None  
-    HAS_MATPLOTLIB = False
+import asyncio
 from datetime import datetime, timedelta
 from .database import SessionLocal, Lesson, User, Homework, TopicMastery, HomeworkStatus, AttendanceStatus
+from .chart_cache import chart_cache
+from .chart_renderer import HAS_MATPLOTLIB, render_chart, chart_render_pool
 from sqlalchemy import func
+from telegram.error import BadRequest
+import hashlib
 import os
 
+def _chart_key(data: dict) -> str:
+    return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()[:16]
+
 def generate_progress_chart(student_id: int):
     """
-    Генерирует и сохраняет комплексный график прогресса ученика,
+    Возвращает путь к комплексному графику прогресса ученика,
     включая динамику баллов и уровень усвоения тем.
+    Пока данные ученика не менялись, возвращается уже построенный файл;
+    при изменении график перестраивается, только если изменились сами данные графика.
+    Рисует в текущем процессе — для скриптов; обработчики бота используют render_progress_chart.
+    """
+    if not HAS_MATPLOTLIB:
+        return None
+    chart_path = chart_cache.get(student_id)
+    if chart_path:
+        return chart_path
+
+    data = load_chart_data(student_id)
+    if data is None:
+        return None
+
+    key = _chart_key(data)
+    chart_path = chart_cache.path_for(student_id, key)
+    if not os.path.exists(chart_path):
+        os.makedirs(chart_cache.chart_dir, exist_ok=True)
+        if not render_chart(data, chart_path):
+            return None
+    chart_cache.put(student_id, key, chart_path)
+    chart_cache.evict()
+    return chart_path
+
+async def render_progress_chart(student_id: int):
+    """
+    Асинхронный вариант generate_progress_chart: данные читаются в потоке,
+    а отрисовка идет в пуле процессов, поэтому event loop не блокируется.
     """
     if not HAS_MATPLOTLIB:
         return None
+    chart_path = chart_cache.get(student_id)
+    if chart_path:
+        return chart_path
+
+    data = await asyncio.to_thread(load_chart_data, student_id)
+    if data is None:
+        return None
+
+    key = _chart_key(data)
+    chart_path = chart_cache.path_for(student_id, key)
+    if not os.path.exists(chart_path):
+        os.makedirs(chart_cache.chart_dir, exist_ok=True)
+        if not await chart_render_pool.render(data, chart_path):
+            return None
+    chart_cache.put(student_id, key, chart_path)
+    await asyncio.to_thread(chart_cache.evict)
+    return chart_path
+
+async def send_progress_chart(bot, chat_id: int, chart_path: str, **kwargs):
+    """
+    Отправляет график, повторно используя file_id уже загруженного в Telegram файла.
+    """
+    file_id = chart_cache.get_file_id(chart_path)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except BadRequest:
+            chart_cache.forget_file_id(chart_path)
+    with open(chart_path, 'rb') as chart_file:
+        message = await bot.send_photo(chat_id=chat_id, photo=chart_file, **kwargs)
+    if message and message.photo:
+        chart_cache.remember_file_id(chart_path, message.photo[-1].file_id)
+    return message
+
+def load_chart_data(student_id: int):
+    """
+    Собирает данные для графика прогресса: точки накопленных баллов и уровни усвоения
+    тем за последние 90 дней. Возвращает None, если ученика нет или событий нет.
+    """
     db = SessionLocal()
     try:
         student = db.query(User).filter(User.id == student_id).first()
@@ -72,8 +139,8 @@ def generate_progress_chart(student_id: int):
         # Убедимся, что последняя точка соответствует текущему общему количеству баллов
         if student.points != cumulative_points[-1]:
              # Это может произойти, если есть баллы, не связанные с событиями, или расхождения.
-             # Добавляем текущее состояние как последнюю точку.
-             dates.append(datetime.now())
+             # Добавляем текущее состояние как последнюю точку (на начало дня, чтобы хэш данных был стабильным).
+             dates.append(datetime.combine(datetime.now().date(), datetime.min.time()))
              cumulative_points.append(student.points)
 
 
@@ -91,70 +158,13 @@ def generate_progress_chart(student_id: int):
             TopicMastery.MASTERED: 3
         }
         mastery_levels = [mastery_map.get(l.mastery_level, 0) for l in recent_lessons]
-        mastery_colors = [
-            '#d9534f' if m == 1 else '#5bc0de' if m == 2 else '#5cb85c'
-            for m in mastery_levels
-        ]
 
-        # 4. Стилизация и построение графика
-        try:
-            plt.style.use('seaborn-v0_8-whitegrid')
-        except:
-            try:
-                plt.style.use('seaborn-whitegrid')
-            except:
-                pass  # Используем стандартный стиль
-        
-        fig, ax1 = plt.subplots(figsize=(14, 8))
-
-        # --- График баллов (левая ось Y) ---
-        ax1.plot(dates, cumulative_points, color='#4a4a4a', linestyle='-', marker='', lw=2.5, label='Динамика баллов')
-        ax1.set_xlabel('Дата', fontsize=12, fontweight='bold')
-        ax1.set_ylabel('Накопленные баллы', fontsize=12, fontweight='bold', color='#4a4a4a')
-        ax1.tick_params(axis='y', labelcolor='#4a4a4a', labelsize=10)
-        ax1.fill_between(dates, cumulative_points, color='#4a4a4a', alpha=0.1)
-
-        # --- График усвоения (правая ось Y) ---
-        ax2 = ax1.twinx()
-        ax2.scatter(lesson_dates, mastery_levels, c=mastery_colors, s=100, alpha=0.8, edgecolors='black', linewidth=0.5, label='Усвоение тем')
-        ax2.set_ylabel('Уровень усвоения темы', fontsize=12, fontweight='bold', color='navy')
-        ax2.set_ylim(0.5, 3.5)
-        ax2.set_yticks([1, 2, 3])
-        ax2.set_yticklabels(['Не усвоено', 'Усвоено', 'Закреплено'], fontsize=10)
-        ax2.tick_params(axis='y', colors='navy')
-        
-        # Добавляем маркеры для легенды
-        from matplotlib.lines import Line2D
-        legend_elements = [
-            Line2D([0], [0], color='#4a4a4a', lw=2.5, label='Динамика баллов'),
-            Line2D([0], [0], marker='o', color='w', label='Не усвоено', markerfacecolor='#d9534f', markersize=10),
-            Line2D([0], [0], marker='o', color='w', label='Усвоено', markerfacecolor='#5bc0de', markersize=10),
-            Line2D([0], [0], marker='o', color='w', label='Закреплено', markerfacecolor='#5cb85c', markersize=10)
-        ]
-        ax1.legend(handles=legend_elements, loc='upper left', fontsize=10)
-
-        # --- Общие настройки ---
-        plt.title(f'Комплексный отчет по прогрессу: {student.full_name}', fontsize=16, fontweight='bold', pad=20)
-        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m.%Y'))
-        ax1.xaxis.set_major_locator(mdates.AutoDateLocator())
-        fig.autofmt_xdate() # Автоматический наклон дат
-        
-        ax1.grid(True, which='major', linestyle='--', linewidth='0.5', color='grey')
-        fig.tight_layout()
-
-        # 5. Сохранение файла
-        chart_dir = "charts"
-        if not os.path.exists(chart_dir):
-            os.makedirs(chart_dir)
-        chart_path = os.path.join(chart_dir, f"progress_chart_{student_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.png")
-        
-        plt.savefig(chart_path, dpi=150)
-        plt.close()
-        
-        return chart_path
-    except Exception as e:
-        # В реальном приложении здесь должно быть логирование
-        print(f"Ошибка при генерации графика: {e}")
-        return None
+        return {
+            'full_name': student.full_name,
+            'dates': dates,
+            'cumulative_points': cumulative_points,
+            'lesson_dates': lesson_dates,
+            'mastery_levels': mastery_levels,
+        }
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Отрисовка графиков прогресса вне event loop.
+render_chart рисует через объектный API matplotlib (Figure + FigureCanvasAgg) без глобального
+состояния pyplot. ChartRenderPool выполняет его в отдельных процессах: число одновременных
+отрисовок ограничено числом процессов, длина очереди ограничена, у каждой отрисовки есть таймаут,
+одинаковые запросы (тот же файл) объединяются в один.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+try:
+    import matplotlib
+    import matplotlib.style
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.lines import Line2D
+    HAS_MATPLOTLIB = True
+except ImportError:
+    matplotlib = None
+    mdates = None
+    HAS_MATPLOTLIB = False
+
+logger = logging.getLogger('RepitBot.Performance')
+
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", "2"))
+CHART_RENDER_MAX_QUEUE = int(os.getenv("CHART_RENDER_MAX_QUEUE", "50"))
+CHART_RENDER_TIMEOUT = float(os.getenv("CHART_RENDER_TIMEOUT", "30"))
+
+CHART_STYLES = ('seaborn-v0_8-whitegrid', 'seaborn-whitegrid')
+
+
+def _chart_style():
+    for style in CHART_STYLES:
+        if style in matplotlib.style.available:
+            return style
+    return 'default'
+
+def render_chart(data: dict, chart_path: str) -> bool:
+    """Рисует график по данным из load_chart_data и сохраняет его в chart_path."""
+    if not HAS_MATPLOTLIB:
+        return False
+    dates = data['dates']
+    cumulative_points = data['cumulative_points']
+    lesson_dates = data['lesson_dates']
+    mastery_levels = data['mastery_levels']
+    mastery_colors = [
+        '#d9534f' if m == 1 else '#5bc0de' if m == 2 else '#5cb85c'
+        for m in mastery_levels
+    ]
+    try:
+        with matplotlib.style.context(_chart_style()):
+            fig = Figure(figsize=(14, 8))
+            FigureCanvasAgg(fig)
+            ax1 = fig.add_subplot()
+
+            # --- График баллов (левая ось Y) ---
+            ax1.plot(dates, cumulative_points, color='#4a4a4a', linestyle='-', marker='', lw=2.5, label='Динамика баллов')
+            ax1.set_xlabel('Дата', fontsize=12, fontweight='bold')
+            ax1.set_ylabel('Накопленные баллы', fontsize=12, fontweight='bold', color='#4a4a4a')
+            ax1.tick_params(axis='y', labelcolor='#4a4a4a', labelsize=10)
+            ax1.fill_between(dates, cumulative_points, color='#4a4a4a', alpha=0.1)
+
+            # --- График усвоения (правая ось Y) ---
+            ax2 = ax1.twinx()
+            ax2.scatter(lesson_dates, mastery_levels, c=mastery_colors, s=100, alpha=0.8, edgecolors='black', linewidth=0.5, label='Усвоение тем')
+            ax2.set_ylabel('Уровень усвоения темы', fontsize=12, fontweight='bold', color='navy')
+            ax2.set_ylim(0.5, 3.5)
+            ax2.set_yticks([1, 2, 3])
+            ax2.set_yticklabels(['Не усвоено', 'Усвоено', 'Закреплено'], fontsize=10)
+            ax2.tick_params(axis='y', colors='navy')
+
+            legend_elements = [
+                Line2D([0], [0], color='#4a4a4a', lw=2.5, label='Динамика баллов'),
+                Line2D([0], [0], marker='o', color='w', label='Не усвоено', markerfacecolor='#d9534f', markersize=10),
+                Line2D([0], [0], marker='o', color='w', label='Усвоено', markerfacecolor='#5bc0de', markersize=10),
+                Line2D([0], [0], marker='o', color='w', label='Закреплено', markerfacecolor='#5cb85c', markersize=10)
+            ]
+            ax1.legend(handles=legend_elements, loc='upper left', fontsize=10)
+
+            # --- Общие настройки ---
+            ax2.set_title(f'Комплексный отчет по прогрессу: {data["full_name"]}', fontsize=16, fontweight='bold', pad=20)
+            ax1.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m.%Y'))
+            ax1.xaxis.set_major_locator(mdates.AutoDateLocator())
+            fig.autofmt_xdate()  # Автоматический наклон дат
+
+            ax1.grid(True, which='major', linestyle='--', linewidth='0.5', color='grey')
+            fig.tight_layout()
+
+            # Сохранение через временный файл, чтобы не отдать недописанный PNG
+            tmp_path = f"{chart_path}.{os.getpid()}.tmp"
+            fig.savefig(tmp_path, dpi=150, format='png')
+        os.replace(tmp_path, chart_path)
+        return True
+    except Exception as e:
+        print(f"Ошибка при генерации графика: {e}")
+        return False
+
+
+class ChartRenderPool:
+    """Пул процессов для отрисовки графиков с очередью ограниченной длины и таймаутом."""
+
+    def __init__(self, workers: int = CHART_RENDER_WORKERS, max_queue: int = CHART_RENDER_MAX_QUEUE,
+                 timeout: float = CHART_RENDER_TIMEOUT):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._queued = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: не наследуем потоки и блокировки бота в дочерних процессах
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._executor
+
+    async def render(self, data: dict, chart_path: str) -> bool:
+        """
+        Рисует график в пуле процессов. Возвращает False при переполнении очереди,
+        таймауте или ошибке отрисовки.
+        """
+        task = self._in_flight.get(chart_path)
+        if task is None:
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                logger.warning(f"Chart render queue is full ({self._queued}), request rejected")
+                return False
+            task = asyncio.ensure_future(self._render(data, chart_path))
+            self._in_flight[chart_path] = task
+            self._queued += 1
+            task.add_done_callback(lambda _: self._finish(chart_path))
+        # shield: отмена одного ожидающего не отменяет общую отрисовку
+        return await asyncio.shield(task)
+
+    def _finish(self, chart_path: str):
+        self._queued -= 1
+        self._in_flight.pop(chart_path, None)
+
+    async def _render(self, data: dict, chart_path: str) -> bool:
+        executor = self._get_executor()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(executor, render_chart, data, chart_path),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                # Процесс нельзя прервать: он доработает сам, а запрос считаем неудачным
+                self.timeouts += 1
+                logger.warning(f"Chart render timed out after {self.timeout}s: {chart_path}")
+                return False
+            except BrokenProcessPool:
+                self.failures += 1
+                logger.error("Chart render pool is broken, restarting it")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                return False
+        if result:
+            self.rendered += 1
+        else:
+            self.failures += 1
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'queued': self._queued,
+            'rendered': self.rendered,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+        }
+
+
+chart_render_pool = ChartRenderPool()
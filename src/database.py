@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 import os
 import enum
+import time
+import logging
 from datetime import datetime, timedelta
 from .timezone_utils import now as tz_now
 from sqlalchemy import (create_engine, Column, Integer, String, ForeignKey,
-                        DateTime, Text, Enum as SAEnum, Boolean, func as sql_func)
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base, joinedload
+                        DateTime, Text, Enum as SAEnum, Boolean, func as sql_func,
+                        Index, event, select, insert, case, and_, literal, union_all)
+from sqlalchemy.orm import Session, sessionmaker, relationship, declarative_base, joinedload, aliased
+from sqlalchemy.orm.attributes import get_history
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import BindParameter, Null
+
+logger = logging.getLogger('RepitBot.Database')
 
 
 # Получаем абсолютный путь к директории, где находится этот файл
@@ -93,6 +100,11 @@ class Lesson(Base):
     student = relationship("User", back_populates="student_lessons")
     homeworks = relationship("Homework", back_populates="lesson", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('ix_lessons_student_date', 'student_id', 'date'),
+        Index('ix_lessons_student_attendance', 'student_id', 'attendance_status'),
+    )
+
 
 class Homework(Base):
     __tablename__ = 'homeworks'
@@ -111,6 +123,10 @@ class Homework(Base):
     lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=False)
     lesson = relationship("Lesson", back_populates="homeworks")
 
+    __table_args__ = (
+        Index('ix_homeworks_status_checked_at', 'status', 'checked_at'),
+    )
+
 # Новая модель для оплат
 class Payment(Base):
     __tablename__ = 'payments'
@@ -123,6 +139,25 @@ class Payment(Base):
     student_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     student = relationship("User", back_populates="payments")
 
+    __table_args__ = (
+        Index('ix_payments_student_payment_date', 'student_id', 'payment_date'),
+    )
+
+
+# Материализованный баланс занятий ученика.
+# Обновляется инкрементально слушателями событий Payment/Lesson (см. ниже),
+# сверяется с исходными данными через rebuild_balances().
+class StudentBalance(Base):
+    __tablename__ = 'student_balances'
+    student_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    lessons_paid = Column(Integer, nullable=False, default=0)
+    lessons_deducted = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    @property
+    def balance(self):
+        return self.lessons_paid - self.lessons_deducted
+
 
 # Новая модель для материалов
 class Material(Base):
@@ -174,6 +209,193 @@ class Achievement(Base):
     # Связи
     student = relationship("User", foreign_keys=[student_id])
 
+# --- Инкрементальное обновление баланса ---
+# Уроки, которые снимают с баланса: посещенные и неуважительные пропуски.
+# Перенесенные уроки и уважительные пропуски НЕ снимают с баланса.
+BALANCE_DEDUCTING_STATUSES = (AttendanceStatus.ATTENDED, AttendanceStatus.UNEXCUSED_ABSENCE)
+
+def _compute_balances(connection, student_ids=None):
+    """Считает (оплачено, списано) по исходным таблицам одним сгруппированным запросом на таблицу."""
+    paid_query = select(Payment.student_id, sql_func.sum(Payment.lessons_paid)).group_by(Payment.student_id)
+    deducted_query = select(Lesson.student_id, sql_func.count(Lesson.id)).where(
+        Lesson.attendance_status.in_(BALANCE_DEDUCTING_STATUSES)
+    ).group_by(Lesson.student_id)
+    if student_ids is not None:
+        paid_query = paid_query.where(Payment.student_id.in_(student_ids))
+        deducted_query = deducted_query.where(Lesson.student_id.in_(student_ids))
+
+    totals = {student_id: [0, 0] for student_id in (student_ids or [])}
+    for student_id, paid in connection.execute(paid_query):
+        totals.setdefault(student_id, [0, 0])[0] = paid or 0
+    for student_id, deducted in connection.execute(deducted_query):
+        totals.setdefault(student_id, [0, 0])[1] = deducted
+    return totals
+
+def _store_balances(connection, totals, replace=True):
+    """Записывает посчитанные балансы, по умолчанию заменяя существующие строки."""
+    if not totals:
+        return
+    table = StudentBalance.__table__
+    if replace:
+        connection.execute(table.delete().where(table.c.student_id.in_(list(totals))))
+    connection.execute(table.insert(), [
+        {"student_id": student_id, "lessons_paid": paid, "lessons_deducted": deducted}
+        for student_id, (paid, deducted) in totals.items()
+    ])
+
+def _apply_balance_delta(connection, student_id, paid=0, deducted=0):
+    """Применяет изменение к строке баланса; если строки нет — считает баланс ученика целиком."""
+    if student_id is None or (not paid and not deducted):
+        return
+    table = StudentBalance.__table__
+    result = connection.execute(
+        table.update().where(table.c.student_id == student_id).values(
+            lessons_paid=table.c.lessons_paid + paid,
+            lessons_deducted=table.c.lessons_deducted + deducted,
+            updated_at=func.now()
+        )
+    )
+    if result.rowcount == 0:
+        # Строку удалили во время flush (например, вместе с учеником) - считаем заново
+        _store_balances(connection, _compute_balances(connection, [student_id]))
+
+def _ensure_balance_row(connection, *student_ids):
+    """
+    Создает недостающие строки баланса по данным до текущего изменения.
+    Вызывается из before_* событий: при пакетной вставке after_insert срабатывает уже после
+    записи всех строк пакета, и полный пересчет в нем учел бы соседние строки дважды.
+    """
+    table = StudentBalance.__table__
+    for student_id in set(student_ids):
+        if student_id is None:
+            continue
+        exists = connection.execute(select(table.c.student_id).where(table.c.student_id == student_id)).first()
+        if exists is None:
+            _store_balances(connection, _compute_balances(connection, [student_id]), replace=False)
+
+def _ensure_balance_rows_before_flush(mapper, connection, target):
+    _, old_student_id = _previous_value(target, 'student_id')
+    _ensure_balance_row(connection, old_student_id, target.student_id)
+
+for _model in (Payment, Lesson):
+    for _event_name in ('before_insert', 'before_update', 'before_delete'):
+        event.listen(_model, _event_name, _ensure_balance_rows_before_flush)
+
+def _previous_value(target, key):
+    """Возвращает (известно ли значение, значение до flush) для атрибута объекта."""
+    history = get_history(target, key)
+    if not history.has_changes():
+        return True, getattr(target, key)
+    if history.deleted:
+        return True, history.deleted[0]
+    # Атрибут был изменен, не будучи загруженным — старое значение неизвестно
+    return False, None
+
+def _recompute_students(connection, *student_ids):
+    student_ids = [student_id for student_id in set(student_ids) if student_id is not None]
+    if student_ids:
+        _store_balances(connection, _compute_balances(connection, student_ids))
+
+@event.listens_for(Payment, 'after_insert')
+def _payment_inserted(mapper, connection, target):
+    _apply_balance_delta(connection, target.student_id, paid=target.lessons_paid or 0)
+
+@event.listens_for(Payment, 'after_delete')
+def _payment_deleted(mapper, connection, target):
+    _apply_balance_delta(connection, target.student_id, paid=-(target.lessons_paid or 0))
+
+@event.listens_for(Payment, 'after_update')
+def _payment_updated(mapper, connection, target):
+    student_known, old_student_id = _previous_value(target, 'student_id')
+    amount_known, old_amount = _previous_value(target, 'lessons_paid')
+    if not (student_known and amount_known):
+        _recompute_students(connection, old_student_id, target.student_id)
+        return
+    if old_student_id == target.student_id and old_amount == target.lessons_paid:
+        return
+    _apply_balance_delta(connection, old_student_id, paid=-(old_amount or 0))
+    _apply_balance_delta(connection, target.student_id, paid=target.lessons_paid or 0)
+
+@event.listens_for(Lesson, 'after_insert')
+def _lesson_inserted(mapper, connection, target):
+    if target.attendance_status in BALANCE_DEDUCTING_STATUSES:
+        _apply_balance_delta(connection, target.student_id, deducted=1)
+
+@event.listens_for(Lesson, 'after_delete')
+def _lesson_deleted(mapper, connection, target):
+    if target.attendance_status in BALANCE_DEDUCTING_STATUSES:
+        _apply_balance_delta(connection, target.student_id, deducted=-1)
+
+@event.listens_for(Lesson, 'after_update')
+def _lesson_updated(mapper, connection, target):
+    student_known, old_student_id = _previous_value(target, 'student_id')
+    status_known, old_status = _previous_value(target, 'attendance_status')
+    if not (student_known and status_known):
+        _recompute_students(connection, old_student_id, target.student_id)
+        return
+    was_deducted = old_status in BALANCE_DEDUCTING_STATUSES
+    is_deducted = target.attendance_status in BALANCE_DEDUCTING_STATUSES
+    if old_student_id == target.student_id and was_deducted == is_deducted:
+        return
+    if was_deducted:
+        _apply_balance_delta(connection, old_student_id, deducted=-1)
+    if is_deducted:
+        _apply_balance_delta(connection, target.student_id, deducted=1)
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    table = StudentBalance.__table__
+    connection.execute(table.delete().where(table.c.student_id == target.id))
+
+# Массовые query(...).update()/delete() и session.execute(update(...)/delete(...)) не вызывают
+# событий маппера выше. Для них затронутые ученики выбираются тем же условием до выполнения
+# запроса, а после - их балансы пересчитываются целиком. Запросы через connection/engine
+# в обход Session не отслеживаются: после них нужен rebuild_balances().
+def _bulk_new_student_ids(orm_execute_state):
+    """
+    Ученики, к которым массовый UPDATE переносит уроки/оплаты: значения student_id из SET
+    запроса и из параметров выполнения (в т.ч. пакетного UPDATE по первичному ключу).
+    Если значение - SQL-выражение и его не определить, запрос отклоняется: без него нельзя
+    пересчитать баланс нового ученика.
+    """
+    params = orm_execute_state.parameters
+    param_rows = params if isinstance(params, list) else [params or {}]
+    student_ids = [row['student_id'] for row in param_rows if 'student_id' in row]
+    for column, value in (orm_execute_state.statement._values or {}).items():
+        if getattr(column, 'key', column) != 'student_id':
+            continue
+        if isinstance(value, BindParameter) and not value.required:
+            student_ids.append(value.effective_value)
+        elif isinstance(value, BindParameter) and all(value.key in row for row in param_rows):
+            student_ids.extend(row[value.key] for row in param_rows)
+        elif not isinstance(value, Null):
+            logger.error("Массовый UPDATE %s меняет student_id на невычислимое значение: %s",
+                         orm_execute_state.bind_mapper.class_.__name__, value)
+            raise ValueError("Массовый UPDATE может менять student_id только на конкретное значение")
+    return student_ids
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_balance_changes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in (Lesson, Payment):
+        return None
+    model = mapper.class_
+    statement = orm_execute_state.statement
+    # Перенос уроков/оплат к другому ученику: пересчитываем и нового ученика
+    new_student_ids = _bulk_new_student_ids(orm_execute_state) if orm_execute_state.is_update else []
+
+    affected_query = select(model.student_id).distinct()
+    if statement.whereclause is not None:
+        affected_query = affected_query.where(statement.whereclause)
+    connection = orm_execute_state.session.connection()
+    student_ids = [student_id for (student_id,) in connection.execute(affected_query)]
+
+    result = orm_execute_state.invoke_statement()
+    _recompute_students(connection, *student_ids, *new_student_ids)
+    return result
+
 # Функции для работы с еженедельным расписанием
 def get_weekly_schedule(student_id: int, tutor_id: int):
     """Возвращает еженедельное расписание для ученика и репетитора."""
@@ -356,24 +578,35 @@ def get_user_by_id(user_id: int):
     db.close()
     return user
 
+def month_range(year: int, month: int):
+    """
+    Полуинтервал [начало месяца, начало следующего месяца).
+    Фильтр по диапазону, в отличие от extract(year/month), может использовать индексы по дате.
+    """
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
 def get_lessons_for_student_by_month(student_id: int, year: int, month: int):
     """Возвращает все уроки для ученика за указанный год и месяц."""
+    start, end = month_range(year, month)
     db = SessionLocal()
     lessons = db.query(Lesson).filter(
         Lesson.student_id == student_id,
-        func.extract('year', Lesson.date) == year,
-        func.extract('month', Lesson.date) == month
+        Lesson.date >= start,
+        Lesson.date < end
     ).order_by(Lesson.date).all()
     db.close()
     return lessons
 
 def get_payments_for_student_by_month(student_id: int, year: int, month: int):
     """Возвращает все платежи для ученика за указанный год и месяц."""
+    start, end = month_range(year, month)
     db = SessionLocal()
     payments = db.query(Payment).filter(
         Payment.student_id == student_id,
-        func.extract('year', Payment.payment_date) == year,
-        func.extract('month', Payment.payment_date) == month
+        Payment.payment_date >= start,
+        Payment.payment_date < end
     ).order_by(Payment.payment_date).all()
     db.close()
     return payments
@@ -427,17 +660,72 @@ def get_user_by_id(user_id: int):
     return user
 
 def get_student_balance(student_id: int):
-    """Рассчитывает баланс занятий для ученика."""
+    """Возвращает баланс занятий для ученика из материализованной таблицы балансов."""
+    return get_balances([student_id])[student_id]
+
+def get_balances(student_ids):
+    """
+    Возвращает {student_id: баланс} для списка учеников одним запросом.
+    Недостающие строки баланса досчитываются по исходным таблицам и сохраняются.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return {}
+    db = SessionLocal()
+    try:
+        rows = db.query(StudentBalance).filter(StudentBalance.student_id.in_(student_ids)).all()
+        balances = {row.student_id: row.balance for row in rows}
+        missing = [student_id for student_id in student_ids if student_id not in balances]
+        if missing:
+            connection = db.connection()
+            totals = _compute_balances(connection, missing)
+            existing = {row[0] for row in connection.execute(select(User.id).where(User.id.in_(missing)))}
+            _store_balances(connection, {student_id: totals[student_id] for student_id in existing})
+            db.commit()
+            for student_id, (paid, deducted) in totals.items():
+                balances[student_id] = paid - deducted
+        return balances
+    finally:
+        db.close()
+
+def get_students_with_balance(balance: int):
+    """
+    Возвращает [(student_id, full_name, chat_id, balance)] для учеников с указанным балансом одним запросом.
+    chat_id — telegram_id родителя, если он подключен к боту, иначе telegram_id самого ученика.
+    Ученики, до которых некому отправить сообщение, не возвращаются.
+    """
+    db = SessionLocal()
+    try:
+        parent = aliased(User)
+        balance_expr = StudentBalance.lessons_paid - StudentBalance.lessons_deducted
+        chat_id_expr = sql_func.coalesce(parent.telegram_id, User.telegram_id)
+        return [tuple(row) for row in db.query(User.id, User.full_name, chat_id_expr, balance_expr).join(
+            StudentBalance, StudentBalance.student_id == User.id
+        ).outerjoin(
+            parent, parent.id == User.parent_id
+        ).filter(
+            User.role == UserRole.STUDENT,
+            balance_expr == balance,
+            chat_id_expr.isnot(None)
+        ).all()]
+    finally:
+        db.close()
+
+def rebuild_balances():
+    """Пересчитывает таблицу балансов с нуля по оплатам и урокам. Возвращает число учеников."""
     db = SessionLocal()
     try:
-        total_paid = db.query(sql_func.sum(Payment.lessons_paid)).filter(Payment.student_id == student_id).scalar() or 0
-        # Считаем уроки, которые снимают с баланса: посещенные и неуважительные пропуски
-        # Перенесенные уроки и уважительные пропуски НЕ снимают с баланса
-        deducted_lessons = db.query(Lesson).filter(
-            Lesson.student_id == student_id, 
-            Lesson.attendance_status.in_([AttendanceStatus.ATTENDED, AttendanceStatus.UNEXCUSED_ABSENCE])
-        ).count()
-        return total_paid - deducted_lessons
+        connection = db.connection()
+        totals = _compute_balances(connection)
+        for (student_id,) in connection.execute(select(User.id).where(User.role == UserRole.STUDENT)):
+            totals.setdefault(student_id, [0, 0])
+        connection.execute(StudentBalance.__table__.delete())
+        _store_balances(connection, totals, replace=False)
+        db.commit()
+        return len(totals)
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -552,40 +840,112 @@ def update_study_streak(student_id: int):
     finally:
         db.close()
 
-def get_dashboard_stats():
-    """Собирает статистику для дашборда репетитора."""
-    db = SessionLocal()
-    try:
-        now = tz_now().replace(tzinfo=None)
-        year, month = now.year, now.month
-
-        student_count = db.query(User).filter(User.role == UserRole.STUDENT).count()
-        
-        lessons_this_month = db.query(Lesson).filter(
-            Lesson.attendance_status == AttendanceStatus.ATTENDED,
-            func.extract('year', Lesson.date) == year,
-            func.extract('month', Lesson.date) == month
-        ).count()
-
-        checked_hw_this_month = db.query(Homework).filter(
-            Homework.status == HomeworkStatus.CHECKED,
-            func.extract('year', Homework.checked_at) == year,
-            func.extract('month', Homework.checked_at) == month
-        ).count()
-
-        payments_sum_this_month = db.query(sql_func.sum(Payment.lessons_paid)).filter(
-            func.extract('year', Payment.payment_date) == year,
-            func.extract('month', Payment.payment_date) == month
-        ).scalar() or 0
-
-        return {
-            "student_count": student_count,
-            "lessons_this_month": lessons_this_month,
-            "checked_hw_this_month": checked_hw_this_month,
-            "payments_sum_this_month": payments_sum_this_month
+# --- Статистика дашборда ---
+DASHBOARD_STATS_TTL = 60  # секунд; любая запись в пользователей/уроки/ДЗ/оплаты сбрасывает кэш раньше
+_dashboard_stats_memo = {}
+
+def invalidate_dashboard_stats():
+    _dashboard_stats_memo.clear()
+
+# Кэш сбрасывается после коммита, а не при flush: иначе запрос из другой сессии, пришедший
+# между flush и коммитом, закэширует данные без этих изменений еще на DASHBOARD_STATS_TTL.
+DASHBOARD_MODELS = (User, Lesson, Homework, Payment)
+_DASHBOARD_DIRTY_KEY = 'dashboard_stats_dirty'
+
+def _dashboard_data_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info[_DASHBOARD_DIRTY_KEY] = True
+
+for _model in DASHBOARD_MODELS:
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _dashboard_data_changed)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_dashboard_changes(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert) \
+            and mapper is not None and mapper.class_ in DASHBOARD_MODELS:
+        orm_execute_state.session.info[_DASHBOARD_DIRTY_KEY] = True
+
+@event.listens_for(Session, 'after_commit')
+def _dashboard_changes_committed(session):
+    if session.info.pop(_DASHBOARD_DIRTY_KEY, False):
+        invalidate_dashboard_stats()
+
+@event.listens_for(Session, 'after_rollback')
+def _dashboard_changes_rolled_back(session):
+    session.info.pop(_DASHBOARD_DIRTY_KEY, None)
+
+def _month_bucket(column, ranges):
+    """Номер месяца из ranges, в который попадает значение column (NULL, если ни в один)."""
+    return case(*[
+        (and_(column >= start, column < end), index)
+        for index, (start, end) in enumerate(ranges)
+    ], else_=None)
+
+def get_dashboard_stats_for_months(months):
+    """
+    Собирает статистику дашборда сразу за несколько месяцев одним запросом
+    (UNION ALL агрегатов с разбиением по месяцам). months — список (год, месяц).
+    Возвращает {(год, месяц): {...}} с теми же ключами, что и get_dashboard_stats().
+    Результат кэшируется на DASHBOARD_STATS_TTL секунд.
+    """
+    months = tuple(dict.fromkeys((int(year), int(month)) for year, month in months))
+    if not months:
+        return {}
+    memo = _dashboard_stats_memo.get(months)
+    if memo is not None and memo[0] > time.monotonic():
+        return memo[1]
+
+    ranges = [month_range(year, month) for year, month in months]
+    lower, upper = min(start for start, _ in ranges), max(end for _, end in ranges)
+
+    lesson_bucket = _month_bucket(Lesson.date, ranges)
+    homework_bucket = _month_bucket(Homework.checked_at, ranges)
+    payment_bucket = _month_bucket(Payment.payment_date, ranges)
+    query = union_all(
+        select(literal('student_count'), literal(-1), sql_func.count(User.id))
+        .where(User.role == UserRole.STUDENT),
+        select(literal('lessons_this_month'), lesson_bucket, sql_func.count(Lesson.id))
+        .where(Lesson.attendance_status == AttendanceStatus.ATTENDED,
+               Lesson.date >= lower, Lesson.date < upper)
+        .group_by(lesson_bucket),
+        select(literal('checked_hw_this_month'), homework_bucket, sql_func.count(Homework.id))
+        .where(Homework.status == HomeworkStatus.CHECKED,
+               Homework.checked_at >= lower, Homework.checked_at < upper)
+        .group_by(homework_bucket),
+        select(literal('payments_sum_this_month'), payment_bucket, sql_func.sum(Payment.lessons_paid))
+        .where(Payment.payment_date >= lower, Payment.payment_date < upper)
+        .group_by(payment_bucket),
+    )
+
+    with engine.connect() as connection:
+        rows = connection.execute(query).all()
+
+    result = {
+        month: {
+            "student_count": 0,
+            "lessons_this_month": 0,
+            "checked_hw_this_month": 0,
+            "payments_sum_this_month": 0
         }
-    finally:
-        db.close()
+        for month in months
+    }
+    for metric, bucket, value in rows:
+        if metric == 'student_count':
+            for stats in result.values():
+                stats[metric] = value or 0
+        elif bucket is not None:
+            result[months[bucket]][metric] = value or 0
+
+    _dashboard_stats_memo[months] = (time.monotonic() + DASHBOARD_STATS_TTL, result)
+    return result
+
+def get_dashboard_stats():
+    """Собирает статистику для дашборда репетитора за текущий месяц."""
+    now = tz_now().replace(tzinfo=None)
+    return get_dashboard_stats_for_months([(now.year, now.month)])[(now.year, now.month)]
 
 def shift_lessons_after_cancellation(cancelled_lesson_id: int):
     """
@@ -791,3 +1151,98 @@ def get_day_note(student_id: int, tutor_id: int, day: str) -> str:
         return getattr(schedule, day_note_field) or ""
     finally:
         db.close()
+
+# --- Массовое создание уроков по шаблону расписания ---
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+DEFAULT_SCHEDULE_WEEKS = 4
+SCHEDULED_LESSON_TOPIC = "Урок (тема не указана)"
+
+def _expand_dates(days, lesson_time, start_date, weeks: int, not_before):
+    """Все даты-время уроков по дням недели days на weeks недель начиная с start_date."""
+    weekdays = {WEEKDAYS.index(day) for day in days}
+    result = []
+    for offset in range(weeks * 7):
+        day = start_date + timedelta(days=offset)
+        if day.weekday() in weekdays:
+            lesson_datetime = datetime.combine(day, lesson_time)
+            if lesson_datetime > not_before:
+                result.append(lesson_datetime)
+    return result
+
+def create_lessons_by_days(student_days: dict, lesson_time, weeks: int = DEFAULT_SCHEDULE_WEEKS):
+    """
+    Создает уроки для нескольких учеников сразу.
+    student_days: {student_id: ['monday', 'thursday', ...]}, lesson_time: datetime.time.
+    Существующие уроки проверяются одним запросом по диапазону дат, новые вставляются пачкой.
+    Возвращает {student_id: число созданных уроков}.
+    """
+    now = tz_now().replace(tzinfo=None)
+    planned = {
+        student_id: _expand_dates(days, lesson_time, now.date(), weeks, now)
+        for student_id, days in student_days.items()
+    }
+    all_dates = [lesson_date for dates in planned.values() for lesson_date in dates]
+    created = {student_id: 0 for student_id in planned}
+    if not all_dates:
+        return created
+
+    db = SessionLocal()
+    try:
+        existing = set(db.execute(
+            select(Lesson.student_id, Lesson.date).where(
+                Lesson.student_id.in_(list(planned)),
+                Lesson.date >= min(all_dates),
+                Lesson.date <= max(all_dates)
+            )
+        ).all())
+
+        rows = []
+        for student_id, dates in planned.items():
+            for lesson_date in dates:
+                if (student_id, lesson_date) in existing:
+                    continue
+                rows.append({
+                    'student_id': student_id,
+                    'topic': SCHEDULED_LESSON_TOPIC,
+                    'date': lesson_date,
+                    'skills_developed': "",
+                    'mastery_level': TopicMastery.NOT_LEARNED,
+                    'attendance_status': AttendanceStatus.SCHEDULED,
+                    'lesson_status': LessonStatus.NOT_CONDUCTED,
+                })
+                created[student_id] += 1
+
+        # Вставка в обход ORM: запланированные уроки не списывают занятия, поэтому баланс не меняется,
+        # а кэш графиков (события ORM при такой вставке не срабатывают) сбрасываем явно
+        if rows:
+            db.execute(insert(Lesson), rows)
+        db.commit()
+        from .chart_cache import chart_cache
+        chart_cache.mark_dirty(*(student_id for student_id, count in created.items() if count))
+        return created
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def create_lessons_from_schedules(lesson_time, weeks: int = DEFAULT_SCHEDULE_WEEKS, tutor_id: int = None, student_ids=None):
+    """
+    Разворачивает шаблоны WeeklySchedule (дни, отмеченные как запланированные) в уроки на weeks недель.
+    Можно ограничить репетитором и/или списком учеников. Возвращает {student_id: число созданных уроков}.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(WeeklySchedule)
+        if tutor_id is not None:
+            query = query.filter(WeeklySchedule.tutor_id == tutor_id)
+        if student_ids is not None:
+            query = query.filter(WeeklySchedule.student_id.in_(list(student_ids)))
+        student_days = {}
+        for schedule in query.all():
+            days = [day for day in WEEKDAYS if is_lesson_planned(schedule, day)]
+            if days:
+                student_days.setdefault(schedule.student_id, set()).update(days)
+    finally:
+        db.close()
+    return create_lessons_by_days(student_days, lesson_time, weeks)
@@ -2,8 +2,11 @@
 import re
 from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
-from ..database import (get_user_by_telegram_id, SessionLocal, User, UserRole)
+from ..database import (SessionLocal, User, UserRole)
+from ..async_database import get_identity_async
+from ..identity_cache import identity_cache
 from ..keyboards import tutor_main_keyboard, student_main_keyboard, parent_main_keyboard
+from .router import callback_route
 
 # --- Helper Functions ---
 def generate_access_code(length=8):
@@ -11,14 +14,14 @@ def generate_access_code(length=8):
     import string
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
-def check_user_role(update: Update, required_role: UserRole) -> bool:
+async def check_user_role(update: Update, required_role: UserRole) -> bool:
     """Проверяет роль пользователя"""
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     return user and user.role == required_role
 
 # --- Basic Handlers ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     if user:
         await show_main_menu(update, context)
     else:
@@ -29,7 +32,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_access_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем, есть ли уже пользователь в системе
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     if user:
         # Пользователь уже зарегистрирован, показываем меню
         await show_main_menu(update, context)
@@ -53,6 +56,8 @@ async def handle_access_code(update: Update, context: ContextTypes.DEFAULT_TYPE)
             user.telegram_id = update.effective_user.id
             user.username = update.effective_user.username
             db.commit()
+            identity_cache.invalidate(update.effective_user.id)
+            identity_cache.invalidate_users(user.id, user.parent_id, user.second_parent_id)
             
             await update.message.reply_text(
                 f"✅ Добро пожаловать, {user.full_name}!\n"
@@ -66,8 +71,9 @@ async def handle_access_code(update: Update, context: ContextTypes.DEFAULT_TYPE)
     finally:
         db.close()
 
+@callback_route("main_menu")
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     
     if not user:
         await update.message.reply_text("Пожалуйста, введите код доступа для начала работы.")
@@ -13,12 +13,14 @@ from sqlalchemy.orm import joinedload
 
 from ..database import (
     SessionLocal, User, UserRole, Lesson, Homework, Payment, Achievement,
-    get_user_by_telegram_id, get_user_by_id, get_student_balance,
+    get_user_by_id, get_student_balance, get_balances,
     HomeworkStatus, TopicMastery, AttendanceStatus
 )
+from ..async_database import get_identity_async
 from ..keyboards import parent_main_keyboard, parent_child_menu_keyboard
 from ..logger import setup_logging, log_user_action
 from .common import show_main_menu
+from .router import callback_route, last_int
 
 logger = setup_logging()
 
@@ -62,16 +64,18 @@ ATTENDANCE_STATUS_RU = {
     AttendanceStatus.RESCHEDULED: "Перенесен",
 }
 
-def check_parent_access(update: Update) -> User:
+async def check_parent_access(update: Update) -> User:
     """Проверяет, что пользователь - родитель"""
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     if not user or user.role != UserRole.PARENT:
         return None
     return user
 
+@callback_route("parent_dashboard")
+@callback_route("select_child")
 async def show_parent_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает дашборд родителя с выбором ребенка"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.message.reply_text("❌ Доступ запрещен")
         return
@@ -103,9 +107,10 @@ async def show_parent_dashboard(update: Update, context: ContextTypes.DEFAULT_TY
             text += f"Выберите ребенка:"
             
             keyboard = []
+            balances = get_balances([child.id for child in children])
             for child in children:
                 # Краткая статистика по ребенку
-                balance = get_student_balance(child.id)
+                balance = balances[child.id]
                 text += f"\n👤 **{child.full_name}**\n"
                 text += f"   Баллы: {child.points} | Баланс: {balance} уроков\n"
                 
@@ -131,6 +136,7 @@ async def show_parent_dashboard(update: Update, context: ContextTypes.DEFAULT_TY
 
 # Первая версия show_child_progress удалена - используем более полную версию ниже в строке 413+
 
+@callback_route("parent_schedule_", parse=last_int)
 async def show_child_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE, child_id: int):
     """Показывает расписание ребенка родителю"""
     query = update.callback_query
@@ -144,7 +150,7 @@ async def show_child_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # Проверяем права доступа
-    parent = get_user_by_telegram_id(update.effective_user.id)
+    parent = await get_identity_async(update.effective_user.id)
     if student.parent_id != parent.id and student.second_parent_id != parent.id:
         await query.edit_message_text("У вас нет доступа к этой информации.")
         return
@@ -198,6 +204,7 @@ async def show_child_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("parent_payments_", parse=last_int)
 async def show_child_payments(update: Update, context: ContextTypes.DEFAULT_TYPE, child_id: int):
     """Показывает информацию об оплатах ребенка"""
     query = update.callback_query
@@ -211,7 +218,7 @@ async def show_child_payments(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # Проверяем права доступа
-    parent = get_user_by_telegram_id(update.effective_user.id)
+    parent = await get_identity_async(update.effective_user.id)
     if student.parent_id != parent.id and student.second_parent_id != parent.id:
         await query.edit_message_text("У вас нет доступа к этой информации.")
         return
@@ -260,35 +267,33 @@ async def parent_generate_chart(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     # Проверяем права доступа
-    parent = get_user_by_telegram_id(update.effective_user.id)
+    parent = await get_identity_async(update.effective_user.id)
     if student.parent_id != parent.id and student.second_parent_id != parent.id:
         await query.edit_message_text("У вас нет доступа к этой информации.")
         return
     
     await query.edit_message_text("📊 Генерируем график прогресса...")
     
-    from ..chart_generator import generate_progress_chart
+    from ..chart_generator import render_progress_chart, send_progress_chart
     
-    chart_path = generate_progress_chart(student_id)
+    chart_path = await render_progress_chart(student_id)
     
     if chart_path:
         try:
-            with open(chart_path, 'rb') as chart_file:
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Назад к ребенку", callback_data=f"parent_child_{student_id}")],
-                    [InlineKeyboardButton("🏠 Главное меню", callback_data="parent_dashboard")]
-                ])
-                
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=chart_file,
-                    caption=f"📊 *Прогресс {student.full_name}*\n\nТекущие баллы: *{student.points}*",
-                    reply_markup=keyboard,
-                    parse_mode='Markdown'
-                )
-                
-                # Удаляем сообщение о генерации
-                await query.message.delete()
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("⬅️ Назад к ребенку", callback_data=f"parent_child_{student_id}")],
+                [InlineKeyboardButton("🏠 Главное меню", callback_data="parent_dashboard")]
+            ])
+            
+            await send_progress_chart(
+                context.bot, update.effective_chat.id, chart_path,
+                caption=f"📊 *Прогресс {student.full_name}*\n\nТекущие баллы: *{student.points}*",
+                reply_markup=keyboard,
+                parse_mode='Markdown'
+            )
+            
+            # Удаляем сообщение о генерации
+            await query.message.delete()
         except Exception as e:
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton("⬅️ Назад к ребенку", callback_data=f"parent_child_{student_id}")],
@@ -309,12 +314,13 @@ async def parent_generate_chart(update: Update, context: ContextTypes.DEFAULT_TY
         )
 
 
+@callback_route("parent_child_", parse=last_int)
 async def show_child_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, child_id: int):
     """Показывает меню для конкретного ребенка"""
     query = update.callback_query
     await query.answer()  # Сразу отвечаем на callback
     
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await query.edit_message_text("❌ Доступ запрещен")
         return
@@ -387,12 +393,13 @@ async def show_child_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, ch
         db.close()
 
 
+@callback_route("parent_progress_", parse=last_int)
 async def show_child_progress(update: Update, context: ContextTypes.DEFAULT_TYPE, child_id: int):
     """Показывает подробный прогресс ребенка"""
     query = update.callback_query
     await query.answer()  # Сразу отвечаем на callback
     
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await query.edit_message_text("❌ Доступ запрещен")
         return
@@ -478,9 +485,10 @@ async def show_child_progress(update: Update, context: ContextTypes.DEFAULT_TYPE
         db.close()
 
 
+@callback_route("parent_homework_")
 async def show_child_homework(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает домашние задания ребенка"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.callback_query.answer("❌ Доступ запрещен")
         return
@@ -547,9 +555,10 @@ async def show_child_homework(update: Update, context: ContextTypes.DEFAULT_TYPE
         db.close()
 
 
+@callback_route("parent_achievements_")
 async def show_child_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает достижения ребенка"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.callback_query.answer("❌ Доступ запрещен")
         return
@@ -601,7 +610,7 @@ async def show_child_achievements(update: Update, context: ContextTypes.DEFAULT_
 # --- Коммуникация с репетитором ---
 async def parent_chat_with_tutor_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает чат родителя с репетитором"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         if update.message:
             await update.message.reply_text("❌ Доступ запрещен")
@@ -630,7 +639,7 @@ async def parent_chat_with_tutor_start(update: Update, context: ContextTypes.DEF
 
 async def parent_forward_message_to_tutor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Пересылает сообщение родителя репетитору"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.message.reply_text("❌ Доступ запрещен")
         return ConversationHandler.END
@@ -690,7 +699,7 @@ async def handle_parent_buttons(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     callback_data = update.callback_query.data
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     
     if not parent:
         await update.callback_query.answer("❌ Доступ запрещен")
@@ -750,9 +759,10 @@ async def handle_parent_buttons(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 # --- Дополнительные функции ---
+@callback_route("parent_lessons_")
 async def show_child_lessons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает историю уроков ребенка"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.callback_query.answer("❌ Доступ запрещен")
         return
@@ -815,9 +825,10 @@ async def show_child_lessons(update: Update, context: ContextTypes.DEFAULT_TYPE)
         db.close()
 
 
+@callback_route("parent_chart_")
 async def parent_generate_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Генерирует график прогресса для родителя"""
-    parent = check_parent_access(update)
+    parent = await check_parent_access(update)
     if not parent:
         await update.callback_query.answer("❌ Доступ запрещен")
         return
@@ -838,8 +849,8 @@ async def parent_generate_chart(update: Update, context: ContextTypes.DEFAULT_TY
         
         await safe_edit_or_reply(update, "Генерируем график прогресса...")
         
-        from ..chart_generator import generate_progress_chart
-        chart_path = generate_progress_chart(student_id)
+        from ..chart_generator import render_progress_chart, send_progress_chart
+        chart_path = await render_progress_chart(student_id)
         
         if chart_path and os.path.exists(chart_path):
             try:
@@ -847,16 +858,13 @@ async def parent_generate_chart(update: Update, context: ContextTypes.DEFAULT_TY
                     [InlineKeyboardButton("Назад к ребенку", callback_data=f"parent_child_{student_id}")]
                 ])
                 
-                with open(chart_path, 'rb') as chart_file:
-                    await context.bot.send_photo(
-                        chat_id=update.effective_chat.id,
-                        photo=chart_file,
-                        caption=f"График прогресса {student.full_name}\n\nТекущие баллы: {student.points}",
-                        reply_markup=keyboard
-                    )
+                await send_progress_chart(
+                    context.bot, update.effective_chat.id, chart_path,
+                    caption=f"График прогресса {student.full_name}\n\nТекущие баллы: {student.points}",
+                    reply_markup=keyboard
+                )
                 
                 await update.callback_query.message.delete()
-                os.remove(chart_path)
             except Exception as e:
                 keyboard = InlineKeyboardMarkup([
                     [InlineKeyboardButton("Назад к ребенку", callback_data=f"parent_child_{student_id}")]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Маршрутизатор callback_data для inline-кнопок.
+Маршруты регистрируются один раз при импорте модулей обработчиков (декоратор callback_route)
+и хранятся в префиксном дереве: поиск обработчика занимает O(длина callback_data)
+и всегда выбирает самый длинный подходящий префикс, независимо от порядка регистрации.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+perf_logger = logging.getLogger('RepitBot.Performance')
+
+# --- Разбор аргументов из callback_data ---
+def last_int(data: str, prefix: str) -> int:
+    """Число после последнего "_": tutor_view_student_15 -> 15"""
+    return int(data.split("_")[-1])
+
+def last_str(data: str, prefix: str) -> str:
+    """Строка после последнего "_": schedule_toggle_monday -> "monday" """
+    return data.split("_")[-1]
+
+def suffix(data: str, prefix: str) -> str:
+    """Все, что идет после префикса: tutor_set_attendance_15_attended -> "15_attended" """
+    return data[len(prefix):]
+
+
+@dataclass
+class RouteStats:
+    calls: int = 0
+    errors: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    def record(self, elapsed: float, failed: bool):
+        self.calls += 1
+        self.errors += int(failed)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_ms': round(self.total_time / self.calls * 1000, 2) if self.calls else 0.0,
+            'max_ms': round(self.max_time * 1000, 2),
+        }
+
+
+@dataclass
+class Route:
+    prefix: str
+    handler: Callable
+    parse: Optional[Callable[[str, str], object]] = None
+    stats: RouteStats = field(default_factory=RouteStats)
+
+    def args(self, data: str) -> tuple:
+        return () if self.parse is None else (self.parse(data, self.prefix),)
+
+
+_ROUTE_KEY = None  # Ключ узла дерева, под которым лежит маршрут (символы — всегда строки)
+
+class CallbackRouter:
+    """Префиксное дерево маршрутов callback_data."""
+
+    def __init__(self):
+        self._root: Dict = {}
+        self._routes: Dict[str, Route] = {}
+
+    def add(self, prefix: str, handler: Callable, parse: Optional[Callable] = None) -> Route:
+        if prefix in self._routes:
+            raise ValueError(f"Маршрут для префикса '{prefix}' уже зарегистрирован")
+        route = Route(prefix, handler, parse)
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_ROUTE_KEY] = route
+        self._routes[prefix] = route
+        return route
+
+    def route(self, prefix: str, parse: Optional[Callable] = None):
+        """Декоратор регистрации обработчика для префикса callback_data."""
+        def decorator(handler):
+            self.add(prefix, handler, parse)
+            return handler
+        return decorator
+
+    def resolve(self, data: str) -> Optional[Route]:
+        """Возвращает маршрут с самым длинным префиксом, с которого начинается data."""
+        node = self._root
+        found = node.get(_ROUTE_KEY)
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(_ROUTE_KEY, found)
+        return found
+
+    async def dispatch(self, route: Route, update, context, data: str):
+        """Вызывает обработчик маршрута, замеряя время выполнения."""
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await route.handler(update, context, *route.args(data))
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            route.stats.record(elapsed, failed)
+            perf_logger.debug(f"callback '{route.prefix}' handled in {elapsed:.3f}s")
+
+    def stats(self) -> Dict[str, dict]:
+        return {prefix: route.stats.as_dict() for prefix, route in self._routes.items() if route.stats.calls}
+
+
+# Глобальный маршрутизатор inline-кнопок бота
+callback_router = CallbackRouter()
+callback_route = callback_router.route
@@ -5,18 +5,23 @@ from telegram.ext import ContextTypes, ConversationHandler
 from telegram.error import Forbidden
 
 from ..database import (
-    SessionLocal, User, UserRole, get_user_by_telegram_id, get_all_students
+    SessionLocal, User, UserRole, get_all_students
 )
+from ..async_database import get_identity_async
 from ..calendar_util import create_calendar
 from .common import show_main_menu
+from .router import callback_router, callback_route, last_str
+# Импорт модулей регистрирует их маршруты в callback_router
+from . import student, tutor, parent  # noqa: F401
 
 # --- Состояния для ConversationHandler ---
 CHAT_WITH_TUTOR = range(1)
 
+@callback_route("parent_chat_with_tutor_")
 async def chat_with_tutor_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает диалог с репетитором"""
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     
     if user.role == UserRole.STUDENT:
         message = (
@@ -162,7 +167,7 @@ async def tutor_quick_reply_start(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     # Проверяем, что это действительно репетитор
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     if not user or user.role != UserRole.TUTOR:
         await query.edit_message_text("У вас нет доступа к этой функции.")
         return
@@ -195,6 +200,7 @@ async def tutor_quick_reply_start(update: Update, context: ContextTypes.DEFAULT_
     )
     return CHAT_WITH_TUTOR  # Возвращаем состояние для ожидания ввода сообщения
 
+@callback_route("tutor_reply_to_", parse=last_str)
 async def tutor_reply_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str):
     """Обработчик кнопки быстрого ответа репетитора."""
     return await tutor_quick_reply_start(update, context, int(user_id))
@@ -224,7 +230,7 @@ async def send_tutor_quick_reply(update: Update, context: ContextTypes.DEFAULT_T
         return CHAT_WITH_TUTOR
 
     user_id = recipient_info['user_id']
-    sender_name = get_user_by_telegram_id(update.effective_user.id)
+    sender_name = await get_identity_async(update.effective_user.id)
     sender_name = sender_name.full_name if sender_name else "Репетитор"
 
     try:
@@ -270,7 +276,7 @@ async def handle_tutor_reply(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     # Проверяем, что отвечающий - репетитор
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     if not user or user.role != UserRole.TUTOR:
         return
 
@@ -454,6 +460,7 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
             f"✅ Выбрана дата: {selected_date}\n\nТеперь введите время в формате ЧЧ:ММ (например: 15:30)"
         )
 
+@callback_route("student_settings")
 async def student_settings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик настроек ученика."""
     query = update.callback_query
@@ -464,8 +471,13 @@ async def student_settings_handler(update: Update, context: ContextTypes.DEFAULT
         parse_mode='Markdown'
     )
 
+@callback_route("noop")
+async def noop_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка без действия (заголовки и разделители в клавиатурах)."""
+    return None
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Основной обработчик всех кнопок - используем рабочий код из handlers.py"""
+    """Основной обработчик всех кнопок: ищет маршрут по callback_data в callback_router."""
     from ..logger import log_user_action
     
     query = update.callback_query
@@ -474,181 +486,17 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     print(f"BUTTON_HANDLER: Received callback '{data}' from user {update.effective_user.id}")
     
-    # Дополнительная отладка для schedule кнопок
-    if "schedule" in data:
-        print(f"DEBUG: Schedule button detected: {data}")
-    
     # Логируем все нажатия кнопок
     log_user_action(update.effective_user.id, f"BUTTON_CLICK: {data}")
     
-    # Проверяем роль пользователя
-    user = get_user_by_telegram_id(update.effective_user.id)
-    
-    # Импортируем функции из микросервисов напрямую
-    from .common import show_main_menu
-    from .student import (show_my_progress, show_schedule, show_homework_menu, show_lesson_history,
-                         show_payment_and_attendance, show_materials_library, show_student_achievements,
-                         student_view_homework, student_view_lesson_details, student_library_by_grade)
-    from .tutor import (show_student_list, show_student_profile, show_analytics_chart,
-                       tutor_delete_student_start, tutor_delete_student_confirm, tutor_add_parent_start,
-                       show_tutor_lessons, show_lesson_details, tutor_mark_lesson_attended,
-                       tutor_set_lesson_attendance, tutor_reschedule_lesson_start, tutor_check_homework,
-                       tutor_manage_library, tutor_add_material_start, tutor_delete_material_start,
-                       tutor_delete_material_confirm, show_material_details, show_tutor_dashboard,
-                       show_tutor_stats, tutor_edit_name_start, tutor_set_homework_status, 
-                       tutor_add_payment_start, tutor_add_lesson_start,
-                       tutor_confirm_lesson_cancellation, tutor_library_by_grade,
-                       tutor_remove_second_parent, tutor_replace_second_parent,
-                       tutor_edit_lesson_start, tutor_edit_attendance_status, tutor_edit_mastery_status,
-                       tutor_edit_lesson_conduct_status, tutor_set_lesson_conduct,
-                       tutor_delete_lesson_start, tutor_confirm_delete_lesson,
-                       tutor_schedule_setup_start, tutor_schedule_toggle_day, tutor_schedule_back,
-                       tutor_parent_contact_start, tutor_message_student_start_wrapper, tutor_message_parent_start_wrapper,
-                       tutor_message_input, tutor_message_send_wrapper, tutor_message_cancel)
-    from .parent import (show_parent_dashboard, show_child_menu, show_child_progress,
-                        show_child_schedule, show_child_payments, parent_generate_chart,
-                        show_child_homework, show_child_lessons, show_child_achievements)
-    
-    # Карта для сопоставления префиксов callback_data с функциями
-    action_map = {
-        "main_menu": (show_main_menu, None),
-        "my_progress": (show_my_progress, None),
-        "schedule": (show_schedule, None),
-        "homework": (show_homework_menu, None),
-        "lessons_history": (show_lesson_history, None),
-        "payment_attendance": (show_payment_and_attendance, None),
-        "tutor_student_list": (show_student_list, None),
-        "tutor_view_student_": (show_student_profile, "student_id"),
-        "tutor_analytics_": (show_analytics_chart, "student_id"),
-        "tutor_delete_student_": (tutor_delete_student_start, "student_id"),
-        "tutor_delete_confirm_": (tutor_delete_student_confirm, "student_id"),
-        # tutor_add_parent_, tutor_add_payment_, tutor_add_lesson_ обрабатываются ConversationHandlers
-        "tutor_lessons_list_": (show_tutor_lessons, "student_id"),
-        "tutor_lesson_details_": (show_lesson_details, "lesson_id"),
-        "tutor_mark_attended_": (tutor_mark_lesson_attended, "lesson_id"),
-        "tutor_set_attendance_": (tutor_set_lesson_attendance, "lesson_id_status"),
-        "tutor_reschedule_lesson_": (tutor_reschedule_lesson_start, "lesson_id"),
-        "tutor_edit_lesson_": (tutor_edit_lesson_start, "lesson_id"),
-        "tutor_edit_attendance_": (tutor_edit_attendance_status, "lesson_id"),
-        "tutor_edit_lesson_conduct_": (tutor_edit_lesson_conduct_status, "lesson_id"),
-        "tutor_set_lesson_conduct_": (tutor_set_lesson_conduct, "lesson_id_status"),
-        "tutor_edit_mastery_": (tutor_edit_mastery_status, "lesson_id"),
-        "tutor_delete_lesson_": (tutor_delete_lesson_start, "lesson_id"),
-        "tutor_confirm_delete_lesson_": (tutor_confirm_delete_lesson, "lesson_id"),
-        "tutor_schedule_setup_": (tutor_schedule_setup_start, "student_id"),
-        "schedule_toggle_": (tutor_schedule_toggle_day, "day"),
-        "schedule_day_": (tutor_schedule_toggle_day, "day"),
-        # "schedule_note_" removed - now using simple toggle logic
-        "schedule_back": (tutor_schedule_back, None),
-        "tutor_parent_contact_": (tutor_parent_contact_start, "student_id"),
-        "tutor_reply_to_": (tutor_reply_handler, "user_id"),
-        "tutor_check_hw_": (tutor_check_homework, "lesson_id"),
-        "tutor_manage_library": (tutor_manage_library, None),
-        "tutor_add_material": (tutor_add_material_start, None),
-        "tutor_delete_material_start": (tutor_delete_material_start, None),
-        "tutor_delete_material_": (tutor_delete_material_confirm, "material_id"),
-        "view_material_": (show_material_details, "material_id"),
-        "parent_dashboard": (show_parent_dashboard, None),
-        "student_view_hw_": (student_view_homework, None),
-        "student_view_lesson_": (student_view_lesson_details, None),
-        "materials_library": (show_materials_library, None),
-        "student_achievements": (show_student_achievements, None),
-        "tutor_dashboard": (show_tutor_dashboard, None),
-        "tutor_stats": (show_tutor_stats, None),
-        # tutor_edit_name_ обрабатывается ConversationHandler
-        "tutor_set_hw_status_": (tutor_set_homework_status, "hw_id_status"),
-        "tutor_confirm_cancel_": (tutor_confirm_lesson_cancellation, "lesson_id_status"),
-        "tutor_view_material_": (show_material_details, "material_id"),
-        "student_view_material_": (show_material_details, "material_id"),
-        "tutor_library_grade_": (tutor_library_by_grade, "grade"),
-        "student_library_grade_": (student_library_by_grade, "grade"),
-        "student_settings": (student_settings_handler, None),
-        "select_child": (show_parent_dashboard, None),
-        "parent_child_": (show_child_menu, "child_id"),
-        "parent_progress_": (show_child_progress, "child_id"),
-        "parent_schedule_": (show_child_schedule, "child_id"), 
-        "parent_payments_": (show_child_payments, "child_id"),
-        "parent_chat_with_tutor_": (chat_with_tutor_start, None),
-        "parent_homework_": (show_child_homework, None),
-        "parent_lessons_": (show_child_lessons, None),
-        "parent_achievements_": (show_child_achievements, None),
-        "parent_chart_": (parent_generate_chart, None),
-        "tutor_remove_second_parent_": (tutor_remove_second_parent, "student_id"),
-        "tutor_replace_second_parent_": (tutor_replace_second_parent, "student_id"),
-        "noop": (lambda update, context: update.callback_query.answer(), None),
-    }
-    
-    # Попробуем найти подходящий обработчик
-    handler_found = False
-    for prefix, (handler, param_name) in action_map.items():
-        if data == prefix or data.startswith(prefix):
-            handler_found = True
-            print(f"DEBUG: Found handler for '{data}': {handler.__name__ if hasattr(handler, '__name__') else handler}")
-            try:
-                if param_name is None:
-                    # Вызываем без параметров
-                    await handler(update, context)
-                elif param_name == "student_id":
-                    student_id = int(data.split("_")[-1])
-                    await handler(update, context, student_id)
-                elif param_name == "child_id":
-                    child_id = int(data.split("_")[-1])
-                    await handler(update, context, child_id)
-                elif param_name == "lesson_id":
-                    lesson_id = int(data.split("_")[-1])
-                    await handler(update, context, lesson_id)
-                elif param_name == "material_id":
-                    material_id = int(data.split("_")[-1])
-                    await handler(update, context, material_id)
-                elif param_name == "lesson_id_status":
-                    # Для установки посещаемости урока или статуса проведения
-                    if data.startswith("tutor_set_attendance_"):
-                        lesson_id_status = "_".join(data.split("_")[3:])  # Убираем префикс "tutor_set_attendance_"
-                    elif data.startswith("tutor_set_lesson_conduct_"):
-                        lesson_id_status = "_".join(data.split("_")[4:])  # Убираем префикс "tutor_set_lesson_conduct_"
-                    else:
-                        lesson_id_status = "_".join(data.split("_")[3:])  # Дефолт для других случаев
-                    await handler(update, context, lesson_id_status)
-                elif param_name == "hw_id_status":
-                    # Для установки статуса домашнего задания
-                    hw_id_status = "_".join(data.split("_")[4:])  # Убираем префикс "tutor_set_hw_status_"
-                    await handler(update, context, hw_id_status)
-                elif param_name == "lesson_id_mastery":
-                    # Для установки уровня усвоения урока
-                    lesson_id_mastery = "_".join(data.split("_")[3:])  # Убираем префикс "tutor_set_mastery_"
-                    await handler(update, context, lesson_id_mastery)
-                elif param_name == "grade":
-                    # Для выбора класса в библиотеке
-                    grade = data.split("_")[-1]  # Последняя часть после последнего "_"
-                    await handler(update, context, grade)
-                elif param_name == "day":
-                    # Для выбора дня в расписании
-                    day = data.split("_")[-1]  # Последняя часть после последнего "_"
-                    await handler(update, context, day)
-                elif param_name == "time":
-                    # Для выбора времени в расписании
-                    time = data.split("_")[-1]  # Последняя часть после последнего "_"
-                    await handler(update, context, time)
-                elif param_name == "parent_id_student_id":
-                    # Для сообщений родителю (формат: tutor_message_parent_<parent_id>_<student_id>)
-                    parts = data.split("_")
-                    if len(parts) >= 4:
-                        parent_id_student_id = "_".join(parts[3:])  # parent_id_student_id
-                        await handler(update, context, parent_id_student_id)
-                    else:
-                        await handler(update, context, data)
-                elif param_name == "user_id":
-                    # Для быстрого ответа пользователю
-                    user_id = data.split("_")[-1]  # Последняя часть после последнего "_"
-                    await handler(update, context, user_id)
-                else:
-                    await handler(update, context)
-                    
-            except Exception as e:
-                print(f"ERROR: Handler {handler.__name__} failed for data '{data}': {e}")
-                await query.edit_message_text(f"❌ Ошибка обработки команды")
-            break
-    
-    if not handler_found:
+    route = callback_router.resolve(data)
+    if route is None:
         print(f"WARNING: No handler found for callback_data '{data}'")
-        await query.edit_message_text("🔄 Функция в разработке")
\ No newline at end of file
+        await query.edit_message_text("🔄 Функция в разработке")
+        return
+
+    try:
+        await callback_router.dispatch(route, update, context, data)
+    except Exception as e:
+        print(f"ERROR: Handler {route.handler.__name__} failed for data '{data}': {e}")
+        await query.edit_message_text(f"❌ Ошибка обработки команды")
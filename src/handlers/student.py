@@ -8,15 +8,17 @@ from sqlalchemy.orm import joinedload
 
 from ..database import (
     SessionLocal, User, UserRole, Lesson, Homework, Payment, Achievement,
-    get_user_by_telegram_id, get_lesson_by_id, get_homework_by_id,
+    get_lesson_by_id, get_homework_by_id,
     get_student_balance, get_student_achievements, HomeworkStatus, TopicMastery, AttendanceStatus
 )
+from ..async_database import get_identity_async, get_user_by_telegram_id_async
 from ..keyboards import (
     student_select_homework_keyboard, student_lesson_list_keyboard,
     student_lesson_details_keyboard, student_materials_list_keyboard
 )
-from ..chart_generator import generate_progress_chart
+from ..chart_generator import render_progress_chart, send_progress_chart
 from .common import check_user_role
+from .router import callback_route, last_str
 
 # --- Состояния для ConversationHandler ---
 SUBMIT_HOMEWORK_FILE = range(1)
@@ -41,14 +43,15 @@ ATTENDANCE_STATUS_RU = {
     AttendanceStatus.RESCHEDULED: "Перенесен",
 }
 
+@callback_route("homework")
 async def show_homework_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard)
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
     
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     db = SessionLocal()
     
     # Загружаем ВСЕ домашние задания для студента с предзагрузкой lesson
@@ -169,6 +172,7 @@ async def student_get_homework_submission(update: Update, context: ContextTypes.
     
     return ConversationHandler.END
 
+@callback_route("student_view_hw_")
 async def student_view_homework(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -240,14 +244,16 @@ async def student_view_homework(update: Update, context: ContextTypes.DEFAULT_TY
             except Exception:
                 pass  # Игнорируем ошибки отправки фото
 
+@callback_route("my_progress")
 async def show_my_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard) 
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
     
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    # Нужны актуальные баллы, поэтому читаем пользователя целиком, а не из кэша идентичности
+    user = await get_user_by_telegram_id_async(update.effective_user.id)
     
     # Отправляем сообщение о генерации графика
     if query:
@@ -257,28 +263,26 @@ async def show_my_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
         progress_msg = await update.message.reply_text("📊 Генерируем график прогресса...")
     
     # Генерируем график
-    chart_path = generate_progress_chart(user.id)
+    chart_path = await render_progress_chart(user.id)
     
     if chart_path:
         try:
-            with open(chart_path, 'rb') as chart_file:
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Назад в главное меню", callback_data="main_menu")]
-                ])
-                
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=chart_file,
-                    caption=f"📊 *Ваш прогресс*\n\nТекущие баллы: *{user.points}*",
-                    reply_markup=keyboard,
-                    parse_mode='Markdown'
-                )
-                
-                # Удаляем сообщение о генерации
-                if query:
-                    await query.message.delete()
-                else:
-                    await progress_msg.delete()
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("⬅️ Назад в главное меню", callback_data="main_menu")]
+            ])
+            
+            await send_progress_chart(
+                context.bot, update.effective_chat.id, chart_path,
+                caption=f"📊 *Ваш прогресс*\n\nТекущие баллы: *{user.points}*",
+                reply_markup=keyboard,
+                parse_mode='Markdown'
+            )
+            
+            # Удаляем сообщение о генерации
+            if query:
+                await query.message.delete()
+            else:
+                await progress_msg.delete()
         except Exception as e:
             error_message = "❌ Не удалось сгенерировать график прогресса."
             keyboard = InlineKeyboardMarkup([
@@ -300,14 +304,15 @@ async def show_my_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await progress_msg.edit_text(error_message, reply_markup=keyboard)
 
+@callback_route("schedule")
 async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard)
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
     
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     
     db = SessionLocal()
     
@@ -359,9 +364,10 @@ async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("materials_library")
 async def show_materials_library(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard)
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
         
@@ -377,9 +383,10 @@ async def show_materials_library(update: Update, context: ContextTypes.DEFAULT_T
     else:
         await update.message.reply_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("student_library_grade_", parse=last_str)
 async def student_library_by_grade(update: Update, context: ContextTypes.DEFAULT_TYPE, grade=None):
     """Показывает материалы для определённого класса или все материалы для студента."""
-    if not check_user_role(update, UserRole.STUDENT):
+    if not await check_user_role(update, UserRole.STUDENT):
         await update.callback_query.answer("У вас нет доступа к этой функции.")
         return
         
@@ -401,14 +408,15 @@ async def student_library_by_grade(update: Update, context: ContextTypes.DEFAULT
     keyboard = student_materials_list_keyboard(materials, grade)
     await update.callback_query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("lessons_history")
 async def show_lesson_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard)
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
     
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     
     db = SessionLocal()
     lessons = db.query(Lesson).filter(
@@ -431,6 +439,7 @@ async def show_lesson_history(update: Update, context: ContextTypes.DEFAULT_TYPE
     else:
         await update.message.reply_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("student_view_lesson_")
 async def student_view_lesson_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -463,14 +472,15 @@ async def student_view_lesson_details(update: Update, context: ContextTypes.DEFA
     keyboard = student_lesson_details_keyboard(lesson)
     await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("student_achievements")
 async def show_student_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard)
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
     
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     
     achievements = get_student_achievements(user.id)
     
@@ -495,14 +505,15 @@ async def show_student_achievements(update: Update, context: ContextTypes.DEFAUL
     else:
         await update.message.reply_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("payment_attendance")
 async def show_payment_and_attendance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем роль пользователя для text-сообщений (reply keyboard)
-    if update.message and not check_user_role(update, UserRole.STUDENT):
+    if update.message and not await check_user_role(update, UserRole.STUDENT):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
     
     query = update.callback_query
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     
     balance = get_student_balance(user.id)
     
@@ -19,15 +19,17 @@ from sqlalchemy.orm import joinedload
 
 from ..database import (
     SessionLocal, User, UserRole, Lesson, Homework, Payment, Material, Achievement, WeeklySchedule,
-    get_user_by_telegram_id, get_all_students, get_user_by_id,
+    get_all_students, get_user_by_id,
     get_lesson_by_id, get_homework_by_id,
     get_lessons_for_student_by_month, get_payments_for_student_by_month,
     get_all_materials, get_material_by_id, delete_material_by_id,
-    get_dashboard_stats, HomeworkStatus, TopicMastery, AttendanceStatus, LessonStatus, get_student_balance,
+    get_dashboard_stats_for_months, HomeworkStatus, TopicMastery, AttendanceStatus, LessonStatus, get_student_balance,
     get_student_achievements, award_achievement, update_study_streak, check_points_achievements,
-    shift_lessons_after_cancellation, get_weekly_schedule, get_schedule_days_text, toggle_schedule_day,
+    shift_lessons_after_cancellation, create_lessons_by_days, DEFAULT_SCHEDULE_WEEKS, get_weekly_schedule, get_schedule_days_text, toggle_schedule_day,
     update_day_note, get_day_note, toggle_lesson_plan, is_lesson_planned, get_planned_lessons_text
 )
+from ..async_database import get_identity_async
+from ..identity_cache import identity_cache
 from ..keyboards import (
     tutor_main_keyboard, tutor_student_list_keyboard, tutor_student_profile_keyboard,
     tutor_lesson_list_keyboard, tutor_lesson_details_keyboard, tutor_cancel_confirmation_keyboard,
@@ -38,8 +40,9 @@ from ..keyboards import (
     second_parent_choice_keyboard, existing_second_parents_keyboard,
     tutor_delete_lesson_keyboard, tutor_schedule_setup_keyboard, tutor_schedule_time_keyboard, tutor_schedule_confirm_keyboard
 )
-from ..chart_generator import generate_progress_chart
+from ..chart_generator import render_progress_chart, send_progress_chart
 from .common import show_main_menu
+from .router import callback_route, last_int, last_str, suffix
 
 # --- Словари для перевода статусов ---
 TOPIC_MASTERY_RU = {
@@ -114,9 +117,9 @@ def generate_access_code(length=8):
     import string
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
-def check_user_role(update: Update, required_role: UserRole) -> bool:
+async def check_user_role(update: Update, required_role: UserRole) -> bool:
     """Проверяет роль пользователя."""
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     return user and user.role == required_role
 
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -129,10 +132,13 @@ async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE
         await show_lesson_details(update, context, lesson_id)
     return ConversationHandler.END
 
+@callback_route("view_material_", parse=last_int)
+@callback_route("tutor_view_material_", parse=last_int)
+@callback_route("student_view_material_", parse=last_int)
 async def show_material_details(update: Update, context: ContextTypes.DEFAULT_TYPE, material_id: int):
     """Показывает детали материала (доступно и репетитору, и ученику)."""
     query = update.callback_query
-    user = get_user_by_telegram_id(query.from_user.id)
+    user = await get_identity_async(query.from_user.id)
     material = get_material_by_id(material_id)
     
     text = (f"*{material.title}*\n\n"
@@ -149,9 +155,10 @@ async def show_material_details(update: Update, context: ContextTypes.DEFAULT_TY
     await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown', disable_web_page_preview=True)
 
 # --- Student Management ---
+@callback_route("tutor_student_list")
 async def show_student_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает список всех учеников репетитора."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
         
@@ -164,6 +171,7 @@ async def show_student_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(message, reply_markup=keyboard)
 
+@callback_route("tutor_view_student_", parse=last_int)
 async def show_student_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Показывает профиль конкретного ученика."""
     print(f"DEBUG: show_student_profile called with student_id={student_id}")
@@ -208,7 +216,7 @@ async def show_student_profile(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def tutor_add_student_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает процесс добавления нового ученика."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         message = "У вас нет доступа к этой функции."
         if update.callback_query:
             await update.callback_query.answer()
@@ -293,6 +301,7 @@ async def tutor_get_new_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if student:
         student.full_name = new_name
         db.commit()
+        identity_cache.invalidate_users(student.id)
         await update.message.reply_text(f"✅ ФИО ученика обновлено.")
     db.close()
     context.user_data.clear()
@@ -416,8 +425,10 @@ async def tutor_select_existing_parent(update: Update, context: ContextTypes.DEF
         student_name = student.full_name
         
         # Привязываем родителя к ученику
+        previous_parent_id = student.parent_id
         student.parent_id = parent_id
         db.commit()
+        identity_cache.invalidate_users(student.id, previous_parent_id, parent_id)
         
         await query.edit_message_text(
             f"✅ Ученик *{student_name}* успешно привязан к родителю *{parent_name}*!\n\n"
@@ -563,8 +574,10 @@ async def tutor_select_existing_second_parent(update: Update, context: ContextTy
         student_name = student.full_name
         
         # Привязываем родителя как второго к ученику
+        previous_parent_id = student.second_parent_id
         student.second_parent_id = parent_id
         db.commit()
+        identity_cache.invalidate_users(student.id, previous_parent_id, parent_id)
         
         await query.edit_message_text(
             f"✅ Ученик *{student_name}* теперь имеет второго родителя *{parent_name}*!\n\n"
@@ -607,8 +620,10 @@ async def tutor_get_second_parent_name(update: Update, context: ContextTypes.DEF
     db.flush()  # Получаем ID родителя
     
     # Привязываем как второго родителя
+    previous_parent_id = student.second_parent_id
     student.second_parent_id = new_parent.id
     db.commit()
+    identity_cache.invalidate_users(student.id, previous_parent_id)
     db.close()
     
     await update.message.reply_text(
@@ -622,6 +637,7 @@ async def tutor_get_second_parent_name(update: Update, context: ContextTypes.DEF
     return ConversationHandler.END
 
 # --- Функции управления вторым родителем ---
+@callback_route("tutor_remove_second_parent_", parse=last_int)
 async def tutor_remove_second_parent(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Удаляет второго родителя у ученика."""
     query = update.callback_query
@@ -643,8 +659,10 @@ async def tutor_remove_second_parent(update: Update, context: ContextTypes.DEFAU
         second_parent_name = second_parent.full_name if second_parent else "Неизвестный"
         
         # Удаляем связь
+        previous_parent_id = student.second_parent_id
         student.second_parent_id = None
         db.commit()
+        identity_cache.invalidate_users(student.id, previous_parent_id)
         
         await query.edit_message_text(
             f"✅ Второй родитель *{second_parent_name}* успешно отвязан от ученика *{student.full_name}*.",
@@ -662,6 +680,7 @@ async def tutor_remove_second_parent(update: Update, context: ContextTypes.DEFAU
     finally:
         db.close()
 
+@callback_route("tutor_replace_second_parent_", parse=last_int)
 async def tutor_replace_second_parent(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Начинает процесс замены второго родителя."""
     query = update.callback_query
@@ -723,8 +742,10 @@ async def tutor_get_parent_name(update: Update, context: ContextTypes.DEFAULT_TY
     db.flush()  # Получаем ID родителя
     
     # Привязываем родителя к ученику
+    previous_parent_id = student.parent_id
     student.parent_id = parent.id
     db.commit()
+    identity_cache.invalidate_users(student.id, previous_parent_id)
     
     message = (f"✅ Родитель добавлен к ученику!\n\n"
                f"👨‍👩‍👧‍👦 Родитель: *{parent.full_name}*\n"
@@ -738,6 +759,7 @@ async def tutor_get_parent_name(update: Update, context: ContextTypes.DEFAULT_TY
     context.user_data.clear()
     return ConversationHandler.END
 
+@callback_route("tutor_delete_student_", parse=last_int)
 async def tutor_delete_student_start(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Запрашивает подтверждение на удаление ученика."""
     query = update.callback_query
@@ -755,6 +777,7 @@ async def tutor_delete_student_start(update: Update, context: ContextTypes.DEFAU
         parse_mode='Markdown'
     )
 
+@callback_route("tutor_delete_confirm_", parse=last_int)
 async def tutor_delete_student_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Окончательно удаляет ученика после подтверждения."""
     query = update.callback_query
@@ -768,9 +791,11 @@ async def tutor_delete_student_confirm(update: Update, context: ContextTypes.DEF
 
         if student:
             name = student.full_name
+            related_user_ids = (student.id, student.parent_id, student.second_parent_id)
             # SQLAlchemy благодаря cascade="all, delete-orphan" сам удалит связанные записи
             db.delete(student)
             db.commit()
+            identity_cache.invalidate_users(*related_user_ids)
             await query.edit_message_text(f"✅ Ученик *{name}* и все его данные были успешно удалены.", parse_mode='Markdown')
         else:
             await query.edit_message_text("❌ Не удалось найти ученика для удаления.")
@@ -784,6 +809,7 @@ async def tutor_delete_student_confirm(update: Update, context: ContextTypes.DEF
     await show_student_list(update, context)
 
 # --- Lesson Management ---
+@callback_route("tutor_lessons_list_", parse=last_int)
 async def show_tutor_lessons(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Показывает список уроков конкретного ученика."""
     student = get_user_by_id(student_id)
@@ -793,6 +819,7 @@ async def show_tutor_lessons(update: Update, context: ContextTypes.DEFAULT_TYPE,
     keyboard = tutor_lesson_list_keyboard(lessons, student_id)
     await update.callback_query.edit_message_text(f"Уроки ученика {student.full_name}:", reply_markup=keyboard)
 
+@callback_route("tutor_lesson_details_", parse=last_int)
 async def show_lesson_details(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id: int):
     """Показывает детали конкретного урока."""
     db = SessionLocal()
@@ -873,6 +900,7 @@ async def tutor_get_lesson_skills(update: Update, context: ContextTypes.DEFAULT_
     context.user_data.clear()
     return ConversationHandler.END
 
+@callback_route("tutor_edit_lesson_", parse=last_int)
 async def tutor_edit_lesson_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню выбора типа статуса для изменения."""
     query = update.callback_query
@@ -886,6 +914,7 @@ async def tutor_edit_lesson_start(update: Update, context: ContextTypes.DEFAULT_
     )
     return EDIT_LESSON_STATUS
 
+@callback_route("tutor_edit_attendance_", parse=last_int)
 async def tutor_edit_attendance_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню для изменения статуса посещаемости урока."""
     query = update.callback_query
@@ -914,6 +943,7 @@ async def tutor_edit_attendance_status(update: Update, context: ContextTypes.DEF
     
     return EDIT_LESSON_STATUS
 
+@callback_route("tutor_edit_mastery_", parse=last_int)
 async def tutor_edit_mastery_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню для изменения уровня усвоения темы."""
     query = update.callback_query
@@ -927,6 +957,7 @@ async def tutor_edit_mastery_status(update: Update, context: ContextTypes.DEFAUL
     )
     return EDIT_LESSON_STATUS
 
+@callback_route("tutor_edit_lesson_conduct_", parse=last_int)
 async def tutor_edit_lesson_conduct_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню для изменения статуса проведения урока."""
     query = update.callback_query
@@ -960,6 +991,7 @@ async def tutor_edit_lesson_conduct_status(update: Update, context: ContextTypes
     
     return EDIT_LESSON_STATUS
 
+@callback_route("tutor_set_lesson_conduct_", parse=suffix)
 async def tutor_set_lesson_conduct(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id_status: str):
     """Устанавливает статус проведения урока."""
     query = update.callback_query
@@ -1062,6 +1094,7 @@ async def tutor_edit_lesson_get_comment(update: Update, context: ContextTypes.DE
     await show_lesson_details(update, context, lesson_id)
     return ConversationHandler.END
 
+@callback_route("tutor_mark_attended_", parse=last_int)
 async def tutor_mark_lesson_attended(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id: int):
     """Отмечает урок как посещенный (legacy функция)."""
     db = SessionLocal()
@@ -1099,6 +1132,7 @@ async def tutor_mark_lesson_attended(update: Update, context: ContextTypes.DEFAU
     await show_lesson_details(update, context, lesson_id)
     db.close()
 
+@callback_route("tutor_set_attendance_", parse=suffix)
 async def tutor_set_lesson_attendance(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id_status: str):
     """Устанавливает статус посещаемости урока."""
     try:
@@ -1191,6 +1225,7 @@ async def tutor_set_lesson_attendance(update: Update, context: ContextTypes.DEFA
         await update.callback_query.answer("Ошибка при изменении статуса")
         print(f"Ошибка в tutor_set_lesson_attendance: {e}")
 
+@callback_route("tutor_reschedule_lesson_", parse=last_int)
 async def tutor_reschedule_lesson_start(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id: int):
     """Начинает процесс переноса урока."""
     query = update.callback_query
@@ -1380,6 +1415,7 @@ async def tutor_finalize_homework(update: Update, context: ContextTypes.DEFAULT_
     context.user_data.clear()
     return ConversationHandler.END
 
+@callback_route("tutor_check_hw_", parse=last_int)
 async def tutor_check_homework(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id: int):
     """Показывает домашнее задание для проверки."""
     db = SessionLocal()
@@ -1443,6 +1479,7 @@ async def tutor_check_homework(update: Update, context: ContextTypes.DEFAULT_TYP
         except:
             pass
 
+@callback_route("tutor_set_hw_status_", parse=suffix)
 async def tutor_set_homework_status(update: Update, context: ContextTypes.DEFAULT_TYPE, hw_id: int, status_value: str):
     """Устанавливает статус домашнего задания."""
     db = SessionLocal()
@@ -1549,20 +1586,21 @@ async def show_student_profile_after_update(update: Update, context: ContextType
     return ConversationHandler.END
 
 # --- Analytics and Reports ---
+DASHBOARD_HISTORY_MONTHS = 3  # Текущий месяц и два предыдущих
+
+@callback_route("tutor_analytics_", parse=last_int)
 async def show_analytics_chart(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Генерирует и отправляет график прогресса ученика."""
     query = update.callback_query
     await query.answer("Генерирую график, это может занять несколько секунд...")
 
-    chart_path = generate_progress_chart(student_id)
+    chart_path = await render_progress_chart(student_id)
 
     if chart_path and os.path.exists(chart_path):
-        await context.bot.send_photo(
-            chat_id=query.from_user.id,
-            photo=open(chart_path, 'rb'),
+        await send_progress_chart(
+            context.bot, query.from_user.id, chart_path,
             caption="График прогресса ученика."
         )
-        os.remove(chart_path)
     else:
         await context.bot.send_message(
             chat_id=query.from_user.id,
@@ -1571,14 +1609,23 @@ async def show_analytics_chart(update: Update, context: ContextTypes.DEFAULT_TYP
     
     await show_student_profile(update, context, student_id)
 
+@callback_route("tutor_dashboard")
 async def show_tutor_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает панель статистики для репетитора."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
         
-    stats = get_dashboard_stats()
-    month_name = tz_now().strftime("%B")
+    # Текущий и предыдущие месяцы считаются одним запросом
+    now = tz_now()
+    months = []
+    year, month = now.year, now.month
+    for _ in range(DASHBOARD_HISTORY_MONTHS):
+        months.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    stats_by_month = await asyncio.to_thread(get_dashboard_stats_for_months, months)
+    stats = stats_by_month[months[0]]
+    month_name = now.strftime("%B")
     
     text = (
         f"📈 *Статистика за {month_name}*\n\n"
@@ -1587,17 +1634,24 @@ async def show_tutor_dashboard(update: Update, context: ContextTypes.DEFAULT_TYP
         f"✅ *Проверено ДЗ:* {stats['checked_hw_this_month']}\n"
         f"💰 *Оплачено уроков:* {stats['payments_sum_this_month']}"
     )
+    if len(months) > 1:
+        text += "\n\n*Предыдущие месяцы* (уроки / ДЗ / оплачено):"
+        for year, month in months[1:]:
+            past = stats_by_month[(year, month)]
+            text += (f"\n{month:02d}.{year}: {past['lessons_this_month']} / "
+                     f"{past['checked_hw_this_month']} / {past['payments_sum_this_month']}")
     
     await update.message.reply_text(text, parse_mode='Markdown')
 
 # Alias for compatibility
+@callback_route("tutor_stats")
 async def show_tutor_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Алиас для show_tutor_dashboard."""
     await show_tutor_dashboard(update, context)
 
 async def report_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает процесс создания отчета."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return ConversationHandler.END
         
@@ -1670,9 +1724,10 @@ async def report_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 # --- Material Library Management ---
+@callback_route("tutor_manage_library")
 async def tutor_manage_library(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает выбор класса для библиотеки материалов."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return
         
@@ -1686,9 +1741,10 @@ async def tutor_manage_library(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await update.message.reply_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("tutor_library_grade_", parse=last_str)
 async def tutor_library_by_grade(update: Update, context: ContextTypes.DEFAULT_TYPE, grade=None):
     """Показывает материалы для определённого класса или все материалы."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         await update.callback_query.answer("У вас нет доступа к этой функции.")
         return
         
@@ -1709,6 +1765,7 @@ async def tutor_library_by_grade(update: Update, context: ContextTypes.DEFAULT_T
     keyboard = tutor_library_management_keyboard(materials, grade)
     await update.callback_query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
+@callback_route("tutor_add_material")
 async def tutor_add_material_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает процесс добавления материала."""
     from ..keyboards import grade_selection_keyboard_for_add_material
@@ -1768,6 +1825,7 @@ async def tutor_get_material_description(update: Update, context: ContextTypes.D
     context.user_data.clear()
     return ConversationHandler.END
 
+@callback_route("tutor_delete_material_start")
 async def tutor_delete_material_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает список материалов для удаления."""
     materials = get_all_materials()
@@ -1777,6 +1835,7 @@ async def tutor_delete_material_start(update: Update, context: ContextTypes.DEFA
     keyboard = tutor_select_material_to_delete_keyboard(materials)
     await update.callback_query.edit_message_text("Выберите материал для удаления:", reply_markup=keyboard)
 
+@callback_route("tutor_delete_material_", parse=last_int)
 async def tutor_delete_material_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, material_id: int):
     """Удаляет выбранный материал."""
     delete_material_by_id(material_id)
@@ -1786,7 +1845,7 @@ async def tutor_delete_material_confirm(update: Update, context: ContextTypes.DE
 # --- Broadcast System ---
 async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начинает диалог создания рассылки."""
-    if not check_user_role(update, UserRole.TUTOR):
+    if not await check_user_role(update, UserRole.TUTOR):
         await update.message.reply_text("У вас нет доступа к этой функции.")
         return ConversationHandler.END
 
@@ -1880,7 +1939,7 @@ async def handle_tutor_reply(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     # Проверяем, что отвечающий - репетитор
-    user = get_user_by_telegram_id(update.effective_user.id)
+    user = await get_identity_async(update.effective_user.id)
     if not user or user.role != UserRole.TUTOR:
         return
 
@@ -1937,6 +1996,7 @@ async def handle_tutor_reply(update: Update, context: ContextTypes.DEFAULT_TYPE)
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка при отправке ответа: {e}")
         return
+@callback_route("tutor_confirm_cancel_", parse=suffix)
 async def tutor_confirm_lesson_cancellation(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id_status: str):
     """Показывает подтверждение перед отменой урока с предупреждением о сдвиге тем."""
     try:
@@ -1991,6 +2051,7 @@ async def tutor_confirm_lesson_cancellation(update: Update, context: ContextType
         db.close()
 
 # --- Lesson Deletion ---
+@callback_route("tutor_delete_lesson_", parse=last_int)
 async def tutor_delete_lesson_start(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id: int):
     """Запрашивает подтверждение удаления урока."""
     query = update.callback_query
@@ -2012,6 +2073,7 @@ async def tutor_delete_lesson_start(update: Update, context: ContextTypes.DEFAUL
     finally:
         db.close()
 
+@callback_route("tutor_confirm_delete_lesson_", parse=last_int)
 async def tutor_confirm_delete_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE, lesson_id: int):
     """Окончательно удаляет урок."""
     query = update.callback_query
@@ -2043,6 +2105,7 @@ async def tutor_confirm_delete_lesson(update: Update, context: ContextTypes.DEFA
         db.close()
 
 # --- Schedule System ---
+@callback_route("tutor_schedule_setup_", parse=last_int)
 async def tutor_schedule_setup_start(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Показывает шаблон расписания для ученика с возможностью редактирования."""
     print(f"DEBUG: tutor_schedule_setup_start called with student_id={student_id}")
@@ -2050,7 +2113,7 @@ async def tutor_schedule_setup_start(update: Update, context: ContextTypes.DEFAU
     db = SessionLocal()
     try:
         student = db.query(User).filter(User.id == student_id).first()
-        tutor = get_user_by_telegram_id(update.effective_user.id)
+        tutor = await get_identity_async(update.effective_user.id)
 
         if not student or not tutor:
             await query.edit_message_text("Ученик или репетитор не найден.")
@@ -2072,6 +2135,8 @@ async def tutor_schedule_setup_start(update: Update, context: ContextTypes.DEFAU
     finally:
         db.close()
 
+@callback_route("schedule_toggle_", parse=last_str)
+@callback_route("schedule_day_", parse=last_str)
 async def tutor_schedule_toggle_day(update: Update, context: ContextTypes.DEFAULT_TYPE, day: str):
     """Переключает запланированный урок на день недели."""
     query = update.callback_query
@@ -2083,7 +2148,7 @@ async def tutor_schedule_toggle_day(update: Update, context: ContextTypes.DEFAUL
 
     db = SessionLocal()
     try:
-        tutor = get_user_by_telegram_id(update.effective_user.id)
+        tutor = await get_identity_async(update.effective_user.id)
         student = db.query(User).filter(User.id == student_id).first()
 
         if not tutor or not student:
@@ -2126,6 +2191,7 @@ async def tutor_schedule_toggle_day(update: Update, context: ContextTypes.DEFAUL
     finally:
         db.close()
 
+@callback_route("schedule_back")
 async def tutor_schedule_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возвращает к просмотру ученика."""
     query = update.callback_query
@@ -2166,7 +2232,7 @@ async def tutor_schedule_select_time(update: Update, context: ContextTypes.DEFAU
         f"📅 Подтверждение расписания:\n\n"
         f"🗓️ Дни: {days_text}\n"
         f"🕐 Время: {time}\n\n"
-        f"Будут созданы уроки на ближайшие 4 недели.\n"
+        f"Будут созданы уроки на ближайшие {DEFAULT_SCHEDULE_WEEKS} нед.\n"
         f"Темы уроков нужно будет добавить отдельно.",
         reply_markup=tutor_schedule_confirm_keyboard(student_id)
     )
@@ -2182,71 +2248,16 @@ async def tutor_schedule_create_lessons(update: Update, context: ContextTypes.DE
         await query.edit_message_text("❌ Ошибка: данные расписания не найдены.")
         return
     
-    db = SessionLocal()
+    weeks = DEFAULT_SCHEDULE_WEEKS
     try:
-        from datetime import datetime, timedelta
-        from ..timezone_utils import now as tz_now
-        
-        # Мапинг дней недели
-        weekday_map = {
-            'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-            'friday': 4, 'saturday': 5, 'sunday': 6
-        }
-        
-        created_lessons = 0
-        current_date = tz_now().date()
-
-        # Создаем уроки на 4 недели вперед
-        for week in range(4):
-            week_start = current_date + timedelta(weeks=week)
-
-            for day_key in selected_days:
-                weekday_num = weekday_map[day_key]
-
-                # Находим дату этого дня недели
-                days_ahead = weekday_num - week_start.weekday()
-                if days_ahead < 0:
-                    days_ahead += 7
-
-                lesson_date = week_start + timedelta(days=days_ahead)
+        lesson_time = datetime.strptime(schedule_time, '%H:%M').time()
+        created = await asyncio.to_thread(create_lessons_by_days, {student_id: selected_days}, lesson_time, weeks)
+        created_lessons = created[student_id]
 
-                # Создаем datetime с выбранным временем
-                time_parts = schedule_time.split(':')
-                lesson_datetime = datetime.combine(
-                    lesson_date,
-                    datetime.strptime(schedule_time, '%H:%M').time()
-                )
-
-                # Проверяем, что урок не в прошлом времени
-                current_datetime = tz_now().replace(tzinfo=None)
-                if lesson_datetime <= current_datetime:
-                    continue
-                
-                # Проверяем, нет ли уже урока в это время
-                existing_lesson = db.query(Lesson).filter(
-                    Lesson.student_id == student_id,
-                    Lesson.date == lesson_datetime
-                ).first()
-                
-                if not existing_lesson:
-                    new_lesson = Lesson(
-                        student_id=student_id,
-                        topic="Урок (тема не указана)",
-                        date=lesson_datetime,
-                        skills_developed="",
-                        mastery_level=TopicMastery.NOT_LEARNED,
-                        attendance_status=AttendanceStatus.SCHEDULED,
-                        lesson_status=LessonStatus.NOT_CONDUCTED
-                    )
-                    db.add(new_lesson)
-                    created_lessons += 1
-        
-        db.commit()
-        
         await query.edit_message_text(
             f"✅ Расписание создано!\n\n"
             f"📝 Создано уроков: {created_lessons}\n"
-            f"📅 На период: 4 недели\n\n"
+            f"📅 На период: {weeks} нед.\n\n"
             f"Не забудьте указать темы для каждого урока в разделе 'Уроки ученика'."
         )
         
@@ -2254,10 +2265,7 @@ async def tutor_schedule_create_lessons(update: Update, context: ContextTypes.DE
         context.user_data.clear()
         
     except Exception as e:
-        db.rollback()
         await query.edit_message_text(f"❌ Ошибка при создании расписания: {e}")
-    finally:
-        db.close()
 
 async def tutor_schedule_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отменяет настройку расписания."""
@@ -2337,6 +2345,7 @@ async def tutor_message_student_start(update: Update, context: ContextTypes.DEFA
     finally:
         db.close()
 
+@callback_route("tutor_parent_contact_", parse=last_int)
 async def tutor_parent_contact_start(update: Update, context: ContextTypes.DEFAULT_TYPE, student_id: int):
     """Показывает список родителей ученика для связи."""
     query = update.callback_query
@@ -2495,7 +2504,7 @@ async def tutor_message_send(update: Update, context: ContextTypes.DEFAULT_TYPE,
         message_content = context.user_data.get('message_content')
         message_type = context.user_data.get('message_type')
         message_caption = context.user_data.get('message_caption', '')
-        sender = get_user_by_telegram_id(update.effective_user.id)
+        sender = await get_identity_async(update.effective_user.id)
         sender_name = sender.full_name if sender else "Репетитор"
         
         header = f"📨 Сообщение от репетитора {sender_name}:\n\n"
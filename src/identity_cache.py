@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш идентичности пользователей бота по telegram_id.
+Хранит только то, что нужно для проверки роли и связей (id, роль, имя, родители, дети),
+чтобы не ходить в БД на каждом обновлении. Записи живут не дольше TTL и вытесняются по LRU;
+пути, которые меняют пользователей, сбрасывают записи явно через invalidate_*.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .database import UserRole
+
+
+@dataclass(frozen=True)
+class Identity:
+    id: int
+    telegram_id: int
+    role: UserRole
+    full_name: str
+    parent_ids: Tuple[int, ...] = ()
+    child_ids: Tuple[int, ...] = ()
+
+
+class IdentityCache:
+    """TTL + LRU кэш Identity, ключ — telegram_id."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Identity]]" = OrderedDict()
+        self._telegram_by_user_id = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id: int) -> Optional[Identity]:
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(telegram_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, identity: Identity):
+        with self._lock:
+            self._drop(identity.telegram_id)
+            self._entries[identity.telegram_id] = (time.monotonic() + self.ttl, identity)
+            self._telegram_by_user_id[identity.id] = identity.telegram_id
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, telegram_id: int):
+        with self._lock:
+            self._drop(telegram_id)
+
+    def invalidate_users(self, *user_ids):
+        """Сбрасывает записи по id пользователей (None игнорируются)."""
+        with self._lock:
+            for user_id in user_ids:
+                telegram_id = self._telegram_by_user_id.get(user_id)
+                if telegram_id is not None:
+                    self._drop(telegram_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._telegram_by_user_id.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def _drop(self, telegram_id: int):
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None:
+            self._telegram_by_user_id.pop(entry[1].id, None)
+
+
+identity_cache = IdentityCache(
+    maxsize=int(os.getenv("IDENTITY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("IDENTITY_CACHE_TTL", "300"))
+)
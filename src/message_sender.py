@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Массовая отправка сообщений с учетом лимитов Telegram.
+Ограничивает число одновременных запросов, общий темп (~30 сообщений/с)
+и темп для одного чата (1 сообщение/с), повторяет отправку после RetryAfter.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+
+from telegram.error import Forbidden, RetryAfter
+
+logger = logging.getLogger('RepitBot.Performance')
+
+# --- Лимиты Telegram Bot API ---
+GLOBAL_MESSAGES_PER_SECOND = 30
+PER_CHAT_MESSAGES_PER_SECOND = 1
+MAX_CONCURRENT_SENDS = 10
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = None
+    description: str = ""  # Для логов: кому и о чем сообщение
+
+
+@dataclass
+class SendStats:
+    total: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retried: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    duration: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'total': self.total,
+            'sent': self.sent,
+            'blocked': self.blocked,
+            'failed': self.failed,
+            'retried': self.retried,
+            'duration_sec': round(self.duration, 3),
+            'rate_per_sec': round(self.sent / self.duration, 2) if self.duration else 0.0,
+        }
+
+
+class RateLimitedSender:
+    """Отправляет сообщения конкурентно, соблюдая общий и поштучный (на чат) темп."""
+
+    def __init__(self, bot, global_rate: float = GLOBAL_MESSAGES_PER_SECOND,
+                 per_chat_rate: float = PER_CHAT_MESSAGES_PER_SECOND,
+                 max_concurrency: int = MAX_CONCURRENT_SENDS):
+        self.bot = bot
+        self._global_interval = 1.0 / global_rate
+        self._chat_interval = 1.0 / per_chat_rate
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._next_global_slot = 0.0
+        self._next_chat_slot: Dict[int, float] = {}
+
+    async def _wait_for_slot(self, chat_id: int):
+        # Слоты резервируются без await между чтением и записью, поэтому блокировка не нужна
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        chat_slot = max(now, self._next_chat_slot.get(chat_id, 0.0))
+        self._next_chat_slot[chat_id] = chat_slot + self._chat_interval
+        if chat_slot > now:
+            await asyncio.sleep(chat_slot - now)
+
+        now = loop.time()
+        global_slot = max(now, self._next_global_slot)
+        self._next_global_slot = global_slot + self._global_interval
+        if global_slot > now:
+            await asyncio.sleep(global_slot - now)
+
+    async def _send_one(self, message: OutgoingMessage, stats: SendStats):
+        async with self._semaphore:
+            for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+                await self._wait_for_slot(message.chat_id)
+                try:
+                    await self.bot.send_message(
+                        chat_id=message.chat_id,
+                        text=message.text,
+                        parse_mode=message.parse_mode
+                    )
+                    stats.sent += 1
+                    return
+                except RetryAfter as e:
+                    if attempt == MAX_RETRY_AFTER_ATTEMPTS:
+                        break
+                    stats.retried += 1
+                    retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                    await asyncio.sleep(retry_after)
+                except Forbidden:
+                    stats.blocked += 1
+                    logger.warning(f"Сообщение не доставлено ({message.description}): бот заблокирован.")
+                    return
+                except Exception as e:
+                    stats.failed += 1
+                    logger.warning(f"Сообщение не доставлено ({message.description}): {e}")
+                    return
+            stats.failed += 1
+            logger.warning(f"Сообщение не доставлено ({message.description}): превышено число повторов после RetryAfter.")
+
+    async def send_all(self, messages: Iterable[OutgoingMessage]) -> SendStats:
+        """Отправляет все сообщения и возвращает статистику прогона."""
+        messages = list(messages)
+        stats = SendStats(total=len(messages))
+        await asyncio.gather(*(self._send_one(message, stats) for message in messages))
+        stats.duration = time.monotonic() - stats.started_at
+        return stats
@@ -2,9 +2,14 @@
 from datetime import datetime, timedelta
 from telegram.ext import Application
 from telegram.error import Forbidden
-from .database import SessionLocal, Lesson, User, UserRole, Payment, get_student_balance, Homework, HomeworkStatus
+import asyncio
+import logging
+from .database import SessionLocal, Lesson, User, UserRole, Payment, get_students_with_balance, Homework, HomeworkStatus
+from .message_sender import RateLimitedSender, OutgoingMessage
 from sqlalchemy import func
 
+logger = logging.getLogger('RepitBot.Performance')
+
 # --- Константы ---
 LOW_BALANCE_THRESHOLD = 1 # Напоминание только когда остается 1 урок
 
@@ -46,39 +51,26 @@ async def send_payment_reminders(application: Application):
     Отправляет напоминания о низком балансе занятий.
     Отправляет родителю, если он есть, иначе - студенту.
     """
-    db = SessionLocal()
-    try:
-        # Выбираем всех студентов, чтобы проверить их баланс
-        students = db.query(User).filter(User.role == UserRole.STUDENT).all()
-
-        for student in students:
-            balance = get_student_balance(student.id)
+    # Один запрос к БД вне event loop, чтобы не блокировать обработку обновлений
+    recipients = await asyncio.to_thread(get_students_with_balance, LOW_BALANCE_THRESHOLD)
 
-            if balance == LOW_BALANCE_THRESHOLD:
-                # Определяем, кому отправлять сообщение
-                target_user = student.parent if student.parent and student.parent.telegram_id else student
-                
-                if not target_user.telegram_id:
-                    continue # Пропускаем, если ни у родителя, ни у студента нет telegram_id
+    messages = [
+        OutgoingMessage(
+            chat_id=chat_id,
+            text=(
+                f"💰 *Напоминание о балансе*\n\n"
+                f"У ученика *{full_name}* остался *{balance}* оплаченный урок.\n\n"
+                "Пожалуйста, не забудьте пополнить баланс для продолжения обучения."
+            ),
+            parse_mode='Markdown',
+            description=f"напоминание о балансе для {full_name} (ID: {student_id})"
+        )
+        for student_id, full_name, chat_id, balance in recipients
+    ]
 
-                message = (
-                    f"💰 *Напоминание о балансе*\n\n"
-                    f"У ученика *{student.full_name}* остался *{balance}* оплаченный урок.\n\n"
-                    "Пожалуйста, не забудьте пополнить баланс для продолжения обучения."
-                )
-                
-                try:
-                    await application.bot.send_message(
-                        chat_id=target_user.telegram_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                except Forbidden:
-                    print(f"Не удалось отправить напоминание о балансе для {student.full_name} (ID: {student.id}) пользователю {target_user.full_name} (ID: {target_user.id}): бот заблокирован.")
-                except Exception as e:
-                    print(f"Не удалось отправить напоминание о балансе для {student.full_name} (ID: {student.id}): {e}")
-    finally:
-        db.close()
+    stats = await RateLimitedSender(application.bot).send_all(messages)
+    logger.info(f"send_payment_reminders: {stats.as_dict()}")
+    return stats
 
 async def send_homework_deadline_reminders(application: Application):
     """Отправляет напоминания о приближающемся дедлайне ДЗ."""
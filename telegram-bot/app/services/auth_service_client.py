@@ -4,6 +4,9 @@ Telegram Bot - Auth Service Client
 HTTP клиент для взаимодействия с Auth Service
 """
 import logging
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from .api_client import BaseApiClient, ServiceUnavailableError, with_fallback, service_registry
@@ -62,6 +65,16 @@ class AuthServiceClient(BaseApiClient):
             logger.error(f"Failed to validate token: {e}")
             return {'valid': False, 'error': str(e)}
     
+    async def validate_tokens(self, tokens: List[str]) -> List[Dict[str, Any]]:
+        """Валидация нескольких токенов одним запросом"""
+        try:
+            data = {'tokens': tokens}
+            result = await self.post('/api/v1/auth/validate:batch', data=data)
+            return result.get('results', [])
+        except Exception as e:
+            logger.error(f"Failed to validate tokens: {e}")
+            return [{'valid': False, 'error': str(e)} for _ in tokens]
+    
     async def logout(
         self, 
         access_token: str, 
@@ -254,6 +267,52 @@ class TokenManager:
 # Глобальный менеджер токенов
 token_manager = TokenManager()
 
+# === Кэш результатов валидации ===
+
+class TokenValidationCache:
+    """
+    Успешные результаты валидации токенов на короткое время (не дольше срока действия токена),
+    чтобы не обращаться к Auth Service на каждое действие пользователя
+    """
+    
+    def __init__(self, ttl: int = None, max_size: int = 5000):
+        self.ttl = ttl if ttl is not None else int(os.getenv('AUTH_VALIDATION_CACHE_TTL', '30'))
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (expires_at, result)
+    
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Результат из кэша или None"""
+        entry = self.entries.get(token)
+        if not entry:
+            return None
+        if entry[0] <= time.time():
+            del self.entries[token]
+            return None
+        return entry[1]
+    
+    def set(self, token: str, result: Dict[str, Any]):
+        """Сохранение успешного результата валидации"""
+        if not self.ttl or not result.get('valid'):
+            return
+        expires_at = time.time() + self.ttl
+        if result.get('expires_at'):
+            try:
+                token_expires = datetime.fromisoformat(str(result['expires_at'])).timestamp()
+                expires_at = min(expires_at, token_expires)
+            except ValueError:
+                pass
+        self.entries[token] = (expires_at, result)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, token: str):
+        """Удаление токена из кэша (выход из системы)"""
+        self.entries.pop(token, None)
+
+# Глобальный кэш валидации
+validation_cache = TokenValidationCache()
+
 # === Fallback функции ===
 
 async def _fallback_login_with_access_code(
@@ -324,11 +383,32 @@ async def login_with_access_code(
 @with_fallback(_fallback_validate_token)
 async def validate_token(token: str) -> Dict[str, Any]:
     """Валидация токена с fallback"""
+    cached = validation_cache.get(token)
+    if cached:
+        return cached
+    
     async with auth_service_client:
-        return await auth_service_client.validate_token(token)
+        result = await auth_service_client.validate_token(token)
+    
+    validation_cache.set(token, result)
+    return result
 
 # === Дополнительные функции без fallback ===
 
+async def validate_tokens(tokens: List[str]) -> List[Dict[str, Any]]:
+    """Валидация нескольких токенов: из кэша или одним запросом к Auth Service"""
+    results = [validation_cache.get(token) for token in tokens]
+    missing = [index for index, result in enumerate(results) if result is None]
+    
+    if missing:
+        async with auth_service_client:
+            validated = await auth_service_client.validate_tokens([tokens[index] for index in missing])
+        for index, result in zip(missing, validated):
+            validation_cache.set(tokens[index], result)
+            results[index] = result
+    
+    return results
+
 async def refresh_token(refresh_token: str) -> Optional[Dict[str, Any]]:
     """Обновление токена"""
     async with auth_service_client:
@@ -339,6 +419,7 @@ async def logout(
     refresh_token: Optional[str] = None
 ) -> bool:
     """Выход из системы"""
+    validation_cache.invalidate(access_token)
     async with auth_service_client:
         return await auth_service_client.logout(access_token, refresh_token)
 
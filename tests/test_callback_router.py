@@ -0,0 +1,68 @@
+"""
+Unit tests for the callback_data prefix router (src/handlers/router.py)
+Runs without services: pytest tests/test_callback_router.py --noconftest
+"""
+
+import asyncio
+import pytest
+
+from src.handlers.router import CallbackRouter, last_int, last_str, suffix
+
+
+async def handler(update, context, *args):
+    return args
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter()
+    # Registration order must not matter
+    router.add("tutor_", handler)
+    router.add("tutor_view_student_", handler, last_int)
+    router.add("tutor_view_", handler)
+    router.add("tutor_set_attendance_", handler, suffix)
+    return router
+
+
+def test_longest_prefix_wins(router):
+    assert router.resolve("tutor_view_student_15").prefix == "tutor_view_student_"
+    assert router.resolve("tutor_view_lessons").prefix == "tutor_view_"
+    assert router.resolve("tutor_add_lesson").prefix == "tutor_"
+
+
+def test_no_match(router):
+    assert router.resolve("student_menu") is None
+    assert router.resolve("") is None
+    assert router.resolve("tutor") is None
+
+
+def test_exact_prefix_matches(router):
+    assert router.resolve("tutor_view_").prefix == "tutor_view_"
+
+
+def test_duplicate_prefix_rejected(router):
+    with pytest.raises(ValueError):
+        router.add("tutor_view_", handler)
+
+
+def test_argument_parsers():
+    assert last_int("tutor_view_student_15", "tutor_view_student_") == 15
+    assert last_str("schedule_toggle_monday", "schedule_toggle_") == "monday"
+    assert suffix("tutor_set_attendance_15_attended", "tutor_set_attendance_") == "15_attended"
+
+
+def test_dispatch_passes_parsed_args_and_records_stats(router):
+    route = router.resolve("tutor_set_attendance_15_attended")
+    result = asyncio.run(router.dispatch(route, None, None, "tutor_set_attendance_15_attended"))
+    assert result == ("15_attended",)
+    assert router.stats()["tutor_set_attendance_"]["calls"] == 1
+
+
+def test_dispatch_counts_errors(router):
+    async def failing(update, context):
+        raise RuntimeError("boom")
+
+    route = router.add("broken_", failing)
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.dispatch(route, None, None, "broken_1"))
+    assert router.stats()["broken_"]["errors"] == 1
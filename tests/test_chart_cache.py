@@ -0,0 +1,174 @@
+"""
+Unit tests for the progress chart cache (src/chart_cache.py)
+Runs without services: pytest tests/test_chart_cache.py --noconftest
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from telegram.error import BadRequest
+
+from src.chart_cache import ChartCache, chart_cache
+from src.chart_generator import send_progress_chart
+from src.database import Base, Homework, Lesson, User, UserRole
+
+
+def write_chart(cache, student_id, key, size=10):
+    path = cache.path_for(student_id, key)
+    with open(path, "wb") as chart_file:
+        chart_file.write(b"x" * size)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # ORM events mark the module-level cache dirty
+    monkeypatch.setattr(chart_cache, "chart_dir", str(tmp_path))
+    monkeypatch.setattr(chart_cache, "_entries", {})
+    monkeypatch.setattr(chart_cache, "_file_ids", {})
+    return chart_cache
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def add_student(session, name):
+    student = User(full_name=name, role=UserRole.STUDENT, access_code=name)
+    session.add(student)
+    session.flush()
+    return student
+
+
+def add_lesson(session, student, topic="t"):
+    lesson = Lesson(student_id=student.id, topic=topic, date=datetime(2024, 1, 1))
+    session.add(lesson)
+    session.flush()
+    return lesson
+
+
+def cache_chart(cache, student, key="k1"):
+    cache.put(student.id, key, write_chart(cache, student.id, key))
+    assert cache.get(student.id) is not None
+
+
+def test_lesson_changes_mark_chart_dirty(cache, session):
+    student = add_student(session, "s1")
+    other = add_student(session, "s2")
+    lesson = add_lesson(session, student)
+    cache_chart(cache, student)
+    cache_chart(cache, other)
+
+    lesson.topic = "new topic"
+    session.flush()
+    assert cache.get(student.id) is None
+    assert cache.get(other.id) is not None
+
+    # Moving a lesson makes both charts stale
+    cache_chart(cache, student, "k2")
+    lesson.student_id = other.id
+    session.flush()
+    assert cache.get(student.id) is None and cache.get(other.id) is None
+
+
+def test_homework_and_user_changes_mark_chart_dirty(cache, session):
+    student = add_student(session, "s3")
+    lesson = add_lesson(session, student)
+    cache_chart(cache, student)
+
+    session.add(Homework(lesson_id=lesson.id, description="hw"))
+    session.flush()
+    assert cache.get(student.id) is None
+
+    cache_chart(cache, student, "k2")
+    student.username = "renamed_login"
+    session.flush()
+    assert cache.get(student.id) is not None
+
+    student.points = 10
+    session.flush()
+    assert cache.get(student.id) is None
+
+
+def test_put_replaces_previous_file(cache):
+    old_path = write_chart(cache, 1, "old")
+    cache.put(1, "old", old_path)
+    cache.remember_file_id(old_path, "file-1")
+
+    new_path = write_chart(cache, 1, "new")
+    cache.put(1, "new", new_path)
+    assert not os.path.exists(old_path)
+    assert cache.get_file_id(old_path) is None
+    assert cache.get(1) == new_path
+
+    # Same data: the file is kept
+    cache.put(1, "new", new_path)
+    assert os.path.exists(new_path)
+
+
+def test_expired_or_deleted_files_are_rebuilt(tmp_path):
+    cache = ChartCache(chart_dir=str(tmp_path), ttl=-1)
+    cache.put(1, "k", write_chart(cache, 1, "k"))
+    assert cache.get(1) is None
+
+    cache = ChartCache(chart_dir=str(tmp_path), ttl=60)
+    path = write_chart(cache, 2, "k")
+    cache.put(2, "k", path)
+    os.remove(path)
+    assert cache.get(2) is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_evict_by_age_and_total_size(tmp_path):
+    cache = ChartCache(chart_dir=str(tmp_path), ttl=60, max_age=3600, max_bytes=25)
+    now = time.time()
+    paths = {}
+    for student_id, age in ((1, 7200), (2, 300), (3, 200), (4, 100)):
+        paths[student_id] = write_chart(cache, student_id, "k")
+        os.utime(paths[student_id], (now - age, now - age))
+    # Chart 2 is in use: kept over the size limit, unlike the expired chart 1
+    cache.put(1, "k", paths[1])
+    cache.put(2, "k", paths[2])
+
+    cache.evict()
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[2])
+    assert not os.path.exists(paths[3])
+    assert os.path.exists(paths[4])
+    assert cache.get(1) is None and cache.get(2) == paths[2]
+
+
+class FakeBot:
+    def __init__(self, reject_file_ids=False):
+        self.reject_file_ids = reject_file_ids
+        self.photos = []
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        if isinstance(photo, str) and self.reject_file_ids:
+            raise BadRequest("Wrong file identifier")
+        self.photos.append(photo if isinstance(photo, str) else "upload")
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id="large")])
+
+
+def test_sent_chart_is_reused_by_file_id(cache):
+    path = write_chart(cache, 1, "k")
+    bot = FakeBot()
+    asyncio.run(send_progress_chart(bot, 100, path))
+    asyncio.run(send_progress_chart(bot, 100, path))
+    assert bot.photos == ["upload", "large"]
+
+    # An expired file_id is forgotten and the file is uploaded again
+    bot.reject_file_ids = True
+    asyncio.run(send_progress_chart(bot, 100, path))
+    assert bot.photos == ["upload", "large", "upload"]
+    assert cache.get_file_id(path) == "large"
@@ -0,0 +1,121 @@
+"""
+Unit tests for the tutor dashboard statistics (src/database.py)
+Runs without services: pytest tests/test_dashboard_stats.py --noconftest
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+from src import database
+from src.database import (
+    Base, User, UserRole, Lesson, Homework, Payment, Achievement, AttendanceStatus, HomeworkStatus,
+    get_dashboard_stats_for_months
+)
+
+MONTHS = [(2023, 12), (2024, 1), (2024, 2)]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "engine", engine)
+    database.invalidate_dashboard_stats()
+    yield engine
+    database.invalidate_dashboard_stats()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+
+def add_user(session, name, role=UserRole.STUDENT):
+    user = User(full_name=name, role=role, access_code=name)
+    session.add(user)
+    session.flush()
+    return user
+
+
+def add_lesson(session, student, date, status=AttendanceStatus.ATTENDED):
+    lesson = Lesson(student_id=student.id, topic="t", date=date, attendance_status=status)
+    session.add(lesson)
+    session.flush()
+    return lesson
+
+
+def test_stats_are_bucketed_by_month(session):
+    student = add_user(session, "s1")
+    add_user(session, "s2")
+    add_user(session, "tutor", UserRole.TUTOR)
+    lesson = add_lesson(session, student, datetime(2023, 12, 31, 23, 59))
+    add_lesson(session, student, datetime(2024, 1, 1))
+    add_lesson(session, student, datetime(2024, 1, 15))
+    add_lesson(session, student, datetime(2024, 1, 20), AttendanceStatus.SCHEDULED)
+    add_lesson(session, student, datetime(2024, 3, 1))
+    session.add_all([
+        Homework(lesson_id=lesson.id, description="hw", status=HomeworkStatus.CHECKED,
+                 checked_at=datetime(2024, 2, 29, 12)),
+        Homework(lesson_id=lesson.id, description="hw", status=HomeworkStatus.SUBMITTED,
+                 checked_at=datetime(2024, 2, 10)),
+        Payment(student_id=student.id, lessons_paid=5, payment_date=datetime(2024, 1, 10)),
+        Payment(student_id=student.id, lessons_paid=3, payment_date=datetime(2024, 1, 31)),
+        Payment(student_id=student.id, lessons_paid=4, payment_date=datetime(2024, 2, 1)),
+    ])
+    session.commit()
+
+    stats = get_dashboard_stats_for_months(MONTHS + [(2024, 1)])
+    assert list(stats) == MONTHS
+    assert stats[(2023, 12)] == {"student_count": 2, "lessons_this_month": 1,
+                                 "checked_hw_this_month": 0, "payments_sum_this_month": 0}
+    assert stats[(2024, 1)] == {"student_count": 2, "lessons_this_month": 2,
+                                "checked_hw_this_month": 0, "payments_sum_this_month": 8}
+    assert stats[(2024, 2)] == {"student_count": 2, "lessons_this_month": 0,
+                                "checked_hw_this_month": 1, "payments_sum_this_month": 4}
+    assert get_dashboard_stats_for_months([]) == {}
+
+
+def test_memo_is_cleared_after_commit(session):
+    student = add_user(session, "s1")
+    session.commit()
+    assert get_dashboard_stats_for_months(MONTHS)[(2024, 1)]["lessons_this_month"] == 0
+
+    add_lesson(session, student, datetime(2024, 1, 5))
+    # Flushed but not committed: the memo still holds the committed state
+    assert get_dashboard_stats_for_months(MONTHS)[(2024, 1)]["lessons_this_month"] == 0
+    session.commit()
+    assert get_dashboard_stats_for_months(MONTHS)[(2024, 1)]["lessons_this_month"] == 1
+
+    # Bulk UPDATE bypasses mapper events but is still tracked
+    session.execute(update(Lesson).values(attendance_status=AttendanceStatus.SCHEDULED))
+    session.commit()
+    assert get_dashboard_stats_for_months(MONTHS)[(2024, 1)]["lessons_this_month"] == 0
+
+
+def test_rolled_back_changes_keep_memo(session):
+    student = add_user(session, "s1")
+    session.commit()
+    stats = get_dashboard_stats_for_months(MONTHS)
+
+    add_user(session, "s2")
+    session.rollback()
+    # The next transaction does not touch dashboard tables
+    session.add(Achievement(student_id=student.id, achievement_type="first_lesson", title="First"))
+    session.commit()
+    assert get_dashboard_stats_for_months(MONTHS) is stats
+
+
+def test_memo_expires_after_ttl(session, monkeypatch):
+    add_user(session, "s1")
+    session.commit()
+    stats = get_dashboard_stats_for_months(MONTHS)
+    assert get_dashboard_stats_for_months(MONTHS) is stats
+
+    monkeypatch.setattr(database, "DASHBOARD_STATS_TTL", -1)
+    database.invalidate_dashboard_stats()
+    stats = get_dashboard_stats_for_months(MONTHS)
+    assert get_dashboard_stats_for_months(MONTHS) is not stats
@@ -0,0 +1,126 @@
+"""
+Unit tests for the identity cache (src/identity_cache.py)
+Runs without services: pytest tests/test_identity_cache.py --noconftest
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from src import async_database
+from src.database import Base, User, UserRole
+from src.identity_cache import Identity, IdentityCache, identity_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("src.identity_cache.time.monotonic", clock)
+    return clock
+
+
+def identity(user_id, telegram_id=None, role=UserRole.STUDENT, **kwargs):
+    return Identity(id=user_id, telegram_id=telegram_id or user_id * 100, role=role,
+                    full_name=f"user{user_id}", **kwargs)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = IdentityCache(maxsize=10, ttl=60)
+    cache.put(identity(1))
+
+    clock.now += 59
+    assert cache.get(100).id == 1
+    clock.now += 2
+    assert cache.get(100) is None
+    assert cache.stats()['size'] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = IdentityCache(maxsize=2, ttl=60)
+    cache.put(identity(1))
+    cache.put(identity(2))
+    assert cache.get(100) is not None  # 1 becomes the most recently used
+
+    cache.put(identity(3))
+    assert cache.get(200) is None
+    assert cache.get(100).id == 1 and cache.get(300).id == 3
+    assert cache.evictions == 1
+    # The evicted entry can no longer be found by user id
+    cache.invalidate_users(2)
+    assert cache.stats()['size'] == 2
+
+
+def test_relinking_telegram_account_replaces_entry(clock):
+    cache = IdentityCache(maxsize=10, ttl=60)
+    cache.put(identity(1, telegram_id=100))
+
+    # Login with the access code from another Telegram account
+    cache.invalidate(200)
+    cache.invalidate_users(1)
+    assert cache.get(100) is None
+
+    cache.put(identity(1, telegram_id=200))
+    cache.invalidate_users(1)
+    assert cache.get(200) is None
+
+
+def test_invalidate_users_drops_parents_and_children(clock):
+    cache = IdentityCache(maxsize=10, ttl=60)
+    cache.put(identity(1, parent_ids=(2,)))
+    cache.put(identity(2, role=UserRole.PARENT, child_ids=(1,)))
+    cache.put(identity(3))
+
+    cache.invalidate_users(1, 2, None)
+    assert cache.get(100) is None and cache.get(200) is None
+    assert cache.get(300).id == 3
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'bot.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    # Each asyncio.run() has its own loop: connections are not pooled between them
+    async_engine = create_async_engine(async_database.to_async_url(url), poolclass=NullPool)
+    monkeypatch.setattr(async_database, "AsyncSessionLocal", async_sessionmaker(async_engine, expire_on_commit=False))
+    identity_cache.clear()
+    yield engine
+    identity_cache.clear()
+    asyncio.run(async_engine.dispose())
+    engine.dispose()
+
+
+def test_identity_reloads_after_role_and_access_code_changes(database):
+    with Session(database) as session:
+        user = User(full_name="Anna", role=UserRole.STUDENT, access_code="CODE01", telegram_id=100)
+        session.add(user)
+        session.commit()
+
+        assert asyncio.run(async_database.get_identity_async(100)).role == UserRole.STUDENT
+        user.role = UserRole.PARENT
+        session.commit()
+        # Served from the cache until the change is invalidated
+        assert asyncio.run(async_database.get_identity_async(100)).role == UserRole.STUDENT
+        identity_cache.invalidate_users(user.id)
+        assert asyncio.run(async_database.get_identity_async(100)).role == UserRole.PARENT
+
+        # The access code is entered from a new Telegram account
+        user.telegram_id = 200
+        session.commit()
+        identity_cache.invalidate(200)
+        identity_cache.invalidate_users(user.id)
+        assert asyncio.run(async_database.get_identity_async(100)) is None
+        assert asyncio.run(async_database.get_identity_async(200)).id == user.id
@@ -0,0 +1,114 @@
+"""
+Unit tests for rate-limited bulk sending (src/message_sender.py)
+Runs without services: pytest tests/test_message_sender.py --noconftest
+"""
+
+import asyncio
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from src import message_sender
+from src.message_sender import OutgoingMessage, RateLimitedSender, SendStats
+
+
+class FakeBot:
+    """Records send times; errors[chat_id] lists exceptions raised by successive sends"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        now = asyncio.get_running_loop().time()
+        self.attempts.append((chat_id, now))
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append((chat_id, now))
+
+
+def send(bot, messages, **kwargs):
+    sender = RateLimitedSender(bot, **kwargs)
+    return asyncio.run(sender.send_all(messages))
+
+
+def span(times):
+    # Slots are reserved at fixed intervals; a late wake-up may shorten one gap but not the span
+    return times[-1] - times[0]
+
+
+def test_global_rate_spaces_all_sends():
+    bot = FakeBot()
+    stats = send(bot, [OutgoingMessage(chat_id, "hi") for chat_id in range(5)],
+                 global_rate=50, per_chat_rate=50)
+
+    assert stats.sent == 5
+    assert span([at for _, at in bot.sent]) >= 4 * 0.02 - 0.005
+
+
+def test_per_chat_rate_spaces_sends_to_one_chat():
+    bot = FakeBot()
+    messages = [OutgoingMessage(1, f"m{i}") for i in range(3)] + [OutgoingMessage(2, "other")]
+    stats = send(bot, messages, global_rate=1000, per_chat_rate=10)
+
+    assert stats.sent == 4
+    chat_one = [at for chat_id, at in bot.sent if chat_id == 1]
+    assert span(chat_one) >= 2 * 0.1 - 0.005
+    # The other chat is not held back by the first one
+    chat_two = [at for chat_id, at in bot.sent if chat_id == 2][0]
+    assert chat_two < chat_one[1]
+
+
+def test_retry_after_waits_and_resends():
+    bot = FakeBot({1: [RetryAfter(timedelta(seconds=0.05))]})
+    stats = send(bot, [OutgoingMessage(1, "hi")], global_rate=1000, per_chat_rate=1000)
+
+    assert (stats.sent, stats.retried, stats.failed) == (1, 1, 0)
+    first, second = [at for _, at in bot.attempts]
+    assert second - first >= 0.045
+
+
+def test_retry_after_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(message_sender, "MAX_RETRY_AFTER_ATTEMPTS", 2)
+    bot = FakeBot({1: [RetryAfter(timedelta(0)) for _ in range(5)]})
+    stats = send(bot, [OutgoingMessage(1, "hi")], global_rate=1000, per_chat_rate=1000)
+
+    assert (stats.sent, stats.retried, stats.failed) == (0, 2, 1)
+    assert len(bot.attempts) == 3
+
+
+def test_blocked_and_failed_sends_are_counted():
+    bot = FakeBot({2: [Forbidden("bot was blocked by the user")], 3: [BadRequest("chat not found")]})
+    stats = send(bot, [OutgoingMessage(chat_id, "hi") for chat_id in (1, 2, 3)],
+                 global_rate=1000, per_chat_rate=1000)
+
+    assert (stats.total, stats.sent, stats.blocked, stats.failed, stats.retried) == (3, 1, 1, 1, 0)
+    # Errors other than RetryAfter are not retried
+    assert len(bot.attempts) == 3
+
+
+def test_concurrency_is_bounded():
+    in_flight = []
+    peak = []
+
+    class SlowBot(FakeBot):
+        async def send_message(self, chat_id, text, parse_mode=None):
+            in_flight.append(chat_id)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(chat_id)
+
+    send(SlowBot(), [OutgoingMessage(chat_id, "hi") for chat_id in range(10)],
+         global_rate=10000, per_chat_rate=10000, max_concurrency=3)
+    assert max(peak) == 3
+
+
+def test_send_stats_as_dict():
+    stats = SendStats(total=4, sent=3, blocked=1, duration=1.5)
+    assert stats.as_dict() == {
+        'total': 4, 'sent': 3, 'blocked': 1, 'failed': 0, 'retried': 0,
+        'duration_sec': 1.5, 'rate_per_sec': 2.0,
+    }
+    assert SendStats().as_dict()['rate_per_sec'] == 0.0
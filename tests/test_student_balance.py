@@ -0,0 +1,114 @@
+"""
+Unit tests for the materialized student balance (src/database.py)
+Runs without services: pytest tests/test_student_balance.py --noconftest
+"""
+
+import pytest
+from datetime import datetime
+from sqlalchemy import bindparam, create_engine, delete, update
+from sqlalchemy.orm import Session
+
+from src.database import (
+    Base, User, UserRole, Lesson, Payment, StudentBalance, AttendanceStatus
+)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def balance_of(session, student_id):
+    row = session.get(StudentBalance, student_id)
+    session.expire_all()
+    return row.balance if row else 0
+
+
+def add_student(session, name):
+    student = User(full_name=name, role=UserRole.STUDENT, access_code=name)
+    session.add(student)
+    session.flush()
+    return student
+
+
+def test_orm_changes_update_balance(session):
+    student = add_student(session, "s1")
+    session.add(Payment(student_id=student.id, lessons_paid=5))
+    lesson = Lesson(student_id=student.id, topic="t", date=datetime(2024, 1, 1),
+                    attendance_status=AttendanceStatus.ATTENDED)
+    session.add(lesson)
+    session.commit()
+    assert balance_of(session, student.id) == 4
+
+    lesson.attendance_status = AttendanceStatus.EXCUSED_ABSENCE
+    session.commit()
+    assert balance_of(session, student.id) == 5
+
+
+def test_bulk_update_and_delete_update_balance(session):
+    student = add_student(session, "s2")
+    other = add_student(session, "s3")
+    session.add(Payment(student_id=student.id, lessons_paid=5))
+    session.add_all([
+        Lesson(student_id=student.id, topic=f"t{i}", date=datetime(2024, 1, i + 1),
+               attendance_status=AttendanceStatus.ATTENDED)
+        for i in range(2)
+    ])
+    session.commit()
+    assert balance_of(session, student.id) == 3
+
+    # Bulk query(...).update() bypasses mapper events
+    session.query(Lesson).filter(Lesson.topic == "t0").update(
+        {Lesson.attendance_status: AttendanceStatus.EXCUSED_ABSENCE}, synchronize_session=False
+    )
+    session.commit()
+    assert balance_of(session, student.id) == 4
+
+    session.execute(delete(Lesson).where(Lesson.topic == "t1"))
+    session.commit()
+    assert balance_of(session, student.id) == 5
+
+    session.execute(update(Payment).where(Payment.student_id == student.id).values(student_id=other.id))
+    session.commit()
+    assert balance_of(session, student.id) == 0
+    assert balance_of(session, other.id) == 5
+
+
+def test_bulk_update_moving_rows_to_another_student(session):
+    student = add_student(session, "s4")
+    other = add_student(session, "s5")
+    third = add_student(session, "s6")
+    payment = Payment(student_id=student.id, lessons_paid=3)
+    lesson = Lesson(student_id=student.id, topic="t", date=datetime(2024, 1, 1),
+                    attendance_status=AttendanceStatus.ATTENDED)
+    session.add_all([payment, lesson])
+    session.commit()
+
+    # New student_id passed as an execution parameter
+    session.execute(
+        update(Payment).where(Payment.id == payment.id).values(student_id=bindparam("new_student")),
+        {"new_student": other.id},
+    )
+    session.commit()
+    assert balance_of(session, student.id) == -1
+    assert balance_of(session, other.id) == 3
+
+    # ORM bulk UPDATE by primary key
+    session.execute(update(Lesson), [{"id": lesson.id, "student_id": third.id}])
+    session.commit()
+    assert balance_of(session, student.id) == 0
+    assert balance_of(session, third.id) == -1
+
+
+def test_bulk_update_to_unknown_student_is_rejected(session):
+    student = add_student(session, "s7")
+    session.add(Payment(student_id=student.id, lessons_paid=2))
+    session.commit()
+
+    with pytest.raises(ValueError):
+        session.execute(update(Payment).values(student_id=Payment.student_id + 1))
+    session.rollback()
+    assert balance_of(session, student.id) == 2